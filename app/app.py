@@ -38,18 +38,28 @@ else:
     print(f"⚠️ Arquivo .env não encontrado em: {env_path}")
 import re
 import json
+import logging
+import unicodedata
+from urllib.parse import quote as url_quote
 import sqlite3
 import hashlib
 import hmac
 import secrets
 import io
-import zipfile
+import zlib
 import threading
+import queue
+import time
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import cached_property, wraps
+from pathlib import Path
 from typing import Optional, List, Dict, Any
 
-from flask import Flask, request, jsonify, g, send_from_directory, send_file
+from flask import Flask, request, jsonify, g, send_from_directory, send_file, stream_with_context
 from flask_cors import CORS
 import jwt
 from werkzeug.utils import secure_filename
@@ -57,9 +67,42 @@ from werkzeug.exceptions import HTTPException
 from apscheduler.schedulers.background import BackgroundScheduler
 import requests
 from openai import OpenAI
-from docxtpl import DocxTemplate
+from services.llm_gateway import LLMGateway, LLMProvider
+from services.jobs import RegistroTarefas
+from services.backup_service import (
+    FORMATOS as BACKUP_FORMATOS,
+    BackupExportJobs,
+    comprimir_gzip,
+    contar_registros,
+    criar_snapshot_sqlite,
+    iterar_arquivo,
+    iterar_backup_json,
+    iterar_backup_ndjson,
+    nome_arquivo_backup,
+    restaurar_arquivo_backup,
+    verificar_arquivo_backup,
+)
+from services.backup_incremental import BackupIncremental
+from services.zip_stream import iterar_zip_stream
+from services.armazenamento import ArmazenamentoConteudo, criar_tabelas_armazenamento
+from services.templates_docx import PoolRenderizacao, TemplateDocxCache, limpar_arquivos_temporarios
+from services.pdf_render import RenderizadorPDF
+from services.paginacao import ContagemCache, criar_indices_paginacao, paginar, parametros_paginacao
+from services.auditoria import AuditoriaAssincrona, criar_tabela_arquivo_auditoria
+from services.metricas import MetricasPlataforma, criar_tabelas_metricas, preencher_historico_metricas
+from services.entrega_arquivos import (
+    CACHE_IMUTAVEL,
+    CACHE_IMUTAVEL_PRIVADO,
+    CACHE_PRIVADO,
+    CACHE_REVALIDAR,
+    EntregaArquivos,
+    asset_com_hash,
+    precomprimir_diretorio,
+)
 from docx import Document
 
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # IMPORTAÇÃO DO SERVIÇO WHATSAPP
 # ============================================================================
@@ -174,38 +217,62 @@ OPENAI_MODEL = (os.environ.get('OPENAI_MODEL') or DEFAULT_OPENAI_MODEL).strip()
 # IA_MODEL, quando definido, sobrescreve qualquer seleção por provider.
 IA_MODEL = (os.environ.get('IA_MODEL') or '').strip()
 
-# Inicializa cliente de IA (prioridade: Groq > OpenAI)
-ia_client = None
-ia_provider = None
+# Inicializa clientes de IA (prioridade: Groq > OpenAI). Com as duas chaves
+# configuradas, a OpenAI fica como failover do Groq no gateway.
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '4'))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LLM_QUEUE_TIMEOUT_SECONDS', '30'))
+LLM_RATE_LIMIT_WAIT_SECONDS = float(os.environ.get('LLM_RATE_LIMIT_WAIT_SECONDS', '5'))
+GROQ_REQUESTS_PER_MINUTE = float(os.environ.get('GROQ_REQUESTS_PER_MINUTE', '30'))
+OPENAI_REQUESTS_PER_MINUTE = float(os.environ.get('OPENAI_REQUESTS_PER_MINUTE', '500'))
+
+llm_gateway = LLMGateway(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+    rate_limit_wait=LLM_RATE_LIMIT_WAIT_SECONDS,
+)
 
 if GROQ_API_KEY:
     try:
         # Configuração sem proxies para evitar erros de compatibilidade
         import httpx
         http_client = httpx.Client(timeout=60.0)
-        ia_client = OpenAI(
-            api_key=GROQ_API_KEY,
-            base_url=GROQ_API_URL,
-            http_client=http_client
-        )
-        ia_provider = 'groq'
+        llm_gateway.add_provider(LLMProvider(
+            'groq',
+            OpenAI(
+                api_key=GROQ_API_KEY,
+                base_url=GROQ_API_URL,
+                http_client=http_client
+            ),
+            IA_MODEL or GROQ_MODEL,
+            requests_per_minute=GROQ_REQUESTS_PER_MINUTE,
+        ))
         print(f"✅ IA Client configurado: Groq (API compatível) | modelo={IA_MODEL or GROQ_MODEL}")
     except Exception as e:
         print(f"⚠️  Erro ao configurar Groq: {e}")
 
-if not ia_client and OPENAI_API_KEY:
+if OPENAI_API_KEY:
     try:
         import httpx
         http_client = httpx.Client(timeout=60.0)
-        ia_client = OpenAI(
-            api_key=OPENAI_API_KEY,
-            http_client=http_client
-        )
-        ia_provider = 'openai'
-        print(f"✅ IA Client configurado: OpenAI | modelo={IA_MODEL or OPENAI_MODEL}")
+        openai_model = OPENAI_MODEL if llm_gateway.is_configured() else (IA_MODEL or OPENAI_MODEL)
+        llm_gateway.add_provider(LLMProvider(
+            'openai',
+            OpenAI(
+                api_key=OPENAI_API_KEY,
+                http_client=http_client
+            ),
+            openai_model,
+            requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+        ))
+        papel = 'failover' if len(llm_gateway.providers) > 1 else 'principal'
+        print(f"✅ IA Client configurado: OpenAI ({papel}) | modelo={openai_model}")
     except Exception as e:
         print(f"⚠️  Erro ao configurar OpenAI: {e}")
 
+# Cliente/provider principal (mantidos para compatibilidade; chamadas passam pelo llm_gateway)
+ia_client = llm_gateway.primary.client if llm_gateway.primary else None
+ia_provider = llm_gateway.primary.name if llm_gateway.primary else None
+
 if not ia_client:
     print("⚠️  Nenhum cliente de IA configurado. Configure GROQ_API_KEY ou OPENAI_API_KEY no .env")
     print("   💡 Recomendamos Groq (gratuito): https://console.groq.com")
@@ -368,6 +435,438 @@ def upsert_global_config(db, chave: str, valor: str, descricao: Optional[str] =
             (chave, valor, descricao_final, updated_by)
         )
 
+
+def phone_without_ddi(digits: str) -> str:
+    """Remove o DDI 55 de um telefone ja normalizado (chave telefone_local)."""
+    if digits.startswith('55') and len(digits) > 11:
+        return digits[2:]
+    return digits
+
+
+def phone_index_values(phone: Any) -> tuple:
+    """Valores de telefone_digits/telefone_local a gravar junto com o telefone."""
+    digits = re.sub(r'\D', '', str(phone or ''))
+    if not digits:
+        return None, None
+    return digits, phone_without_ddi(digits)
+
+
+def backfill_phone_index_columns(db, only_missing: bool = True) -> int:
+    """Preenche telefone_digits/telefone_local em clientes e users.
+
+    Com only_missing=False recalcula todas as linhas (ex.: apos restaurar backup,
+    quando o telefone pode ter vindo sem as colunas derivadas).
+    """
+    total = 0
+    for table in ('clientes', 'users'):
+        query = f'SELECT id, telefone FROM {table}'
+        if only_missing:
+            query += " WHERE telefone IS NOT NULL AND TRIM(telefone) != '' AND telefone_digits IS NULL"
+        rows = db.execute(query).fetchall()
+        updates = [(*phone_index_values(row['telefone']), row['id']) for row in rows]
+        if updates:
+            db.executemany(
+                f'UPDATE {table} SET telefone_digits = ?, telefone_local = ? WHERE id = ?',
+                updates,
+            )
+            total += len(updates)
+    return total
+
+
+# Blobs endereçados por conteúdo + uso de armazenamento por workspace
+armazenamento = ArmazenamentoConteudo(lambda: app.config['UPLOAD_FOLDER'])
+
+
+def _caminho_upload_interno(file_url: Optional[str]) -> Optional[str]:
+    """Caminho absoluto de uma URL /uploads/... (None se externa ou fora da pasta)."""
+    value = str(file_url or '').strip()
+    if not value.startswith('/uploads/'):
+        return None
+    rel_path = value[len('/uploads/'):].lstrip('/')
+    if not rel_path:
+        return None
+    uploads_root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    target = os.path.abspath(os.path.join(uploads_root, rel_path))
+    if not target.startswith(uploads_root + os.sep):
+        return None
+    return target
+
+
+def backfill_armazenamento_uso(db) -> int:
+    """Calcula o uso inicial por workspace (documentos, templates, logos e avatares)."""
+    uso: Dict[int, List[int]] = {}
+
+    def _somar(workspace_id, tamanho):
+        if workspace_id:
+            total = uso.setdefault(int(workspace_id), [0, 0])
+            total[0] += int(tamanho or 0)
+            total[1] += 1
+
+    def _tamanho(caminho):
+        try:
+            return os.path.getsize(caminho) if caminho else None
+        except OSError:
+            return None
+
+    for row in db.execute('SELECT workspace_id, file_size FROM documentos'):
+        _somar(row['workspace_id'], row['file_size'])
+    for row in db.execute("SELECT workspace_id, caminho_arquivo FROM templates_documentos WHERE tipo_arquivo = 'docx'"):
+        tamanho = _tamanho(row['caminho_arquivo'])
+        if tamanho is not None:
+            _somar(row['workspace_id'], tamanho)
+    for row in db.execute('SELECT id, logo_url, assinatura_imagem_url FROM workspaces'):
+        for url in (row['logo_url'], row['assinatura_imagem_url']):
+            tamanho = _tamanho(_caminho_upload_interno(url))
+            if tamanho is not None:
+                _somar(row['id'], tamanho)
+    for row in db.execute('SELECT workspace_id, avatar_url FROM users'):
+        tamanho = _tamanho(_caminho_upload_interno(row['avatar_url']))
+        if tamanho is not None:
+            _somar(row['workspace_id'], tamanho)
+
+    db.executemany(
+        'INSERT OR REPLACE INTO armazenamento_uso (workspace_id, bytes, arquivos) VALUES (?, ?, ?)',
+        [(workspace_id, total[0], total[1]) for workspace_id, total in uso.items()],
+    )
+    return len(uso)
+
+
+# ============================================================================
+# ÍNDICE DE BUSCA TEXTUAL (FTS5)
+# ============================================================================
+# Índice FTS5 com tokenizer trigram sobre processos, clientes e movimentações.
+# O texto é gravado sem acentos e em minúsculas, então "joao" encontra "João"
+# e buscas por trecho ("1234-56") funcionam como o LIKE '%...%' de antes.
+# Triggers SQL enfileiram as linhas alteradas em busca_index_pendentes; cada
+# busca aplica um lote da fila e um job do agendador drena o resto (carga
+# inicial, worker DataJud, restauração de backup). Linhas ainda na fila são
+# conferidas uma a uma contra o texto atual, com a mesma normalização; só uma
+# fila maior que um lote (carga inicial, restauração) devolve a busca ao LIKE.
+
+BUSCA_INDEX_MAX_SYNC_BATCH = int(os.getenv('BUSCA_INDEX_MAX_SYNC_BATCH', '2000'))
+BUSCA_INDEX_FUZZY_MIN_SCORE = float(os.getenv('BUSCA_INDEX_FUZZY_MIN_SCORE', '0.5'))
+
+# Código da entidade compõe o rowid do índice: codigo * 10^12 + id
+BUSCA_INDEX_ENTIDADES = {'processo': 1, 'cliente': 2, 'movimentacao': 3}
+_BUSCA_INDEX_ROWID_BASE = 10 ** 12
+_busca_index_disponivel: Optional[bool] = None
+
+
+def normalizar_texto_busca(valor: Any) -> str:
+    """Remove acentos, baixa a caixa e colapsa espaços."""
+    texto = unicodedata.normalize('NFKD', str(valor or ''))
+    texto = ''.join(ch for ch in texto if not unicodedata.combining(ch))
+    return re.sub(r'\s+', ' ', texto.lower()).strip()
+
+
+def _trigramas_busca(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _texto_indexavel(*partes: Any) -> str:
+    valores = []
+    for parte in partes:
+        normalizado = normalizar_texto_busca(parte)
+        if not normalizado:
+            continue
+        valores.append(normalizado)
+        digitos = re.sub(r'\D', '', normalizado)
+        # Números de processo, CPF e telefone também entram só com dígitos
+        if len(digitos) >= 6 and digitos != normalizado:
+            valores.append(digitos)
+    return ' | '.join(valores)
+
+
+def _carregar_textos_indice(db, entidade: str, ids: List[int]) -> Dict[int, tuple]:
+    """Retorna {id: (workspace_id, texto)} das linhas ainda existentes."""
+    marcadores = ', '.join('?' for _ in ids)
+    if entidade == 'processo':
+        rows = db.execute(
+            f'''SELECT p.id, p.workspace_id, p.numero, p.numero_cnj, p.titulo, p.descricao,
+                       p.tipo, p.comarca, p.vara, c.nome as cliente_nome
+                FROM processos p
+                LEFT JOIN clientes c ON c.id = p.cliente_id AND c.workspace_id = p.workspace_id
+                WHERE p.id IN ({marcadores})''',
+            ids,
+        ).fetchall()
+        return {
+            row['id']: (row['workspace_id'], _texto_indexavel(
+                row['numero'], row['numero_cnj'], row['titulo'], row['cliente_nome'],
+                row['tipo'], row['comarca'], row['vara'], (row['descricao'] or '')[:2000],
+            ))
+            for row in rows
+        }
+    if entidade == 'cliente':
+        rows = db.execute(
+            f'''SELECT id, workspace_id, nome, email, cpf_cnpj, telefone
+                FROM clientes WHERE id IN ({marcadores})''',
+            ids,
+        ).fetchall()
+        return {
+            row['id']: (row['workspace_id'], _texto_indexavel(
+                row['nome'], row['email'], row['cpf_cnpj'], row['telefone'],
+            ))
+            for row in rows
+        }
+    rows = db.execute(
+        f'''SELECT id, workspace_id, nome_movimento, complementos, orgao_julgador
+            FROM movimentacoes_processo WHERE id IN ({marcadores})''',
+        ids,
+    ).fetchall()
+    return {
+        row['id']: (row['workspace_id'], _texto_indexavel(
+            row['nome_movimento'], row['complementos'], row['orgao_julgador'],
+        ))
+        for row in rows
+    }
+
+
+def criar_indice_busca(db) -> bool:
+    """Cria tabela FTS5, fila de pendências e triggers (idempotente).
+
+    Retorna False quando o SQLite não tem FTS5/trigram; nesse caso as buscas
+    continuam no LIKE.
+    """
+    global _busca_index_disponivel
+    try:
+        existia = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'busca_index'"
+        ).fetchone() is not None
+        db.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS busca_index USING fts5(
+                workspace_id UNINDEXED,
+                entidade UNINDEXED,
+                entidade_id UNINDEXED,
+                texto,
+                tokenize = 'trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Índice de busca FTS5 indisponível, usando LIKE: {e}")
+        _busca_index_disponivel = False
+        return False
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS busca_index_pendentes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entidade TEXT NOT NULL,
+            entidade_id INTEGER NOT NULL
+        )
+    ''')
+
+    gatilhos = {
+        'processos': ('processo', 'numero, numero_cnj, titulo, descricao, tipo, comarca, vara, cliente_id'),
+        'clientes': ('cliente', 'nome, email, cpf_cnpj, telefone'),
+        'movimentacoes_processo': ('movimentacao', 'nome_movimento, complementos, orgao_julgador'),
+    }
+    for tabela, (entidade, colunas) in gatilhos.items():
+        for evento, ref in (('INSERT', 'NEW'), (f'UPDATE OF {colunas}', 'NEW'), ('DELETE', 'OLD')):
+            sufixo = evento.split()[0].lower()
+            extra = ''
+            if tabela == 'clientes' and sufixo == 'update':
+                # Processos indexam o nome do cliente
+                extra = (
+                    "INSERT INTO busca_index_pendentes (entidade, entidade_id) "
+                    "SELECT 'processo', id FROM processos WHERE cliente_id = NEW.id;"
+                )
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_busca_{tabela}_{sufixo}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    INSERT INTO busca_index_pendentes (entidade, entidade_id) VALUES ('{entidade}', {ref}.id);
+                    {extra}
+                END
+            ''')
+
+    if not existia:
+        # Primeira criação: enfileira tudo; a carga fica com o job do agendador
+        db.execute(
+            '''INSERT INTO busca_index_pendentes (entidade, entidade_id)
+               SELECT 'processo', id FROM processos
+               UNION ALL SELECT 'cliente', id FROM clientes
+               UNION ALL SELECT 'movimentacao', id FROM movimentacoes_processo'''
+        )
+    _busca_index_disponivel = True
+    return True
+
+
+def indice_busca_disponivel(db) -> bool:
+    global _busca_index_disponivel
+    if _busca_index_disponivel is None:
+        _busca_index_disponivel = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'busca_index'"
+        ).fetchone() is not None
+    return _busca_index_disponivel
+
+
+def sincronizar_indice_busca(db, max_itens: Optional[int] = None, drenar: bool = False) -> int:
+    """Aplica as pendências enfileiradas pelos triggers. Retorna itens aplicados.
+
+    Aplica um lote de até `max_itens`; com drenar=True (job do agendador)
+    repete até esvaziar a fila. Não roda dentro de uma transação aberta pelo
+    chamador, para não commitar (ou desfazer) escritas alheias.
+    """
+    if not indice_busca_disponivel(db) or db.in_transaction:
+        return 0
+    max_itens = max_itens or BUSCA_INDEX_MAX_SYNC_BATCH
+    total = 0
+    try:
+        while True:
+            rows = db.execute(
+                'SELECT seq, entidade, entidade_id FROM busca_index_pendentes ORDER BY seq LIMIT ?',
+                (max_itens,),
+            ).fetchall()
+            if not rows:
+                break
+            ultimo_seq = rows[-1]['seq']
+            por_entidade: Dict[str, set] = {}
+            for row in rows:
+                por_entidade.setdefault(row['entidade'], set()).add(row['entidade_id'])
+
+            for entidade, ids_set in por_entidade.items():
+                codigo = BUSCA_INDEX_ENTIDADES.get(entidade)
+                if not codigo:
+                    continue
+                ids = sorted(ids_set)
+                textos = _carregar_textos_indice(db, entidade, ids)
+                db.executemany(
+                    'DELETE FROM busca_index WHERE rowid = ?',
+                    [(codigo * _BUSCA_INDEX_ROWID_BASE + entidade_id,) for entidade_id in ids],
+                )
+                db.executemany(
+                    '''INSERT INTO busca_index (rowid, workspace_id, entidade, entidade_id, texto)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    [
+                        (codigo * _BUSCA_INDEX_ROWID_BASE + entidade_id, workspace_id, entidade, entidade_id, texto)
+                        for entidade_id, (workspace_id, texto) in textos.items()
+                    ],
+                )
+            # Pendências com seq maior chegaram depois da leitura e ficam para a próxima
+            db.execute('DELETE FROM busca_index_pendentes WHERE seq <= ?', (ultimo_seq,))
+            db.commit()
+            total += len(rows)
+            if not drenar or len(rows) < max_itens:
+                break
+    except sqlite3.OperationalError as e:
+        # Conexões somente leitura (ferramentas paralelas do copiloto) buscam no
+        # índice como está; a próxima conexão de escrita aplica a fila.
+        db.rollback()
+        if 'readonly' not in str(e).lower() and 'locked' not in str(e).lower():
+            raise
+    return total
+
+
+def reconstruir_indice_busca(db) -> int:
+    """Descarta o índice e reenfileira todas as linhas (ex.: após restaurar backup).
+
+    Não commita: a carga acontece na próxima busca, fora da transação do chamador.
+    """
+    if not indice_busca_disponivel(db):
+        return 0
+    db.execute('DELETE FROM busca_index')
+    db.execute('DELETE FROM busca_index_pendentes')
+    return db.execute(
+        '''INSERT INTO busca_index_pendentes (entidade, entidade_id)
+           SELECT 'processo', id FROM processos
+           UNION ALL SELECT 'cliente', id FROM clientes
+           UNION ALL SELECT 'movimentacao', id FROM movimentacoes_processo'''
+    ).rowcount
+
+
+def _fts_frase(texto: str) -> str:
+    return '"' + texto.replace('"', '""') + '"'
+
+
+def _buscar_pendentes(db, workspace_id: int, entidade: str) -> Optional[tuple]:
+    """Confere as linhas da fila contra o texto atual (a versão do índice pode estar velha).
+
+    Retorna (ids pendentes, [(id, texto)] das que ainda existem no workspace)
+    ou None quando a fila da entidade passa de um lote.
+    """
+    pendentes = [
+        row['entidade_id'] for row in db.execute(
+            'SELECT DISTINCT entidade_id FROM busca_index_pendentes WHERE entidade = ? LIMIT ?',
+            (entidade, BUSCA_INDEX_MAX_SYNC_BATCH + 1),
+        )
+    ]
+    if len(pendentes) > BUSCA_INDEX_MAX_SYNC_BATCH:
+        return None
+    textos = _carregar_textos_indice(db, entidade, pendentes) if pendentes else {}
+    atuais = [
+        (entidade_id, texto) for entidade_id, (ws_id, texto) in textos.items()
+        if ws_id == workspace_id
+    ]
+    return set(pendentes), atuais
+
+
+def buscar_indice(
+    db,
+    workspace_id: int,
+    termo: str,
+    entidade: str,
+    limite: Optional[int] = 50,
+    aproximada: bool = True,
+) -> Optional[List[int]]:
+    """Busca ids de uma entidade no índice, do mais ao menos relevante.
+
+    Todas as palavras com 3+ caracteres precisam aparecer (como trecho), sem
+    acentos e sem diferença de caixa. Sem resultados e com aproximada=True,
+    tenta a busca tolerante a erros de digitação por sobreposição de
+    trigramas. Retorna None quando o índice não se aplica (indisponível, termo
+    curto demais ou fila grande demais) e o chamador deve usar LIKE.
+    limite=None devolve todos os ids.
+    """
+    if not indice_busca_disponivel(db):
+        return None
+    normalizado = normalizar_texto_busca(termo)
+    palavras = [p for p in normalizado.split(' ') if len(p) >= 3]
+    if not palavras:
+        return None
+
+    sincronizar_indice_busca(db)
+    consulta = ' '.join(palavras)
+    trigramas = _trigramas_busca(consulta)
+    fila = _buscar_pendentes(db, workspace_id, entidade)
+    if fila is None:
+        return None
+    pendentes, atuais = fila
+    limite = None if limite is None else max(1, int(limite))
+    rows = db.execute(
+        '''SELECT entidade_id FROM busca_index
+           WHERE busca_index MATCH ? AND workspace_id = ? AND entidade = ?
+           ORDER BY bm25(busca_index)
+           LIMIT ?''',
+        (' AND '.join(_fts_frase(p) for p in palavras), workspace_id, entidade,
+         -1 if limite is None else limite + len(pendentes)),
+    ).fetchall()
+    encontrados = [row['entidade_id'] for row in rows if row['entidade_id'] not in pendentes]
+    encontrados += [
+        entidade_id for entidade_id, texto in atuais
+        if all(palavra in texto for palavra in palavras)
+    ]
+    if encontrados or not aproximada:
+        return encontrados[:limite]
+
+    if len(trigramas) < 2:
+        return []
+    candidatos = [
+        (row['entidade_id'], row['texto']) for row in db.execute(
+            '''SELECT entidade_id, texto FROM busca_index
+               WHERE busca_index MATCH ? AND workspace_id = ? AND entidade = ?
+               ORDER BY bm25(busca_index)
+               LIMIT 200''',
+            (' OR '.join(_fts_frase(t) for t in sorted(trigramas)), workspace_id, entidade),
+        )
+        if row['entidade_id'] not in pendentes
+    ] + atuais
+    pontuados = []
+    for entidade_id, texto in candidatos:
+        score = len(trigramas & _trigramas_busca(texto)) / len(trigramas)
+        if score >= BUSCA_INDEX_FUZZY_MIN_SCORE:
+            pontuados.append((score, entidade_id))
+    pontuados.sort(key=lambda item: -item[0])
+    return [entidade_id for _, entidade_id in pontuados][:limite]
+
 # Configura o serviço de email com acesso ao banco
 if EMAIL_SERVICE_DISPONIVEL:
     notificador_email.get_db = get_db
@@ -406,6 +905,8 @@ def init_db():
             password_hash TEXT NOT NULL,
             role TEXT DEFAULT 'user',
             telefone TEXT,
+            telefone_digits TEXT,  -- Telefone só com dígitos (matching WhatsApp)
+            telefone_local TEXT,   -- Telefone sem DDI 55 (chave indexada)
             oab TEXT,
             avatar_url TEXT,
             alerta_email BOOLEAN DEFAULT 1,
@@ -471,6 +972,8 @@ def init_db():
             nome TEXT NOT NULL,
             email TEXT,
             telefone TEXT,
+            telefone_digits TEXT,  -- Telefone só com dígitos (matching WhatsApp)
+            telefone_local TEXT,   -- Telefone sem DDI 55 (chave indexada)
             cpf_cnpj TEXT,
             rg_ie TEXT,
             data_nascimento TEXT,
@@ -757,6 +1260,23 @@ def init_db():
         )
     ''')
 
+    # Resumo rolante das sessoes do Copiloto (mensagens antigas compactadas)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS chat_session_summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            workspace_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            session_id TEXT NOT NULL,
+            summary TEXT NOT NULL DEFAULT '',
+            summarized_until_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (workspace_id, user_id, session_id)
+        )
+    ''')
+    db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_chat_history_sessao ON chat_history (workspace_id, user_id, session_id, id)'
+    )
+
     # Auditoria de interacoes da IA (qualidade, latencia e erros)
     db.execute('''
         CREATE TABLE IF NOT EXISTS ia_interaction_logs (
@@ -769,7 +1289,7 @@ def init_db():
             input_message TEXT,
             response_text TEXT,
             function_calls TEXT, -- JSON array: nome, args, duration_ms, erro
-            status TEXT NOT NULL, -- success | error | quota | fallback
+            status TEXT NOT NULL, -- success | error | quota | fallback | cancelled
             error_message TEXT,
             total_duration_ms INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -1074,6 +1594,7 @@ def init_db():
             message_text TEXT,
             provider_message_id TEXT,
             status TEXT,
+            conversation_seq INTEGER, -- ordem de chegada dentro da conversa (inbound)
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (workspace_id) REFERENCES workspaces (id),
             FOREIGN KEY (client_id) REFERENCES clientes (id),
@@ -1099,6 +1620,7 @@ def init_db():
             last_message_at TIMESTAMP,
             resolved_at TIMESTAMP,
             assigned_user_id INTEGER,
+            last_inbound_seq INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             UNIQUE(workspace_id, phone),
@@ -1249,6 +1771,50 @@ def init_db():
     except:
         db.execute('ALTER TABLE workspace_whatsapp_config ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
 
+    # Migration: telefone normalizado e indexado para matching de WhatsApp
+    for table in ('clientes', 'users'):
+        for column in ('telefone_digits', 'telefone_local'):
+            try:
+                db.execute(f'SELECT {column} FROM {table} LIMIT 1')
+            except sqlite3.OperationalError:
+                db.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+    db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_clientes_workspace_telefone_local '
+        'ON clientes (workspace_id, telefone_local)'
+    )
+    db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_users_workspace_telefone_local '
+        'ON users (workspace_id, telefone_local)'
+    )
+    backfill_phone_index_columns(db)
+
+    # Índice de busca textual (FTS5 trigram) com fila alimentada por triggers
+    criar_indice_busca(db)
+
+    # Índices compostos das listagens paginadas por cursor (admin/auditoria)
+    criar_indices_paginacao(db)
+
+    # Auditoria: linhas antigas saem de audit_logs para o arquivo
+    criar_tabela_arquivo_auditoria(db)
+
+    # Métricas materializadas do Super Admin: na criação, histórico de cadastros
+    if criar_tabelas_metricas(db):
+        preencher_historico_metricas(db)
+
+    # Armazenamento endereçado por conteúdo: na criação, calcula o uso atual
+    if criar_tabelas_armazenamento(db):
+        backfill_armazenamento_uso(db)
+
+    # Migration: sequência por conversa para ingestão em lote do webhook WhatsApp
+    try:
+        db.execute('SELECT conversation_seq FROM whatsapp_message_log LIMIT 1')
+    except sqlite3.OperationalError:
+        db.execute('ALTER TABLE whatsapp_message_log ADD COLUMN conversation_seq INTEGER')
+    try:
+        db.execute('SELECT last_inbound_seq FROM whatsapp_inbox_conversations LIMIT 1')
+    except sqlite3.OperationalError:
+        db.execute('ALTER TABLE whatsapp_inbox_conversations ADD COLUMN last_inbound_seq INTEGER DEFAULT 0')
+
     db.commit()
 
 # Initialize database on startup
@@ -1658,32 +2224,40 @@ def require_recurso(recurso: str):
     return decorator
 
 
+AUDIT_LOG_MODO = os.getenv('AUDIT_LOG_MODO', 'assincrono')
+AUDIT_LOG_LOTE = int(os.getenv('AUDIT_LOG_LOTE', '200'))
+AUDIT_LOG_INTERVALO_SEGUNDOS = float(os.getenv('AUDIT_LOG_INTERVALO_SEGUNDOS', '2'))
+AUDIT_LOG_MAX_BUFFER = int(os.getenv('AUDIT_LOG_MAX_BUFFER', '10000'))
+AUDIT_LOG_ACOES_DURAVEIS = os.getenv('AUDIT_LOG_ACOES_DURAVEIS', 'impersonate,reset_senha,excluir,backup_restaurar').split(',')
+AUDIT_LOG_RETENCAO_DIAS = int(os.getenv('AUDIT_LOG_RETENCAO_DIAS', '90'))
+
+auditoria = AuditoriaAssincrona(
+    lambda: app.config['DATABASE'],
+    lote=AUDIT_LOG_LOTE,
+    intervalo_segundos=AUDIT_LOG_INTERVALO_SEGUNDOS,
+    max_buffer=AUDIT_LOG_MAX_BUFFER,
+    modo=AUDIT_LOG_MODO,
+    acoes_duraveis=AUDIT_LOG_ACOES_DURAVEIS,
+)
+atexit.register(auditoria.parar)
+
+
 def registrar_audit_log(acao, entidade, entidade_id=None, dados_anteriores=None, dados_novos=None):
-    """Registra uma ação no log de auditoria."""
+    """Registra uma ação no log de auditoria (em lote; ações duráveis gravam na hora)."""
     try:
-        db = get_db()
-        user_id = g.auth.get('user_id') if hasattr(g, 'auth') else None
-        user_nome = g.auth.get('user', {}).get('nome') if hasattr(g, 'auth') else None
-        user_email = g.auth.get('user', {}).get('email') if hasattr(g, 'auth') else None
-        
-        db.execute('''
-            INSERT INTO audit_logs 
-            (user_id, user_nome, user_email, acao, entidade, entidade_id, 
-             dados_anteriores, dados_novos, ip_address, user_agent)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            user_nome,
-            user_email,
-            acao,
-            entidade,
-            entidade_id,
-            json.dumps(dados_anteriores) if dados_anteriores else None,
-            json.dumps(dados_novos) if dados_novos else None,
-            request.remote_addr,
-            request.headers.get('User-Agent')
-        ))
-        db.commit()
+        auth = getattr(g, 'auth', None) or {}
+        auditoria.registrar({
+            'user_id': auth.get('user_id'),
+            'user_nome': auth.get('user', {}).get('nome'),
+            'user_email': auth.get('user', {}).get('email'),
+            'acao': acao,
+            'entidade': entidade,
+            'entidade_id': entidade_id,
+            'dados_anteriores': json.dumps(dados_anteriores) if dados_anteriores else None,
+            'dados_novos': json.dumps(dados_novos) if dados_novos else None,
+            'ip_address': request.remote_addr,
+            'user_agent': request.headers.get('User-Agent'),
+        }, conexao=get_db() if auditoria.duravel(acao) else None)
     except Exception as e:
         print(f"Erro ao registrar audit log: {e}")
 
@@ -3408,15 +3982,21 @@ class DatajudMonitor:
         }
     
     @classmethod
-    def salvar_movimentacoes(cls, processo_id: int, workspace_id: int, movimentos: List[Dict]) -> Dict[str, Any]:
+    def salvar_movimentacoes(cls, processo_id: int, workspace_id: int, movimentos: List[Dict],
+                             numero_processo: Optional[str] = None) -> Dict[str, Any]:
         """
         Salva movimentações no banco de dados
         Usa INSERT IGNORE para evitar duplicatas (chave única: processo_id + codigo + data)
         
+        Os alertas das movimentações novas são gravados no mesmo commit: uma
+        falha depois dele não deixa movimentação já vista sem alerta. Email e
+        WhatsApp ficam com criar_alertas_movimentacao.
+        
         Args:
             processo_id: ID do processo no banco
             workspace_id: ID do workspace
             movimentos: Lista de movimentações da API Datajud
+            numero_processo: Número para o título do alerta (buscado se omitido)
             
         Returns:
             Dict com estatísticas de inserção
@@ -3497,6 +4077,13 @@ class DatajudMonitor:
                     print(f"Erro ao inserir movimentação {codigo}: {e}")
                     continue
             
+            if novas_movimentacoes:
+                if numero_processo is None:
+                    row = db.execute('SELECT numero FROM processos WHERE id = ?', (processo_id,)).fetchone()
+                    numero_processo = (row['numero'] if row else '') or ''
+                cls.inserir_alertas_movimentacao(
+                    db, workspace_id, processo_id, numero_processo, novas_movimentacoes
+                )
             db.commit()
             
             return {
@@ -3515,92 +4102,64 @@ class DatajudMonitor:
                 'duplicadas': duplicadas
             }
     
+    @staticmethod
+    def inserir_alertas_movimentacao(db, workspace_id: int, processo_id: int, numero_processo: str,
+                                     movimentacoes: List[Dict]) -> int:
+        """Grava os alertas das movimentações sem commitar (vale a transação do chamador)."""
+        agora = datetime.now()
+        db.executemany('''
+            INSERT INTO alertas_notificacoes 
+            (workspace_id, processo_id, tipo, titulo, mensagem, lido, data_criacao)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                workspace_id,
+                processo_id,
+                'movimentacao',
+                f"Nova movimentação - {numero_processo[-9:]}",  # Últimos 9 dígitos
+                f"{mov['nome']}\nData: {mov['data']}",
+                False,
+                agora,
+            )
+            for mov in movimentacoes
+        ])
+        return len(movimentacoes)
+
     @classmethod
     def criar_alertas_movimentacao(cls, processo_id: int, workspace_id: int, 
-                                    movimentacoes: List[Dict], numero_processo: str) -> int:
+                                    movimentacoes: List[Dict], numero_processo: str,
+                                    digest: Optional['MovimentacaoDigest'] = None) -> int:
         """
-        Cria alertas/notificações para novas movimentações
+        Entrega as notificações (email/WhatsApp) de novas movimentações
+        
+        Os alertas já foram gravados por salvar_movimentacoes, junto das
+        movimentações.
         
         Args:
             processo_id: ID do processo
             workspace_id: ID do workspace
             movimentacoes: Lista de novas movimentações
             numero_processo: Número do processo para exibir na notificação
+            digest: Agregador da execução atual; quando informado, email e
+                WhatsApp são entregues em lote no flush do digest
             
         Returns:
-            Número de alertas criados
+            Número de alertas notificados (ou pendentes no digest)
         """
-        db = get_db()
-        alertas_criados = 0
-        
-        try:
-            for mov in movimentacoes:
-                # Cria título e mensagem do alerta
-                titulo = f"Nova movimentação - {numero_processo[-9:]}"  # Últimos 9 dígitos
-                mensagem = f"{mov['nome']}\nData: {mov['data']}"
-                
-                db.execute('''
-                    INSERT INTO alertas_notificacoes 
-                    (workspace_id, processo_id, tipo, titulo, mensagem, lido, data_criacao)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (workspace_id, processo_id, 'movimentacao', titulo, mensagem, 
-                      False, datetime.now()))
-                
-                alertas_criados += 1
-            
-            db.commit()
-            
-            # ============================================================================
-            # ENVIO DE EMAIL PARA MOVIMENTAÇÕES
-            # ============================================================================
-            if (
-                EMAIL_NOTIFICATIONS_ENABLED
-                and EMAIL_SERVICE_DISPONIVEL
-                and email_service.is_configured()
-                and alertas_criados > 0
-            ):
-                try:
-                    # Envia email de notificação
-                    resultado_email = notificador_email.notificar_nova_movimentacao(
-                        workspace_id=workspace_id,
-                        processo_id=processo_id,
-                        numero_processo=numero_processo,
-                        descricao=f"{len(movimentacoes)} nova(s) movimentação(ões) detectada(s)",
-                        data_movimento=movimentacoes[0]['data'] if movimentacoes else None
-                    )
-                    
-                    if resultado_email.get('success'):
-                        print(f"📧 Email de movimentação enviado para {resultado_email.get('success_count', 0)} usuário(s)")
-                    else:
-                        print(f"⚠️  Erro ao enviar email de movimentação: {resultado_email.get('error')}")
-                except Exception as e:
-                    print(f"⚠️  Erro ao enviar notificação por email: {e}")
+        if digest is not None:
+            return digest.adicionar(workspace_id, processo_id, numero_processo, movimentacoes)
 
-            # ============================================================================
-            # ENVIO AUTOMÁTICO WHATSAPP PARA MOVIMENTAÇÕES
-            # ============================================================================
-            try:
-                if alertas_criados > 0:
-                    resultado_whatsapp = trigger_whatsapp_on_new_movements(
-                        workspace_id=workspace_id,
-                        processo_id=processo_id,
-                        numero_processo=numero_processo,
-                        movimentacoes=movimentacoes,
-                    )
-                    if resultado_whatsapp.get('success'):
-                        print(
-                            f"📱 WhatsApp de movimentações enviado: "
-                            f"{resultado_whatsapp.get('enviados', 0)} enviado(s)"
-                        )
-            except Exception as e:
-                print(f"⚠️  Erro ao enviar automação WhatsApp de movimentações: {e}")
-            
-            return alertas_criados
-            
-        except Exception as e:
-            db.rollback()
-            print(f"Erro ao criar alertas: {e}")
-            return 0
+        if NOTIFICATION_DIGEST_WINDOW_SECONDS > 0:
+            pendentes = movimentacao_digest_janela.adicionar(
+                workspace_id, processo_id, numero_processo, movimentacoes
+            )
+            movimentacao_digest_janela.agendar_flush()
+            return pendentes
+
+        digest_imediato = MovimentacaoDigest()
+        digest_imediato.adicionar(workspace_id, processo_id, numero_processo, movimentacoes)
+        resultado = digest_imediato.flush().get(workspace_id) or {}
+        return int(resultado.get('alertas') or 0)
 
 
 # ============================================================================
@@ -3675,6 +4234,10 @@ class AssistenteIA:
                         "type": "string",
                         "description": "Filtrar por número do processo (opcional)"
                     },
+                    "termo": {
+                        "type": "string",
+                        "description": "Texto a procurar no nome, complementos ou órgão da movimentação (opcional)"
+                    },
                     "dias": {
                         "type": "integer",
                         "description": "Filtrar movimentações dos últimos N dias (opcional)"
@@ -3920,6 +4483,42 @@ class AssistenteIA:
             }
         }
     ]
+
+    SYSTEM_PROMPT = """Você é o Copiloto Jurídico do JurisGestão, um assistente de IA especializado em gestão de escritórios de advocacia.
+
+SUA IDENTIDADE:
+- Nome: Copiloto Jurídico
+- Especialidade: Gestão jurídica e organização de escritórios de advocacia
+- Tom: Profissional, prestativo, claro e direto
+
+O QUE VOCÊ PODE FAZER:
+- Buscar e consultar processos com detalhes completos
+- Localizar informações de clientes
+- Verificar prazos processuais pendentes
+- Listar tarefas e afazeres do escritório
+- Analisar o financeiro (entradas, saídas, balanço)
+- Responder dúvidas sobre movimentações processuais
+- Sugerir organização da agenda e prioridades
+
+COMO RESPONDER:
+- Seja sempre cordial e profissional
+- Use formatacao clara quando apropriado
+- Entenda primeiro a intencao principal do usuario e responda exatamente ao que ele pediu
+- Seja compreensivo e direto: menos genericidade e mais orientacao pratica
+- Se faltar dado para concluir, faca apenas 1 pergunta objetiva para destravar
+- Quando nao souber algo, seja honesto e sugira alternativas
+- Mantenha respostas concisas mas completas
+- Sempre responda em portugues do Brasil
+- Nao invente dados de cliente, processo, prazo ou movimentacao
+- Sempre que o usuario pedir para executar uma acao real (criar prazo, criar tarefa, lancar financeiro, enviar WhatsApp), use primeiro uma funcao `solicitar_*` para preparar a acao com confirmacao explicita.
+- Quando o usuario pedir para criar prazo, use `solicitar_criacao_prazo` (nao transforme prazo em tarefa).
+- Quando o usuario pedir listagem de processos ativos/arquivados, use `listar_processos` com o status correspondente e responda apenas com o retorno da funcao.
+- Nunca execute acao operacional sem confirmacao textual do usuario.
+
+Use as funcoes disponiveis para buscar informacoes em tempo real quando necessario."""
+
+    # Mesmo catálogo no formato da API de tools (permite chamadas paralelas)
+    TOOLS = [{'type': 'function', 'function': funcao} for funcao in FUNCTIONS]
     
     @staticmethod
     def get_modelo() -> str:
@@ -4212,6 +4811,18 @@ class AssistenteIA:
 
         titulo = str(titulo or '').strip()
         if titulo:
+            ids = buscar_indice(db, workspace_id, titulo, 'processo', limite=1)
+            if ids is not None:
+                if not ids:
+                    return None
+                row = db.execute(
+                    '''SELECT p.*, c.nome as cliente_nome
+                       FROM processos p
+                       LEFT JOIN clientes c ON c.id = p.cliente_id AND c.workspace_id = p.workspace_id
+                       WHERE p.id = ? AND p.workspace_id = ?''',
+                    (ids[0], workspace_id),
+                ).fetchone()
+                return dict(row) if row else None
             row = db.execute(
                 '''SELECT p.*, c.nome as cliente_nome
                    FROM processos p
@@ -4292,6 +4903,16 @@ class AssistenteIA:
             if row:
                 return dict(row)
 
+            ids = buscar_indice(db, workspace_id, nome, 'cliente', limite=1)
+            if ids is not None:
+                if not ids:
+                    return None
+                row = db.execute(
+                    'SELECT id, nome, telefone, email FROM clientes WHERE id = ? AND workspace_id = ?',
+                    (ids[0], workspace_id),
+                ).fetchone()
+                return dict(row) if row else None
+
             row = db.execute(
                 '''SELECT id, nome, telefone, email
                    FROM clientes
@@ -4714,13 +5335,328 @@ class AssistenteIA:
     @staticmethod
     def processar_mensagem(mensagem: str, workspace_id: int, user_id: int, session_id: str) -> Dict[str, Any]:
         """Processa mensagem do usuário usando IA (OpenAI ou Groq)"""
-        global ia_client, ia_provider
+        resultado: Dict[str, Any] = {}
+        for evento in AssistenteIA.processar_mensagem_eventos(
+            mensagem, workspace_id, user_id, session_id, stream=False
+        ):
+            if evento['tipo'] == 'fim':
+                resultado = evento['resultado']
+        return resultado
 
-        started_at = datetime.now()
+    @staticmethod
+    def processar_mensagem_eventos(
+        mensagem: str,
+        workspace_id: int,
+        user_id: int,
+        session_id: str,
+        stream: bool = True,
+    ):
+        """
+        Processa a mensagem emitindo eventos incrementais.
+
+        Eventos: 'inicio' (session_id), 'token' (trecho da resposta), 'funcao'
+        (progresso de cada chamada de função) e 'fim' (mesmo payload de
+        processar_mensagem). Se o consumidor fechar o gerador antes do 'fim'
+        (cliente desconectou), o texto parcial é gravado em chat_history e a
+        interação fica em ia_interaction_logs com status 'cancelled'.
+        """
+        started_at = datetime.now()
         session_id = AssistenteIA.normalizar_session_id_chat(session_id)
+        partes_resposta: List[str] = []
+        rastreio_funcoes: List[Dict[str, Any]] = []
+        concluido = False
+
+        yield {'tipo': 'inicio', 'session_id': session_id}
+        try:
+            for evento in AssistenteIA._gerar_eventos_mensagem(
+                mensagem, workspace_id, user_id, session_id, stream, rastreio_funcoes
+            ):
+                if evento['tipo'] == 'token':
+                    partes_resposta.append(evento['texto'])
+                elif evento['tipo'] == 'fim':
+                    concluido = True
+                yield evento
+        except GeneratorExit:
+            if not concluido:
+                AssistenteIA._registrar_interacao_interrompida(
+                    workspace_id=workspace_id,
+                    user_id=user_id,
+                    session_id=session_id,
+                    mensagem=mensagem,
+                    resposta_parcial=''.join(partes_resposta),
+                    rastreio_funcoes=rastreio_funcoes,
+                    started_at=started_at,
+                )
+            raise
+
+    @staticmethod
+    def _registrar_interacao_interrompida(
+        workspace_id: int,
+        user_id: int,
+        session_id: str,
+        mensagem: str,
+        resposta_parcial: str,
+        rastreio_funcoes: List[Dict[str, Any]],
+        started_at: datetime,
+    ) -> None:
+        """Persiste o que já foi gerado quando o stream é encerrado antes do fim."""
+        try:
+            db = get_db()
+            db.execute(
+                'INSERT INTO chat_history (workspace_id, user_id, session_id, role, content) VALUES (?, ?, ?, ?, ?)',
+                (workspace_id, user_id, session_id, 'user', mensagem),
+            )
+            if resposta_parcial.strip():
+                db.execute(
+                    'INSERT INTO chat_history (workspace_id, user_id, session_id, role, content) VALUES (?, ?, ?, ?, ?)',
+                    (workspace_id, user_id, session_id, 'assistant', resposta_parcial),
+                )
+            AssistenteIA.registrar_log_interacao(
+                db=db,
+                workspace_id=workspace_id,
+                user_id=user_id,
+                session_id=session_id,
+                provider=ia_provider,
+                model=AssistenteIA.get_modelo(),
+                input_message=mensagem,
+                response_text=resposta_parcial,
+                function_calls=rastreio_funcoes,
+                status='cancelled',
+                error_message='Stream encerrado pelo cliente antes da resposta completa',
+                total_duration_ms=int((datetime.now() - started_at).total_seconds() * 1000),
+            )
+            db.commit()
+        except Exception as log_error:
+            print(f"[ia] Falha ao registrar interacao interrompida: {log_error}")
+
+    @staticmethod
+    def _completion_eventos(payload: Dict[str, Any], stream: bool):
+        """
+        Executa a completion; com stream=True repassa cada trecho como evento
+        'token' e remonta content/tool_calls ao final (retorno do gerador).
+        """
+        if not stream:
+            return llm_gateway.chat_completion(**payload).choices[0].message
+
+        conteudo: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        for chunk in llm_gateway.chat_completion(**payload, stream=True):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            for tool_delta in getattr(delta, 'tool_calls', None) or []:
+                indice = getattr(tool_delta, 'index', None)
+                item = tool_calls.setdefault(
+                    len(tool_calls) if indice is None else indice,
+                    {'id': '', 'name': '', 'arguments': []},
+                )
+                item['id'] = getattr(tool_delta, 'id', None) or item['id']
+                function_delta = getattr(tool_delta, 'function', None)
+                if function_delta:
+                    item['name'] += getattr(function_delta, 'name', None) or ''
+                    item['arguments'].append(getattr(function_delta, 'arguments', None) or '')
+            texto = getattr(delta, 'content', None)
+            if texto:
+                conteudo.append(texto)
+                yield {'tipo': 'token', 'texto': texto}
+
+        return SimpleNamespace(
+            content=''.join(conteudo) or None,
+            tool_calls=[
+                SimpleNamespace(
+                    id=item['id'] or f'call_{indice}',
+                    type='function',
+                    function=SimpleNamespace(name=item['name'], arguments=''.join(item['arguments'])),
+                )
+                for indice, item in sorted(tool_calls.items())
+                if item['name']
+            ] or None,
+        )
+
+    @staticmethod
+    def _texto_restante(resposta_final: str, transmitido: str) -> str:
+        """Parte de `resposta_final` que o cliente ainda não recebeu pelo stream.
+
+        O texto transmitido é comparado como saiu; se não bater (a resposta
+        final tem as pontas aparadas), compara os dois aparados do mesmo jeito.
+        """
+        if resposta_final.startswith(transmitido):
+            return resposta_final[len(transmitido):]
+        base_final = resposta_final.lstrip()
+        base_transmitida = transmitido.strip()
+        if base_final.startswith(base_transmitida):
+            return base_final[len(base_transmitida):]
+        return resposta_final
+
+    @staticmethod
+    def _executar_funcao_em_conexao_leitura(
+        nome: str,
+        args: Dict[str, Any],
+        workspace_id: int,
+        user_id: Optional[int],
+        session_id: str,
+    ) -> Dict[str, Any]:
+        """Roda função somente leitura numa thread do pool, com conexão própria."""
+        with app.app_context():
+            db = get_db()
+            db.execute('PRAGMA query_only = ON')
+            return AssistenteIA.executar_funcao(
+                nome, args, workspace_id, user_id=user_id, session_id=session_id, db=db
+            )
+
+    @staticmethod
+    def _executar_chamadas_funcoes(
+        chamadas: List[Dict[str, Any]],
+        workspace_id: int,
+        user_id: int,
+        session_id: str,
+        rastreio_funcoes: List[Dict[str, Any]],
+    ):
+        """
+        Executa as chamadas de função pedidas pelo modelo.
+
+        Com mais de uma chamada, as somente leitura vão para o pool (cada uma na
+        sua conexão) enquanto as de escrita rodam em sequência na conexão da
+        requisição. Emite eventos 'funcao' e retorna os resultados na ordem das
+        chamadas.
+        """
+        lote_started_at = time.perf_counter()
+        paralelo = len(chamadas) > 1
+        resultados: List[Any] = [None] * len(chamadas)
+        futures: Dict[Any, int] = {}
+
+        def _registrar(indice: int, resultado: Any, erro: str, inicio: float, fim: float):
+            chamada = chamadas[indice]
+            resultados[indice] = resultado
+            duration_ms = int((fim - inicio) * 1000)
+            rastreio_funcoes.append({
+                'nome': chamada['nome'],
+                'args': chamada['args'],
+                'duration_ms': duration_ms,
+                'inicio_ms': int((inicio - lote_started_at) * 1000),
+                'paralelo': paralelo and chamada['somente_leitura'],
+                'erro': erro,
+                'result_summary': AssistenteIA.resumir_resultado_funcao(resultado),
+            })
+            return {
+                'tipo': 'funcao',
+                'nome': chamada['nome'],
+                'status': 'erro' if erro else 'concluida',
+                'duration_ms': duration_ms,
+            }
+
+        def _executar_no_pool(indice: int):
+            chamada = chamadas[indice]
+            inicio = time.perf_counter()
+            try:
+                resultado = AssistenteIA._executar_funcao_em_conexao_leitura(
+                    chamada['nome'], chamada['args'], workspace_id, user_id, session_id
+                )
+                erro = ''
+            except Exception as function_error:
+                erro = str(function_error)
+                resultado = {'erro': erro}
+            return resultado, erro, inicio, time.perf_counter()
+
+        for indice, chamada in enumerate(chamadas):
+            yield {'tipo': 'funcao', 'nome': chamada['nome'], 'status': 'iniciada'}
+            if paralelo and chamada['somente_leitura']:
+                futures[assistente_funcoes_pool.submit(_executar_no_pool, indice)] = indice
+
+        for indice, chamada in enumerate(chamadas):
+            if paralelo and chamada['somente_leitura']:
+                continue
+            inicio = time.perf_counter()
+            erro = ''
+            try:
+                resultado = AssistenteIA.executar_funcao(
+                    chamada['nome'],
+                    chamada['args'],
+                    workspace_id,
+                    user_id=user_id,
+                    session_id=session_id,
+                )
+            except Exception as function_error:
+                erro = str(function_error)
+                resultado = {'erro': erro}
+            yield _registrar(indice, resultado, erro, inicio, time.perf_counter())
+
+        for future in as_completed(futures):
+            yield _registrar(futures[future], *future.result())
+
+        return resultados
+
+    @staticmethod
+    def _responder_por_intencao(
+        db,
+        rota: Dict[str, Any],
+        mensagem: str,
+        workspace_id: int,
+        user_id: int,
+        session_id: str,
+        rastreio_funcoes: List[Dict[str, Any]],
+        started_at: datetime,
+    ):
+        """
+        Atende a intenção detectada pelo roteador sem chamar o LLM. Retorna o
+        payload final, ou None se a função falhar (a mensagem segue para o LLM).
+        """
+        chamada = {
+            'nome': rota['funcao'],
+            'args': rota['args'],
+            'somente_leitura': bool((ASSISTENTE_FUNCOES.get(rota['funcao']) or {}).get('somente_leitura')),
+        }
+        resultados = yield from AssistenteIA._executar_chamadas_funcoes(
+            [chamada], workspace_id, user_id, session_id, rastreio_funcoes
+        )
+        resposta = roteador_intencoes.formatar(rota, resultados[0])
+        if resposta is None:
+            return None
+
+        yield {'tipo': 'token', 'texto': resposta}
+        db.execute(
+            'INSERT INTO chat_history (workspace_id, user_id, session_id, role, content) VALUES (?, ?, ?, ?, ?)',
+            (workspace_id, user_id, session_id, 'user', mensagem),
+        )
+        db.execute(
+            'INSERT INTO chat_history (workspace_id, user_id, session_id, role, content) VALUES (?, ?, ?, ?, ?)',
+            (workspace_id, user_id, session_id, 'assistant', resposta),
+        )
+        AssistenteIA.registrar_log_interacao(
+            db=db,
+            workspace_id=workspace_id,
+            user_id=user_id,
+            session_id=session_id,
+            provider='roteador',
+            model=f"intencao:{rota['intencao']}",
+            input_message=mensagem,
+            response_text=resposta,
+            function_calls=rastreio_funcoes,
+            status='success',
+            error_message='',
+            total_duration_ms=int((datetime.now() - started_at).total_seconds() * 1000),
+        )
+        db.commit()
+        return {
+            'resposta': resposta,
+            'funcoes_chamadas': [{'nome': chamada['nome'], 'args': chamada['args']}],
+            'acoes_sugeridas': [],
+            'session_id': session_id,
+            'roteamento': {'intencao': rota['intencao'], 'llm': False},
+        }
+
+    @staticmethod
+    def _gerar_eventos_mensagem(
+        mensagem: str,
+        workspace_id: int,
+        user_id: int,
+        session_id: str,
+        stream: bool,
+        rastreio_funcoes: List[Dict[str, Any]],
+    ):
+        started_at = datetime.now()
         modelo = AssistenteIA.get_modelo()
         funcoes_chamadas: List[Dict[str, Any]] = []
-        rastreio_funcoes: List[Dict[str, Any]] = []
         db = get_db()
 
         comando_acao_resultado = AssistenteIA.processar_comando_acao(
@@ -4763,9 +5699,22 @@ class AssistenteIA:
             db.commit()
 
             comando_acao_resultado['session_id'] = session_id
-            return comando_acao_resultado
+            roteador_intencoes.registrar_turno('comando')
+            yield {'tipo': 'token', 'texto': resposta_comando}
+            yield {'tipo': 'fim', 'resultado': comando_acao_resultado}
+            return
+
+        rota = roteador_intencoes.classificar(mensagem)
+        if rota is not None:
+            retorno_rota = yield from AssistenteIA._responder_por_intencao(
+                db, rota, mensagem, workspace_id, user_id, session_id, rastreio_funcoes, started_at
+            )
+            if retorno_rota is not None:
+                roteador_intencoes.registrar_turno('intencao', rota['intencao'])
+                yield {'tipo': 'fim', 'resultado': retorno_rota}
+                return
 
-        if not ia_client:
+        if not llm_gateway.is_configured():
             resposta_sem_ia = '''🤖 **Copiloto Jurídico não configurado**
 
 Para usar o assistente IA, configure uma das opções no arquivo `.env`:
@@ -4780,59 +5729,24 @@ Para usar o assistente IA, configure uma das opções no arquivo `.env`:
 - Adicione ao .env: `OPENAI_API_KEY=sua_chave_aqui`
 
 💡 Recomendamos o **Groq** pois é gratuito e ultra-rápido!'''
-            return {
+            yield {'tipo': 'token', 'texto': resposta_sem_ia}
+            yield {'tipo': 'fim', 'resultado': {
                 'resposta': resposta_sem_ia,
                 'funcoes_chamadas': [],
                 'acoes_sugeridas': [],
                 'session_id': session_id,
-            }
+            }}
+            return
 
+        roteador_intencoes.registrar_turno('llm')
         try:
-            historico = db.execute(
-                '''SELECT role, content FROM chat_history
-                   WHERE workspace_id = ? AND user_id = ? AND session_id = ?
-                   ORDER BY created_at DESC LIMIT 10''',
-                (workspace_id, user_id, session_id),
-            ).fetchall()
-
-            messages = [
-                {"role": "system", "content": """Você é o Copiloto Jurídico do JurisGestão, um assistente de IA especializado em gestão de escritórios de advocacia.
-
-SUA IDENTIDADE:
-- Nome: Copiloto Jurídico
-- Especialidade: Gestão jurídica e organização de escritórios de advocacia
-- Tom: Profissional, prestativo, claro e direto
-
-O QUE VOCÊ PODE FAZER:
-- Buscar e consultar processos com detalhes completos
-- Localizar informações de clientes
-- Verificar prazos processuais pendentes
-- Listar tarefas e afazeres do escritório
-- Analisar o financeiro (entradas, saídas, balanço)
-- Responder dúvidas sobre movimentações processuais
-- Sugerir organização da agenda e prioridades
-
-COMO RESPONDER:
-- Seja sempre cordial e profissional
-- Use formatacao clara quando apropriado
-- Entenda primeiro a intencao principal do usuario e responda exatamente ao que ele pediu
-- Seja compreensivo e direto: menos genericidade e mais orientacao pratica
-- Se faltar dado para concluir, faca apenas 1 pergunta objetiva para destravar
-- Quando nao souber algo, seja honesto e sugira alternativas
-- Mantenha respostas concisas mas completas
-- Sempre responda em portugues do Brasil
-- Nao invente dados de cliente, processo, prazo ou movimentacao
-- Sempre que o usuario pedir para executar uma acao real (criar prazo, criar tarefa, lancar financeiro, enviar WhatsApp), use primeiro uma funcao `solicitar_*` para preparar a acao com confirmacao explicita.
-- Quando o usuario pedir para criar prazo, use `solicitar_criacao_prazo` (nao transforme prazo em tarefa).
-- Quando o usuario pedir listagem de processos ativos/arquivados, use `listar_processos` com o status correspondente e responda apenas com o retorno da funcao.
-- Nunca execute acao operacional sem confirmacao textual do usuario.
-
-Use as funcoes disponiveis para buscar informacoes em tempo real quando necessario."""}
-            ]
-
-            for h in reversed(historico):
-                messages.append({"role": h['role'], "content": h['content']})
-            messages.append({"role": "user", "content": mensagem})
+            messages = chat_context_manager.montar_mensagens(
+                db=db,
+                workspace_id=workspace_id,
+                user_id=user_id,
+                session_id=session_id,
+                mensagem=mensagem,
+            )
 
             def _criar_completion(com_funcoes: bool = True):
                 payload = {
@@ -4842,83 +5756,95 @@ Use as funcoes disponiveis para buscar informacoes em tempo real quando necessar
                     'max_tokens': 500,
                 }
                 if com_funcoes:
-                    payload['functions'] = AssistenteIA.FUNCTIONS
-                    payload['function_call'] = 'auto'
-                return ia_client.chat.completions.create(**payload)
+                    payload['tools'] = AssistenteIA.TOOLS
+                    payload['tool_choice'] = 'auto'
+                return AssistenteIA._completion_eventos(payload, stream)
 
             fallback_sem_funcoes = False
             try:
-                response = _criar_completion(com_funcoes=True)
+                message = yield from _criar_completion(com_funcoes=True)
             except Exception as tool_error:
                 tool_error_msg = str(tool_error)
                 if 'tool_use_failed' in tool_error_msg or 'Failed to call a function' in tool_error_msg:
                     fallback_sem_funcoes = True
-                    response = _criar_completion(com_funcoes=False)
+                    message = yield from _criar_completion(com_funcoes=False)
                 else:
                     raise
 
-            message = response.choices[0].message
-
-            db.execute(
-                'INSERT INTO chat_history (workspace_id, user_id, session_id, role, content) VALUES (?, ?, ?, ?, ?)',
-                (workspace_id, user_id, session_id, 'user', mensagem),
-            )
-
-            function_call = getattr(message, 'function_call', None)
-            if function_call:
-                func_name = function_call.name
-                try:
-                    func_args = json.loads(function_call.arguments or '{}')
-                except Exception:
-                    func_args = {}
-                if not isinstance(func_args, dict):
-                    func_args = {}
-
-                funcoes_chamadas.append({'nome': func_name, 'args': func_args})
+            tool_calls = list(getattr(message, 'tool_calls', None) or [])
+            resultados: List[Any] = []
+            if tool_calls:
+                chamadas: List[Dict[str, Any]] = []
+                for tool_call in tool_calls:
+                    func_name = tool_call.function.name
+                    try:
+                        func_args = json.loads(tool_call.function.arguments or '{}')
+                    except Exception:
+                        func_args = {}
+                    if not isinstance(func_args, dict):
+                        func_args = {}
+                    registro = ASSISTENTE_FUNCOES.get(func_name) or {}
+                    chamadas.append({
+                        'nome': func_name,
+                        'args': func_args,
+                        'somente_leitura': bool(registro.get('somente_leitura')),
+                    })
+                    funcoes_chamadas.append({'nome': func_name, 'args': func_args})
 
-                func_started_at = datetime.now()
-                func_error_msg = ''
-                try:
-                    resultado = AssistenteIA.executar_funcao(
-                        func_name,
-                        func_args,
-                        workspace_id,
-                        user_id=user_id,
-                        session_id=session_id,
-                    )
-                except Exception as function_error:
-                    func_error_msg = str(function_error)
-                    resultado = {'erro': func_error_msg}
-
-                func_duration_ms = int((datetime.now() - func_started_at).total_seconds() * 1000)
-                rastreio_funcoes.append({
-                    'nome': func_name,
-                    'args': func_args,
-                    'duration_ms': func_duration_ms,
-                    'erro': func_error_msg,
-                    'result_summary': AssistenteIA.resumir_resultado_funcao(resultado),
-                })
+                resultados = yield from AssistenteIA._executar_chamadas_funcoes(
+                    chamadas, workspace_id, user_id, session_id, rastreio_funcoes
+                )
 
                 messages.append({
-                    "role": "function",
-                    "name": func_name,
-                    "content": json.dumps(resultado, ensure_ascii=False),
+                    "role": "assistant",
+                    "content": message.content or '',
+                    "tool_calls": [
+                        {
+                            "id": tool_call.id,
+                            "type": "function",
+                            "function": {
+                                "name": tool_call.function.name,
+                                "arguments": tool_call.function.arguments or '{}',
+                            },
+                        }
+                        for tool_call in tool_calls
+                    ],
                 })
+                for tool_call, resultado in zip(tool_calls, resultados):
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": chat_context_manager.limitar_texto(
+                            json.dumps(resultado, ensure_ascii=False, default=str),
+                            CHAT_CONTEXT_MAX_TOOL_RESULT_TOKENS,
+                        ),
+                    })
 
-                if isinstance(resultado, dict) and resultado.get('_final_resposta'):
-                    resposta_base = str(resultado.get('_final_resposta')).strip()
-                    acoes_sugeridas = resultado.get('_acoes_sugeridas') or []
-                    if not isinstance(acoes_sugeridas, list):
-                        acoes_sugeridas = []
+                respostas_finais = [
+                    resultado for resultado in resultados
+                    if isinstance(resultado, dict) and resultado.get('_final_resposta')
+                ]
+                if respostas_finais and len(respostas_finais) == len(resultados):
+                    # Todas as funções já trazem a resposta pronta (ex.: solicitações com confirmação)
+                    resposta_base = '\n\n'.join(
+                        str(resultado.get('_final_resposta')).strip() for resultado in respostas_finais
+                    )
+                    acoes_sugeridas = []
+                    for resultado in respostas_finais:
+                        acoes = resultado.get('_acoes_sugeridas') or []
+                        if isinstance(acoes, list):
+                            acoes_sugeridas.extend(acoes)
                     message = None
                 else:
-                    response = ia_client.chat.completions.create(
-                        model=modelo,
-                        messages=messages,
-                        temperature=0.7,
-                        max_tokens=500,
+                    message = yield from AssistenteIA._completion_eventos(
+                        {
+                            'model': modelo,
+                            'messages': messages,
+                            'temperature': 0.7,
+                            'max_tokens': 500,
+                        },
+                        stream,
                     )
-                    message = response.choices[0].message
                     resposta_base = message.content or "Não entendi. Pode reformular?"
                     if AssistenteIA.deve_sugerir_acoes(mensagem, resposta_base, funcoes_chamadas):
                         acoes_sugeridas = AssistenteIA.construir_acoes_sugeridas(mensagem, funcoes_chamadas)
@@ -4932,7 +5858,17 @@ Use as funcoes disponiveis para buscar informacoes em tempo real quando necessar
                     acoes_sugeridas = []
 
             resposta_final = AssistenteIA.anexar_acoes_sugeridas(resposta_base, acoes_sugeridas)
+            # Envia o que ainda não saiu pelo stream: resposta inteira (modo sem
+            # stream, fallback de texto, resposta final de função) ou só as ações sugeridas
+            transmitido = (message.content or '') if stream and message is not None else ''
+            restante = AssistenteIA._texto_restante(resposta_final, transmitido)
+            if restante:
+                yield {'tipo': 'token', 'texto': restante}
 
+            db.execute(
+                'INSERT INTO chat_history (workspace_id, user_id, session_id, role, content) VALUES (?, ?, ?, ?, ?)',
+                (workspace_id, user_id, session_id, 'user', mensagem),
+            )
             db.execute(
                 'INSERT INTO chat_history (workspace_id, user_id, session_id, role, content) VALUES (?, ?, ?, ?, ?)',
                 (workspace_id, user_id, session_id, 'assistant', resposta_final),
@@ -4948,8 +5884,8 @@ Use as funcoes disponiveis para buscar informacoes em tempo real quando necessar
                 workspace_id=workspace_id,
                 user_id=user_id,
                 session_id=session_id,
-                provider=ia_provider,
-                model=modelo,
+                provider=llm_gateway.last_provider() or ia_provider,
+                model=llm_gateway.last_model() or modelo,
                 input_message=mensagem,
                 response_text=resposta_final,
                 function_calls=rastreio_funcoes,
@@ -4965,9 +5901,11 @@ Use as funcoes disponiveis para buscar informacoes em tempo real quando necessar
                 'acoes_sugeridas': acoes_sugeridas,
                 'session_id': session_id,
             }
-            if function_call and isinstance(resultado, dict) and resultado.get('_acao_pendente'):
-                retorno['acao_pendente'] = resultado.get('_acao_pendente')
-            return retorno
+            for resultado in resultados:
+                if isinstance(resultado, dict) and resultado.get('_acao_pendente'):
+                    retorno['acao_pendente'] = resultado.get('_acao_pendente')
+                    break
+            yield {'tipo': 'fim', 'resultado': retorno}
 
         except Exception as error:
             error_msg = str(error)
@@ -5010,12 +5948,13 @@ Parece que você atingiu o limite da sua API Key atual.
             except Exception as log_error:
                 print(f"[ia] Falha ao registrar auditoria de erro: {log_error}")
 
-            return {
+            yield {'tipo': 'erro', 'mensagem': resposta_erro}
+            yield {'tipo': 'fim', 'resultado': {
                 'resposta': resposta_erro,
                 'funcoes_chamadas': funcoes_chamadas,
                 'acoes_sugeridas': [],
                 'session_id': session_id,
-            }
+            }}
     
     @staticmethod
     def executar_funcao(
@@ -5024,959 +5963,1682 @@ Parece que você atingiu o limite da sua API Key atual.
         workspace_id: int,
         user_id: Optional[int] = None,
         session_id: str = 'default',
+        db=None,
     ) -> Dict:
-        """Executa função chamada pelo modelo"""
-        db = get_db()
-        session_id = AssistenteIA.normalizar_session_id(session_id)
+        """Executa função chamada pelo modelo (via ASSISTENTE_FUNCOES)"""
+        funcao = ASSISTENTE_FUNCOES.get(nome)
+        if not funcao:
+            return {'erro': 'Função não implementada'}
+        return funcao['handler'](
+            db if db is not None else get_db(),
+            args if isinstance(args, dict) else {},
+            workspace_id,
+            user_id,
+            AssistenteIA.normalizar_session_id(session_id),
+        )
 
-        def _to_int(raw_value: Any) -> Optional[int]:
-            try:
-                if raw_value in (None, ''):
-                    return None
-                return int(raw_value)
-            except (TypeError, ValueError):
-                return None
-        
-        if nome == 'listar_processos':
-            query = '''
-                SELECT p.*,
-                       c.nome as cliente_nome,
-                       c.email as cliente_email,
-                       c.telefone as cliente_telefone
-                FROM processos p
-                LEFT JOIN clientes c
-                  ON c.id = p.cliente_id
-                 AND c.workspace_id = p.workspace_id
-                WHERE p.workspace_id = ?
-            '''
-            params = [workspace_id]
-            
-            if args.get('status'):
-                status_raw = str(args.get('status') or '').strip().lower()
-                if status_raw in {'ativo', 'ativos'}:
-                    query += " AND LOWER(COALESCE(p.status, '')) IN ('ativo', 'em_andamento', 'andamento')"
-                elif status_raw in {'arquivado', 'arquivados'}:
-                    query += " AND LOWER(COALESCE(p.status, '')) = 'arquivado'"
-                elif status_raw in {'suspenso', 'suspensos'}:
-                    query += " AND LOWER(COALESCE(p.status, '')) = 'suspenso'"
-                else:
-                    query += ' AND LOWER(COALESCE(p.status, "")) = ?'
-                    params.append(status_raw)
-            
-            if args.get('cliente'):
-                query += ' AND LOWER(COALESCE(c.nome, "")) LIKE ?'
-                params.append(f"%{str(args['cliente']).lower()}%")
-            
-            query += ' ORDER BY p.created_at DESC'
-            limite = AssistenteIA.parse_limited_int(args.get('limite'), default=20, max_value=100)
-            query += " LIMIT ?"
-            params.append(limite)
-            
-            rows = db.execute(query, params).fetchall()
-            return {'processos': [AssistenteIA.serializar_processo_para_ia(r) for r in rows]}
-        
-        elif nome == 'buscar_processo':
-            query = '''
-                SELECT p.*,
-                       c.nome as cliente_nome,
-                       c.email as cliente_email,
-                       c.telefone as cliente_telefone
-                FROM processos p
-                LEFT JOIN clientes c
-                  ON c.id = p.cliente_id
-                 AND c.workspace_id = p.workspace_id
-                WHERE p.workspace_id = ? AND (
-            '''
-            params = [workspace_id]
-            
-            conditions = []
-            if args.get('numero'):
-                conditions.append('(p.numero LIKE ? OR p.numero_cnj LIKE ?)')
-                params.append(f"%{args['numero']}%")
-                params.append(f"%{args['numero']}%")
-            if args.get('titulo'):
-                conditions.append('p.titulo LIKE ?')
-                params.append(f"%{args['titulo']}%")
-            if args.get('cliente'):
-                conditions.append('LOWER(COALESCE(c.nome, "")) LIKE ?')
-                params.append(f"%{str(args['cliente']).lower()}%")
-            
-            query += ' OR '.join(conditions) + ')' if conditions else '1=0)'
-            limite = AssistenteIA.parse_limited_int(args.get('limite'), default=10, max_value=50)
-            query += ' ORDER BY p.created_at DESC LIMIT ?'
-            params.append(limite)
-            
-            rows = db.execute(query, params).fetchall()
-            return {'processos': [AssistenteIA.serializar_processo_para_ia(r) for r in rows]}
-
-        elif nome == 'listar_movimentacoes_recentes':
-            query = '''
-                SELECT m.id,
-                       m.workspace_id,
-                       m.processo_id,
-                       m.codigo_movimento,
-                       m.nome_movimento,
-                       m.data_movimento,
-                       m.fonte,
-                       p.numero as processo_numero,
-                       p.numero_cnj as processo_numero_cnj,
-                       p.titulo as processo_titulo,
-                       c.nome as cliente_nome
-                FROM movimentacoes_processo m
-                JOIN processos p ON p.id = m.processo_id
-                LEFT JOIN clientes c
-                  ON c.id = p.cliente_id
-                 AND c.workspace_id = p.workspace_id
-                WHERE m.workspace_id = ?
-            '''
-            params: List[Any] = [workspace_id]
-
-            processo_numero = (args.get('processo_numero') or '').strip()
-            if processo_numero:
-                query += ' AND (p.numero LIKE ? OR COALESCE(p.numero_cnj, "") LIKE ?)'
-                like_proc = f"%{processo_numero}%"
-                params.extend([like_proc, like_proc])
-
-            dias_raw = args.get('dias')
-            if dias_raw is not None:
-                dias = AssistenteIA.parse_limited_int(dias_raw, default=30, max_value=365)
-                data_limite = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d')
-                query += ' AND date(m.data_movimento) >= date(?)'
-                params.append(data_limite)
-
-            limite = AssistenteIA.parse_limited_int(args.get('limite'), default=20, max_value=100)
-            query += ' ORDER BY datetime(m.data_movimento) DESC, m.id DESC LIMIT ?'
-            params.append(limite)
-
-            rows = db.execute(query, params).fetchall()
-            return {'movimentacoes': [dict(r) for r in rows]}
-
-        elif nome == 'proximos_prazos_criticos':
-            dias = AssistenteIA.parse_limited_int(args.get('dias'), default=15, max_value=120)
-            limite = AssistenteIA.parse_limited_int(args.get('limite'), default=20, max_value=100)
-            incluir_vencidos_raw = args.get('incluir_vencidos', True)
-            incluir_vencidos = str(incluir_vencidos_raw).strip().lower() not in {'0', 'false', 'nao', 'não'}
-
-            hoje = datetime.now().strftime('%Y-%m-%d')
-            data_limite = (datetime.now() + timedelta(days=dias)).strftime('%Y-%m-%d')
-
-            query = '''
-                SELECT p.id,
-                       p.tipo,
-                       p.data_prazo,
-                       p.descricao,
-                       p.status,
-                       pr.id as processo_id,
-                       pr.numero as processo_numero,
-                       pr.numero_cnj as processo_numero_cnj,
-                       pr.titulo as processo_titulo,
-                       c.nome as cliente_nome,
-                       CAST(julianday(date(p.data_prazo)) - julianday(date(?)) AS INTEGER) as dias_restantes
-                FROM prazos p
-                JOIN processos pr ON pr.id = p.processo_id
-                LEFT JOIN clientes c
-                  ON c.id = pr.cliente_id
-                 AND c.workspace_id = pr.workspace_id
-                WHERE p.workspace_id = ?
-                  AND p.status = 'pendente'
-                  AND p.data_prazo IS NOT NULL
-                  AND date(p.data_prazo) <= date(?)
-            '''
-            params: List[Any] = [hoje, workspace_id, data_limite]
-
-            if not incluir_vencidos:
-                query += ' AND date(p.data_prazo) >= date(?)'
-                params.append(hoje)
-
-            query += ' ORDER BY date(p.data_prazo) ASC LIMIT ?'
-            params.append(limite)
-
-            rows = db.execute(query, params).fetchall()
-            prazos = []
-            for row in rows:
-                item = dict(row)
-                dias_restantes = item.get('dias_restantes')
-                if dias_restantes is None:
-                    criticidade = 'atencao'
-                elif int(dias_restantes) < 0:
-                    criticidade = 'atrasado'
-                elif int(dias_restantes) == 0:
-                    criticidade = 'hoje'
-                elif int(dias_restantes) <= 2:
-                    criticidade = 'urgente'
-                elif int(dias_restantes) <= 7:
-                    criticidade = 'atencao'
-                else:
-                    criticidade = 'planejado'
-                item['criticidade'] = criticidade
-                prazos.append(item)
+# ============================================================================
+# CONTEXTO DO COPILOTO (RESUMO ROLANTE + ORÇAMENTO DE TOKENS)
+# ============================================================================
 
-            return {
-                'prazos_criticos': prazos,
-                'janela_dias': dias,
-                'inclui_vencidos': incluir_vencidos,
-                'total': len(prazos),
-            }
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', '6000'))
+CHAT_CONTEXT_RESPONSE_TOKENS = 500
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv('CHAT_CONTEXT_MAX_MESSAGES', '20'))
+CHAT_CONTEXT_MAX_MESSAGE_TOKENS = int(os.getenv('CHAT_CONTEXT_MAX_MESSAGE_TOKENS', '800'))
+CHAT_CONTEXT_MAX_TOOL_RESULT_TOKENS = int(os.getenv('CHAT_CONTEXT_MAX_TOOL_RESULT_TOKENS', '1500'))
+CHAT_CONTEXT_SUMMARY_BATCH = int(os.getenv('CHAT_CONTEXT_SUMMARY_BATCH', '6'))
+CHAT_CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv('CHAT_CONTEXT_SUMMARY_MAX_TOKENS', '400'))
+CHAT_CONTEXT_SUMMARY_INPUT_MESSAGES = int(os.getenv('CHAT_CONTEXT_SUMMARY_INPUT_MESSAGES', '40'))
+CHAT_CONTEXT_SUMMARY_INPUT_TOKENS = int(os.getenv('CHAT_CONTEXT_SUMMARY_INPUT_TOKENS', '3000'))
 
-        elif nome == 'resumo_processo_360':
-            processo_id = args.get('processo_id')
-            numero = (args.get('numero') or '').strip()
-            titulo = (args.get('titulo') or '').strip()
 
-            query = '''
-                SELECT p.*,
-                       c.nome as cliente_nome,
-                       c.email as cliente_email,
-                       c.telefone as cliente_telefone
-                FROM processos p
-                LEFT JOIN clientes c
-                  ON c.id = p.cliente_id
-                 AND c.workspace_id = p.workspace_id
-                WHERE p.workspace_id = ?
-            '''
-            params: List[Any] = [workspace_id]
-
-            if processo_id:
-                query += ' AND p.id = ?'
-                params.append(processo_id)
-            elif numero:
-                query += ' AND (p.numero LIKE ? OR COALESCE(p.numero_cnj, "") LIKE ?)'
-                like_num = f'%{numero}%'
-                params.extend([like_num, like_num])
-            elif titulo:
-                query += ' AND p.titulo LIKE ?'
-                params.append(f'%{titulo}%')
-            else:
-                return {'erro': 'Informe processo_id, numero ou titulo para gerar o resumo 360'}
-
-            query += ' ORDER BY p.created_at DESC LIMIT 1'
-            processo_row = db.execute(query, params).fetchone()
-            if not processo_row:
-                return {'erro': 'Processo não encontrado'}
-
-            processo = AssistenteIA.serializar_processo_para_ia(processo_row)
-            processo_id = int(processo['id'])
-
-            movimentacoes_rows = db.execute(
-                '''SELECT id, codigo_movimento, nome_movimento, data_movimento, fonte
-                   FROM movimentacoes_processo
-                   WHERE workspace_id = ? AND processo_id = ?
-                   ORDER BY datetime(data_movimento) DESC, id DESC
-                   LIMIT 5''',
-                (workspace_id, processo_id),
-            ).fetchall()
+def estimar_tokens(texto: Any) -> int:
+    """Estimativa de tokens (~4 caracteres por token, como nos tokenizers BPE em pt-BR)."""
+    return (len(str(texto or '')) + 3) // 4
 
-            prazos_rows = db.execute(
-                '''SELECT id, tipo, data_prazo, descricao, status,
-                          CAST(julianday(date(data_prazo)) - julianday(date('now')) AS INTEGER) as dias_restantes
-                   FROM prazos
-                   WHERE workspace_id = ?
-                     AND processo_id = ?
-                     AND status = 'pendente'
-                   ORDER BY date(data_prazo) ASC
-                   LIMIT 5''',
-                (workspace_id, processo_id),
-            ).fetchall()
 
-            tarefas_rows = db.execute(
-                '''SELECT t.id, t.titulo, t.descricao, t.prioridade, t.status, t.data_vencimento,
-                          u.nome as responsavel_nome,
-                          CAST(julianday(date(t.data_vencimento)) - julianday(date('now')) AS INTEGER) as dias_para_vencer
-                   FROM tarefas t
-                   LEFT JOIN users u ON u.id = t.assigned_to
-                   WHERE t.workspace_id = ?
-                     AND t.processo_id = ?
-                     AND t.status IN ('pendente', 'em_andamento')
-                   ORDER BY
-                     CASE WHEN t.data_vencimento IS NULL THEN 1 ELSE 0 END ASC,
-                     date(t.data_vencimento) ASC,
-                     t.created_at DESC
-                   LIMIT 7''',
-                (workspace_id, processo_id),
-            ).fetchall()
+class ChatContextManager:
+    """
+    Monta as mensagens de cada turno do Copiloto dentro de um orçamento de tokens.
+
+    A parte estática (prompt de sistema + schema das funções) é montada e
+    contada uma vez. O histórico entra do mais recente para o mais antigo até
+    o orçamento acabar; o que fica de fora é dobrado num resumo rolante por
+    sessão (chat_session_summaries) assim que acumula CHAT_CONTEXT_SUMMARY_BATCH
+    mensagens. O resumo é atualizado numa thread de fundo, fora da requisição,
+    com no máximo CHAT_CONTEXT_SUMMARY_INPUT_MESSAGES mensagens por rodada.
+    """
 
-            receitas = db.execute(
-                '''SELECT COALESCE(SUM(valor), 0) as total
-                   FROM financeiro
-                   WHERE workspace_id = ? AND processo_id = ? AND tipo IN ('receita', 'entrada')''',
-                (workspace_id, processo_id),
-            ).fetchone()['total']
-            despesas = db.execute(
-                '''SELECT COALESCE(SUM(valor), 0) as total
-                   FROM financeiro
-                   WHERE workspace_id = ? AND processo_id = ? AND tipo IN ('despesa', 'saida')''',
-                (workspace_id, processo_id),
-            ).fetchone()['total']
-
-            total_movimentacoes = db.execute(
-                '''SELECT COUNT(*) as total
-                   FROM movimentacoes_processo
-                   WHERE workspace_id = ? AND processo_id = ?''',
-                (workspace_id, processo_id),
-            ).fetchone()['total']
-            total_prazos_pendentes = db.execute(
-                '''SELECT COUNT(*) as total
-                   FROM prazos
-                   WHERE workspace_id = ? AND processo_id = ? AND status = 'pendente' ''',
-                (workspace_id, processo_id),
-            ).fetchone()['total']
-            total_tarefas_abertas = db.execute(
-                '''SELECT COUNT(*) as total
-                   FROM tarefas
-                   WHERE workspace_id = ?
-                     AND processo_id = ?
-                     AND status IN ('pendente', 'em_andamento')''',
-                (workspace_id, processo_id),
-            ).fetchone()['total']
+    MENSAGEM_OVERHEAD_TOKENS = 4
 
-            return {
-                'processo': processo,
-                'movimentacoes_recentes': [dict(r) for r in movimentacoes_rows],
-                'prazos_pendentes': [dict(r) for r in prazos_rows],
-                'tarefas_abertas': [dict(r) for r in tarefas_rows],
-                'financeiro_processo': {
-                    'receitas': receitas,
-                    'despesas': despesas,
-                    'saldo': receitas - despesas,
-                },
-                'indicadores': {
-                    'total_movimentacoes': total_movimentacoes,
-                    'total_prazos_pendentes': total_prazos_pendentes,
-                    'total_tarefas_abertas': total_tarefas_abertas,
-                },
-            }
-        
-        elif nome == 'listar_prazos':
-            query = 'SELECT p.*, pr.numero as processo_numero FROM prazos p '
-            query += 'JOIN processos pr ON p.processo_id = pr.id WHERE p.workspace_id = ?'
-            params = [workspace_id]
-            
-            status = (args.get('status') or '').strip().lower()
-            if status == 'vencido':
-                hoje = datetime.now().strftime('%Y-%m-%d')
-                query += " AND p.status = 'pendente' AND date(p.data_prazo) < date(?)"
-                params.append(hoje)
-            elif status:
-                query += ' AND p.status = ?'
-                params.append(status)
-            
-            if args.get('dias'):
-                dias = AssistenteIA.parse_limited_int(args.get('dias'), default=30, max_value=365)
-                data_limite = (datetime.now() + timedelta(days=dias)).strftime('%Y-%m-%d')
-                query += ' AND p.data_prazo <= ?'
-                params.append(data_limite)
-            
-            query += ' ORDER BY p.data_prazo'
-            limite = AssistenteIA.parse_limited_int(args.get('limite'), default=30, max_value=100)
-            query += ' LIMIT ?'
-            params.append(limite)
-            
-            rows = db.execute(query, params).fetchall()
-            return {'prazos': [dict(r) for r in rows]}
-        
-        elif nome == 'listar_tarefas':
-            query = 'SELECT * FROM tarefas WHERE workspace_id = ?'
-            params = [workspace_id]
-            
-            if args.get('status'):
-                query += ' AND status = ?'
-                params.append(args['status'])
-            
-            if args.get('prioridade'):
-                query += ' AND prioridade = ?'
-                params.append(args['prioridade'])
-            
-            query += ' ORDER BY created_at DESC'
-            limite = AssistenteIA.parse_limited_int(args.get('limite'), default=30, max_value=100)
-            query += ' LIMIT ?'
-            params.append(limite)
-            
-            rows = db.execute(query, params).fetchall()
-            return {'tarefas': [dict(r) for r in rows]}
-        
-        elif nome == 'listar_clientes':
-            query = 'SELECT * FROM clientes WHERE workspace_id = ?'
-            params = [workspace_id]
-            
-            if args.get('nome'):
-                query += ' AND nome LIKE ?'
-                params.append(f"%{args['nome']}%")
-            
-            query += ' ORDER BY nome'
-            limite = AssistenteIA.parse_limited_int(args.get('limite'), default=50, max_value=200)
-            query += ' LIMIT ?'
-            params.append(limite)
-            
-            rows = db.execute(query, params).fetchall()
-            return {'clientes': [dict(r) for r in rows]}
-        
-        elif nome == 'resumo_financeiro':
-            hoje = datetime.now()
-            
-            if args.get('periodo') == 'mes_atual':
-                inicio = hoje.replace(day=1).strftime('%Y-%m-%d')
-                fim = hoje.strftime('%Y-%m-%d')
-            elif args.get('periodo') == 'mes_anterior':
-                inicio = (hoje.replace(day=1) - timedelta(days=1)).replace(day=1).strftime('%Y-%m-%d')
-                fim = hoje.replace(day=1).strftime('%Y-%m-%d')
-            else:
-                inicio = hoje.replace(month=1, day=1).strftime('%Y-%m-%d')
-                fim = hoje.strftime('%Y-%m-%d')
-            
-            receitas = db.execute(
-                '''SELECT COALESCE(SUM(valor), 0) as total
-                   FROM financeiro
-                   WHERE workspace_id = ?
-                     AND tipo IN ('receita', 'entrada')
-                     AND data BETWEEN ? AND ?''',
-                (workspace_id, inicio, fim)
-            ).fetchone()['total']
-
-            despesas = db.execute(
-                '''SELECT COALESCE(SUM(valor), 0) as total
-                   FROM financeiro
-                   WHERE workspace_id = ?
-                     AND tipo IN ('despesa', 'saida')
-                     AND data BETWEEN ? AND ?''',
-                (workspace_id, inicio, fim)
-            ).fetchone()['total']
-            
-            return {
-                'receitas': receitas,
-                'despesas': despesas,
-                'saldo': receitas - despesas,
-                'periodo': args.get('periodo', 'ano')
+    def __init__(self, system_prompt: str, tools: List[Dict[str, Any]],
+                 budget: int = CHAT_CONTEXT_TOKEN_BUDGET):
+        self.system_prompt = system_prompt
+        self.tools = tools
+        self.budget = budget
+        self._compactando: set = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='copiloto-resumo')
+
+    @cached_property
+    def mensagem_sistema(self) -> Dict[str, str]:
+        return {'role': 'system', 'content': self.system_prompt}
+
+    @cached_property
+    def tokens_estaticos(self) -> int:
+        schema = json.dumps(self.tools, ensure_ascii=False, separators=(',', ':'))
+        return estimar_tokens(self.system_prompt) + estimar_tokens(schema) + self.MENSAGEM_OVERHEAD_TOKENS
+
+    def tokens_mensagem(self, mensagem: Dict[str, Any]) -> int:
+        return estimar_tokens(mensagem.get('content')) + self.MENSAGEM_OVERHEAD_TOKENS
+
+    @staticmethod
+    def limitar_texto(texto: str, max_tokens: int) -> str:
+        """Corta o texto no limite de tokens, sinalizando o corte."""
+        texto = str(texto or '')
+        limite = max(int(max_tokens), 1) * 4
+        if len(texto) <= limite:
+            return texto
+        return texto[:limite].rstrip() + ' …[truncado]'
+
+    def montar_mensagens(self, db, workspace_id: int, user_id: int, session_id: str,
+                         mensagem: str) -> List[Dict[str, Any]]:
+        resumo_row = db.execute(
+            '''SELECT summary, summarized_until_id FROM chat_session_summaries
+               WHERE workspace_id = ? AND user_id = ? AND session_id = ?''',
+            (workspace_id, user_id, session_id),
+        ).fetchone()
+        resumo = (resumo_row['summary'] if resumo_row else '') or ''
+        resumido_ate = int(resumo_row['summarized_until_id'] or 0) if resumo_row else 0
+
+        historico = db.execute(
+            '''SELECT id, role, content FROM chat_history
+               WHERE workspace_id = ? AND user_id = ? AND session_id = ? AND id > ?
+               ORDER BY id DESC LIMIT ?''',
+            (workspace_id, user_id, session_id, resumido_ate, CHAT_CONTEXT_MAX_MESSAGES + 1),
+        ).fetchall()
+
+        mensagem_usuario = {'role': 'user', 'content': self.limitar_texto(mensagem, CHAT_CONTEXT_MAX_MESSAGE_TOKENS * 2)}
+        disponivel = (
+            self.budget
+            - self.tokens_estaticos
+            - CHAT_CONTEXT_RESPONSE_TOKENS
+            - self.tokens_mensagem(mensagem_usuario)
+            - (estimar_tokens(resumo) + 2 * self.MENSAGEM_OVERHEAD_TOKENS if resumo else 0)
+        )
+
+        mantidas: List[Dict[str, Any]] = []
+        menor_id_mantido: Optional[int] = None
+        for row in historico[:CHAT_CONTEXT_MAX_MESSAGES]:
+            item = {
+                'role': row['role'],
+                'content': self.limitar_texto(row['content'], CHAT_CONTEXT_MAX_MESSAGE_TOKENS),
             }
+            custo = self.tokens_mensagem(item)
+            if custo > disponivel:
+                break
+            disponivel -= custo
+            mantidas.append(item)
+            menor_id_mantido = int(row['id'])
+
+        excedentes = len(historico) - len(mantidas)
+        if excedentes and (excedentes >= CHAT_CONTEXT_SUMMARY_BATCH or len(historico) > CHAT_CONTEXT_MAX_MESSAGES):
+            self.agendar_compactacao(
+                workspace_id, user_id, session_id,
+                ate_id=(menor_id_mantido - 1) if menor_id_mantido else int(historico[0]['id']),
+            )
 
-        elif nome == 'gerar_mensagem_whatsapp_contextual':
-            destino = (args.get('destino') or 'cliente').strip().lower()
-            if destino not in {'cliente', 'equipe'}:
-                destino = 'cliente'
+        mensagens = [self.mensagem_sistema]
+        if resumo:
+            mensagens.append({
+                'role': 'system',
+                'content': f'Resumo da conversa anterior nesta sessão:\n{resumo}',
+            })
+        mensagens.extend(reversed(mantidas))
+        mensagens.append(mensagem_usuario)
+        return mensagens
+
+    def agendar_compactacao(self, workspace_id: int, user_id: int, session_id: str, ate_id: int) -> bool:
+        """Atualiza o resumo da sessão em segundo plano (uma rodada por sessão de cada vez)."""
+        chave = (workspace_id, user_id, session_id)
+        with self._lock:
+            if chave in self._compactando:
+                return False
+            self._compactando.add(chave)
+        try:
+            self._pool.submit(self._compactar_em_segundo_plano, chave, ate_id)
+        except RuntimeError:
+            with self._lock:
+                self._compactando.discard(chave)
+            return False
+        return True
 
-            tipo_contexto = (args.get('tipo_contexto') or 'comunicado').strip().lower()
-            if tipo_contexto not in {'movimentacao', 'prazo', 'tarefa', 'status_processo', 'comunicado'}:
-                tipo_contexto = 'comunicado'
+    def _compactar_em_segundo_plano(self, chave: tuple, ate_id: int) -> None:
+        workspace_id, user_id, session_id = chave
+        conn = sqlite3.connect(app.config['DATABASE'], timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            self.compactar(conn, workspace_id, user_id, session_id, ate_id)
+        except Exception as error:
+            print(f"[ia] Falha ao compactar contexto da sessao {session_id}: {error}")
+        finally:
+            conn.close()
+            with self._lock:
+                self._compactando.discard(chave)
 
-            tom = (args.get('tom') or 'acolhedor').strip().lower()
-            if tom not in {'formal', 'acolhedor', 'direto'}:
-                tom = 'acolhedor'
+    def compactar(self, db, workspace_id: int, user_id: int, session_id: str, ate_id: int) -> str:
+        """
+        Dobra no resumo rolante da sessão as mensagens ainda não resumidas até `ate_id`.
 
-            processo_numero = (args.get('processo_numero') or '').strip()
-            cliente_nome_informado = (args.get('cliente_nome') or '').strip()
-            objetivo = (args.get('objetivo') or '').strip()
+        Cada rodada leva as mais antigas, até CHAT_CONTEXT_SUMMARY_INPUT_MESSAGES
+        mensagens ou CHAT_CONTEXT_SUMMARY_INPUT_TOKENS; o resto fica para a próxima.
+        """
+        resumo_row = db.execute(
+            '''SELECT summary, summarized_until_id FROM chat_session_summaries
+               WHERE workspace_id = ? AND user_id = ? AND session_id = ?''',
+            (workspace_id, user_id, session_id),
+        ).fetchone()
+        resumo_atual = (resumo_row['summary'] if resumo_row else '') or ''
+        resumido_ate = int(resumo_row['summarized_until_id'] or 0) if resumo_row else 0
 
-            processo = None
-            if processo_numero:
-                processo_row = db.execute(
-                    '''SELECT p.*,
-                              c.nome as cliente_nome
-                       FROM processos p
-                       LEFT JOIN clientes c
-                         ON c.id = p.cliente_id
-                        AND c.workspace_id = p.workspace_id
-                       WHERE p.workspace_id = ?
-                         AND (p.numero LIKE ? OR COALESCE(p.numero_cnj, '') LIKE ?)
-                       ORDER BY p.created_at DESC
-                       LIMIT 1''',
-                    (workspace_id, f'%{processo_numero}%', f'%{processo_numero}%'),
-                ).fetchone()
-                if processo_row:
-                    processo = dict(processo_row)
-
-            cliente_nome = cliente_nome_informado or (processo.get('cliente_nome') if processo else '')
-            if not cliente_nome and destino == 'cliente':
-                cliente_nome = 'cliente'
-
-            cabecalho = 'Olá!' if destino == 'cliente' else 'Equipe,'
-            if destino == 'cliente' and cliente_nome:
-                cabecalho = f'Olá, {cliente_nome}!'
-
-            contexto_linha = ''
-            if processo:
-                contexto_linha = (
-                    f"Processo {processo.get('numero') or processo.get('numero_cnj') or ''} "
-                    f"- {processo.get('titulo') or 'sem título'}"
-                ).strip()
+        rows = db.execute(
+            '''SELECT id, role, content FROM chat_history
+               WHERE workspace_id = ? AND user_id = ? AND session_id = ? AND id > ? AND id <= ?
+               ORDER BY id LIMIT ?''',
+            (workspace_id, user_id, session_id, resumido_ate, ate_id,
+             max(1, CHAT_CONTEXT_SUMMARY_INPUT_MESSAGES)),
+        ).fetchall()
+        if not rows:
+            return resumo_atual
 
-            detalhe = ''
-            if tipo_contexto == 'movimentacao' and processo:
-                mov_row = db.execute(
-                    '''SELECT nome_movimento, data_movimento
-                       FROM movimentacoes_processo
-                       WHERE workspace_id = ? AND processo_id = ?
-                       ORDER BY datetime(data_movimento) DESC, id DESC
-                       LIMIT 1''',
-                    (workspace_id, processo['id']),
-                ).fetchone()
-                if mov_row:
-                    detalhe = (
-                        f"Identificamos nova movimentação em {mov_row['data_movimento']}: "
-                        f"{mov_row['nome_movimento']}."
-                    )
-                else:
-                    detalhe = 'Não há movimentação recente registrada no momento.'
-            elif tipo_contexto == 'prazo' and processo:
-                prazo_row = db.execute(
-                    '''SELECT tipo, data_prazo, descricao
-                       FROM prazos
-                       WHERE workspace_id = ?
-                         AND processo_id = ?
-                         AND status = 'pendente'
-                       ORDER BY date(data_prazo) ASC
-                       LIMIT 1''',
-                    (workspace_id, processo['id']),
-                ).fetchone()
-                if prazo_row:
-                    detalhe = (
-                        f"Próximo prazo: {prazo_row['tipo']} em {prazo_row['data_prazo']}. "
-                        f"Detalhe: {prazo_row['descricao'] or '-'}."
-                    )
-                else:
-                    detalhe = 'No momento não há prazos pendentes para este processo.'
-            elif tipo_contexto == 'tarefa' and processo:
-                tarefa_row = db.execute(
-                    '''SELECT titulo, data_vencimento, prioridade
-                       FROM tarefas
-                       WHERE workspace_id = ?
-                         AND processo_id = ?
-                         AND status IN ('pendente', 'em_andamento')
-                       ORDER BY
-                         CASE WHEN data_vencimento IS NULL THEN 1 ELSE 0 END ASC,
-                         date(data_vencimento) ASC,
-                         created_at DESC
-                       LIMIT 1''',
-                    (workspace_id, processo['id']),
-                ).fetchone()
-                if tarefa_row:
-                    detalhe = (
-                        f"Tarefa em aberto: {tarefa_row['titulo']} "
-                        f"(prioridade {tarefa_row['prioridade']}, vencimento {tarefa_row['data_vencimento'] or 'sem data'})."
-                    )
-                else:
-                    detalhe = 'Não há tarefas pendentes vinculadas a este processo.'
-            elif tipo_contexto == 'status_processo' and processo:
-                detalhe = (
-                    f"Status atual do processo: {processo.get('status') or 'não informado'}. "
-                    f"Último movimento registrado: {processo.get('ultimo_movimento') or 'sem registro'}."
-                )
-            else:
-                detalhe = 'Passando um comunicado rápido sobre o andamento atual.'
-
-            objetivo_linha = f"Objetivo: {objetivo}" if objetivo else ''
-
-            mensagem_base = '\n'.join(
-                line for line in [
-                    cabecalho,
-                    contexto_linha,
-                    detalhe,
-                    objetivo_linha,
-                    'Se precisar, sigo à disposição por aqui.',
-                ] if line
+        linhas: List[str] = []
+        disponivel = CHAT_CONTEXT_SUMMARY_INPUT_TOKENS
+        ultimo_id = resumido_ate
+        for row in rows:
+            linha = f"{'Usuário' if row['role'] == 'user' else 'Copiloto'}: {self.limitar_texto(row['content'], 300)}"
+            custo = estimar_tokens(linha)
+            if linhas and custo > disponivel:
+                break
+            disponivel -= custo
+            linhas.append(linha)
+            ultimo_id = int(row['id'])
+        trechos = '\n'.join(linhas)
+        try:
+            resposta = llm_gateway.chat_completion(
+                messages=[
+                    {
+                        'role': 'system',
+                        'content': (
+                            'Resuma a conversa entre um advogado e o Copiloto Jurídico em português, '
+                            'em até 8 tópicos curtos. Preserve números de processo, nomes, datas, '
+                            'valores e pedidos em aberto. Não invente informações.'
+                        ),
+                    },
+                    {
+                        'role': 'user',
+                        'content': f"Resumo atual:\n{resumo_atual or '(vazio)'}\n\nNovas mensagens:\n{trechos}",
+                    },
+                ],
+                temperature=0.2,
+                max_tokens=CHAT_CONTEXT_SUMMARY_MAX_TOKENS,
             )
+            novo_resumo = (resposta.choices[0].message.content or '').strip()
+        except Exception as error:
+            print(f"[ia] Falha ao resumir contexto da sessao {session_id}: {error}")
+            novo_resumo = ''
 
-            preferencia_tom = {
-                'formal': 'Tom formal, claro e respeitoso.',
-                'acolhedor': 'Tom acolhedor e humano, sem perder objetividade.',
-                'direto': 'Tom direto e curto, com chamada clara para ação.',
-            }[tom]
+        if not novo_resumo:
+            # Sem IA: mantém um resumo extrativo com as mensagens mais recentes
+            novo_resumo = f"{resumo_atual}\n{trechos}".strip()
+            novo_resumo = novo_resumo[-CHAT_CONTEXT_SUMMARY_MAX_TOKENS * 4:]
+        novo_resumo = self.limitar_texto(novo_resumo, CHAT_CONTEXT_SUMMARY_MAX_TOKENS)
 
-            mensagem_final = maybe_generate_whatsapp_message_with_ai(
-                base_message=mensagem_base,
-                objective=f"Gerar mensagem de WhatsApp contextual para {destino} no contexto {tipo_contexto}.",
-                ai_prompt=preferencia_tom,
-            )
+        db.execute(
+            '''INSERT INTO chat_session_summaries
+               (workspace_id, user_id, session_id, summary, summarized_until_id, updated_at)
+               VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+               ON CONFLICT(workspace_id, user_id, session_id) DO UPDATE SET
+                   summary = excluded.summary,
+                   summarized_until_id = excluded.summarized_until_id,
+                   updated_at = CURRENT_TIMESTAMP''',
+            (workspace_id, user_id, session_id, novo_resumo, ultimo_id),
+        )
+        db.commit()
+        return novo_resumo
 
-            processo_preview = None
-            if processo:
-                processo_preview = {
-                    'id': processo.get('id'),
-                    'numero': processo.get('numero'),
-                    'numero_cnj': processo.get('numero_cnj'),
-                    'titulo': processo.get('titulo'),
-                    'cliente_nome': processo.get('cliente_nome'),
-                }
+    def encerrar(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
-            return {
-                'mensagem': mensagem_final,
-                'mensagem_base': mensagem_base,
-                'destino': destino,
-                'tipo_contexto': tipo_contexto,
-                'tom': tom,
-                'processo': processo_preview,
-                'cliente_nome': cliente_nome or None,
-            }
 
-        elif nome == 'solicitar_criacao_prazo':
-            if user_id is None:
-                return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
+chat_context_manager = ChatContextManager(AssistenteIA.SYSTEM_PROMPT, AssistenteIA.TOOLS)
+atexit.register(chat_context_manager.encerrar)
 
-            tipo_prazo = str(args.get('tipo') or '').strip()
-            if not tipo_prazo:
-                return {'erro': 'Tipo do prazo é obrigatório'}
 
-            data_prazo_raw = str(args.get('data_prazo') or '').strip()
-            if not data_prazo_raw:
-                return {'erro': 'Data do prazo é obrigatória'}
-            data_prazo = data_prazo_raw[:10]
-            try:
-                datetime.strptime(data_prazo, '%Y-%m-%d')
-            except ValueError:
-                return {'erro': 'Data do prazo inválida. Use YYYY-MM-DD (ex.: 2026-03-30).'}
+# ============================================================================
+# FUNÇÕES DO COPILOTO (REGISTRO DE DISPATCH)
+# ============================================================================
 
-            processo = AssistenteIA.buscar_processo_para_acao(
-                db=db,
-                workspace_id=workspace_id,
-                processo_id=_to_int(args.get('processo_id')),
-                numero=str(args.get('processo_numero') or '').strip(),
-                titulo=str(args.get('processo_titulo') or '').strip(),
-            )
+# nome -> {'handler', 'somente_leitura'}; funções somente leitura podem rodar
+# em paralelo, cada uma na sua própria conexão de leitura.
+ASSISTENTE_FUNCOES: Dict[str, Dict[str, Any]] = {}
 
-            if not processo:
-                cliente_nome = str(args.get('cliente_nome') or '').strip().lower()
-                if cliente_nome:
-                    processo_row = db.execute(
-                        '''SELECT p.*, c.nome as cliente_nome
-                           FROM processos p
-                           LEFT JOIN clientes c ON c.id = p.cliente_id AND c.workspace_id = p.workspace_id
-                           WHERE p.workspace_id = ?
-                             AND LOWER(COALESCE(c.nome, '')) LIKE ?
-                             AND LOWER(COALESCE(p.status, '')) = 'ativo'
-                           ORDER BY p.created_at DESC
-                           LIMIT 1''',
-                        (workspace_id, f'%{cliente_nome}%'),
-                    ).fetchone()
-                    if processo_row:
-                        processo = dict(processo_row)
+ASSISTENTE_FUNCOES_MAX_WORKERS = int(os.getenv('ASSISTENTE_FUNCOES_MAX_WORKERS', '4'))
+assistente_funcoes_pool = ThreadPoolExecutor(
+    max_workers=max(1, ASSISTENTE_FUNCOES_MAX_WORKERS),
+    thread_name_prefix='copiloto-funcao',
+)
 
-            if not processo:
-                return {
-                    'erro': (
-                        'Não consegui identificar o processo para este prazo. '
-                        'Informe o número/CNJ do processo ou o título exato.'
-                    )
-                }
 
-            status_prazo = str(args.get('status') or 'pendente').strip().lower()
-            if status_prazo not in {'pendente', 'cumprido'}:
-                status_prazo = 'pendente'
+def registrar_funcao_assistente(nome: str, somente_leitura: bool = True):
+    """Registra handler de função chamável pelo modelo."""
+    def decorator(func):
+        ASSISTENTE_FUNCOES[nome] = {'handler': func, 'somente_leitura': somente_leitura}
+        return func
+    return decorator
 
-            payload = {
-                'tipo': tipo_prazo,
-                'descricao': str(args.get('descricao') or '').strip() or None,
-                'data_prazo': data_prazo,
-                'status': status_prazo,
-                'processo_id': int(processo['id']),
-            }
 
-            preview_linhas = [
-                'Criar prazo',
-                f'Tipo: {tipo_prazo}',
-                f'Data: {data_prazo}',
-                f'Status: {status_prazo}',
-                (
-                    f"Processo: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')} "
-                    f"- {processo.get('titulo') or 'sem título'}"
-                ),
-            ]
-            if payload.get('descricao'):
-                preview_linhas.append(f"Descrição: {payload.get('descricao')}")
+def _ia_to_int(raw_value: Any) -> Optional[int]:
+    try:
+        if raw_value in (None, ''):
+            return None
+        return int(raw_value)
+    except (TypeError, ValueError):
+        return None
 
-            preview = '\n'.join(preview_linhas)
-            acao = AssistenteIA.criar_acao_pendente(
-                db=db,
-                workspace_id=workspace_id,
-                user_id=user_id,
-                session_id=session_id,
-                action_type='criar_prazo',
-                payload=payload,
-                preview=preview,
-            )
 
-            resposta = (
-                f"Prévia da ação solicitada:\n{preview}\n\n"
-                "Use os botões de confirmação abaixo para confirmar ou recusar."
-            )
-            return {
-                'ok': True,
-                'acao_pendente': acao,
-                '_acao_pendente': acao,
-                '_final_resposta': resposta,
-                '_acoes_sugeridas': [],
-            }
+@registrar_funcao_assistente('listar_processos')
+def _funcao_listar_processos(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    select_sql = '''
+        SELECT p.*,
+               c.nome as cliente_nome,
+               c.email as cliente_email,
+               c.telefone as cliente_telefone
+    '''
+    query = '''
+        FROM processos p
+        LEFT JOIN clientes c
+          ON c.id = p.cliente_id
+         AND c.workspace_id = p.workspace_id
+        WHERE p.workspace_id = ?
+    '''
+    params = [workspace_id]
 
-        elif nome == 'solicitar_criacao_tarefa':
-            if user_id is None:
-                return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
+    if args.get('status'):
+        status_raw = str(args.get('status') or '').strip().lower()
+        if status_raw in {'ativo', 'ativos'}:
+            query += " AND LOWER(COALESCE(p.status, '')) IN ('ativo', 'em_andamento', 'andamento')"
+        elif status_raw in {'arquivado', 'arquivados'}:
+            query += " AND LOWER(COALESCE(p.status, '')) = 'arquivado'"
+        elif status_raw in {'suspenso', 'suspensos'}:
+            query += " AND LOWER(COALESCE(p.status, '')) = 'suspenso'"
+        else:
+            query += ' AND LOWER(COALESCE(p.status, "")) = ?'
+            params.append(status_raw)
+
+    if args.get('cliente'):
+        cliente_ids = buscar_indice(db, workspace_id, str(args['cliente']), 'cliente', limite=200)
+        if cliente_ids is None:
+            query += ' AND LOWER(COALESCE(c.nome, "")) LIKE ?'
+            params.append(f"%{str(args['cliente']).lower()}%")
+        else:
+            query += ' AND p.cliente_id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(cliente_ids))
 
-            titulo = str(args.get('titulo') or '').strip()
-            if not titulo:
-                return {'erro': 'Título da tarefa é obrigatório'}
+    # Total com os mesmos filtros: a lista abaixo é limitada
+    total = db.execute('SELECT COUNT(*) ' + query, params).fetchone()[0]
+    limite = AssistenteIA.parse_limited_int(args.get('limite'), default=20, max_value=100)
+    rows = db.execute(select_sql + query + ' ORDER BY p.created_at DESC LIMIT ?', params + [limite]).fetchall()
+    return {'processos': [AssistenteIA.serializar_processo_para_ia(r) for r in rows], 'total': total}
 
-            prioridade = str(args.get('prioridade') or 'media').strip().lower()
-            if prioridade not in {'baixa', 'media', 'alta', 'urgente'}:
-                prioridade = 'media'
 
-            processo = AssistenteIA.buscar_processo_para_acao(
-                db=db,
-                workspace_id=workspace_id,
-                processo_id=_to_int(args.get('processo_id')),
-                numero=str(args.get('processo_numero') or '').strip(),
-                titulo=str(args.get('processo_titulo') or '').strip(),
+@registrar_funcao_assistente('buscar_processo')
+def _funcao_buscar_processo(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    query = '''
+        SELECT p.*,
+               c.nome as cliente_nome,
+               c.email as cliente_email,
+               c.telefone as cliente_telefone
+        FROM processos p
+        LEFT JOIN clientes c
+          ON c.id = p.cliente_id
+         AND c.workspace_id = p.workspace_id
+        WHERE p.workspace_id = ? AND (
+    '''
+    params = [workspace_id]
+    limite = AssistenteIA.parse_limited_int(args.get('limite'), default=10, max_value=50)
+
+    # Índice textual: ignora acentos e tolera erros de digitação; ordena por relevância
+    termos = [str(args[campo]) for campo in ('numero', 'titulo', 'cliente') if args.get(campo)]
+    ids_indice: Optional[List[int]] = [] if termos else None
+    for termo in termos:
+        encontrados = buscar_indice(db, workspace_id, termo, 'processo', limite=limite)
+        if encontrados is None:
+            ids_indice = None
+            break
+        ids_indice.extend(i for i in encontrados if i not in ids_indice)
+    if ids_indice is not None:
+        rows = db.execute(
+            query + 'p.id IN (SELECT value FROM json_each(?)))',
+            (workspace_id, json.dumps(ids_indice)),
+        ).fetchall()
+        ordem = {processo_id: pos for pos, processo_id in enumerate(ids_indice)}
+        rows = sorted(rows, key=lambda r: ordem.get(r['id'], len(ordem)))[:limite]
+        return {'processos': [AssistenteIA.serializar_processo_para_ia(r) for r in rows]}
+
+    conditions = []
+    if args.get('numero'):
+        conditions.append('(p.numero LIKE ? OR p.numero_cnj LIKE ?)')
+        params.append(f"%{args['numero']}%")
+        params.append(f"%{args['numero']}%")
+    if args.get('titulo'):
+        conditions.append('p.titulo LIKE ?')
+        params.append(f"%{args['titulo']}%")
+    if args.get('cliente'):
+        conditions.append('LOWER(COALESCE(c.nome, "")) LIKE ?')
+        params.append(f"%{str(args['cliente']).lower()}%")
+
+    query += ' OR '.join(conditions) + ')' if conditions else '1=0)'
+    query += ' ORDER BY p.created_at DESC LIMIT ?'
+    params.append(limite)
+
+    rows = db.execute(query, params).fetchall()
+    return {'processos': [AssistenteIA.serializar_processo_para_ia(r) for r in rows]}
+
+
+@registrar_funcao_assistente('listar_movimentacoes_recentes')
+def _funcao_listar_movimentacoes_recentes(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    select_sql = '''
+        SELECT m.id,
+               m.workspace_id,
+               m.processo_id,
+               m.codigo_movimento,
+               m.nome_movimento,
+               m.data_movimento,
+               m.fonte,
+               p.numero as processo_numero,
+               p.numero_cnj as processo_numero_cnj,
+               p.titulo as processo_titulo,
+               c.nome as cliente_nome
+    '''
+    query = '''
+        FROM movimentacoes_processo m
+        JOIN processos p ON p.id = m.processo_id
+        LEFT JOIN clientes c
+          ON c.id = p.cliente_id
+         AND c.workspace_id = p.workspace_id
+        WHERE m.workspace_id = ?
+    '''
+    params: List[Any] = [workspace_id]
+
+    processo_numero = (args.get('processo_numero') or '').strip()
+    if processo_numero:
+        query += ' AND (p.numero LIKE ? OR COALESCE(p.numero_cnj, "") LIKE ?)'
+        like_proc = f"%{processo_numero}%"
+        params.extend([like_proc, like_proc])
+
+    termo = (args.get('termo') or '').strip()
+    if termo:
+        mov_ids = buscar_indice(db, workspace_id, termo, 'movimentacao', limite=500)
+        if mov_ids is None:
+            query += ' AND LOWER(m.nome_movimento) LIKE ?'
+            params.append(f"%{termo.lower()}%")
+        else:
+            query += ' AND m.id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(mov_ids))
+
+    dias_raw = args.get('dias')
+    if dias_raw is not None:
+        dias = AssistenteIA.parse_limited_int(dias_raw, default=30, max_value=365)
+        data_limite = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d')
+        query += ' AND date(m.data_movimento) >= date(?)'
+        params.append(data_limite)
+
+    total = db.execute('SELECT COUNT(*) ' + query, params).fetchone()[0]
+    limite = AssistenteIA.parse_limited_int(args.get('limite'), default=20, max_value=100)
+    rows = db.execute(
+        select_sql + query + ' ORDER BY datetime(m.data_movimento) DESC, m.id DESC LIMIT ?',
+        params + [limite],
+    ).fetchall()
+    return {'movimentacoes': [dict(r) for r in rows], 'total': total}
+
+
+@registrar_funcao_assistente('proximos_prazos_criticos')
+def _funcao_proximos_prazos_criticos(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    dias = AssistenteIA.parse_limited_int(args.get('dias'), default=15, max_value=120)
+    limite = AssistenteIA.parse_limited_int(args.get('limite'), default=20, max_value=100)
+    incluir_vencidos_raw = args.get('incluir_vencidos', True)
+    incluir_vencidos = str(incluir_vencidos_raw).strip().lower() not in {'0', 'false', 'nao', 'não'}
+
+    hoje = datetime.now().strftime('%Y-%m-%d')
+    data_limite = (datetime.now() + timedelta(days=dias)).strftime('%Y-%m-%d')
+
+    select_sql = '''
+        SELECT p.id,
+               p.tipo,
+               p.data_prazo,
+               p.descricao,
+               p.status,
+               pr.id as processo_id,
+               pr.numero as processo_numero,
+               pr.numero_cnj as processo_numero_cnj,
+               pr.titulo as processo_titulo,
+               c.nome as cliente_nome,
+               CAST(julianday(date(p.data_prazo)) - julianday(date(?)) AS INTEGER) as dias_restantes
+    '''
+    query = '''
+        FROM prazos p
+        JOIN processos pr ON pr.id = p.processo_id
+        LEFT JOIN clientes c
+          ON c.id = pr.cliente_id
+         AND c.workspace_id = pr.workspace_id
+        WHERE p.workspace_id = ?
+          AND p.status = 'pendente'
+          AND p.data_prazo IS NOT NULL
+          AND date(p.data_prazo) <= date(?)
+    '''
+    params: List[Any] = [workspace_id, data_limite]
+
+    if not incluir_vencidos:
+        query += ' AND date(p.data_prazo) >= date(?)'
+        params.append(hoje)
+
+    total = db.execute('SELECT COUNT(*) ' + query, params).fetchone()[0]
+    rows = db.execute(
+        select_sql + query + ' ORDER BY date(p.data_prazo) ASC LIMIT ?',
+        [hoje] + params + [limite],
+    ).fetchall()
+    prazos = []
+    for row in rows:
+        item = dict(row)
+        dias_restantes = item.get('dias_restantes')
+        if dias_restantes is None:
+            criticidade = 'atencao'
+        elif int(dias_restantes) < 0:
+            criticidade = 'atrasado'
+        elif int(dias_restantes) == 0:
+            criticidade = 'hoje'
+        elif int(dias_restantes) <= 2:
+            criticidade = 'urgente'
+        elif int(dias_restantes) <= 7:
+            criticidade = 'atencao'
+        else:
+            criticidade = 'planejado'
+        item['criticidade'] = criticidade
+        prazos.append(item)
+
+    return {
+        'prazos_criticos': prazos,
+        'janela_dias': dias,
+        'inclui_vencidos': incluir_vencidos,
+        'total': total,
+    }
+
+
+@registrar_funcao_assistente('resumo_processo_360')
+def _funcao_resumo_processo_360(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    processo_id = args.get('processo_id')
+    numero = (args.get('numero') or '').strip()
+    titulo = (args.get('titulo') or '').strip()
+
+    query = '''
+        SELECT p.*,
+               c.nome as cliente_nome,
+               c.email as cliente_email,
+               c.telefone as cliente_telefone
+        FROM processos p
+        LEFT JOIN clientes c
+          ON c.id = p.cliente_id
+         AND c.workspace_id = p.workspace_id
+        WHERE p.workspace_id = ?
+    '''
+    params: List[Any] = [workspace_id]
+
+    if processo_id:
+        query += ' AND p.id = ?'
+        params.append(processo_id)
+    elif numero:
+        query += ' AND (p.numero LIKE ? OR COALESCE(p.numero_cnj, "") LIKE ?)'
+        like_num = f'%{numero}%'
+        params.extend([like_num, like_num])
+    elif titulo:
+        query += ' AND p.titulo LIKE ?'
+        params.append(f'%{titulo}%')
+    else:
+        return {'erro': 'Informe processo_id, numero ou titulo para gerar o resumo 360'}
+
+    query += ' ORDER BY p.created_at DESC LIMIT 1'
+    processo_row = db.execute(query, params).fetchone()
+    if not processo_row:
+        return {'erro': 'Processo não encontrado'}
+
+    processo = AssistenteIA.serializar_processo_para_ia(processo_row)
+    processo_id = int(processo['id'])
+
+    movimentacoes_rows = db.execute(
+        '''SELECT id, codigo_movimento, nome_movimento, data_movimento, fonte
+           FROM movimentacoes_processo
+           WHERE workspace_id = ? AND processo_id = ?
+           ORDER BY datetime(data_movimento) DESC, id DESC
+           LIMIT 5''',
+        (workspace_id, processo_id),
+    ).fetchall()
+
+    prazos_rows = db.execute(
+        '''SELECT id, tipo, data_prazo, descricao, status,
+                  CAST(julianday(date(data_prazo)) - julianday(date('now')) AS INTEGER) as dias_restantes
+           FROM prazos
+           WHERE workspace_id = ?
+             AND processo_id = ?
+             AND status = 'pendente'
+           ORDER BY date(data_prazo) ASC
+           LIMIT 5''',
+        (workspace_id, processo_id),
+    ).fetchall()
+
+    tarefas_rows = db.execute(
+        '''SELECT t.id, t.titulo, t.descricao, t.prioridade, t.status, t.data_vencimento,
+                  u.nome as responsavel_nome,
+                  CAST(julianday(date(t.data_vencimento)) - julianday(date('now')) AS INTEGER) as dias_para_vencer
+           FROM tarefas t
+           LEFT JOIN users u ON u.id = t.assigned_to
+           WHERE t.workspace_id = ?
+             AND t.processo_id = ?
+             AND t.status IN ('pendente', 'em_andamento')
+           ORDER BY
+             CASE WHEN t.data_vencimento IS NULL THEN 1 ELSE 0 END ASC,
+             date(t.data_vencimento) ASC,
+             t.created_at DESC
+           LIMIT 7''',
+        (workspace_id, processo_id),
+    ).fetchall()
+
+    receitas = db.execute(
+        '''SELECT COALESCE(SUM(valor), 0) as total
+           FROM financeiro
+           WHERE workspace_id = ? AND processo_id = ? AND tipo IN ('receita', 'entrada')''',
+        (workspace_id, processo_id),
+    ).fetchone()['total']
+    despesas = db.execute(
+        '''SELECT COALESCE(SUM(valor), 0) as total
+           FROM financeiro
+           WHERE workspace_id = ? AND processo_id = ? AND tipo IN ('despesa', 'saida')''',
+        (workspace_id, processo_id),
+    ).fetchone()['total']
+
+    total_movimentacoes = db.execute(
+        '''SELECT COUNT(*) as total
+           FROM movimentacoes_processo
+           WHERE workspace_id = ? AND processo_id = ?''',
+        (workspace_id, processo_id),
+    ).fetchone()['total']
+    total_prazos_pendentes = db.execute(
+        '''SELECT COUNT(*) as total
+           FROM prazos
+           WHERE workspace_id = ? AND processo_id = ? AND status = 'pendente' ''',
+        (workspace_id, processo_id),
+    ).fetchone()['total']
+    total_tarefas_abertas = db.execute(
+        '''SELECT COUNT(*) as total
+           FROM tarefas
+           WHERE workspace_id = ?
+             AND processo_id = ?
+             AND status IN ('pendente', 'em_andamento')''',
+        (workspace_id, processo_id),
+    ).fetchone()['total']
+
+    return {
+        'processo': processo,
+        'movimentacoes_recentes': [dict(r) for r in movimentacoes_rows],
+        'prazos_pendentes': [dict(r) for r in prazos_rows],
+        'tarefas_abertas': [dict(r) for r in tarefas_rows],
+        'financeiro_processo': {
+            'receitas': receitas,
+            'despesas': despesas,
+            'saldo': receitas - despesas,
+        },
+        'indicadores': {
+            'total_movimentacoes': total_movimentacoes,
+            'total_prazos_pendentes': total_prazos_pendentes,
+            'total_tarefas_abertas': total_tarefas_abertas,
+        },
+    }
+
+
+@registrar_funcao_assistente('listar_prazos')
+def _funcao_listar_prazos(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    query = 'SELECT p.*, pr.numero as processo_numero FROM prazos p '
+    query += 'JOIN processos pr ON p.processo_id = pr.id WHERE p.workspace_id = ?'
+    params = [workspace_id]
+
+    status = (args.get('status') or '').strip().lower()
+    if status == 'vencido':
+        hoje = datetime.now().strftime('%Y-%m-%d')
+        query += " AND p.status = 'pendente' AND date(p.data_prazo) < date(?)"
+        params.append(hoje)
+    elif status:
+        query += ' AND p.status = ?'
+        params.append(status)
+
+    if args.get('dias'):
+        dias = AssistenteIA.parse_limited_int(args.get('dias'), default=30, max_value=365)
+        data_limite = (datetime.now() + timedelta(days=dias)).strftime('%Y-%m-%d')
+        query += ' AND p.data_prazo <= ?'
+        params.append(data_limite)
+
+    query += ' ORDER BY p.data_prazo'
+    limite = AssistenteIA.parse_limited_int(args.get('limite'), default=30, max_value=100)
+    query += ' LIMIT ?'
+    params.append(limite)
+
+    rows = db.execute(query, params).fetchall()
+    return {'prazos': [dict(r) for r in rows]}
+
+
+@registrar_funcao_assistente('listar_tarefas')
+def _funcao_listar_tarefas(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    query = 'FROM tarefas WHERE workspace_id = ?'
+    params = [workspace_id]
+
+    if args.get('status'):
+        query += ' AND status = ?'
+        params.append(args['status'])
+
+    if args.get('prioridade'):
+        query += ' AND prioridade = ?'
+        params.append(args['prioridade'])
+
+    total = db.execute('SELECT COUNT(*) ' + query, params).fetchone()[0]
+    limite = AssistenteIA.parse_limited_int(args.get('limite'), default=30, max_value=100)
+    rows = db.execute('SELECT * ' + query + ' ORDER BY created_at DESC LIMIT ?', params + [limite]).fetchall()
+    return {'tarefas': [dict(r) for r in rows], 'total': total}
+
+
+@registrar_funcao_assistente('listar_clientes')
+def _funcao_listar_clientes(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    query = 'SELECT * FROM clientes WHERE workspace_id = ?'
+    params = [workspace_id]
+
+    if args.get('nome'):
+        query += ' AND nome LIKE ?'
+        params.append(f"%{args['nome']}%")
+
+    query += ' ORDER BY nome'
+    limite = AssistenteIA.parse_limited_int(args.get('limite'), default=50, max_value=200)
+    query += ' LIMIT ?'
+    params.append(limite)
+
+    rows = db.execute(query, params).fetchall()
+    return {'clientes': [dict(r) for r in rows]}
+
+
+@registrar_funcao_assistente('resumo_financeiro')
+def _funcao_resumo_financeiro(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    hoje = datetime.now()
+
+    if args.get('periodo') == 'mes_atual':
+        inicio = hoje.replace(day=1).strftime('%Y-%m-%d')
+        fim = hoje.strftime('%Y-%m-%d')
+    elif args.get('periodo') == 'mes_anterior':
+        inicio = (hoje.replace(day=1) - timedelta(days=1)).replace(day=1).strftime('%Y-%m-%d')
+        fim = hoje.replace(day=1).strftime('%Y-%m-%d')
+    else:
+        inicio = hoje.replace(month=1, day=1).strftime('%Y-%m-%d')
+        fim = hoje.strftime('%Y-%m-%d')
+
+    receitas = db.execute(
+        '''SELECT COALESCE(SUM(valor), 0) as total
+           FROM financeiro
+           WHERE workspace_id = ?
+             AND tipo IN ('receita', 'entrada')
+             AND data BETWEEN ? AND ?''',
+        (workspace_id, inicio, fim)
+    ).fetchone()['total']
+
+    despesas = db.execute(
+        '''SELECT COALESCE(SUM(valor), 0) as total
+           FROM financeiro
+           WHERE workspace_id = ?
+             AND tipo IN ('despesa', 'saida')
+             AND data BETWEEN ? AND ?''',
+        (workspace_id, inicio, fim)
+    ).fetchone()['total']
+
+    return {
+        'receitas': receitas,
+        'despesas': despesas,
+        'saldo': receitas - despesas,
+        'periodo': args.get('periodo', 'ano')
+    }
+
+
+@registrar_funcao_assistente('gerar_mensagem_whatsapp_contextual')
+def _funcao_gerar_mensagem_whatsapp_contextual(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    destino = (args.get('destino') or 'cliente').strip().lower()
+    if destino not in {'cliente', 'equipe'}:
+        destino = 'cliente'
+
+    tipo_contexto = (args.get('tipo_contexto') or 'comunicado').strip().lower()
+    if tipo_contexto not in {'movimentacao', 'prazo', 'tarefa', 'status_processo', 'comunicado'}:
+        tipo_contexto = 'comunicado'
+
+    tom = (args.get('tom') or 'acolhedor').strip().lower()
+    if tom not in {'formal', 'acolhedor', 'direto'}:
+        tom = 'acolhedor'
+
+    processo_numero = (args.get('processo_numero') or '').strip()
+    cliente_nome_informado = (args.get('cliente_nome') or '').strip()
+    objetivo = (args.get('objetivo') or '').strip()
+
+    processo = None
+    if processo_numero:
+        processo_row = db.execute(
+            '''SELECT p.*,
+                      c.nome as cliente_nome
+               FROM processos p
+               LEFT JOIN clientes c
+                 ON c.id = p.cliente_id
+                AND c.workspace_id = p.workspace_id
+               WHERE p.workspace_id = ?
+                 AND (p.numero LIKE ? OR COALESCE(p.numero_cnj, '') LIKE ?)
+               ORDER BY p.created_at DESC
+               LIMIT 1''',
+            (workspace_id, f'%{processo_numero}%', f'%{processo_numero}%'),
+        ).fetchone()
+        if processo_row:
+            processo = dict(processo_row)
+
+    cliente_nome = cliente_nome_informado or (processo.get('cliente_nome') if processo else '')
+    if not cliente_nome and destino == 'cliente':
+        cliente_nome = 'cliente'
+
+    cabecalho = 'Olá!' if destino == 'cliente' else 'Equipe,'
+    if destino == 'cliente' and cliente_nome:
+        cabecalho = f'Olá, {cliente_nome}!'
+
+    contexto_linha = ''
+    if processo:
+        contexto_linha = (
+            f"Processo {processo.get('numero') or processo.get('numero_cnj') or ''} "
+            f"- {processo.get('titulo') or 'sem título'}"
+        ).strip()
+
+    detalhe = ''
+    if tipo_contexto == 'movimentacao' and processo:
+        mov_row = db.execute(
+            '''SELECT nome_movimento, data_movimento
+               FROM movimentacoes_processo
+               WHERE workspace_id = ? AND processo_id = ?
+               ORDER BY datetime(data_movimento) DESC, id DESC
+               LIMIT 1''',
+            (workspace_id, processo['id']),
+        ).fetchone()
+        if mov_row:
+            detalhe = (
+                f"Identificamos nova movimentação em {mov_row['data_movimento']}: "
+                f"{mov_row['nome_movimento']}."
             )
-            responsavel = AssistenteIA.buscar_usuario_para_acao(
-                db=db,
-                workspace_id=workspace_id,
-                user_id=_to_int(args.get('responsavel_id')),
-                nome=str(args.get('responsavel_nome') or '').strip(),
+        else:
+            detalhe = 'Não há movimentação recente registrada no momento.'
+    elif tipo_contexto == 'prazo' and processo:
+        prazo_row = db.execute(
+            '''SELECT tipo, data_prazo, descricao
+               FROM prazos
+               WHERE workspace_id = ?
+                 AND processo_id = ?
+                 AND status = 'pendente'
+               ORDER BY date(data_prazo) ASC
+               LIMIT 1''',
+            (workspace_id, processo['id']),
+        ).fetchone()
+        if prazo_row:
+            detalhe = (
+                f"Próximo prazo: {prazo_row['tipo']} em {prazo_row['data_prazo']}. "
+                f"Detalhe: {prazo_row['descricao'] or '-'}."
             )
+        else:
+            detalhe = 'No momento não há prazos pendentes para este processo.'
+    elif tipo_contexto == 'tarefa' and processo:
+        tarefa_row = db.execute(
+            '''SELECT titulo, data_vencimento, prioridade
+               FROM tarefas
+               WHERE workspace_id = ?
+                 AND processo_id = ?
+                 AND status IN ('pendente', 'em_andamento')
+               ORDER BY
+                 CASE WHEN data_vencimento IS NULL THEN 1 ELSE 0 END ASC,
+                 date(data_vencimento) ASC,
+                 created_at DESC
+               LIMIT 1''',
+            (workspace_id, processo['id']),
+        ).fetchone()
+        if tarefa_row:
+            detalhe = (
+                f"Tarefa em aberto: {tarefa_row['titulo']} "
+                f"(prioridade {tarefa_row['prioridade']}, vencimento {tarefa_row['data_vencimento'] or 'sem data'})."
+            )
+        else:
+            detalhe = 'Não há tarefas pendentes vinculadas a este processo.'
+    elif tipo_contexto == 'status_processo' and processo:
+        detalhe = (
+            f"Status atual do processo: {processo.get('status') or 'não informado'}. "
+            f"Último movimento registrado: {processo.get('ultimo_movimento') or 'sem registro'}."
+        )
+    else:
+        detalhe = 'Passando um comunicado rápido sobre o andamento atual.'
+
+    objetivo_linha = f"Objetivo: {objetivo}" if objetivo else ''
+
+    mensagem_base = '\n'.join(
+        line for line in [
+            cabecalho,
+            contexto_linha,
+            detalhe,
+            objetivo_linha,
+            'Se precisar, sigo à disposição por aqui.',
+        ] if line
+    )
 
-            payload = {
-                'titulo': titulo,
-                'descricao': str(args.get('descricao') or '').strip() or None,
-                'prioridade': prioridade,
-                'data_vencimento': str(args.get('data_vencimento') or '').strip() or None,
-                'processo_id': int(processo['id']) if processo else None,
-                'assigned_to_id': int(responsavel['id']) if responsavel else int(user_id),
-            }
+    preferencia_tom = {
+        'formal': 'Tom formal, claro e respeitoso.',
+        'acolhedor': 'Tom acolhedor e humano, sem perder objetividade.',
+        'direto': 'Tom direto e curto, com chamada clara para ação.',
+    }[tom]
 
-            preview_linhas = [
-                'Criar tarefa',
-                f"Título: {titulo}",
-                f"Prioridade: {prioridade}",
-            ]
-            if payload.get('descricao'):
-                preview_linhas.append(f"Descrição: {payload.get('descricao')}")
-            if payload.get('data_vencimento'):
-                preview_linhas.append(f"Vencimento: {payload.get('data_vencimento')}")
-            if processo:
-                preview_linhas.append(
-                    f"Processo: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')} - {processo.get('titulo') or 'sem título'}"
-                )
-            if responsavel:
-                preview_linhas.append(f"Responsável: {responsavel.get('nome') or responsavel.get('email')}")
+    mensagem_final = maybe_generate_whatsapp_message_with_ai(
+        base_message=mensagem_base,
+        objective=f"Gerar mensagem de WhatsApp contextual para {destino} no contexto {tipo_contexto}.",
+        ai_prompt=preferencia_tom,
+    )
 
-            preview = '\n'.join(preview_linhas)
-            acao = AssistenteIA.criar_acao_pendente(
-                db=db,
-                workspace_id=workspace_id,
-                user_id=user_id,
-                session_id=session_id,
-                action_type='criar_tarefa',
-                payload=payload,
-                preview=preview,
-            )
+    processo_preview = None
+    if processo:
+        processo_preview = {
+            'id': processo.get('id'),
+            'numero': processo.get('numero'),
+            'numero_cnj': processo.get('numero_cnj'),
+            'titulo': processo.get('titulo'),
+            'cliente_nome': processo.get('cliente_nome'),
+        }
 
-            resposta = (
-                f"Prévia da ação solicitada:\n{preview}\n\n"
-                "Use os botões de confirmação abaixo para confirmar ou recusar."
+    return {
+        'mensagem': mensagem_final,
+        'mensagem_base': mensagem_base,
+        'destino': destino,
+        'tipo_contexto': tipo_contexto,
+        'tom': tom,
+        'processo': processo_preview,
+        'cliente_nome': cliente_nome or None,
+    }
+
+
+@registrar_funcao_assistente('solicitar_criacao_prazo', somente_leitura=False)
+def _funcao_solicitar_criacao_prazo(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    if user_id is None:
+        return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
+
+    tipo_prazo = str(args.get('tipo') or '').strip()
+    if not tipo_prazo:
+        return {'erro': 'Tipo do prazo é obrigatório'}
+
+    data_prazo_raw = str(args.get('data_prazo') or '').strip()
+    if not data_prazo_raw:
+        return {'erro': 'Data do prazo é obrigatória'}
+    data_prazo = data_prazo_raw[:10]
+    try:
+        datetime.strptime(data_prazo, '%Y-%m-%d')
+    except ValueError:
+        return {'erro': 'Data do prazo inválida. Use YYYY-MM-DD (ex.: 2026-03-30).'}
+
+    processo = AssistenteIA.buscar_processo_para_acao(
+        db=db,
+        workspace_id=workspace_id,
+        processo_id=_ia_to_int(args.get('processo_id')),
+        numero=str(args.get('processo_numero') or '').strip(),
+        titulo=str(args.get('processo_titulo') or '').strip(),
+    )
+
+    if not processo:
+        cliente_nome = str(args.get('cliente_nome') or '').strip().lower()
+        if cliente_nome:
+            processo_row = db.execute(
+                '''SELECT p.*, c.nome as cliente_nome
+                   FROM processos p
+                   LEFT JOIN clientes c ON c.id = p.cliente_id AND c.workspace_id = p.workspace_id
+                   WHERE p.workspace_id = ?
+                     AND LOWER(COALESCE(c.nome, '')) LIKE ?
+                     AND LOWER(COALESCE(p.status, '')) = 'ativo'
+                   ORDER BY p.created_at DESC
+                   LIMIT 1''',
+                (workspace_id, f'%{cliente_nome}%'),
+            ).fetchone()
+            if processo_row:
+                processo = dict(processo_row)
+
+    if not processo:
+        return {
+            'erro': (
+                'Não consegui identificar o processo para este prazo. '
+                'Informe o número/CNJ do processo ou o título exato.'
             )
-            return {
-                'ok': True,
-                'acao_pendente': acao,
-                '_acao_pendente': acao,
-                '_final_resposta': resposta,
-                '_acoes_sugeridas': [],
-            }
+        }
 
-        elif nome == 'solicitar_lancamento_financeiro_entrada':
-            if user_id is None:
-                return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
+    status_prazo = str(args.get('status') or 'pendente').strip().lower()
+    if status_prazo not in {'pendente', 'cumprido'}:
+        status_prazo = 'pendente'
 
-            try:
-                valor = float(args.get('valor'))
-            except (TypeError, ValueError):
-                return {'erro': 'Valor inválido para lançamento financeiro'}
-            if valor <= 0:
-                return {'erro': 'Valor deve ser maior que zero'}
+    payload = {
+        'tipo': tipo_prazo,
+        'descricao': str(args.get('descricao') or '').strip() or None,
+        'data_prazo': data_prazo,
+        'status': status_prazo,
+        'processo_id': int(processo['id']),
+    }
+
+    preview_linhas = [
+        'Criar prazo',
+        f'Tipo: {tipo_prazo}',
+        f'Data: {data_prazo}',
+        f'Status: {status_prazo}',
+        (
+            f"Processo: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')} "
+            f"- {processo.get('titulo') or 'sem título'}"
+        ),
+    ]
+    if payload.get('descricao'):
+        preview_linhas.append(f"Descrição: {payload.get('descricao')}")
+
+    preview = '\n'.join(preview_linhas)
+    acao = AssistenteIA.criar_acao_pendente(
+        db=db,
+        workspace_id=workspace_id,
+        user_id=user_id,
+        session_id=session_id,
+        action_type='criar_prazo',
+        payload=payload,
+        preview=preview,
+    )
+
+    resposta = (
+        f"Prévia da ação solicitada:\n{preview}\n\n"
+        "Use os botões de confirmação abaixo para confirmar ou recusar."
+    )
+    return {
+        'ok': True,
+        'acao_pendente': acao,
+        '_acao_pendente': acao,
+        '_final_resposta': resposta,
+        '_acoes_sugeridas': [],
+    }
+
+
+@registrar_funcao_assistente('solicitar_criacao_tarefa', somente_leitura=False)
+def _funcao_solicitar_criacao_tarefa(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    if user_id is None:
+        return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
+
+    titulo = str(args.get('titulo') or '').strip()
+    if not titulo:
+        return {'erro': 'Título da tarefa é obrigatório'}
+
+    prioridade = str(args.get('prioridade') or 'media').strip().lower()
+    if prioridade not in {'baixa', 'media', 'alta', 'urgente'}:
+        prioridade = 'media'
+
+    processo = AssistenteIA.buscar_processo_para_acao(
+        db=db,
+        workspace_id=workspace_id,
+        processo_id=_ia_to_int(args.get('processo_id')),
+        numero=str(args.get('processo_numero') or '').strip(),
+        titulo=str(args.get('processo_titulo') or '').strip(),
+    )
+    responsavel = AssistenteIA.buscar_usuario_para_acao(
+        db=db,
+        workspace_id=workspace_id,
+        user_id=_ia_to_int(args.get('responsavel_id')),
+        nome=str(args.get('responsavel_nome') or '').strip(),
+    )
+
+    payload = {
+        'titulo': titulo,
+        'descricao': str(args.get('descricao') or '').strip() or None,
+        'prioridade': prioridade,
+        'data_vencimento': str(args.get('data_vencimento') or '').strip() or None,
+        'processo_id': int(processo['id']) if processo else None,
+        'assigned_to_id': int(responsavel['id']) if responsavel else int(user_id),
+    }
+
+    preview_linhas = [
+        'Criar tarefa',
+        f"Título: {titulo}",
+        f"Prioridade: {prioridade}",
+    ]
+    if payload.get('descricao'):
+        preview_linhas.append(f"Descrição: {payload.get('descricao')}")
+    if payload.get('data_vencimento'):
+        preview_linhas.append(f"Vencimento: {payload.get('data_vencimento')}")
+    if processo:
+        preview_linhas.append(
+            f"Processo: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')} - {processo.get('titulo') or 'sem título'}"
+        )
+    if responsavel:
+        preview_linhas.append(f"Responsável: {responsavel.get('nome') or responsavel.get('email')}")
+
+    preview = '\n'.join(preview_linhas)
+    acao = AssistenteIA.criar_acao_pendente(
+        db=db,
+        workspace_id=workspace_id,
+        user_id=user_id,
+        session_id=session_id,
+        action_type='criar_tarefa',
+        payload=payload,
+        preview=preview,
+    )
+
+    resposta = (
+        f"Prévia da ação solicitada:\n{preview}\n\n"
+        "Use os botões de confirmação abaixo para confirmar ou recusar."
+    )
+    return {
+        'ok': True,
+        'acao_pendente': acao,
+        '_acao_pendente': acao,
+        '_final_resposta': resposta,
+        '_acoes_sugeridas': [],
+    }
 
-            descricao = str(args.get('descricao') or '').strip()
-            if not descricao:
-                return {'erro': 'Descrição é obrigatória para lançamento financeiro'}
 
-            processo = AssistenteIA.buscar_processo_para_acao(
+@registrar_funcao_assistente('solicitar_lancamento_financeiro_entrada', somente_leitura=False)
+def _funcao_solicitar_lancamento_financeiro_entrada(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    if user_id is None:
+        return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
+
+    try:
+        valor = float(args.get('valor'))
+    except (TypeError, ValueError):
+        return {'erro': 'Valor inválido para lançamento financeiro'}
+    if valor <= 0:
+        return {'erro': 'Valor deve ser maior que zero'}
+
+    descricao = str(args.get('descricao') or '').strip()
+    if not descricao:
+        return {'erro': 'Descrição é obrigatória para lançamento financeiro'}
+
+    processo = AssistenteIA.buscar_processo_para_acao(
+        db=db,
+        workspace_id=workspace_id,
+        processo_id=_ia_to_int(args.get('processo_id')),
+        numero=str(args.get('processo_numero') or '').strip(),
+        titulo='',
+    )
+    cliente = AssistenteIA.buscar_cliente_para_acao(
+        db=db,
+        workspace_id=workspace_id,
+        cliente_id=_ia_to_int(args.get('cliente_id')),
+        nome=str(args.get('cliente_nome') or '').strip(),
+    )
+    if not cliente and processo and processo.get('cliente_id'):
+        cliente = AssistenteIA.buscar_cliente_para_acao(
+            db=db,
+            workspace_id=workspace_id,
+            cliente_id=_ia_to_int(processo.get('cliente_id')),
+            nome='',
+        )
+
+    data_lancamento = str(args.get('data') or datetime.now().strftime('%Y-%m-%d')).strip()
+    categoria = str(args.get('categoria') or 'geral').strip() or 'geral'
+    status_lancamento = str(args.get('status') or 'pendente').strip().lower()
+    if status_lancamento not in {'pendente', 'pago', 'cancelado'}:
+        status_lancamento = 'pendente'
+
+    payload = {
+        'valor': valor,
+        'descricao': descricao,
+        'categoria': categoria,
+        'data': data_lancamento,
+        'status': status_lancamento,
+        'processo_id': int(processo['id']) if processo else None,
+        'cliente_id': int(cliente['id']) if cliente else None,
+    }
+
+    valor_fmt = f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+    preview_linhas = [
+        'Lançar entrada financeira',
+        f'Valor: R$ {valor_fmt}',
+        f'Descrição: {descricao}',
+        f'Categoria: {categoria}',
+        f'Data: {data_lancamento}',
+        f'Status: {status_lancamento}',
+    ]
+    if processo:
+        preview_linhas.append(
+            f"Processo: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')} - {processo.get('titulo') or 'sem título'}"
+        )
+    if cliente:
+        preview_linhas.append(f"Cliente: {cliente.get('nome') or cliente.get('id')}")
+    preview = '\n'.join(preview_linhas)
+
+    acao = AssistenteIA.criar_acao_pendente(
+        db=db,
+        workspace_id=workspace_id,
+        user_id=user_id,
+        session_id=session_id,
+        action_type='lancar_financeiro_entrada',
+        payload=payload,
+        preview=preview,
+    )
+
+    resposta = (
+        f"Prévia da ação solicitada:\n{preview}\n\n"
+        "Use os botões de confirmação abaixo para confirmar ou recusar."
+    )
+    return {
+        'ok': True,
+        'acao_pendente': acao,
+        '_acao_pendente': acao,
+        '_final_resposta': resposta,
+        '_acoes_sugeridas': [],
+    }
+
+
+@registrar_funcao_assistente('solicitar_envio_whatsapp', somente_leitura=False)
+def _funcao_solicitar_envio_whatsapp(
+    db,
+    args: Dict,
+    workspace_id: int,
+    user_id: Optional[int],
+    session_id: str,
+) -> Dict:
+    if user_id is None:
+        return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
+    if not whatsapp_service.is_configured():
+        return {'erro': 'Serviço WhatsApp não configurado'}
+
+    mensagem_envio = str(args.get('mensagem') or '').strip()
+    if not mensagem_envio:
+        return {'erro': 'Mensagem é obrigatória para envio no WhatsApp'}
+
+    destino = str(args.get('destino') or '').strip().lower()
+    if destino not in {'cliente', 'equipe', 'telefone'}:
+        return {'erro': 'Destino inválido para envio WhatsApp'}
+
+    payload: Dict[str, Any] = {
+        'mensagem': mensagem_envio,
+        'destino': destino,
+    }
+    preview_linhas = [
+        f'Enviar WhatsApp para {destino}',
+        f"Mensagem: {mensagem_envio[:400]}",
+    ]
+
+    if destino == 'cliente':
+        processo = AssistenteIA.buscar_processo_para_acao(
+            db=db,
+            workspace_id=workspace_id,
+            processo_id=None,
+            numero=str(args.get('processo_numero') or '').strip(),
+            titulo='',
+        )
+        cliente = AssistenteIA.buscar_cliente_para_acao(
+            db=db,
+            workspace_id=workspace_id,
+            cliente_id=_ia_to_int(args.get('cliente_id')),
+            nome=str(args.get('cliente_nome') or '').strip(),
+        )
+        if not cliente and processo and processo.get('cliente_id'):
+            cliente = AssistenteIA.buscar_cliente_para_acao(
                 db=db,
                 workspace_id=workspace_id,
-                processo_id=_to_int(args.get('processo_id')),
-                numero=str(args.get('processo_numero') or '').strip(),
-                titulo='',
+                cliente_id=_ia_to_int(processo.get('cliente_id')),
+                nome='',
             )
-            cliente = AssistenteIA.buscar_cliente_para_acao(
+        if not cliente:
+            return {'erro': 'Cliente não encontrado para envio de WhatsApp'}
+
+        payload['cliente_id'] = int(cliente['id'])
+        preview_linhas.append(f"Cliente: {cliente.get('nome') or cliente.get('id')}")
+        if cliente.get('telefone'):
+            preview_linhas.append(f"Telefone: {cliente.get('telefone')}")
+        if processo:
+            preview_linhas.append(
+                f"Processo referência: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')}"
+            )
+
+    elif destino == 'equipe':
+        enviar_para_toda_equipe = parse_bool(args.get('enviar_para_toda_equipe', False))
+        if enviar_para_toda_equipe:
+            payload['user_ids'] = []
+            preview_linhas.append('Destino: toda a equipe com telefone')
+        else:
+            responsavel = AssistenteIA.buscar_usuario_para_acao(
                 db=db,
                 workspace_id=workspace_id,
-                cliente_id=_to_int(args.get('cliente_id')),
-                nome=str(args.get('cliente_nome') or '').strip(),
+                user_id=_ia_to_int(args.get('responsavel_id')),
+                nome=str(args.get('responsavel_nome') or '').strip(),
             )
-            if not cliente and processo and processo.get('cliente_id'):
-                cliente = AssistenteIA.buscar_cliente_para_acao(
-                    db=db,
-                    workspace_id=workspace_id,
-                    cliente_id=_to_int(processo.get('cliente_id')),
-                    nome='',
+            if responsavel:
+                payload['user_ids'] = [int(responsavel['id'])]
+                preview_linhas.append(
+                    f"Destino: {responsavel.get('nome') or responsavel.get('email')}"
                 )
+            else:
+                payload['user_ids'] = []
+                preview_linhas.append('Destino: toda a equipe com telefone')
 
-            data_lancamento = str(args.get('data') or datetime.now().strftime('%Y-%m-%d')).strip()
-            categoria = str(args.get('categoria') or 'geral').strip() or 'geral'
-            status_lancamento = str(args.get('status') or 'pendente').strip().lower()
-            if status_lancamento not in {'pendente', 'pago', 'cancelado'}:
-                status_lancamento = 'pendente'
-
-            payload = {
-                'valor': valor,
-                'descricao': descricao,
-                'categoria': categoria,
-                'data': data_lancamento,
-                'status': status_lancamento,
-                'processo_id': int(processo['id']) if processo else None,
-                'cliente_id': int(cliente['id']) if cliente else None,
-            }
+    else:  # telefone
+        telefone = str(args.get('telefone') or '').strip()
+        if not telefone:
+            return {'erro': 'Telefone é obrigatório quando destino=telefone'}
+        payload['telefone'] = telefone
+        preview_linhas.append(f'Telefone: {telefone}')
+
+    preview = '\n'.join(preview_linhas)
+    acao = AssistenteIA.criar_acao_pendente(
+        db=db,
+        workspace_id=workspace_id,
+        user_id=user_id,
+        session_id=session_id,
+        action_type='enviar_whatsapp',
+        payload=payload,
+        preview=preview,
+    )
+
+    resposta = (
+        f"Prévia da ação solicitada:\n{preview}\n\n"
+        "Use os botões de confirmação abaixo para confirmar ou recusar."
+    )
+    return {
+        'ok': True,
+        'acao_pendente': acao,
+        '_acao_pendente': acao,
+        '_final_resposta': resposta,
+        '_acoes_sugeridas': [],
+    }
+
+
+# ============================================================================
+# ROTEADOR DE INTENÇÕES DO COPILOTO (SEM LLM)
+# ============================================================================
+# Pedidos de leitura frequentes ("listar processos ativos", "prazos da semana",
+# "resumo financeiro") são mapeados direto para a função do Copiloto e
+# respondidos com formatação local. O classificador exige uma única âncora de
+# intenção e que todas as palavras da mensagem sejam conhecidas; qualquer
+# palavra fora do vocabulário (nome, cidade, mês, número de processo) ou verbo
+# de escrita manda a mensagem para o LLM, que sabe transformá-la em filtro.
+
+COPILOTO_ROTEADOR_ENABLED = os.getenv('COPILOTO_ROTEADOR_ENABLED', 'true').strip().lower() in ('1', 'true', 'sim', 'yes', 'on')
+COPILOTO_ROTEADOR_MAX_TOKENS = int(os.getenv('COPILOTO_ROTEADOR_MAX_TOKENS', '12'))
+
+
+def _data_br(valor: Any) -> str:
+    texto = str(valor or '')[:10]
+    try:
+        return datetime.strptime(texto, '%Y-%m-%d').strftime('%d/%m/%Y')
+    except ValueError:
+        return texto or '-'
+
+
+def _quantidade_intencao(itens: List, resultado: Dict) -> tuple:
+    """(total real, aviso de corte): o total vem do COUNT com os mesmos filtros da lista."""
+    total = resultado.get('total')
+    if not isinstance(total, int) or total <= len(itens):
+        return len(itens), ''
+    return total, f" (mostrando {len(itens)} de {total})"
+
+
+def _formatar_processos_intencao(resultado: Dict, args: Dict) -> str:
+    processos = resultado.get('processos') or []
+    rotulo = {'ativo': ' ativos', 'arquivado': ' arquivados', 'suspenso': ' suspensos'}.get(args.get('status'), '')
+    if not processos:
+        return f"Nenhum processo{rotulo} encontrado."
+    total, corte = _quantidade_intencao(processos, resultado)
+    linhas = [f"📁 **{total} processo(s){rotulo}**{corte}:"]
+    for processo in processos:
+        numero = processo.get('numero_cnj') or processo.get('numero') or f"#{processo.get('id')}"
+        cliente = f" — Cliente: {processo['cliente']}" if processo.get('cliente') else ''
+        linhas.append(f"- **{numero}** · {processo.get('titulo') or 'sem título'}{cliente}")
+    return '\n'.join(linhas)
+
+
+def _formatar_prazos_intencao(resultado: Dict, args: Dict) -> str:
+    prazos = resultado.get('prazos_criticos') or []
+    janela = resultado.get('janela_dias')
+    if not prazos:
+        return f"Nenhum prazo pendente nos próximos {janela} dia(s), nem vencido. ✅"
+    icones = {'atrasado': '🔴', 'hoje': '🟠', 'urgente': '🟠', 'atencao': '🟡', 'planejado': '🟢'}
+    total, corte = _quantidade_intencao(prazos, resultado)
+    linhas = [f"⏰ **{total} prazo(s) pendente(s) até {janela} dia(s)** (inclui vencidos){corte}:"]
+    for prazo in prazos:
+        dias = prazo.get('dias_restantes')
+        if dias is None:
+            quando = ''
+        elif dias < 0:
+            quando = f" — atrasado há {-dias} dia(s)"
+        elif dias == 0:
+            quando = ' — vence hoje'
+        else:
+            quando = f" — em {dias} dia(s)"
+        processo = prazo.get('processo_numero_cnj') or prazo.get('processo_numero') or ''
+        cliente = f" ({prazo['cliente_nome']})" if prazo.get('cliente_nome') else ''
+        linhas.append(
+            f"- {icones.get(prazo.get('criticidade'), '•')} {_data_br(prazo.get('data_prazo'))}{quando}: "
+            f"**{prazo.get('tipo') or 'Prazo'}** · {processo}{cliente}"
+        )
+    return '\n'.join(linhas)
+
+
+def _formatar_financeiro_intencao(resultado: Dict, args: Dict) -> str:
+    periodo = {'mes_atual': 'mês atual', 'mes_anterior': 'mês anterior'}.get(resultado.get('periodo'), 'ano até hoje')
+    return '\n'.join([
+        f"💰 **Resumo financeiro — {periodo}**",
+        f"- Receitas: {_format_currency_br(resultado.get('receitas'))}",
+        f"- Despesas: {_format_currency_br(resultado.get('despesas'))}",
+        f"- Saldo: **{_format_currency_br(resultado.get('saldo'))}**",
+    ])
+
+
+def _formatar_tarefas_intencao(resultado: Dict, args: Dict) -> str:
+    tarefas = resultado.get('tarefas') or []
+    rotulo = ' pendentes' if args.get('status') == 'pendente' else ''
+    if not tarefas:
+        return f"Nenhuma tarefa{rotulo} encontrada."
+    total, corte = _quantidade_intencao(tarefas, resultado)
+    linhas = [f"✅ **{total} tarefa(s){rotulo}**{corte}:"]
+    for tarefa in tarefas:
+        vencimento = f" — vence {_data_br(tarefa.get('data_vencimento'))}" if tarefa.get('data_vencimento') else ''
+        linhas.append(
+            f"- [{tarefa.get('prioridade') or 'media'}] **{tarefa.get('titulo')}** ({tarefa.get('status')}){vencimento}"
+        )
+    return '\n'.join(linhas)
+
+
+def _formatar_movimentacoes_intencao(resultado: Dict, args: Dict) -> str:
+    movimentacoes = resultado.get('movimentacoes') or []
+    if not movimentacoes:
+        return "Nenhuma movimentação recente encontrada."
+    total, corte = _quantidade_intencao(movimentacoes, resultado)
+    linhas = [f"📰 **{total} movimentação(ões) recente(s)**{corte}:"]
+    for mov in movimentacoes:
+        processo = mov.get('processo_numero_cnj') or mov.get('processo_numero') or ''
+        cliente = f" ({mov['cliente_nome']})" if mov.get('cliente_nome') else ''
+        linhas.append(f"- {_data_br(mov.get('data_movimento'))}: **{mov.get('nome_movimento')}** · {processo}{cliente}")
+    return '\n'.join(linhas)
+
+
+def _args_processos_intencao(tokens: set) -> Dict:
+    if tokens & {'arquivado', 'arquivados'}:
+        return {'status': 'arquivado'}
+    if tokens & {'suspenso', 'suspensos'}:
+        return {'status': 'suspenso'}
+    if tokens & {'ativo', 'ativos', 'andamento', 'aberto', 'abertos'}:
+        return {'status': 'ativo'}
+    return {}
+
+
+def _janela_dias_intencao(tokens: set) -> Optional[int]:
+    if tokens & {'hoje', 'amanha'}:
+        return 1
+    if 'semana' in tokens:
+        return 7
+    if 'mes' in tokens:
+        return 30
+    numeros = [int(t) for t in tokens if t.isdigit() and 0 < int(t) <= 120]
+    return numeros[0] if numeros else None
+
+
+def _args_prazos_intencao(tokens: set) -> Dict:
+    return {'dias': _janela_dias_intencao(tokens) or 15, 'incluir_vencidos': True}
+
+
+def _args_financeiro_intencao(tokens: set) -> Dict:
+    if tokens & {'passado', 'anterior'}:
+        return {'periodo': 'mes_anterior'}
+    if 'mes' in tokens:
+        return {'periodo': 'mes_atual'}
+    return {}
+
+
+def _args_tarefas_intencao(tokens: set) -> Dict:
+    args: Dict[str, Any] = {}
+    if tokens & {'pendente', 'pendentes', 'abertas', 'aberta'}:
+        args['status'] = 'pendente'
+    if tokens & {'urgente', 'urgentes'}:
+        args['prioridade'] = 'urgente'
+    elif 'alta' in tokens:
+        args['prioridade'] = 'alta'
+    return args
+
+
+def _args_movimentacoes_intencao(tokens: set) -> Dict:
+    dias = _janela_dias_intencao(tokens)
+    return {'dias': dias} if dias else {}
+
+
+class RoteadorIntencoes:
+    """Classifica mensagens em intenções de leitura respondidas sem LLM."""
+
+    VOCABULARIO_COMUM = {
+        'quais', 'qual', 'quantos', 'quantas', 'os', 'as', 'o', 'a', 'e', 'meu', 'meus', 'minha',
+        'minhas', 'me', 'mostre', 'mostra', 'mostrar', 'liste', 'listar', 'lista', 'ver', 'veja', 'exiba',
+        'exibir', 'traga', 'trazer', 'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na', 'nos', 'nas', 'por',
+        'favor', 'pf', 'pfv', 'quero', 'gostaria', 'tenho', 'temos', 'ha', 'tem', 'existem', 'para', 'pra',
+        'todos', 'todas', 'resumo', 'como', 'esta', 'estao', 'desta', 'deste', 'dessa', 'desse', 'nesta',
+        'neste', 'nessa', 'nesse', 'agora', 'atual', 'atuais', 'escritorio', 'oi', 'ola', 'dia',
+        'tarde', 'noite', 'preciso', 'saber', 'situacao', 'status', 'proximo', 'proximos',
+        'proxima', 'proximas', 'ultimos', 'ultimas', 'dias', 'semana', 'mes', 'hoje', 'amanha',
+    }
+    # Pedidos de escrita, explicação ou comparação sempre vão para o LLM
+    BLOQUEIO = {
+        'criar', 'crie', 'cadastre', 'cadastrar', 'agende', 'agendar', 'adicione', 'adicionar', 'lance',
+        'lancar', 'envie', 'enviar', 'mande', 'mandar', 'altere', 'alterar', 'exclua', 'excluir', 'apague',
+        'porque', 'explique', 'explicar', 'analise', 'analisar', 'compare', 'comparar', 'nao', 'sem',
+        'exceto', 'whatsapp', 'mensagem', 'redija', 'escreva', 'gere', 'gerar',
+    }
+    # Palavras que também são nomes de lugar/pessoa ("São Paulo", "Boa Vista"):
+    # só contam como conhecidas logo após um interrogativo ("quais são")
+    AMBIGUAS = {'sao'}
+    INTERROGATIVOS = {'quais', 'qual', 'quantos', 'quantas', 'que'}
+
+    INTENCOES = [
+        {
+            'nome': 'processos',
+            'funcao': 'listar_processos',
+            'ancoras': {'processo', 'processos', 'casos', 'acoes'},
+            'modificadores': {'ativo', 'ativos', 'andamento', 'aberto', 'abertos', 'arquivado',
+                              'arquivados', 'suspenso', 'suspensos'},
+            'args': _args_processos_intencao,
+            'formatar': _formatar_processos_intencao,
+        },
+        {
+            'nome': 'prazos',
+            'funcao': 'proximos_prazos_criticos',
+            'ancoras': {'prazo', 'prazos', 'vencimentos'},
+            'modificadores': {'criticos', 'urgentes', 'vencidos', 'atrasados', 'pendentes', 'vencem',
+                              '7', '10', '15', '30', '60', '90'},
+            'args': _args_prazos_intencao,
+            'formatar': _formatar_prazos_intencao,
+        },
+        {
+            'nome': 'financeiro',
+            'funcao': 'resumo_financeiro',
+            'ancoras': {'financeiro', 'financeira', 'financas', 'faturamento', 'saldo', 'receitas',
+                        'despesas', 'caixa'},
+            'modificadores': {'passado', 'anterior', 'ano', 'balanco', 'entradas', 'saidas'},
+            'args': _args_financeiro_intencao,
+            'formatar': _formatar_financeiro_intencao,
+        },
+        {
+            'nome': 'tarefas',
+            'funcao': 'listar_tarefas',
+            'ancoras': {'tarefa', 'tarefas', 'pendencias'},
+            'modificadores': {'pendente', 'pendentes', 'aberta', 'abertas', 'urgente', 'urgentes',
+                              'alta', 'prioridade'},
+            'args': _args_tarefas_intencao,
+            'formatar': _formatar_tarefas_intencao,
+        },
+        {
+            'nome': 'movimentacoes',
+            'funcao': 'listar_movimentacoes_recentes',
+            'ancoras': {'movimentacao', 'movimentacoes', 'andamentos', 'publicacoes', 'intimacoes'},
+            'modificadores': {'recente', 'recentes', 'novas', 'nova', 'processuais', 'processos'},
+            'args': _args_movimentacoes_intencao,
+            'formatar': _formatar_movimentacoes_intencao,
+        },
+    ]
 
-            valor_fmt = f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
-            preview_linhas = [
-                'Lançar entrada financeira',
-                f'Valor: R$ {valor_fmt}',
-                f'Descrição: {descricao}',
-                f'Categoria: {categoria}',
-                f'Data: {data_lancamento}',
-                f'Status: {status_lancamento}',
-            ]
-            if processo:
-                preview_linhas.append(
-                    f"Processo: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')} - {processo.get('titulo') or 'sem título'}"
-                )
-            if cliente:
-                preview_linhas.append(f"Cliente: {cliente.get('nome') or cliente.get('id')}")
-            preview = '\n'.join(preview_linhas)
+    def __init__(self, enabled: bool = True, max_tokens: int = 12):
+        self.enabled = enabled
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._turnos = {'comando': 0, 'intencao': 0, 'llm': 0}
+        self._por_intencao: Dict[str, int] = {}
 
-            acao = AssistenteIA.criar_acao_pendente(
-                db=db,
-                workspace_id=workspace_id,
-                user_id=user_id,
-                session_id=session_id,
-                action_type='lancar_financeiro_entrada',
-                payload=payload,
-                preview=preview,
-            )
+    def classificar(self, mensagem: str) -> Optional[Dict[str, Any]]:
+        """Retorna {intencao, funcao, args} ou None quando ambíguo."""
+        if not self.enabled:
+            return None
+        tokens = re.findall(r'[a-z0-9]+', normalizar_texto_busca(mensagem))
+        if not tokens or len(tokens) > self.max_tokens:
+            return None
+        conjunto = set(tokens)
+        if conjunto & self.BLOQUEIO:
+            return None
 
-            resposta = (
-                f"Prévia da ação solicitada:\n{preview}\n\n"
-                "Use os botões de confirmação abaixo para confirmar ou recusar."
-            )
-            return {
-                'ok': True,
-                'acao_pendente': acao,
-                '_acao_pendente': acao,
-                '_final_resposta': resposta,
-                '_acoes_sugeridas': [],
-            }
+        candidatas = [intencao for intencao in self.INTENCOES if conjunto & intencao['ancoras']]
+        if len(candidatas) != 1:
+            # "processos" aparece como modificador de movimentações ("movimentações dos processos")
+            candidatas = [
+                intencao for intencao in candidatas
+                if not (conjunto & intencao['ancoras']) <= {'processo', 'processos'}
+            ] if len(candidatas) == 2 else []
+            if len(candidatas) != 1:
+                return None
+        intencao = candidatas[0]
 
-        elif nome == 'solicitar_envio_whatsapp':
-            if user_id is None:
-                return {'erro': 'Não foi possível identificar o usuário para preparar a ação'}
-            if not whatsapp_service.is_configured():
-                return {'erro': 'Serviço WhatsApp não configurado'}
+        # Palavra desconhecida vira filtro que o roteador não sabe aplicar
+        # ("processos do joão", "prazos de março"): a mensagem vai para o LLM
+        conhecidos = self.VOCABULARIO_COMUM | intencao['ancoras'] | intencao['modificadores']
+        for posicao, token in enumerate(tokens):
+            if token in conhecidos:
+                continue
+            if token in self.AMBIGUAS and posicao > 0 and tokens[posicao - 1] in self.INTERROGATIVOS:
+                continue
+            return None
+        return {
+            'intencao': intencao['nome'],
+            'funcao': intencao['funcao'],
+            'args': intencao['args'](conjunto),
+        }
 
-            mensagem_envio = str(args.get('mensagem') or '').strip()
-            if not mensagem_envio:
-                return {'erro': 'Mensagem é obrigatória para envio no WhatsApp'}
+    def formatar(self, rota: Dict[str, Any], resultado: Any) -> Optional[str]:
+        """Resposta local para o resultado da função; None se não der para formatar."""
+        if not isinstance(resultado, dict) or resultado.get('erro'):
+            return None
+        for intencao in self.INTENCOES:
+            if intencao['nome'] == rota['intencao']:
+                return intencao['formatar'](resultado, rota['args'])
+        return None
 
-            destino = str(args.get('destino') or '').strip().lower()
-            if destino not in {'cliente', 'equipe', 'telefone'}:
-                return {'erro': 'Destino inválido para envio WhatsApp'}
+    def registrar_turno(self, tipo: str, intencao: Optional[str] = None):
+        with self._lock:
+            self._turnos[tipo] = self._turnos.get(tipo, 0) + 1
+            if intencao:
+                self._por_intencao[intencao] = self._por_intencao.get(intencao, 0) + 1
 
-            payload: Dict[str, Any] = {
-                'mensagem': mensagem_envio,
-                'destino': destino,
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self._turnos.values())
+            sem_llm = self._turnos['comando'] + self._turnos['intencao']
+            return {
+                'enabled': self.enabled,
+                'turnos': dict(self._turnos),
+                'por_intencao': dict(self._por_intencao),
+                'sem_llm_ratio': round(sem_llm / total, 3) if total else 0.0,
             }
-            preview_linhas = [
-                f'Enviar WhatsApp para {destino}',
-                f"Mensagem: {mensagem_envio[:400]}",
-            ]
 
-            if destino == 'cliente':
-                processo = AssistenteIA.buscar_processo_para_acao(
-                    db=db,
-                    workspace_id=workspace_id,
-                    processo_id=None,
-                    numero=str(args.get('processo_numero') or '').strip(),
-                    titulo='',
-                )
-                cliente = AssistenteIA.buscar_cliente_para_acao(
-                    db=db,
-                    workspace_id=workspace_id,
-                    cliente_id=_to_int(args.get('cliente_id')),
-                    nome=str(args.get('cliente_nome') or '').strip(),
-                )
-                if not cliente and processo and processo.get('cliente_id'):
-                    cliente = AssistenteIA.buscar_cliente_para_acao(
-                        db=db,
-                        workspace_id=workspace_id,
-                        cliente_id=_to_int(processo.get('cliente_id')),
-                        nome='',
-                    )
-                if not cliente:
-                    return {'erro': 'Cliente não encontrado para envio de WhatsApp'}
-
-                payload['cliente_id'] = int(cliente['id'])
-                preview_linhas.append(f"Cliente: {cliente.get('nome') or cliente.get('id')}")
-                if cliente.get('telefone'):
-                    preview_linhas.append(f"Telefone: {cliente.get('telefone')}")
-                if processo:
-                    preview_linhas.append(
-                        f"Processo referência: {processo.get('numero') or processo.get('numero_cnj') or processo.get('id')}"
-                    )
 
-            elif destino == 'equipe':
-                enviar_para_toda_equipe = parse_bool(args.get('enviar_para_toda_equipe', False))
-                if enviar_para_toda_equipe:
-                    payload['user_ids'] = []
-                    preview_linhas.append('Destino: toda a equipe com telefone')
-                else:
-                    responsavel = AssistenteIA.buscar_usuario_para_acao(
-                        db=db,
-                        workspace_id=workspace_id,
-                        user_id=_to_int(args.get('responsavel_id')),
-                        nome=str(args.get('responsavel_nome') or '').strip(),
-                    )
-                    if responsavel:
-                        payload['user_ids'] = [int(responsavel['id'])]
-                        preview_linhas.append(
-                            f"Destino: {responsavel.get('nome') or responsavel.get('email')}"
-                        )
-                    else:
-                        payload['user_ids'] = []
-                        preview_linhas.append('Destino: toda a equipe com telefone')
-
-            else:  # telefone
-                telefone = str(args.get('telefone') or '').strip()
-                if not telefone:
-                    return {'erro': 'Telefone é obrigatório quando destino=telefone'}
-                payload['telefone'] = telefone
-                preview_linhas.append(f'Telefone: {telefone}')
-
-            preview = '\n'.join(preview_linhas)
-            acao = AssistenteIA.criar_acao_pendente(
-                db=db,
-                workspace_id=workspace_id,
-                user_id=user_id,
-                session_id=session_id,
-                action_type='enviar_whatsapp',
-                payload=payload,
-                preview=preview,
-            )
+roteador_intencoes = RoteadorIntencoes(
+    enabled=COPILOTO_ROTEADOR_ENABLED,
+    max_tokens=COPILOTO_ROTEADOR_MAX_TOKENS,
+)
 
-            resposta = (
-                f"Prévia da ação solicitada:\n{preview}\n\n"
-                "Use os botões de confirmação abaixo para confirmar ou recusar."
-            )
-            return {
-                'ok': True,
-                'acao_pendente': acao,
-                '_acao_pendente': acao,
-                '_final_resposta': resposta,
-                '_acoes_sugeridas': [],
-            }
-        
-        return {'erro': 'Função não implementada'}
 
 # ============================================================================
 # WHATSAPP UTILS
@@ -6053,43 +7715,79 @@ def build_phone_candidates(phone: str) -> List[str]:
 
 
 def find_workspace_client_by_phone(db, workspace_id: int, phone: str) -> Optional[Dict[str, Any]]:
-    """Localiza cliente do workspace pelo telefone, normalizando para comparacao."""
+    """Localiza cliente do workspace pelo telefone via chave indexada telefone_local."""
     candidates = set(build_phone_candidates(phone))
     if not candidates:
         return None
 
     rows = db.execute(
-        '''SELECT id, nome, telefone
+        '''SELECT id, nome, telefone, telefone_digits
            FROM clientes
-           WHERE workspace_id = ? AND telefone IS NOT NULL AND TRIM(telefone) != ''',
-        (workspace_id,),
+           WHERE workspace_id = ? AND telefone_local = ?
+           ORDER BY id''',
+        (workspace_id, phone_without_ddi(normalize_phone_digits(phone))),
     ).fetchall()
 
     for row in rows:
-        raw_phone = row['telefone'] if isinstance(row, dict) else row[2]
-        normalized = normalize_phone_digits(raw_phone)
-        if normalized in candidates:
+        if row['telefone_digits'] in candidates:
             return dict(row)
 
     return None
 
 
+def find_workspace_clients_by_phones(db, workspace_id: int, phones: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Resolve varios telefones para clientes do workspace em uma unica consulta.
+
+    Retorna um mapa telefone informado -> cliente (mesma regra de
+    find_workspace_client_by_phone); telefones sem cliente ficam de fora.
+    """
+    lookups: Dict[str, tuple] = {}
+    for phone in phones:
+        candidates = set(build_phone_candidates(phone))
+        if candidates and phone not in lookups:
+            lookups[phone] = (candidates, phone_without_ddi(normalize_phone_digits(phone)))
+    if not lookups:
+        return {}
+
+    local_keys = sorted({local_key for _, local_key in lookups.values()})
+    placeholders = ','.join(['?' for _ in local_keys])
+    rows = db.execute(
+        f'''SELECT id, nome, telefone, telefone_digits, telefone_local
+            FROM clientes
+            WHERE workspace_id = ? AND telefone_local IN ({placeholders})
+            ORDER BY id''',
+        [workspace_id, *local_keys],
+    ).fetchall()
+
+    rows_by_local: Dict[str, List[Any]] = {}
+    for row in rows:
+        rows_by_local.setdefault(row['telefone_local'], []).append(row)
+
+    found: Dict[str, Dict[str, Any]] = {}
+    for phone, (candidates, local_key) in lookups.items():
+        for row in rows_by_local.get(local_key, []):
+            if row['telefone_digits'] in candidates:
+                found[phone] = dict(row)
+                break
+    return found
+
+
 def find_workspace_user_by_phone(db, workspace_id: int, phone: str) -> Optional[Dict[str, Any]]:
-    """Localiza usuário do workspace pelo telefone, normalizando para comparacao."""
+    """Localiza usuário do workspace pelo telefone via chave indexada telefone_local."""
     candidates = set(build_phone_candidates(phone))
     if not candidates:
         return None
 
     rows = db.execute(
-        '''SELECT id, nome, telefone, role
+        '''SELECT id, nome, telefone, role, telefone_digits
            FROM users
-           WHERE workspace_id = ? AND telefone IS NOT NULL AND TRIM(telefone) != ''',
-        (workspace_id,),
+           WHERE workspace_id = ? AND telefone_local = ?
+           ORDER BY id''',
+        (workspace_id, phone_without_ddi(normalize_phone_digits(phone))),
     ).fetchall()
 
     for row in rows:
-        normalized = normalize_phone_digits(row['telefone'])
-        if normalized in candidates:
+        if row['telefone_digits'] in candidates:
             return dict(row)
 
     return None
@@ -6603,82 +8301,64 @@ def upsert_whatsapp_inbox_conversation_inbound(
     phone: str,
     message_text: str = '',
     client_id: Optional[int] = None,
-) -> None:
-    """Atualiza/insere conversa de inbox quando chega mensagem do cliente."""
+    message_count: int = 1,
+    received_at: Optional[str] = None,
+) -> Optional[int]:
+    """Atualiza/insere conversa de inbox quando chega mensagem do cliente.
+
+    message_count permite aplicar de uma vez varias mensagens da mesma conversa
+    (message_text deve ser a ultima). Retorna a sequencia da primeira mensagem
+    aplicada; as demais seguem em ordem.
+    """
     normalized_phone = normalize_phone_digits(phone)
     if not normalized_phone:
-        return
+        return None
 
-    now_value = now_sql_timestamp()
-    existing = db.execute(
-        'SELECT * FROM whatsapp_inbox_conversations WHERE workspace_id = ? AND phone = ? LIMIT 1',
-        (workspace_id, normalized_phone),
-    ).fetchone()
+    message_count = max(int(message_count or 1), 1)
+    now_value = received_at or now_sql_timestamp()
 
     resolved_client_id = client_id
     if resolved_client_id is None:
         found_client = find_workspace_client_by_phone(db, workspace_id, normalized_phone)
         resolved_client_id = found_client.get('id') if found_client else None
 
-    if existing:
-        existing_dict = dict(existing)
-        unread_count = max(int(existing_dict.get('unread_count') or 0) + 1, 1)
-        current_status = existing_dict.get('status') or 'novo'
-        new_status = current_status if current_status in WHATSAPP_INBOX_STATUS_VALUES else 'novo'
-        resolved_at = existing_dict.get('resolved_at')
-        if new_status == 'resolvido':
-            new_status = 'novo'
-            resolved_at = None
-
-        db.execute(
-            '''UPDATE whatsapp_inbox_conversations
-               SET client_id = ?,
-                   status = ?,
-                   unread_count = ?,
-                   last_inbound_at = ?,
-                   last_message_text = ?,
-                   last_message_direction = 'inbound',
-                   last_message_at = ?,
-                   resolved_at = ?,
-                   updated_at = ?
-               WHERE id = ?''',
-            (
-                resolved_client_id or existing_dict.get('client_id'),
-                new_status,
-                unread_count,
-                now_value,
-                (message_text or '')[:1000],
-                now_value,
-                resolved_at,
-                now_value,
-                existing_dict.get('id'),
-            ),
-        )
-        if not existing_dict.get('first_inbound_at'):
-            db.execute(
-                'UPDATE whatsapp_inbox_conversations SET first_inbound_at = ? WHERE id = ?',
-                (now_value, existing_dict.get('id')),
-            )
-        return
-
+    # Linha garantida e sequência alocada num único UPDATE ... RETURNING: dois
+    # workers aplicando a mesma conversa nunca recebem a mesma faixa
     db.execute(
-        '''INSERT INTO whatsapp_inbox_conversations
-           (workspace_id, phone, client_id, status, unread_count, first_inbound_at,
-            last_inbound_at, last_message_text, last_message_direction, last_message_at,
-            created_at, updated_at)
-           VALUES (?, ?, ?, 'novo', 1, ?, ?, ?, 'inbound', ?, ?, ?)''',
+        '''INSERT OR IGNORE INTO whatsapp_inbox_conversations
+           (workspace_id, phone, client_id, status, unread_count, last_inbound_seq, created_at, updated_at)
+           VALUES (?, ?, ?, 'novo', 0, 0, ?, ?)''',
+        (workspace_id, normalized_phone, resolved_client_id, now_value, now_value),
+    )
+    row = db.execute(
+        '''UPDATE whatsapp_inbox_conversations
+           SET client_id = COALESCE(?, client_id),
+               status = CASE WHEN status IN ('novo', 'aguardando') THEN status ELSE 'novo' END,
+               resolved_at = CASE WHEN status = 'resolvido' THEN NULL ELSE resolved_at END,
+               unread_count = MAX(COALESCE(unread_count, 0) + ?, 1),
+               first_inbound_at = COALESCE(first_inbound_at, ?),
+               last_inbound_at = ?,
+               last_message_text = ?,
+               last_message_direction = 'inbound',
+               last_message_at = ?,
+               last_inbound_seq = COALESCE(last_inbound_seq, 0) + ?,
+               updated_at = ?
+           WHERE workspace_id = ? AND phone = ?
+           RETURNING last_inbound_seq''',
         (
-            workspace_id,
-            normalized_phone,
             resolved_client_id,
+            message_count,
             now_value,
             now_value,
             (message_text or '')[:1000],
             now_value,
+            message_count,
             now_value,
-            now_value,
+            workspace_id,
+            normalized_phone,
         ),
-    )
+    ).fetchone()
+    return int(row[0]) - message_count + 1
 
 
 def upsert_whatsapp_inbox_conversation_outbound(
@@ -7023,18 +8703,137 @@ def register_whatsapp_automacao_log(
     db.commit()
 
 
-def maybe_generate_whatsapp_message_with_ai(
-    base_message: str,
-    objective: str,
-    ai_prompt: str = '',
-) -> str:
+# ============================================================================
+# CACHE DE MENSAGENS WHATSAPP REESCRITAS PELA IA
+# ============================================================================
+
+WHATSAPP_AI_CACHE_TTL_SECONDS = int(os.getenv('WHATSAPP_AI_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+WHATSAPP_AI_CACHE_MAX_ENTRIES = int(os.getenv('WHATSAPP_AI_CACHE_MAX_ENTRIES', '2000'))
+WHATSAPP_AI_CACHE_SLOTS = parse_bool(os.getenv('WHATSAPP_AI_CACHE_SLOTS', 'true'))
+
+_AI_SLOT_LABEL_LINE = re.compile(r'^(\s*[A-Za-zÀ-ÿ][A-Za-zÀ-ÿ /()-]{1,40}:[ \t]*)(\S.*?)\s*$', re.MULTILINE)
+_AI_SLOT_INLINE = re.compile(
+    r'\d{7}-\d{2}\.\d{4}\.\d\.\d{2}\.\d{4}'      # numero CNJ
+    r'|\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?'  # data ISO
+    r'|\d{2}/\d{2}/\d{4}'                              # data BR
+    r'|R\$\s?[\d.,]+'                                  # valor
+    r'|\b\d+(?:[.,]\d+)?\b'                           # quantidades
+)
+_AI_SLOT_PLACEHOLDER = '[[V{}]]'
+
+
+def normalize_whatsapp_ai_text(texto: str) -> str:
+    """Normaliza só os espaços para compor a chave do cache (a caixa é preservada)."""
+    linhas = [re.sub(r'[ \t]+', ' ', linha).strip() for linha in str(texto or '').strip().splitlines()]
+    return '\n'.join(linhas)
+
+
+def extract_whatsapp_ai_slots(texto: str) -> tuple:
     """
-    Reescreve mensagem com IA (quando configurada), mantendo fallback deterministico.
+    Separa a mensagem em esqueleto + variáveis.
+
+    Valores de linhas "Rótulo: valor" e números/datas/valores soltos viram
+    marcadores [[V1]], [[V2]]...; mensagens com a mesma estrutura geram o mesmo
+    esqueleto e podem reaproveitar a reescrita feita pela IA.
     """
-    if not openai_client:
-        return base_message
+    valores: List[str] = []
+
+    def _marcar(valor: str) -> str:
+        valores.append(valor)
+        return _AI_SLOT_PLACEHOLDER.format(len(valores))
+
+    partes: List[str] = []
+    cursor = 0
+    for match in _AI_SLOT_LABEL_LINE.finditer(texto):
+        partes.append(_AI_SLOT_INLINE.sub(lambda m: _marcar(m.group(0)), texto[cursor:match.start(2)]))
+        partes.append(_marcar(match.group(2)))
+        cursor = match.end(2)
+    partes.append(_AI_SLOT_INLINE.sub(lambda m: _marcar(m.group(0)), texto[cursor:]))
+    return ''.join(partes), valores
+
+
+def fill_whatsapp_ai_slots(esqueleto: str, valores: List[str]) -> Optional[str]:
+    """Reinjeta as variáveis; None se a reescrita perdeu, duplicou ou inventou marcadores."""
+    marcadores = re.findall(r'\[\[V(\d+)\]\]', esqueleto)
+    if sorted(int(m) for m in marcadores) != list(range(1, len(valores) + 1)):
+        return None
+    return re.sub(r'\[\[V(\d+)\]\]', lambda m: valores[int(m.group(1)) - 1], esqueleto)
+
+
+class WhatsAppAIMessageCache:
+    """
+    Cache LRU com TTL das reescritas de mensagem feitas pela IA.
+
+    Duas chaves: hash exato (mensagem normalizada + objetivo + ai_prompt) e
+    hash do esqueleto com marcadores. Esqueletos cuja reescrita não preservou
+    os marcadores ficam marcados para não tentar de novo até expirar.
+    """
+
+    SLOT_INSEGURO = object()
+
+    def __init__(self, ttl_seconds: int = WHATSAPP_AI_CACHE_TTL_SECONDS,
+                 max_entries: int = WHATSAPP_AI_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = max(0, int(ttl_seconds))
+        self.max_entries = max(0, int(max_entries))
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'exact_hits': 0, 'slot_hits': 0, 'misses': 0, 'llm_calls': 0, 'evictions': 0}
+
+    @staticmethod
+    def build_key(tipo: str, texto: str, objective: str, ai_prompt: str) -> str:
+        material = '\x1f'.join([
+            tipo,
+            normalize_whatsapp_ai_text(texto),
+            normalize_whatsapp_ai_text(objective),
+            normalize_whatsapp_ai_text(ai_prompt),
+        ])
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return valor
 
-    model = AssistenteIA.get_modelo()
+    def put(self, key: str, valor: Any):
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (valor, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def record(self, evento: str):
+        with self._lock:
+            self._stats[evento] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats['exact_hits'] + self._stats['slot_hits']
+            total = hits + self._stats['misses']
+            return {
+                **self._stats,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hit_rate': round(hits / total, 3) if total else 0.0,
+            }
+
+
+whatsapp_ai_message_cache = WhatsAppAIMessageCache()
+
+
+def _rewrite_whatsapp_message_with_ai(base_message: str, objective: str, ai_prompt: str,
+                                      preservar_marcadores: bool = False) -> str:
+    """Chamada ao LLM; devolve '' quando a IA não responde."""
     system_prompt = (
         "Voce escreve mensagens para WhatsApp de escritorio juridico com tom humano e profissional, "
         "como uma secretaria executiva atenciosa. "
@@ -7046,23 +8845,85 @@ def maybe_generate_whatsapp_message_with_ai(
 
     user_prompt = (
         f"Objetivo: {objective}\n"
-        "Reescreva a mensagem abaixo para WhatsApp, sem inventar dados, mantendo ate 700 caracteres.\n\n"
-        f"Mensagem base:\n{base_message}"
+        "Reescreva a mensagem abaixo para WhatsApp, sem inventar dados, mantendo ate 700 caracteres.\n"
+    )
+    if preservar_marcadores:
+        user_prompt += (
+            "Os marcadores no formato [[V1]], [[V2]]... representam dados variaveis: mantenha cada "
+            "marcador exatamente como esta, uma unica vez, sem traduzir nem explicar.\n"
+        )
+    user_prompt += f"\nMensagem base:\n{base_message}"
+
+    whatsapp_ai_message_cache.record('llm_calls')
+    response = llm_gateway.chat_completion(
+        messages=[
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt},
+        ],
+        temperature=0.5,
+        max_tokens=260,
     )
+    content = response.choices[0].message.content if response.choices else ''
+    return (content or '').strip()
+
+
+def maybe_generate_whatsapp_message_with_ai(
+    base_message: str,
+    objective: str,
+    ai_prompt: str = '',
+) -> str:
+    """
+    Reescreve mensagem com IA (quando configurada), mantendo fallback deterministico.
+
+    Reescritas ficam em cache: mensagens idênticas reaproveitam o texto e, com
+    WHATSAPP_AI_CACHE_SLOTS, mensagens com a mesma estrutura reaproveitam o
+    esqueleto reescrito com as variáveis reinjetadas.
+    """
+    if not llm_gateway.is_configured():
+        return base_message
+
+    cache = whatsapp_ai_message_cache
+    chave_exata = cache.build_key('exato', base_message, objective, ai_prompt)
+    cached = cache.get(chave_exata)
+    if cached is not None:
+        cache.record('exact_hits')
+        return cached
 
     try:
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=[
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt},
-            ],
-            temperature=0.5,
-            max_tokens=260,
-        )
-        content = response.choices[0].message.content if response.choices else ''
-        text = (content or '').strip()
-        return text or base_message
+        if WHATSAPP_AI_CACHE_SLOTS:
+            esqueleto, valores = extract_whatsapp_ai_slots(base_message)
+            if valores:
+                chave_esqueleto = cache.build_key('esqueleto', esqueleto, objective, ai_prompt)
+                reescrito = cache.get(chave_esqueleto)
+                if reescrito is not None and reescrito is not cache.SLOT_INSEGURO:
+                    texto = fill_whatsapp_ai_slots(reescrito, valores)
+                    if texto:
+                        cache.record('slot_hits')
+                        cache.put(chave_exata, texto)
+                        return texto
+
+                cache.record('misses')
+                if reescrito is None:
+                    reescrito = _rewrite_whatsapp_message_with_ai(
+                        esqueleto, objective, ai_prompt, preservar_marcadores=True
+                    )
+                    texto = fill_whatsapp_ai_slots(reescrito, valores) if reescrito else None
+                    if texto:
+                        cache.put(chave_esqueleto, reescrito)
+                        cache.put(chave_exata, texto)
+                        return texto
+                    cache.put(chave_esqueleto, cache.SLOT_INSEGURO)
+
+                texto = _rewrite_whatsapp_message_with_ai(base_message, objective, ai_prompt)
+                if texto:
+                    cache.put(chave_exata, texto)
+                return texto or base_message
+
+        cache.record('misses')
+        texto = _rewrite_whatsapp_message_with_ai(base_message, objective, ai_prompt)
+        if texto:
+            cache.put(chave_exata, texto)
+        return texto or base_message
     except Exception as error:
         print(f"[whatsapp-ai] Falha ao gerar mensagem com IA: {error}")
         return base_message
@@ -7231,26 +9092,204 @@ def trigger_whatsapp_on_new_movements(
     more_count = max(len(movimentacoes) - 5, 0)
     complemento = f"\n...e mais {more_count} movimentacao(oes)." if more_count else ''
 
-    message = (
-        "Atualizacao de processo\n\n"
-        f"Processo: {numero_processo}\n"
-        f"Novas movimentacoes: {len(movimentacoes)}\n\n"
-        + '\n'.join(resumo_linhas)
-        + complemento
-    )
+    message = (
+        "Atualizacao de processo\n\n"
+        f"Processo: {numero_processo}\n"
+        f"Novas movimentacoes: {len(movimentacoes)}\n\n"
+        + '\n'.join(resumo_linhas)
+        + complemento
+    )
+
+    if config.get('ai_generate_messages'):
+        message = maybe_generate_whatsapp_message_with_ai(
+            base_message=message,
+            objective='Notificar equipe sobre novas movimentacoes de processo',
+            ai_prompt=config.get('ai_prompt') or '',
+        )
+
+    return dispatch_platform_whatsapp_message(
+        db=db,
+        workspace_id=workspace_id,
+        message=message,
+    )
+
+
+def trigger_whatsapp_on_movements_digest(
+    workspace_id: int,
+    processos: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Dispara um unico WhatsApp com as novas movimentacoes de varios processos."""
+    if len(processos) == 1:
+        processo = processos[0]
+        return trigger_whatsapp_on_new_movements(
+            workspace_id=workspace_id,
+            processo_id=processo['processo_id'],
+            numero_processo=processo['numero_processo'],
+            movimentacoes=processo['movimentacoes'],
+        )
+
+    db = get_db()
+    config = get_workspace_whatsapp_config(db, workspace_id)
+    if not config.get('auto_nova_movimentacao'):
+        return {'success': False, 'reason': 'auto_nova_movimentacao_desativado'}
+
+    if not processos:
+        return {'success': False, 'reason': 'sem_movimentacoes'}
+
+    total_movimentacoes = sum(len(p['movimentacoes']) for p in processos)
+    resumo_linhas = []
+    for processo in processos[:10]:
+        ultima = processo['movimentacoes'][0] if processo['movimentacoes'] else {}
+        resumo_linhas.append(
+            f"- {processo['numero_processo']}: {len(processo['movimentacoes'])} nova(s)"
+            f" | ultima: {ultima.get('nome')} ({ultima.get('data')})"
+        )
+
+    more_count = max(len(processos) - 10, 0)
+    complemento = f"\n...e mais {more_count} processo(s)." if more_count else ''
+
+    message = (
+        "Atualizacao de processos\n\n"
+        f"Processos com novidades: {len(processos)}\n"
+        f"Novas movimentacoes: {total_movimentacoes}\n\n"
+        + '\n'.join(resumo_linhas)
+        + complemento
+    )
+
+    if config.get('ai_generate_messages'):
+        message = maybe_generate_whatsapp_message_with_ai(
+            base_message=message,
+            objective='Notificar equipe sobre novas movimentacoes em varios processos',
+            ai_prompt=config.get('ai_prompt') or '',
+        )
+
+    return dispatch_platform_whatsapp_message(
+        db=db,
+        workspace_id=workspace_id,
+        message=message,
+    )
+
+
+# ============================================================================
+# RESUMO (DIGEST) DE NOTIFICAÇÕES DE MOVIMENTAÇÕES
+# ============================================================================
+
+NOTIFICATION_DIGEST_WINDOW_SECONDS = int(os.environ.get('NOTIFICATION_DIGEST_WINDOW_SECONDS', '0'))
+
+
+class MovimentacaoDigest:
+    """
+    Agrega novas movimentações por workspace e entrega um resumo por canal.
+
+    Os alertas são gravados junto das movimentações (salvar_movimentacoes);
+    aqui só a entrega é agrupada: no flush cada workspace recebe um único
+    email e um único WhatsApp com todos os processos.
+    """
+
+    def __init__(self, window_seconds: int = 0):
+        self.window_seconds = max(0, window_seconds)
+        self._pendentes: Dict[int, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def adicionar(self, workspace_id: int, processo_id: int, numero_processo: str,
+                  movimentacoes: List[Dict]) -> int:
+        """Registra movimentações para o próximo flush; retorna quantos alertas ficaram pendentes."""
+        if not movimentacoes:
+            return 0
+        with self._lock:
+            self._pendentes.setdefault(workspace_id, []).append({
+                'processo_id': processo_id,
+                'numero_processo': numero_processo,
+                'movimentacoes': list(movimentacoes),
+            })
+        return len(movimentacoes)
+
+    def agendar_flush(self) -> None:
+        """Agenda o flush ao fim da janela configurada (um timer por janela)."""
+        with self._lock:
+            if self._timer and self._timer.is_alive():
+                return
+            self._timer = threading.Timer(self.window_seconds, self._flush_em_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_em_background(self) -> None:
+        with app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  Erro ao entregar resumo de movimentações: {e}")
+
+    def flush(self) -> Dict[int, Dict[str, Any]]:
+        """Envia um resumo por workspace das movimentações pendentes (requer app context)."""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+            self._timer = None
+
+        resultados: Dict[int, Dict[str, Any]] = {}
+        for workspace_id, processos in pendentes.items():
+            resultados[workspace_id] = {
+                'alertas': sum(len(processo['movimentacoes']) for processo in processos),
+                'processos': len(processos),
+                'email': self._enviar_email(workspace_id, processos),
+                'whatsapp': self._enviar_whatsapp(workspace_id, processos),
+            }
+        return resultados
+
+    @staticmethod
+    def _enviar_email(workspace_id: int, processos: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not (
+            EMAIL_NOTIFICATIONS_ENABLED
+            and EMAIL_SERVICE_DISPONIVEL
+            and email_service.is_configured()
+        ):
+            return None
+        try:
+            if len(processos) == 1:
+                processo = processos[0]
+                resultado_email = notificador_email.notificar_nova_movimentacao(
+                    workspace_id=workspace_id,
+                    processo_id=processo['processo_id'],
+                    numero_processo=processo['numero_processo'],
+                    descricao=f"{len(processo['movimentacoes'])} nova(s) movimentação(ões) detectada(s)",
+                    data_movimento=processo['movimentacoes'][0]['data'],
+                    enfileirar=True,
+                )
+            else:
+                resultado_email = notificador_email.notificar_resumo_movimentacoes(
+                    workspace_id=workspace_id,
+                    processos=processos,
+                    enfileirar=True,
+                )
+
+            if resultado_email.get('success'):
+                print(f"📧 Email de movimentação enfileirado para {resultado_email.get('total', 0)} usuário(s)")
+            else:
+                print(f"⚠️  Erro ao enviar email de movimentação: {resultado_email.get('error')}")
+            return resultado_email
+        except Exception as e:
+            print(f"⚠️  Erro ao enviar notificação por email: {e}")
+            return {'success': False, 'error': str(e)}
+
+    @staticmethod
+    def _enviar_whatsapp(workspace_id: int, processos: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        try:
+            resultado_whatsapp = trigger_whatsapp_on_movements_digest(workspace_id, processos)
+            if resultado_whatsapp.get('success'):
+                print(
+                    f"📱 WhatsApp de movimentações enviado: "
+                    f"{resultado_whatsapp.get('enviados', 0)} enviado(s)"
+                )
+            return resultado_whatsapp
+        except Exception as e:
+            print(f"⚠️  Erro ao enviar automação WhatsApp de movimentações: {e}")
+            return {'success': False, 'error': str(e)}
 
-    if config.get('ai_generate_messages'):
-        message = maybe_generate_whatsapp_message_with_ai(
-            base_message=message,
-            objective='Notificar equipe sobre novas movimentacoes de processo',
-            ai_prompt=config.get('ai_prompt') or '',
-        )
 
-    return dispatch_platform_whatsapp_message(
-        db=db,
-        workspace_id=workspace_id,
-        message=message,
-    )
+# Digest compartilhado para chamadas fora de um job (ex.: consulta manual),
+# usado apenas quando NOTIFICATION_DIGEST_WINDOW_SECONDS > 0.
+movimentacao_digest_janela = MovimentacaoDigest(window_seconds=NOTIFICATION_DIGEST_WINDOW_SECONDS)
 
 
 def build_workspace_daily_summary_message(
@@ -7490,6 +9529,10 @@ def monitorar_datajud_job():
         
         print(f"[{datetime.now()}] Monitorando {len(processos)} processos...")
         
+        # Alertas são gravados com as movimentações; emails e WhatsApp da
+        # execução são entregues em lote ao final
+        digest = MovimentacaoDigest()
+        
         for proc in processos:
             try:
                 processo_id = proc['id']
@@ -7543,7 +9586,7 @@ def monitorar_datajud_job():
                     
                     # Salva movimentações (INSERT IGNORE para evitar duplicatas)
                     resultado_salvamento = DatajudMonitor.salvar_movimentacoes(
-                        processo_id, workspace_id, movimentos
+                        processo_id, workspace_id, movimentos, numero_processo
                     )
                     
                     movs_novas = resultado_salvamento.get('novas_movimentacoes', [])
@@ -7584,9 +9627,9 @@ def monitorar_datajud_job():
                     # Se há movimentações novas, cria alertas
                     if movs_novas:
                         alertas_criados = DatajudMonitor.criar_alertas_movimentacao(
-                            processo_id, workspace_id, movs_novas, numero_processo
+                            processo_id, workspace_id, movs_novas, numero_processo, digest=digest
                         )
-                        print(f"  ✅ {numero_processo}: {len(movs_novas)} nova(s) movimentação(ões), {alertas_criados} alerta(s)")
+                        print(f"  ✅ {numero_processo}: {len(movs_novas)} nova(s) movimentação(ões), {alertas_criados} alerta(s) no resumo")
                     else:
                         print(f"  ℹ️ {numero_processo}: Sem novas movimentações")
                 
@@ -7614,6 +9657,13 @@ def monitorar_datajud_job():
                 db.rollback()
                 continue
         
+        resumo_digest = digest.flush()
+        for workspace_id, resultado_digest in resumo_digest.items():
+            print(
+                f"  🔔 Workspace {workspace_id}: {resultado_digest.get('alertas', 0)} alerta(s) "
+                f"em {resultado_digest.get('processos', 0)} processo(s)"
+            )
+        
         print(f"[{datetime.now()}] Monitoramento Datajud concluído.")
 
 
@@ -7854,6 +9904,87 @@ def enviar_resumo_diario_whatsapp_job():
                 f"mensagens enviadas: {total_enviados}"
             )
 
+BACKUP_INCREMENTAL_ENABLED = parse_bool(os.environ.get('BACKUP_INCREMENTAL_ENABLED', 'false'))
+BACKUP_INCREMENTAL_HORA = int(os.getenv('BACKUP_INCREMENTAL_HORA', '2'))
+BACKUP_FULL_INTERVALO_DIAS = int(os.getenv('BACKUP_FULL_INTERVALO_DIAS', '7'))
+BACKUP_MAX_DELTAS = int(os.getenv('BACKUP_MAX_DELTAS', '30'))
+BACKUP_RETENCAO_CADEIAS = int(os.getenv('BACKUP_RETENCAO_CADEIAS', '4'))
+
+
+def backup_incremental_job():
+    """Backup noturno: delta das alterações, ou snapshot completo quando a cadeia vence."""
+    try:
+        resultado = backup_incremental.executar('auto')
+        print(
+            f"[backup] {resultado['tipo']} concluído: {resultado.get('arquivo') or 'sem alterações'} "
+            f"({resultado.get('duracao_ms', 0)} ms)"
+        )
+    except Exception as e:
+        print(f"[backup] Falha no backup incremental: {e}")
+
+
+TEMP_ARQUIVOS_TTL_HORAS = float(os.getenv('TEMP_ARQUIVOS_TTL_HORAS', '6'))
+
+
+def _diretorios_temporarios():
+    return [
+        os.path.join(os.path.dirname(__file__), 'temp'),
+        os.path.join(armazenamento.diretorio_blobs, 'tmp'),
+        os.path.join(app.config['UPLOAD_FOLDER'], 'cache', 'documentos_lote'),
+    ]
+
+
+def limpar_temporarios_job():
+    """Remove documentos gerados antigos (app/temp), uploads interrompidos (blobs/tmp) e blobs sem referências."""
+    try:
+        totais = limpar_arquivos_temporarios(_diretorios_temporarios(), TEMP_ARQUIVOS_TTL_HORAS * 3600)
+        if totais['removidos']:
+            print(f"[temp] {totais['removidos']} arquivo(s) temporário(s) removido(s) ({totais['bytes']} bytes)")
+    except Exception as e:
+        print(f"[temp] Falha na limpeza de temporários: {e}")
+    try:
+        conn = sqlite3.connect(app.config['DATABASE'], timeout=30)
+        try:
+            coletados = armazenamento.coletar_orfaos(conn)
+        finally:
+            conn.close()
+        if coletados['blobs']:
+            print(f"[armazenamento] {coletados['blobs']} blob(s) sem referência removido(s) ({coletados['bytes']} bytes)")
+    except Exception as e:
+        print(f"[armazenamento] Falha na coleta de blobs: {e}")
+
+
+def arquivar_auditoria_job():
+    """Move para audit_logs_arquivo as entradas além da retenção."""
+    try:
+        movidas = auditoria.arquivar(AUDIT_LOG_RETENCAO_DIAS)
+        if movidas:
+            contagem_listagens_admin.invalidar('auditoria')
+            print(f"[auditoria] {movidas} entrada(s) movida(s) para o arquivo")
+    except Exception as e:
+        print(f"[auditoria] Falha ao arquivar logs: {e}")
+
+
+def sincronizar_indice_busca_job():
+    """Drena a fila do índice de busca (carga inicial e gravações fora das buscas)."""
+    try:
+        with app.app_context():
+            aplicados = sincronizar_indice_busca(get_db(), drenar=True)
+        if aplicados:
+            print(f"[busca] {aplicados} item(ns) aplicados ao índice")
+    except Exception as e:
+        print(f"[busca] Falha ao sincronizar índice: {e}")
+
+
+def metricas_plataforma_job():
+    """Grava o ponto horário (e atualiza o diário) das métricas do Super Admin."""
+    try:
+        with app.app_context():
+            metricas_plataforma.registrar_snapshot(get_db())
+    except Exception as e:
+        print(f"[metricas] Falha ao registrar snapshot: {e}")
+
+
 BACKGROUND_JOBS_ENABLED = parse_bool(os.environ.get('ENABLE_BACKGROUND_JOBS', 'true'))
 
 if BACKGROUND_JOBS_ENABLED:
@@ -7907,17 +10038,65 @@ if BACKGROUND_JOBS_ENABLED:
             replace_existing=True
         )
 
+        scheduler.add_job(
+            limpar_temporarios_job,
+            'cron',
+            minute=15,
+            id='limpar_temporarios',
+            replace_existing=True
+        )
+
+        scheduler.add_job(
+            sincronizar_indice_busca_job,
+            'cron',
+            minute='*',
+            id='sincronizar_indice_busca',
+            replace_existing=True
+        )
+
+        scheduler.add_job(
+            metricas_plataforma_job,
+            'cron',
+            minute=55,
+            id='metricas_plataforma',
+            replace_existing=True
+        )
+
+        if AUDIT_LOG_RETENCAO_DIAS > 0:
+            scheduler.add_job(
+                arquivar_auditoria_job,
+                'cron',
+                hour=3,
+                minute=45,
+                id='arquivar_auditoria',
+                replace_existing=True
+            )
+
+        if BACKUP_INCREMENTAL_ENABLED:
+            scheduler.add_job(
+                backup_incremental_job,
+                'cron',
+                hour=BACKUP_INCREMENTAL_HORA,
+                minute=30,
+                id='backup_incremental',
+                replace_existing=True
+            )
+
         print(f"[{datetime.now()}] Agendador iniciado. Jobs configurados:")
         print(f"  - PJe Monitor: 06:00 diariamente")
         print(f"  - Verificar Prazos: 08:00 diariamente")
         print(f"  - Datajud Monitor: 00:00, 06:00, 12:00 e 18:00")
         print(f"  - WhatsApp Resumo Diário: checagem a cada minuto")
         print(f"  - WhatsApp Campanhas Agendadas: checagem a cada minuto")
+        print(f"  - Limpeza de temporários: a cada hora (HH:15)")
+        print(f"  - Métricas do Super Admin: a cada hora (HH:55)")
+        if AUDIT_LOG_RETENCAO_DIAS > 0:
+            print(f"  - Arquivo de auditoria: 03:45 diariamente (retenção de {AUDIT_LOG_RETENCAO_DIAS} dias)")
+        if BACKUP_INCREMENTAL_ENABLED:
+            print(f"  - Backup Incremental: {BACKUP_INCREMENTAL_HORA:02d}:30 diariamente")
         scheduler.start()
 
         # Graceful shutdown do scheduler
-        import atexit
-
         def _shutdown_scheduler():
             try:
                 if scheduler.running:
@@ -8086,8 +10265,12 @@ def verify_register():
 
     # Create user as admin
     cursor = db.execute(
-        'INSERT INTO users (workspace_id, nome, email, telefone, password_hash, role) VALUES (?, ?, ?, ?, ?, ?)',
-        (workspace_id, pending['nome'], pending_email, pending['telefone'], pending['password_hash'], 'admin')
+        '''INSERT INTO users (workspace_id, nome, email, telefone, telefone_digits, telefone_local, password_hash, role)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        (
+            workspace_id, pending['nome'], pending_email, pending['telefone'],
+            *phone_index_values(pending['telefone']), pending['password_hash'], 'admin',
+        )
     )
     user_id = cursor.lastrowid
 
@@ -8215,6 +10398,9 @@ def get_me():
                 })
             }
     
+    if workspace:
+        workspace['armazenamento_uso'] = armazenamento.uso_workspace(db, workspace_id)
+
     return jsonify({
         'user': g.auth['user'],
         'workspace': workspace
@@ -8240,6 +10426,9 @@ def update_me():
                 params.append(1 if parse_bool(data[campo]) else 0)
             else:
                 params.append(data[campo])
+    if 'telefone' in data:
+        updates.append('telefone_digits = ?, telefone_local = ?')
+        params.extend(phone_index_values(data['telefone']))
     
     if updates:
         params.append(g.auth['user_id'])
@@ -8351,20 +10540,20 @@ def upload_workspace_logo():
         return jsonify({'error': 'Formato não suportado. Use PNG, JPG ou WEBP'}), 400
 
     workspace_id = g.auth['workspace_id']
-    filename = f"workspace_logo_{workspace_id}_{int(datetime.now().timestamp())}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    blob, erro = _armazenar_upload(file, ext, workspace_id)
+    if erro:
+        return erro
 
     db = get_db()
     atual = db.execute('SELECT logo_url FROM workspaces WHERE id = ?', (workspace_id,)).fetchone()
     logo_anterior = str(atual['logo_url'] or '') if atual else ''
-    logo_url = f"/uploads/{filename}"
+    logo_url = armazenamento.url_publica(blob['caminho'])
 
     db.execute('UPDATE workspaces SET logo_url = ? WHERE id = ?', (logo_url, workspace_id))
     db.commit()
 
-    if logo_anterior and logo_anterior != logo_url:
-        _remove_upload_file_from_url(logo_anterior)
+    if logo_anterior:
+        _remove_upload_file_from_url(logo_anterior, workspace_id)
 
     return jsonify({'logo_url': logo_url})
 
@@ -8386,7 +10575,7 @@ def delete_workspace_logo():
     db.commit()
 
     if logo_atual:
-        _remove_upload_file_from_url(logo_atual)
+        _remove_upload_file_from_url(logo_atual, workspace_id)
 
     return jsonify({'success': True})
 
@@ -8412,9 +10601,9 @@ def upload_workspace_assinatura_imagem():
         return jsonify({'error': 'Formato não suportado. Use PNG, JPG ou WEBP'}), 400
 
     workspace_id = g.auth['workspace_id']
-    filename = f"workspace_assinatura_{workspace_id}_{int(datetime.now().timestamp())}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    blob, erro = _armazenar_upload(file, ext, workspace_id)
+    if erro:
+        return erro
 
     db = get_db()
     atual = db.execute(
@@ -8422,7 +10611,7 @@ def upload_workspace_assinatura_imagem():
         (workspace_id,),
     ).fetchone()
     anterior = str(atual['assinatura_imagem_url'] or '') if atual else ''
-    assinatura_url = f"/uploads/{filename}"
+    assinatura_url = armazenamento.url_publica(blob['caminho'])
 
     db.execute(
         'UPDATE workspaces SET assinatura_imagem_url = ? WHERE id = ?',
@@ -8430,8 +10619,8 @@ def upload_workspace_assinatura_imagem():
     )
     db.commit()
 
-    if anterior and anterior != assinatura_url:
-        _remove_upload_file_from_url(anterior)
+    if anterior:
+        _remove_upload_file_from_url(anterior, workspace_id)
 
     return jsonify({'assinatura_imagem_url': assinatura_url})
 
@@ -8459,7 +10648,7 @@ def delete_workspace_assinatura_imagem():
     db.commit()
 
     if atual:
-        _remove_upload_file_from_url(atual)
+        _remove_upload_file_from_url(atual, workspace_id)
 
     return jsonify({'success': True})
 
@@ -8488,20 +10677,18 @@ def upload_avatar():
     ).fetchone()
     avatar_anterior = str(atual['avatar_url'] or '') if atual else ''
 
-    # Criar nome único
-    filename = f"avatar_{g.auth['user_id']}_{int(datetime.now().timestamp() * 1000)}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    
-    # Salvar arquivo
-    file.save(filepath)
+    # Salvar arquivo (blob deduplicado, conta no armazenamento do workspace)
+    blob, erro = _armazenar_upload(file, ext, g.auth['workspace_id'])
+    if erro:
+        return erro
     
     # Atualizar banco
-    avatar_url = f"/uploads/{filename}"
+    avatar_url = armazenamento.url_publica(blob['caminho'])
     db.execute('UPDATE users SET avatar_url = ? WHERE id = ?', (avatar_url, g.auth['user_id']))
     db.commit()
 
-    if avatar_anterior and avatar_anterior != avatar_url:
-        _remove_upload_file_from_url(avatar_anterior)
+    if avatar_anterior:
+        _remove_upload_file_from_url(avatar_anterior, g.auth['workspace_id'])
     
     return jsonify({'avatar_url': avatar_url})
 
@@ -8522,7 +10709,7 @@ def delete_avatar():
     db.commit()
 
     if avatar_atual:
-        _remove_upload_file_from_url(avatar_atual)
+        _remove_upload_file_from_url(avatar_atual, g.auth['workspace_id'])
     
     return jsonify({'message': 'Avatar removido'})
 
@@ -8544,8 +10731,14 @@ def list_clientes():
     params = [g.auth['workspace_id']]
     
     if search:
-        query += ' AND (c.nome LIKE ? OR c.email LIKE ? OR c.cpf_cnpj LIKE ? OR c.telefone LIKE ?)'
-        params.extend([f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%'])
+        # Índice sem acentos e tolerante a erros; LIKE só sem índice ou termo curto
+        ids = buscar_indice(db, g.auth['workspace_id'], search, 'cliente', limite=None)
+        if ids is not None:
+            query += ' AND c.id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(ids))
+        else:
+            query += ' AND (c.nome LIKE ? OR c.email LIKE ? OR c.cpf_cnpj LIKE ? OR c.telefone LIKE ?)'
+            params.extend([f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%'])
     
     query += ' ORDER BY c.nome'
     
@@ -8571,12 +10764,13 @@ def create_cliente():
         }), 403
     
     cursor = db.execute(
-        '''INSERT INTO clientes (workspace_id, nome, email, telefone, cpf_cnpj, rg_ie, 
-           data_nascimento, nacionalidade, estado_civil, profissao, endereco, numero, complemento, 
-           bairro, cidade, estado, cep, observacoes)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        '''INSERT INTO clientes (workspace_id, nome, email, telefone, telefone_digits, telefone_local,
+           cpf_cnpj, rg_ie, data_nascimento, nacionalidade, estado_civil, profissao, endereco, numero,
+           complemento, bairro, cidade, estado, cep, observacoes)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
         (g.auth['workspace_id'], data.get('nome'), data.get('email'), 
-         data.get('telefone'), data.get('cpf_cnpj'), data.get('rg_ie'),
+         data.get('telefone'), *phone_index_values(data.get('telefone')),
+         data.get('cpf_cnpj'), data.get('rg_ie'),
          data.get('data_nascimento'), data.get('nacionalidade', 'Brasileiro(a)'),
          data.get('estado_civil'), data.get('profissao'), data.get('endereco'),
          data.get('numero'), data.get('complemento'), data.get('bairro'),
@@ -8611,12 +10805,13 @@ def update_cliente(id):
     db = get_db()
     
     db.execute(
-        '''UPDATE clientes SET nome = ?, email = ?, telefone = ?, 
+        '''UPDATE clientes SET nome = ?, email = ?, telefone = ?, telefone_digits = ?, telefone_local = ?,
            cpf_cnpj = ?, rg_ie = ?, data_nascimento = ?, nacionalidade = ?, estado_civil = ?, 
            profissao = ?, endereco = ?, numero = ?, complemento = ?, bairro = ?, 
            cidade = ?, estado = ?, cep = ?, observacoes = ? 
            WHERE id = ? AND workspace_id = ?''',
         (data.get('nome'), data.get('email'), data.get('telefone'),
+         *phone_index_values(data.get('telefone')),
          data.get('cpf_cnpj'), data.get('rg_ie'), data.get('data_nascimento'),
          data.get('nacionalidade', 'Brasileiro(a)'), data.get('estado_civil'),
          data.get('profissao'), data.get('endereco'), data.get('numero'),
@@ -8671,17 +10866,25 @@ def list_processos():
         params.append(cliente_id)
     
     if search:
-        query += ' AND (p.numero LIKE ? OR p.titulo LIKE ? OR c.nome LIKE ?)'
-        params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
+        # Índice sem acentos e tolerante a erros, como em list_clientes
+        ids = buscar_indice(db, g.auth['workspace_id'], search, 'processo', limite=None)
+        if ids is not None:
+            query += ' AND p.id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(ids))
+        else:
+            query += ' AND (p.numero LIKE ? OR p.titulo LIKE ? OR c.nome LIKE ?)'
+            params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
     
     query += ' ORDER BY p.created_at DESC'
     
     rows = db.execute(query, params).fetchall()
     return jsonify([dict(r) for r in rows])
 
-def verificar_limite_workspace(workspace_id: int, entidade: str) -> tuple:
+def verificar_limite_workspace(workspace_id: int, entidade: str, adicional: int = 0) -> tuple:
     """Verifica se o workspace atingiu o limite de uma entidade.
     Retorna (permitido: bool, limite: int, atual: int, mensagem: str)
+
+    Para 'armazenamento', `adicional` são os bytes do arquivo que está chegando.
     """
     db = get_db()
     
@@ -8717,6 +10920,14 @@ def verificar_limite_workspace(workspace_id: int, entidade: str) -> tuple:
     elif entidade == 'usuarios':
         atual = db.execute('SELECT COUNT(*) as count FROM users WHERE workspace_id = ?', 
                           (workspace_id,)).fetchone()['count']
+    elif entidade == 'armazenamento':
+        atual = armazenamento.uso_workspace(db, workspace_id)['bytes']
+        if atual + adicional > limite:
+            return (
+                False, limite, atual,
+                f'Limite de armazenamento atingido. Plano {plano_codigo}: {limite // (1024 * 1024)} MB.',
+            )
+        return True, limite, atual, ''
     else:
         return True, -1, 0, ''
     
@@ -9224,7 +11435,7 @@ def consultar_datajud(id):
 
         # Salva movimentações no banco (evita duplicatas)
         resultado_salvamento = DatajudMonitor.salvar_movimentacoes(
-            id, workspace_id, movimentos
+            id, workspace_id, movimentos, numero_processo
         )
         movs_novas = resultado_salvamento.get('novas_movimentacoes', [])
 
@@ -10123,29 +12334,23 @@ def create_tarefa():
     print(f"🔔 Notificação criada para user_id={assigned_to}: {mensagem}")
     
     if EMAIL_NOTIFICATIONS_ENABLED and EMAIL_SERVICE_DISPONIVEL and email_service.is_configured():
-        titulo_tarefa = data.get('titulo')
-        descricao = data.get('descricao')
-        data_vencimento = data.get('data_vencimento')
-
-        def _enviar_email_tarefa():
-            with app.app_context():
-                try:
-                    resultado_email = notificador_email.notificar_nova_tarefa(
-                        workspace_id=workspace_id,
-                        tarefa_id=tarefa_id,
-                        titulo_tarefa=titulo_tarefa,
-                        descricao=descricao,
-                        data_vencimento=data_vencimento,
-                        usuario_atribuido_id=assigned_to
-                    )
-                    if resultado_email.get('success'):
-                        print(f"[email] Notificação de tarefa enviada para user_id={assigned_to}")
-                    else:
-                        print(f"[email] Falha ao enviar notificação de tarefa: {resultado_email.get('error')}")
-                except Exception as e:
-                    print(f"[email] Erro inesperado ao enviar notificação de tarefa: {e}")
-
-        threading.Thread(target=_enviar_email_tarefa, daemon=True).start()
+        # Destinatários resolvidos aqui; o envio sai da requisição pela fila de email
+        try:
+            resultado_email = notificador_email.notificar_nova_tarefa(
+                workspace_id=workspace_id,
+                tarefa_id=tarefa_id,
+                titulo_tarefa=data.get('titulo'),
+                descricao=data.get('descricao'),
+                data_vencimento=data.get('data_vencimento'),
+                usuario_atribuido_id=assigned_to,
+                enfileirar=True,
+            )
+            if resultado_email.get('success'):
+                print(f"[email] Notificação de tarefa enfileirada para user_id={assigned_to}")
+            else:
+                print(f"[email] Falha ao enfileirar notificação de tarefa: {resultado_email.get('error')}")
+        except Exception as e:
+            print(f"[email] Erro inesperado ao enfileirar notificação de tarefa: {e}")
 
     # Automação WhatsApp para nova tarefa (assíncrono)
     def _whatsapp_nova_tarefa_job():
@@ -10404,26 +12609,39 @@ def _normalize_branding_url(raw_url: Any, max_len: int = 1024) -> Optional[str]:
     return safe
 
 
-def _remove_upload_file_from_url(file_url: Optional[str]) -> None:
-    """Remove arquivo interno de /uploads quando existir."""
-    value = str(file_url or '').strip()
-    if not value.startswith('/uploads/'):
+def _remove_upload_file_from_url(file_url: Optional[str], workspace_id: Optional[int] = None) -> None:
+    """Libera o arquivo interno de /uploads (referência do blob ou arquivo legado)."""
+    target = _caminho_upload_interno(file_url)
+    if not target:
         return
 
-    rel_path = value[len('/uploads/'):].lstrip('/')
-    if not rel_path:
-        return
+    db = get_db()
+    legado = armazenamento.liberar(db, target, workspace_id)
+    db.commit()
+    armazenamento.remover_arquivo(legado)
 
-    uploads_root = os.path.abspath(app.config['UPLOAD_FOLDER'])
-    target = os.path.abspath(os.path.join(uploads_root, rel_path))
-    if not target.startswith(uploads_root + os.sep):
-        return
 
-    try:
-        if os.path.exists(target):
-            os.remove(target)
-    except OSError:
-        pass
+def _armazenar_upload(file, extensao: str, workspace_id: int, verificar_limite: bool = True):
+    """Recebe o upload em streaming e grava como blob (sem commit).
+
+    Retorna (registro, None) ou (None, resposta de erro) se o limite de
+    armazenamento do plano seria ultrapassado.
+    """
+    recebido = armazenamento.receber(file.stream, extensao)
+    if verificar_limite:
+        permitido, limite, atual, mensagem = verificar_limite_workspace(
+            workspace_id, 'armazenamento', adicional=recebido['tamanho']
+        )
+        if not permitido:
+            armazenamento.descartar(recebido)
+            return None, (jsonify({
+                'error': 'Limite atingido',
+                'message': mensagem,
+                'limite': limite,
+                'atual': atual,
+                'sugestao': 'Faça upgrade do plano para ampliar o armazenamento.',
+            }), 403)
+    return armazenamento.registrar(get_db(), recebido, workspace_id), None
 
 
 def _build_financeiro_extrato(workspace_id: int, mes_raw: Optional[str]) -> Dict[str, Any]:
@@ -11028,81 +13246,396 @@ def _render_financeiro_extrato_html(extrato: Dict[str, Any]) -> str:
         <div>Total de transacoes: {int(resumo.get('total_transacoes') or 0)} | Comprovantes de saida: {int(resumo.get('total_comprovantes_saida') or 0)}</div>
       </div>
 
-      <div class="cards">
-        <div class="card">
-          <div class="card-label">Entradas</div>
-          <div class="card-value entrada">{html.escape(entradas_fmt)}</div>
-        </div>
-        <div class="card">
-          <div class="card-label">Saidas</div>
-          <div class="card-value saida">{html.escape(saidas_fmt)}</div>
-        </div>
-        <div class="card">
-          <div class="card-label">Saldo do Mes</div>
-          <div class="card-value saldo {saldo_class}">{html.escape(saldo_fmt)}</div>
-        </div>
-      </div>
+      <div class="cards">
+        <div class="card">
+          <div class="card-label">Entradas</div>
+          <div class="card-value entrada">{html.escape(entradas_fmt)}</div>
+        </div>
+        <div class="card">
+          <div class="card-label">Saidas</div>
+          <div class="card-value saida">{html.escape(saidas_fmt)}</div>
+        </div>
+        <div class="card">
+          <div class="card-label">Saldo do Mes</div>
+          <div class="card-value saldo {saldo_class}">{html.escape(saldo_fmt)}</div>
+        </div>
+      </div>
+
+      <div class="secao">
+        <h2>Historico de Transacoes</h2>
+        <table>
+          <thead>
+            <tr>
+              <th>Data</th>
+              <th>Descricao</th>
+              <th>Tipo</th>
+              <th>Status</th>
+              <th style="text-align:right;">Valor</th>
+              <th style="text-align:center;">Docs</th>
+            </tr>
+          </thead>
+          <tbody>
+            {''.join(linhas_transacoes)}
+          </tbody>
+        </table>
+      </div>
+
+      <div class="secao">
+        <h2>Comprovantes de Saida</h2>
+        {''.join(linhas_comprovantes)}
+      </div>
+
+      <div class="assinatura-bloco">
+        <div class="assinatura-box">
+          {assinatura_imagem_markup}
+          <div class="assinatura-linha"></div>
+          <div class="assinatura-nome">{html.escape(assinatura_nome)}</div>
+          {'<div class="assinatura-cargo">' + html.escape(assinatura_cargo) + '</div>' if assinatura_cargo else ''}
+        </div>
+      </div>
+    </div>
+
+    <div class="rodape">
+      Documento gerado automaticamente por {html.escape(workspace_nome)} via JurisPocket.
+    </div>
+  </div>
+</body>
+</html>
+"""
+
+
+def _sanitize_extrato_payload(extrato: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove campos internos (ex.: paths de arquivo) antes de expor payload."""
+    sanitized = dict(extrato)
+    transacoes_limpas: List[Dict[str, Any]] = []
+
+    for transacao in extrato.get('transacoes') or []:
+        item = dict(transacao)
+        docs_limpos: List[Dict[str, Any]] = []
+        for doc in item.get('documentos') or []:
+            doc_clean = dict(doc)
+            doc_clean.pop('file_path', None)
+            docs_limpos.append(doc_clean)
+        item['documentos'] = docs_limpos
+        transacoes_limpas.append(item)
+
+    sanitized['transacoes'] = transacoes_limpas
+    return sanitized
+
+
+# ============================================================================
+# CACHE DE RENDERIZAÇÃO DO EXTRATO FINANCEIRO
+# ============================================================================
+
+EXTRATO_RENDER_CACHE_MAX_BYTES = int(os.getenv('EXTRATO_RENDER_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+EXTRATO_ZIP_CACHE_MAX_BYTES = int(os.getenv('EXTRATO_ZIP_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+
+def _extrato_data_version(extrato: Dict[str, Any]) -> str:
+    """Hash do conteúdo do extrato (transações, comprovantes e identidade do workspace).
+
+    O campo gerado_em fica de fora: dois extratos com os mesmos dados produzem a
+    mesma versão e reaproveitam o HTML/ZIP já renderizado.
+    """
+    payload = {k: v for k, v in extrato.items() if k != 'gerado_em'}
+    serializado = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+class ExtratoRenderCache:
+    """
+    Cache LRU em memória do extrato renderizado (HTML; o ZIP fica em ExtratoZipCache).
+
+    A chave é (workspace_id, mes_referencia, versão dos dados, formato); como a
+    versão é o hash do conteúdo, uma alteração em financeiro/documentos gera uma
+    chave nova automaticamente. invalidar() apenas libera as entradas antigas
+    do mês assim que uma escrita acontece.
+    """
+
+    def __init__(self, max_bytes: int = EXTRATO_RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, workspace_id: int, mes_ref: str, versao: str, formato: str) -> Optional[bytes]:
+        chave = (int(workspace_id), mes_ref, versao, formato)
+        with self._lock:
+            conteudo = self._entries.get(chave)
+            if conteudo is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(chave)
+            self._stats['hits'] += 1
+            return conteudo
+
+    def put(self, workspace_id: int, mes_ref: str, versao: str, formato: str, conteudo: bytes):
+        tamanho = len(conteudo)
+        # Pacotes maiores que 1/4 do orçamento não compensam expulsar o resto
+        if self.max_bytes <= 0 or tamanho > self.max_bytes // 4:
+            return
+        chave = (int(workspace_id), mes_ref, versao, formato)
+        with self._lock:
+            anterior = self._entries.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior)
+            self._entries[chave] = conteudo
+            self._bytes += tamanho
+            while self._bytes > self.max_bytes and self._entries:
+                _, removido = self._entries.popitem(last=False)
+                self._bytes -= len(removido)
+
+    def invalidar(self, workspace_id: int, meses: Optional[set] = None):
+        """Remove entradas do workspace (todas ou só dos meses informados)."""
+        with self._lock:
+            chaves = [
+                chave for chave in self._entries
+                if chave[0] == int(workspace_id) and (meses is None or chave[1] in meses)
+            ]
+            for chave in chaves:
+                self._bytes -= len(self._entries.pop(chave))
+            if chaves:
+                self._stats['invalidations'] += len(chaves)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round(self._stats['hits'] / total, 3) if total else 0.0,
+            }
+
+
+extrato_render_cache = ExtratoRenderCache()
+
+
+class ExtratoZipCache:
+    """
+    Pacotes ZIP do extrato em disco, um arquivo por (workspace, mês, versão dos
+    dados). O ZIP é gravado enquanto é transmitido ao primeiro cliente e só
+    entra no cache ao terminar; downloads seguintes saem direto do arquivo.
+    O total em disco é limitado a max_bytes, expulsando os menos usados.
+    """
+
+    def __init__(self, diretorio_fn, max_bytes: int = EXTRATO_ZIP_CACHE_MAX_BYTES):
+        self._diretorio_fn = diretorio_fn
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def caminho(self, workspace_id: int, mes_ref: str, versao: str) -> str:
+        return os.path.join(self._diretorio_fn(), f'{int(workspace_id)}_{mes_ref}_{versao[:32]}.zip')
+
+    def obter(self, workspace_id: int, mes_ref: str, versao: str) -> Optional[str]:
+        caminho = self.caminho(workspace_id, mes_ref, versao)
+        try:
+            os.utime(caminho)  # mtime marca o último uso para a expulsão LRU
+        except OSError:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        with self._lock:
+            self._stats['hits'] += 1
+        return caminho
+
+    def gravar_stream(self, workspace_id: int, mes_ref: str, versao: str, blocos):
+        """Repassa os blocos ao cliente gravando uma cópia; download interrompido não entra no cache."""
+        if self.max_bytes <= 0:
+            yield from blocos
+            return
+        caminho = self.caminho(workspace_id, mes_ref, versao)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        parcial = f'{caminho}.{secrets.token_hex(4)}.parcial'
+        concluido = False
+        try:
+            with open(parcial, 'wb') as saida:
+                for bloco in blocos:
+                    saida.write(bloco)
+                    yield bloco
+            os.replace(parcial, caminho)
+            concluido = True
+            self._aplicar_limite()
+        finally:
+            if not concluido:
+                try:
+                    os.remove(parcial)
+                except OSError:
+                    pass
+
+    def _arquivos(self):
+        try:
+            with os.scandir(self._diretorio_fn()) as entradas:
+                return [(e.path, e.stat()) for e in entradas if e.name.endswith('.zip')]
+        except OSError:
+            return []
+
+    def _aplicar_limite(self):
+        arquivos = sorted(self._arquivos(), key=lambda item: item[1].st_mtime)
+        total = sum(info.st_size for _, info in arquivos)
+        for caminho, info in arquivos:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(caminho)
+                total -= info.st_size
+                with self._lock:
+                    self._stats['evictions'] += 1
+            except OSError:
+                pass
+
+    def invalidar(self, workspace_id: int, meses: Optional[set] = None):
+        """Remove os pacotes do workspace (todos ou só dos meses informados)."""
+        prefixos = tuple(f'{int(workspace_id)}_{mes}_' for mes in meses) if meses else (f'{int(workspace_id)}_',)
+        removidos = 0
+        for caminho, _ in self._arquivos():
+            if os.path.basename(caminho).startswith(prefixos):
+                try:
+                    os.remove(caminho)
+                    removidos += 1
+                except OSError:
+                    pass
+        if removidos:
+            with self._lock:
+                self._stats['invalidations'] += removidos
+
+    def get_stats(self) -> Dict[str, Any]:
+        arquivos = self._arquivos()
+        with self._lock:
+            return {
+                **self._stats,
+                'entries': len(arquivos),
+                'bytes': sum(info.st_size for _, info in arquivos),
+                'max_bytes': self.max_bytes,
+            }
+
+
+extrato_zip_cache = ExtratoZipCache(lambda: os.path.join(app.config['UPLOAD_FOLDER'], 'cache', 'extratos'))
+
+# PDF gerado no servidor (LibreOffice headless, sem serviço externo)
+PDF_SOFFICE_PATH = os.getenv('PDF_SOFFICE_PATH', '').strip() or None
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', '2'))
+PDF_TIMEOUT_SEGUNDOS = int(os.getenv('PDF_TIMEOUT_SEGUNDOS', '60'))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+PDF_ESPERA_SEGUNDOS = float(os.getenv('PDF_ESPERA_SEGUNDOS', '3'))
+
+renderizador_pdf = RenderizadorPDF(
+    lambda: os.path.join(app.config['UPLOAD_FOLDER'], 'cache', 'pdf'),
+    soffice=PDF_SOFFICE_PATH,
+    max_workers=PDF_WORKERS,
+    timeout_segundos=PDF_TIMEOUT_SEGUNDOS,
+    max_bytes=PDF_CACHE_MAX_BYTES,
+)
+atexit.register(renderizador_pdf.encerrar)
+
+
+def _html_para_pdf_offline(html_content: str) -> bytes:
+    """Imagens de /uploads viram file:// (lidas do disco); URLs externas são removidas."""
+    import html
+
+    def _src(match):
+        caminho = _caminho_upload_interno(html.unescape(match.group(1)))
+        if caminho and os.path.exists(caminho):
+            return f'src="{html.escape(Path(caminho).as_uri(), quote=True)}"'
+        return 'src=""'
+    return re.sub(r'src="([^"]*)"', _src, html_content).encode('utf-8')
+
+
+def _solicitar_pdf(chave, extensao, produzir, nome):
+    """Resposta padrão do PDF: arquivo se pronto, 202 com pdf_id enquanto converte."""
+    if not renderizador_pdf.disponivel:
+        return jsonify({'error': 'Geração de PDF indisponível no servidor (LibreOffice não instalado)'}), 503
+    estado = renderizador_pdf.solicitar(
+        g.auth['workspace_id'], chave, extensao, produzir, nome=nome, aguardar_segundos=PDF_ESPERA_SEGUNDOS
+    )
+    return _responder_pdf(chave, estado)
+
+
+def _responder_pdf(chave, estado):
+    if estado is None:
+        return jsonify({'error': 'PDF não encontrado'}), 404
+    if estado['status'] == 'pronto':
+        return send_file(
+            estado['caminho'],
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=estado['nome'],
+            conditional=True,
+            etag=chave,
+        )
+    if estado['status'] == 'erro':
+        return jsonify({'error': f"Falha ao gerar PDF: {estado['erro']}", 'pdf_id': chave}), 500
+    response = jsonify({'status': 'processando', 'pdf_id': chave, 'url': f'/api/pdf/{chave}'})
+    response.status_code = 202
+    response.headers['Retry-After'] = '2'
+    return response
+
 
-      <div class="secao">
-        <h2>Historico de Transacoes</h2>
-        <table>
-          <thead>
-            <tr>
-              <th>Data</th>
-              <th>Descricao</th>
-              <th>Tipo</th>
-              <th>Status</th>
-              <th style="text-align:right;">Valor</th>
-              <th style="text-align:center;">Docs</th>
-            </tr>
-          </thead>
-          <tbody>
-            {''.join(linhas_transacoes)}
-          </tbody>
-        </table>
-      </div>
+def invalidar_cache_extrato_financeiro(workspace_id: int, *datas: Optional[str]):
+    """Libera o extrato cacheado dos meses afetados (datas YYYY-MM-DD); sem datas, o workspace todo."""
+    meses = {str(d)[:7] for d in datas if d}
+    extrato_render_cache.invalidar(workspace_id, meses or None)
+    extrato_zip_cache.invalidar(workspace_id, meses or None)
 
-      <div class="secao">
-        <h2>Comprovantes de Saida</h2>
-        {''.join(linhas_comprovantes)}
-      </div>
 
-      <div class="assinatura-bloco">
-        <div class="assinatura-box">
-          {assinatura_imagem_markup}
-          <div class="assinatura-linha"></div>
-          <div class="assinatura-nome">{html.escape(assinatura_nome)}</div>
-          {'<div class="assinatura-cargo">' + html.escape(assinatura_cargo) + '</div>' if assinatura_cargo else ''}
-        </div>
-      </div>
-    </div>
+def invalidar_cache_extrato_por_transacao(db, workspace_id: int, financeiro_id: Optional[int]):
+    """Invalida o mês da transação dona de um comprovante."""
+    if not financeiro_id:
+        return
+    row = db.execute(
+        'SELECT data FROM financeiro WHERE id = ? AND workspace_id = ?',
+        (financeiro_id, workspace_id),
+    ).fetchone()
+    invalidar_cache_extrato_financeiro(workspace_id, row['data'] if row else None)
 
-    <div class="rodape">
-      Documento gerado automaticamente por {html.escape(workspace_nome)} via JurisPocket.
-    </div>
-  </div>
-</body>
-</html>
-"""
 
+def _render_financeiro_extrato_html_cached(extrato: Dict[str, Any], versao: str) -> str:
+    workspace_id = int((extrato.get('workspace') or {}).get('id') or 0)
+    mes_ref = str(extrato.get('mes_referencia') or '')
+    cached = extrato_render_cache.get(workspace_id, mes_ref, versao, 'html')
+    if cached is not None:
+        return cached.decode('utf-8')
+    html_content = _render_financeiro_extrato_html(extrato)
+    extrato_render_cache.put(workspace_id, mes_ref, versao, 'html', html_content.encode('utf-8'))
+    return html_content
 
-def _sanitize_extrato_payload(extrato: Dict[str, Any]) -> Dict[str, Any]:
-    """Remove campos internos (ex.: paths de arquivo) antes de expor payload."""
-    sanitized = dict(extrato)
-    transacoes_limpas: List[Dict[str, Any]] = []
 
+def _entradas_financeiro_extrato_zip(extrato: Dict[str, Any], versao: str):
+    """Entradas do pacote ZIP do extrato (HTML/JSON + comprovantes de saída), na ordem do arquivo."""
+    mes_ref = str(extrato.get('mes_referencia') or datetime.now().strftime('%Y-%m'))
+    yield f'extrato_{mes_ref}.html', _render_financeiro_extrato_html_cached(extrato, versao)
+    yield (
+        f'extrato_{mes_ref}.json',
+        json.dumps(_sanitize_extrato_payload(extrato), ensure_ascii=False, indent=2),
+    )
+
+    nomes_usados: set[str] = set()
     for transacao in extrato.get('transacoes') or []:
-        item = dict(transacao)
-        docs_limpos: List[Dict[str, Any]] = []
-        for doc in item.get('documentos') or []:
-            doc_clean = dict(doc)
-            doc_clean.pop('file_path', None)
-            docs_limpos.append(doc_clean)
-        item['documentos'] = docs_limpos
-        transacoes_limpas.append(item)
+        tipo_raw = str(transacao.get('tipo') or '').strip().lower()
+        if tipo_raw not in {'saida', 'despesa'}:
+            continue
 
-    sanitized['transacoes'] = transacoes_limpas
-    return sanitized
+        for doc in transacao.get('documentos') or []:
+            file_path = str(doc.get('file_path') or '').strip()
+            if not file_path or not os.path.exists(file_path):
+                continue
+
+            nome_original = str(doc.get('nome') or doc.get('filename') or 'comprovante')
+            nome_base = secure_filename(nome_original) or f"comprovante_{doc.get('id')}"
+            nome_zip = f"comprovantes/transacao_{int(transacao.get('id'))}_{nome_base}"
+
+            if nome_zip in nomes_usados:
+                raiz, ext = os.path.splitext(nome_base)
+                idx = 2
+                while f"comprovantes/transacao_{int(transacao.get('id'))}_{raiz}_{idx}{ext}" in nomes_usados:
+                    idx += 1
+                nome_zip = f"comprovantes/transacao_{int(transacao.get('id'))}_{raiz}_{idx}{ext}"
+
+            nomes_usados.add(nome_zip)
+            yield nome_zip, Path(file_path)
 
 
 @app.route('/api/financeiro/extrato', methods=['GET'])
@@ -11124,62 +13657,75 @@ def imprimir_extrato_financeiro():
         workspace_id=g.auth['workspace_id'],
         mes_raw=request.args.get('mes'),
     )
-    html_content = _render_financeiro_extrato_html(extrato)
+    html_content = _render_financeiro_extrato_html_cached(extrato, _extrato_data_version(extrato))
     return app.response_class(html_content, mimetype='text/html')
 
 
-@app.route('/api/financeiro/extrato/download', methods=['GET'])
+@app.route('/api/financeiro/extrato/pdf', methods=['GET'])
 @require_auth
-def download_extrato_financeiro():
-    """Baixa pacote ZIP com extrato (HTML/JSON) e comprovantes de saída do mês."""
+def pdf_extrato_financeiro():
+    """Extrato em PDF gerado no servidor (cache por versão dos dados do mês)."""
     extrato = _build_financeiro_extrato(
         workspace_id=g.auth['workspace_id'],
         mes_raw=request.args.get('mes'),
     )
     mes_ref = str(extrato.get('mes_referencia') or datetime.now().strftime('%Y-%m'))
-    html_content = _render_financeiro_extrato_html(extrato)
-
-    buffer = io.BytesIO()
-    nomes_usados: set[str] = set()
-
-    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr(f'extrato_{mes_ref}.html', html_content)
-        zf.writestr(
-            f'extrato_{mes_ref}.json',
-            json.dumps(_sanitize_extrato_payload(extrato), ensure_ascii=False, indent=2),
-        )
+    versao = _extrato_data_version(extrato)
+    chave = renderizador_pdf.chave('extrato', g.auth['workspace_id'], mes_ref, versao)
+    return _solicitar_pdf(
+        chave,
+        'html',
+        lambda: _html_para_pdf_offline(_render_financeiro_extrato_html_cached(extrato, versao)),
+        f'extrato_{mes_ref}.pdf',
+    )
 
-        for transacao in extrato.get('transacoes') or []:
-            tipo_raw = str(transacao.get('tipo') or '').strip().lower()
-            if tipo_raw not in {'saida', 'despesa'}:
-                continue
 
-            for doc in transacao.get('documentos') or []:
-                file_path = str(doc.get('file_path') or '').strip()
-                if not file_path or not os.path.exists(file_path):
-                    continue
+@app.route('/api/pdf/<pdf_id>', methods=['GET'])
+@require_auth
+def obter_pdf_gerado(pdf_id):
+    """Consulta/baixa um PDF pedido antes (202 enquanto a conversão não termina)."""
+    if not re.fullmatch(r'[0-9a-f]{64}', pdf_id or ''):
+        return jsonify({'error': 'PDF não encontrado'}), 404
+    return _responder_pdf(pdf_id, renderizador_pdf.status(g.auth['workspace_id'], pdf_id))
 
-                nome_original = str(doc.get('nome') or doc.get('filename') or 'comprovante')
-                nome_base = secure_filename(nome_original) or f"comprovante_{doc.get('id')}"
-                nome_zip = f"comprovantes/transacao_{int(transacao.get('id'))}_{nome_base}"
 
-                if nome_zip in nomes_usados:
-                    raiz, ext = os.path.splitext(nome_base)
-                    idx = 2
-                    while f"comprovantes/transacao_{int(transacao.get('id'))}_{raiz}_{idx}{ext}" in nomes_usados:
-                        idx += 1
-                    nome_zip = f"comprovantes/transacao_{int(transacao.get('id'))}_{raiz}_{idx}{ext}"
+@app.route('/api/financeiro/extrato/download', methods=['GET'])
+@require_auth
+def download_extrato_financeiro():
+    """Baixa pacote ZIP com extrato (HTML/JSON) e comprovantes de saída do mês.
 
-                nomes_usados.add(nome_zip)
-                zf.write(file_path, arcname=nome_zip)
+    O ZIP é transmitido enquanto é gerado (comprovantes lidos do disco em
+    blocos) e fica em cache por versão dos dados do mês; com cache, sai do
+    arquivo com ETag e suporte a Range.
+    """
+    extrato = _build_financeiro_extrato(
+        workspace_id=g.auth['workspace_id'],
+        mes_raw=request.args.get('mes'),
+    )
+    mes_ref = str(extrato.get('mes_referencia') or datetime.now().strftime('%Y-%m'))
+    versao = _extrato_data_version(extrato)
+    download_name = f'extrato_{mes_ref}.zip'
+
+    cached = extrato_zip_cache.obter(g.auth['workspace_id'], mes_ref, versao)
+    if cached:
+        return send_file(
+            cached,
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name=download_name,
+            etag=versao,
+            conditional=True,
+        )
 
-    buffer.seek(0)
-    return send_file(
-        buffer,
+    blocos = iterar_zip_stream(_entradas_financeiro_extrato_zip(extrato, versao))
+    response = app.response_class(
+        stream_with_context(extrato_zip_cache.gravar_stream(g.auth['workspace_id'], mes_ref, versao, blocos)),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name=f'extrato_{mes_ref}.zip',
+        headers={'X-Accel-Buffering': 'no'},
     )
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.set_etag(versao)
+    return response
 
 @app.route('/api/financeiro/resumo', methods=['GET'])
 @require_auth
@@ -11285,6 +13831,7 @@ def create_financeiro():
              data.get('data'), data.get('descricao'), data.get('status', 'pendente'))
         )
         db.commit()
+        invalidar_cache_extrato_financeiro(g.auth['workspace_id'], data.get('data'))
         
         record = db.execute('SELECT * FROM financeiro WHERE id = ?', (cursor.lastrowid,)).fetchone()
         result = dict(record)
@@ -11299,6 +13846,9 @@ def update_financeiro(id):
     """Update financial record"""
     data = request.get_json()
     db = get_db()
+    anterior = db.execute(
+        'SELECT data FROM financeiro WHERE id = ? AND workspace_id = ?', (id, g.auth['workspace_id'])
+    ).fetchone()
     
     db.execute(
         '''UPDATE financeiro SET processo_id = ?, cliente_id = ?, tipo = ?, categoria = ?,
@@ -11309,6 +13859,9 @@ def update_financeiro(id):
          data.get('descricao'), data.get('status'), id, g.auth['workspace_id'])
     )
     db.commit()
+    invalidar_cache_extrato_financeiro(
+        g.auth['workspace_id'], anterior['data'] if anterior else None, data.get('data')
+    )
     
     record = db.execute('SELECT * FROM financeiro WHERE id = ?', (id,)).fetchone()
     result = dict(record)
@@ -11320,6 +13873,7 @@ def update_financeiro(id):
 def delete_financeiro(id):
     """Delete financial record"""
     db = get_db()
+    invalidar_cache_extrato_por_transacao(db, g.auth['workspace_id'], id)
     db.execute('DELETE FROM financeiro WHERE id = ? AND workspace_id = ?', (id, g.auth['workspace_id']))
     db.commit()
     return jsonify({'message': 'Registro excluído'})
@@ -11747,6 +14301,13 @@ def dashboard():
 # API ROUTES - AI ASSISTANT
 # ============================================================================
 
+def formatar_eventos_sse(eventos):
+    """Serializa eventos do assistente no formato server-sent events."""
+    for evento in eventos:
+        dados = {chave: valor for chave, valor in evento.items() if chave != 'tipo'}
+        yield f"event: {evento['tipo']}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
+
+
 @app.route('/api/assistente/chat', methods=['POST'])
 @require_auth
 def chat_assistente():
@@ -11758,6 +14319,25 @@ def chat_assistente():
     if not mensagem:
         return jsonify({'error': 'Mensagem não fornecida'}), 400
     
+    aceita_sse = 'text/event-stream' in (request.headers.get('Accept') or '')
+    if data.get('stream') or aceita_sse:
+        eventos = AssistenteIA.processar_mensagem_eventos(
+            mensagem,
+            g.auth['workspace_id'],
+            g.auth['user_id'],
+            session_id,
+            stream=True,
+        )
+        return app.response_class(
+            stream_with_context(formatar_eventos_sse(eventos)),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                # Nginx não deve acumular o stream antes de repassar
+                'X-Accel-Buffering': 'no',
+            },
+        )
+    
     resultado = AssistenteIA.processar_mensagem(
         mensagem,
         g.auth['workspace_id'],
@@ -11810,36 +14390,37 @@ def ia_auditoria():
     role = g.auth.get('role')
 
     status = (request.args.get('status') or '').strip().lower()
-    try:
-        limit = int(request.args.get('limit', 50))
-    except (TypeError, ValueError):
-        limit = 50
-    limit = max(1, min(limit, 200))
+    limit, cursor, _ = parametros_paginacao(request.args, padrao=50, maximo=200)
 
-    query = '''
-        SELECT id, workspace_id, user_id, session_id, provider, model,
-               input_message, response_text, function_calls, status,
-               error_message, total_duration_ms, created_at
-        FROM ia_interaction_logs
-        WHERE workspace_id = ?
-    '''
+    condicoes = ['workspace_id = ?']
     params: List[Any] = [workspace_id]
 
     if status:
-        query += ' AND status = ?'
+        condicoes.append('status = ?')
         params.append(status)
 
     # Usuários comuns só enxergam as próprias interações
     if role not in ('admin', 'superadmin'):
-        query += ' AND user_id = ?'
+        condicoes.append('user_id = ?')
         params.append(user_id)
 
-    query += ' ORDER BY id DESC LIMIT ?'
-    params.append(limit)
-    rows = db.execute(query, params).fetchall()
+    try:
+        pagina = paginar(
+            db,
+            '''SELECT id, workspace_id, user_id, session_id, provider, model,
+                      input_message, response_text, function_calls, status,
+                      error_message, total_duration_ms, created_at''',
+            'FROM ia_interaction_logs',
+            condicoes,
+            params,
+            limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     interacoes = []
-    for row in rows:
+    for row in pagina['itens']:
         item = dict(row)
         try:
             item['function_calls'] = json.loads(item.get('function_calls') or '[]')
@@ -11847,11 +14428,31 @@ def ia_auditoria():
             item['function_calls'] = []
         interacoes.append(item)
 
-    return jsonify({
+    resposta = {
         'sucesso': True,
         'total': len(interacoes),
         'interacoes': interacoes,
-    })
+        'proximo_cursor': pagina['proximo_cursor'],
+        'tem_mais': pagina['tem_mais'],
+    }
+    if role in ('admin', 'superadmin'):
+        resposta['gateway'] = llm_gateway.get_stats()
+        resposta['roteador'] = roteador_intencoes.get_stats()
+        # Histórico persistido: turnos de 30 dias atendidos sem chamada ao LLM
+        turnos = db.execute(
+            '''SELECT COUNT(*) as total,
+                      SUM(CASE WHEN provider = 'roteador' THEN 1 ELSE 0 END) as roteados
+               FROM ia_interaction_logs
+               WHERE workspace_id = ? AND created_at >= datetime('now', '-30 days')''',
+            (workspace_id,),
+        ).fetchone()
+        total_turnos = turnos['total'] or 0
+        resposta['roteador']['workspace_30d'] = {
+            'turnos': total_turnos,
+            'roteados_sem_llm': turnos['roteados'] or 0,
+            'sem_llm_ratio': round((turnos['roteados'] or 0) / total_turnos, 3) if total_turnos else 0.0,
+        }
+    return jsonify(resposta)
 
 # ============================================================================
 # API ROUTES - DOCUMENTOS
@@ -11931,12 +14532,10 @@ def upload_documento():
     if ext not in allowed_extensions:
         return jsonify({'error': 'Formato não suportado'}), 400
     
-    # Criar nome único
-    filename = f"doc_{g.auth['user_id']}_{int(datetime.now().timestamp())}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    
-    # Salvar arquivo
-    file.save(filepath)
+    # Salvar arquivo (blob endereçado por conteúdo; conteúdo repetido é deduplicado)
+    blob, erro = _armazenar_upload(file, ext, g.auth['workspace_id'])
+    if erro:
+        return erro
     
     # Salvar no banco
     db = get_db()
@@ -11944,8 +14543,8 @@ def upload_documento():
         '''INSERT INTO documentos (workspace_id, processo_id, cliente_id, financeiro_id, nome, filename, 
            file_path, file_size, mime_type, categoria, descricao, uploaded_by)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-        (g.auth['workspace_id'], processo_id, cliente_id, financeiro_id, file.filename, filename,
-         filepath, os.path.getsize(filepath), file.content_type, categoria, descricao, g.auth['user_id'])
+        (g.auth['workspace_id'], processo_id, cliente_id, financeiro_id, file.filename, blob['relativo'],
+         blob['caminho'], blob['tamanho'], file.content_type, categoria, descricao, g.auth['user_id'])
     )
     db.commit()
     
@@ -11967,13 +14566,14 @@ def delete_documento(id):
     if not doc:
         return jsonify({'error': 'Documento não encontrado'}), 404
     
-    # Deletar arquivo
-    if os.path.exists(doc['file_path']):
-        os.remove(doc['file_path'])
+    # Liberar arquivo (o blob só é apagado sem outras referências)
+    legado = armazenamento.liberar(db, doc['file_path'], g.auth['workspace_id'], doc['file_size'])
     
     # Deletar do banco
     db.execute('DELETE FROM documentos WHERE id = ?', (id,))
     db.commit()
+    armazenamento.remover_arquivo(legado)
+    invalidar_cache_extrato_por_transacao(db, g.auth['workspace_id'], doc['financeiro_id'])
     
     return jsonify({'message': 'Documento excluído'})
 
@@ -11991,12 +14591,12 @@ def download_documento(id):
     if not doc:
         return jsonify({'error': 'Documento não encontrado'}), 404
     
-    if not os.path.exists(doc['file_path']):
+    if entrega_uploads.localizar(doc['filename']) is None:
         return jsonify({'error': 'Arquivo não encontrado no servidor'}), 404
     
-    return send_from_directory(
-        app.config['UPLOAD_FOLDER'], 
+    return entrega_uploads.responder(
         doc['filename'],
+        cache_control=CACHE_PRIVADO,
         as_attachment=True,
         download_name=doc['nome']
     )
@@ -12082,22 +14682,21 @@ def upload_financeiro_documento(financeiro_id):
     if ext not in allowed_extensions:
         return jsonify({'error': 'Formato não suportado'}), 400
     
-    # Criar nome único para o arquivo
-    filename = f"doc_fin_{g.auth['user_id']}_{int(datetime.now().timestamp())}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    
-    # Salvar arquivo
-    file.save(filepath)
+    # Salvar arquivo (blob endereçado por conteúdo; conteúdo repetido é deduplicado)
+    blob, erro = _armazenar_upload(file, ext, g.auth['workspace_id'])
+    if erro:
+        return erro
     
     # Salvar no banco
     cursor = db.execute(
         '''INSERT INTO documentos (workspace_id, financeiro_id, nome, filename, 
            file_path, file_size, mime_type, categoria, descricao, uploaded_by)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-        (g.auth['workspace_id'], financeiro_id, nome_final, filename,
-         filepath, os.path.getsize(filepath), file.content_type, 'comprovante', descricao, g.auth['user_id'])
+        (g.auth['workspace_id'], financeiro_id, nome_final, blob['relativo'],
+         blob['caminho'], blob['tamanho'], file.content_type, 'comprovante', descricao, g.auth['user_id'])
     )
     db.commit()
+    invalidar_cache_extrato_por_transacao(db, g.auth['workspace_id'], financeiro_id)
     
     documento = db.execute('SELECT * FROM documentos WHERE id = ?', (cursor.lastrowid,)).fetchone()
     return jsonify(dict(documento)), 201
@@ -12234,17 +14833,11 @@ def upload_template_word():
     if not nome:
         nome = file.filename.replace('.docx', '')
     
-    # Criar pasta de templates se não existir
-    templates_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'templates')
-    os.makedirs(templates_dir, exist_ok=True)
-    
-    # Criar nome único para o arquivo
-    timestamp = int(datetime.now().timestamp())
-    safe_filename = f"template_{g.auth['workspace_id']}_{timestamp}.docx"
-    filepath = os.path.join(templates_dir, safe_filename)
-    
-    # Salvar arquivo
-    file.save(filepath)
+    # Salvar arquivo (blob endereçado por conteúdo; nunca é sobrescrito no lugar)
+    blob, erro = _armazenar_upload(file, 'docx', g.auth['workspace_id'])
+    if erro:
+        return erro
+    filepath = blob['caminho']
     
     # Salvar no banco
     db = get_db()
@@ -12306,13 +14899,16 @@ def atualizar_template(id):
     
     # Verifica se template existe e pertence ao workspace
     template = db.execute(
-        'SELECT id FROM templates_documentos WHERE id = ? AND workspace_id = ?',
+        'SELECT id, caminho_arquivo FROM templates_documentos WHERE id = ? AND workspace_id = ?',
         (id, g.auth['workspace_id'])
     ).fetchone()
     
     if not template:
         return jsonify({'error': 'Template não encontrado'}), 404
     
+    if template['caminho_arquivo']:
+        template_docx_cache.invalidar(template['caminho_arquivo'])
+    
     # Atualiza campos fornecidos
     campos = []
     valores = []
@@ -12355,76 +14951,57 @@ def excluir_template(id):
     db = get_db()
     
     template = db.execute(
-        'SELECT id FROM templates_documentos WHERE id = ? AND workspace_id = ?',
+        'SELECT id, tipo_arquivo, caminho_arquivo FROM templates_documentos WHERE id = ? AND workspace_id = ?',
         (id, g.auth['workspace_id'])
     ).fetchone()
     
     if not template:
         return jsonify({'error': 'Template não encontrado'}), 404
     
+    legado = None
+    if template['tipo_arquivo'] == 'docx' and template['caminho_arquivo']:
+        template_docx_cache.invalidar(template['caminho_arquivo'])
+        legado = armazenamento.liberar(db, template['caminho_arquivo'], g.auth['workspace_id'])
     db.execute('DELETE FROM templates_documentos WHERE id = ?', (id,))
     db.commit()
+    armazenamento.remover_arquivo(legado)
     
     return jsonify({'message': 'Template excluído com sucesso'})
 
 
-def build_template_context(db, processo_id, workspace_id, user_id):
-    """Constrói o contexto completo para preenchimento de templates.
-    
-    Retorna um dicionário com todos os dados disponíveis para templates.
-    """
-    # Busca o processo com dados completos do cliente
-    processo = db.execute('''
-        SELECT p.*, 
-               c.nome as cliente_nome, 
-               c.cpf_cnpj as cliente_cpf, 
-               c.rg_ie as cliente_rg,
-               c.nacionalidade as cliente_nacionalidade,
-               c.endereco as cliente_endereco, 
-               c.numero as cliente_numero,
-               c.complemento as cliente_complemento,
-               c.bairro as cliente_bairro,
-               c.cidade as cliente_cidade,
-               c.estado as cliente_estado,
-               c.cep as cliente_cep,
-               c.email as cliente_email,
-               c.telefone as cliente_telefone,
-               c.data_nascimento as cliente_data_nascimento,
-               c.estado_civil as cliente_estado_civil,
-               c.profissao as cliente_profissao
-        FROM processos p
-        LEFT JOIN clientes c ON p.cliente_id = c.id
-        WHERE p.id = ? AND p.workspace_id = ?
-    ''', (processo_id, workspace_id)).fetchone()
-    
-    if not processo:
-        return None
-    
-    # Busca dados do advogado
-    advogado = db.execute(
-        'SELECT nome, email, oab, telefone FROM users WHERE id = ?',
-        (user_id,)
-    ).fetchone()
-    
-    # Busca workspace
-    workspace = db.execute(
-        'SELECT nome FROM workspaces WHERE id = ?',
-        (workspace_id,)
-    ).fetchone()
-    
-    # Busca dados financeiros do processo
-    financeiro = db.execute('''
-        SELECT 
-            COALESCE(SUM(CASE WHEN tipo IN ('entrada', 'receita') THEN valor ELSE 0 END), 0) as total_entradas,
-            COALESCE(SUM(CASE WHEN tipo IN ('saida', 'despesa') THEN valor ELSE 0 END), 0) as total_saidas
-        FROM financeiro 
-        WHERE processo_id = ? AND workspace_id = ?
-    ''', (processo_id, workspace_id)).fetchone()
-    
-    # Data atual
-    hoje = datetime.now()
+# Templates Word compilados em memória (ver services/templates_docx.py)
+TEMPLATE_DOCX_CACHE_MAX_BYTES = int(os.getenv('TEMPLATE_DOCX_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+TEMPLATE_LOTE_MAX = int(os.getenv('TEMPLATE_LOTE_MAX', '50'))
+TEMPLATE_LOTE_WORKERS = int(os.getenv('TEMPLATE_LOTE_WORKERS', '4'))
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+template_docx_cache = TemplateDocxCache(TEMPLATE_DOCX_CACHE_MAX_BYTES)
+
+# Lotes grandes: jobs em background renderizados num pool de processos
+TEMPLATE_LOTE_JOB_MAX = int(os.getenv('TEMPLATE_LOTE_JOB_MAX', '500'))
+TEMPLATE_LOTE_PROCESSOS = int(os.getenv('TEMPLATE_LOTE_PROCESSOS', str(min(4, os.cpu_count() or 1))))
+TEMPLATE_LOTE_JOBS_POR_WORKSPACE = int(os.getenv('TEMPLATE_LOTE_JOBS_POR_WORKSPACE', '10'))
+
+pool_renderizacao_documentos = PoolRenderizacao(TEMPLATE_LOTE_PROCESSOS, TEMPLATE_DOCX_CACHE_MAX_BYTES // 2)
+# Estado em disco, ao lado dos ZIPs: a consulta funciona em qualquer worker
+lote_documentos_jobs = RegistroTarefas(
+    diretorio_fn=lambda: _diretorio_lotes_documentos(),
+    max_por_workspace=TEMPLATE_LOTE_JOBS_POR_WORKSPACE,
+)
+atexit.register(pool_renderizacao_documentos.encerrar)
+
+
+def _nome_documento_gerado(template, context):
+    safe_cliente_nome = re.sub(r'[^\w\s-]', '', context['cliente_nome'] or 'Cliente').strip().replace(' ', '_')
+    return f"{template['nome']}_{safe_cliente_nome}_{int(datetime.now().timestamp())}.docx"
+
+
+def _montar_template_context(processo, advogado, workspace, financeiro, hoje):
+    """Dicionário de variáveis do template para um processo já carregado."""
     meses = ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho',
              'julho', 'agosto', 'setembro', 'outubro', 'novembro', 'dezembro']
+    if financeiro is None:
+        financeiro = {'total_entradas': 0, 'total_saidas': 0}
     
     # Formatar valor da causa
     valor_causa_formatado = ''
@@ -12528,7 +15105,94 @@ def build_template_context(db, processo_id, workspace_id, user_id):
         },
     }
     
-    return context
+    return context
+
+
+def build_template_contexts(db, processo_ids, workspace_id, user_id):
+    """Constrói os contextos de vários processos com consultas em conjunto.
+    
+    Retorna {processo_id: contexto}; processos inexistentes ou de outro
+    workspace ficam de fora.
+    """
+    ids = []
+    for valor in processo_ids:
+        try:
+            ids.append(int(valor))
+        except (TypeError, ValueError):
+            continue
+    if not ids:
+        return {}
+    ids_json = json.dumps(ids)
+    
+    # Busca os processos com dados completos do cliente
+    processos = db.execute('''
+        SELECT p.*, 
+               c.nome as cliente_nome, 
+               c.cpf_cnpj as cliente_cpf, 
+               c.rg_ie as cliente_rg,
+               c.nacionalidade as cliente_nacionalidade,
+               c.endereco as cliente_endereco, 
+               c.numero as cliente_numero,
+               c.complemento as cliente_complemento,
+               c.bairro as cliente_bairro,
+               c.cidade as cliente_cidade,
+               c.estado as cliente_estado,
+               c.cep as cliente_cep,
+               c.email as cliente_email,
+               c.telefone as cliente_telefone,
+               c.data_nascimento as cliente_data_nascimento,
+               c.estado_civil as cliente_estado_civil,
+               c.profissao as cliente_profissao
+        FROM processos p
+        LEFT JOIN clientes c ON p.cliente_id = c.id
+        WHERE p.workspace_id = ? AND p.id IN (SELECT value FROM json_each(?))
+    ''', (workspace_id, ids_json)).fetchall()
+    
+    if not processos:
+        return {}
+    
+    # Busca dados do advogado
+    advogado = db.execute(
+        'SELECT nome, email, oab, telefone FROM users WHERE id = ?',
+        (user_id,)
+    ).fetchone()
+    
+    # Busca workspace
+    workspace = db.execute(
+        'SELECT nome FROM workspaces WHERE id = ?',
+        (workspace_id,)
+    ).fetchone()
+    
+    # Busca dados financeiros dos processos (um agregado por processo)
+    financeiros = {row['processo_id']: row for row in db.execute('''
+        SELECT 
+            processo_id,
+            COALESCE(SUM(CASE WHEN tipo IN ('entrada', 'receita') THEN valor ELSE 0 END), 0) as total_entradas,
+            COALESCE(SUM(CASE WHEN tipo IN ('saida', 'despesa') THEN valor ELSE 0 END), 0) as total_saidas
+        FROM financeiro 
+        WHERE workspace_id = ? AND processo_id IN (SELECT value FROM json_each(?))
+        GROUP BY processo_id
+    ''', (workspace_id, ids_json)).fetchall()}
+    
+    hoje = datetime.now()
+    return {
+        int(processo['id']): _montar_template_context(
+            processo, advogado, workspace, financeiros.get(processo['id']), hoje
+        )
+        for processo in processos
+    }
+
+
+def build_template_context(db, processo_id, workspace_id, user_id):
+    """Constrói o contexto completo para preenchimento de templates.
+    
+    Retorna um dicionário com todos os dados disponíveis para templates.
+    """
+    try:
+        processo_id = int(processo_id)
+    except (TypeError, ValueError):
+        return None
+    return build_template_contexts(db, [processo_id], workspace_id, user_id).get(processo_id)
 
 
 @app.route('/api/templates/<int:template_id>/gerar', methods=['POST'])
@@ -12542,7 +15206,7 @@ def gerar_documento_template(template_id):
         return jsonify({'error': 'ID do processo é obrigatório'}), 400
     
     processo_id = data['processo_id']
-    formato = data.get('formato', 'auto')  # 'auto', 'json', 'download'
+    formato = data.get('formato', 'auto')  # 'auto', 'json', 'download', 'pdf'
     db = get_db()
     
     # Busca o template
@@ -12566,24 +15230,23 @@ def gerar_documento_template(template_id):
             return jsonify({'error': 'Arquivo do template não encontrado'}), 404
         
         try:
-            # Carrega o template Word
-            doc = DocxTemplate(template['caminho_arquivo'])
+            output_filename = _nome_documento_gerado(template, context)
             
-            # Renderiza com o contexto
-            doc.render(context)
-            
-            # Cria pasta temp se não existir
-            temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # Nome do arquivo de saída
-            safe_cliente_nome = re.sub(r'[^\w\s-]', '', context['cliente_nome'] or 'Cliente').strip().replace(' ', '_')
-            safe_processo = re.sub(r'[^\w\s-]', '', context['processo_numero'] or 'Processo').strip().replace(' ', '_')
-            output_filename = f"{template['nome']}_{safe_cliente_nome}_{int(datetime.now().timestamp())}.docx"
-            output_path = os.path.join(temp_dir, output_filename)
+            # PDF: conversão no pool do servidor; chave pelo template + dados usados.
+            # O DOCX só é renderizado se não houver PDF pronto nem em conversão
+            if formato == 'pdf':
+                chave = renderizador_pdf.chave(
+                    'docx', template['caminho_arquivo'], json.dumps(context, sort_keys=True, default=str)
+                )
+                return _solicitar_pdf(
+                    chave,
+                    'docx',
+                    lambda: template_docx_cache.renderizar(template['caminho_arquivo'], context),
+                    output_filename[:-len('.docx')] + '.pdf',
+                )
             
-            # Salva o documento
-            doc.save(output_path)
+            # Template compilado em cache; o documento é gerado em memória
+            conteudo = template_docx_cache.renderizar(template['caminho_arquivo'], context)
             
             # Se solicitou JSON (preview), retorna info
             if formato == 'json':
@@ -12597,9 +15260,9 @@ def gerar_documento_template(template_id):
                 })
             
             # Retorna arquivo para download
-            return send_from_directory(
-                temp_dir,
-                output_filename,
+            return send_file(
+                io.BytesIO(conteudo),
+                mimetype=DOCX_MIMETYPE,
                 as_attachment=True,
                 download_name=output_filename
             )
@@ -12630,6 +15293,224 @@ def gerar_documento_template(template_id):
         })
 
 
+def _preparar_lote_documentos(template_id, limite):
+    """
+    Valida a requisição de lote e monta os contextos (consultas em conjunto).
+    Retorna (template, [(nome_arquivo, contexto)], erros, None) ou (..., resposta_erro).
+    """
+    data = request.get_json() or {}
+    processo_ids = []
+    for valor in data.get('processo_ids') or []:
+        try:
+            processo_id = int(valor)
+        except (TypeError, ValueError):
+            continue
+        if processo_id not in processo_ids:
+            processo_ids.append(processo_id)
+    
+    if not processo_ids:
+        return None, None, None, (jsonify({'error': 'Selecione ao menos um processo'}), 400)
+    if len(processo_ids) > limite:
+        return None, None, None, (jsonify({'error': f'Máximo de {limite} processos por lote'}), 400)
+    
+    db = get_db()
+    template = db.execute(
+        'SELECT * FROM templates_documentos WHERE id = ? AND workspace_id = ?',
+        (template_id, g.auth['workspace_id'])
+    ).fetchone()
+    
+    if not template:
+        return None, None, None, (jsonify({'error': 'Template não encontrado'}), 404)
+    if template['tipo_arquivo'] != 'docx':
+        return None, None, None, (jsonify({'error': 'Geração em lote disponível apenas para templates Word'}), 400)
+    if not template['caminho_arquivo'] or not os.path.exists(template['caminho_arquivo']):
+        return None, None, None, (jsonify({'error': 'Arquivo do template não encontrado'}), 404)
+    
+    # Contextos montados aqui (conexão da requisição); só a renderização vai para o pool
+    contextos_por_id = build_template_contexts(db, processo_ids, g.auth['workspace_id'], g.auth['user_id'])
+    contextos = []
+    erros = []
+    nomes_usados = set()
+    for processo_id in processo_ids:
+        context = contextos_por_id.get(processo_id)
+        if not context:
+            erros.append(f'Processo {processo_id}: não encontrado')
+            continue
+        safe_processo = re.sub(r'[^\w\s-]', '', context['processo_numero'] or str(processo_id)).strip().replace(' ', '_')
+        base = _nome_documento_gerado(template, context)[:-len('.docx')]
+        nome = f'{base}_{safe_processo}.docx'
+        idx = 2
+        while nome in nomes_usados:
+            nome = f'{base}_{safe_processo}_{idx}.docx'
+            idx += 1
+        nomes_usados.add(nome)
+        contextos.append((nome, context))
+    
+    if not contextos:
+        return None, None, None, (jsonify({'error': 'Nenhum processo encontrado', 'erros': erros}), 404)
+    return template, contextos, erros, None
+
+
+def _nome_zip_lote(template):
+    nome = re.sub(r'\s+', '_', re.sub(r'[^\w\s-]', '', template['nome'] or 'documentos').strip())
+    return (nome or 'documentos') + '_lote.zip'
+
+
+def _definir_anexo(response, nome: str) -> None:
+    """Content-Disposition de download; nomes fora do ASCII vão em filename* (RFC 5987), como no send_file."""
+    try:
+        nome.encode('ascii')
+        opcoes = {'filename': nome}
+    except UnicodeEncodeError:
+        simples = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+        opcoes = {'filename': simples or 'download.zip', 'filename*': f"UTF-8''{url_quote(nome, safe='')}"}
+    response.headers.set('Content-Disposition', 'attachment', **opcoes)
+
+
+@app.route('/api/templates/<int:template_id>/gerar-lote', methods=['POST'])
+@require_auth
+@require_recurso('templates')
+def gerar_documentos_template_lote(template_id):
+    """Gera um documento Word por processo selecionado e devolve todos num ZIP"""
+    template, contextos, erros, resposta_erro = _preparar_lote_documentos(template_id, TEMPLATE_LOTE_MAX)
+    if resposta_erro:
+        return resposta_erro
+    
+    try:
+        gerados = template_docx_cache.renderizar_lote(
+            template['caminho_arquivo'], contextos, max_workers=TEMPLATE_LOTE_WORKERS
+        )
+    except Exception as e:
+        return jsonify({'error': f'Erro ao gerar documentos Word: {str(e)}'}), 500
+    
+    entradas = [(nome, conteudo) for nome, conteudo, erro in gerados if conteudo is not None]
+    erros.extend(f'{nome}: {erro}' for nome, conteudo, erro in gerados if erro)
+    if not entradas:
+        return jsonify({'error': 'Nenhum documento gerado', 'erros': erros}), 500
+    total_gerados = len(entradas)
+    if erros:
+        entradas.append(('erros.txt', '\n'.join(erros) + '\n'))
+    
+    response = app.response_class(
+        stream_with_context(iterar_zip_stream(entradas)),
+        mimetype='application/zip',
+    )
+    _definir_anexo(response, _nome_zip_lote(template))
+    response.headers['X-Documentos-Gerados'] = str(total_gerados)
+    return response
+
+
+def _diretorio_lotes_documentos():
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'cache', 'documentos_lote')
+
+
+def _executar_lote_documentos(job_id, caminho_template, contextos, erros_iniciais, atualizar):
+    """Renderiza no pool de processos e grava o ZIP à medida que os documentos ficam prontos."""
+    diretorio = _diretorio_lotes_documentos()
+    os.makedirs(diretorio, exist_ok=True)
+    destino = os.path.join(diretorio, f'{job_id}.zip')
+    parcial = destino + '.parcial'
+    total = len(contextos)
+    estado = {'gerados': 0, 'falhas': list(erros_iniciais)}
+    
+    def _entradas():
+        for nome, conteudo, erro in pool_renderizacao_documentos.renderizar(caminho_template, contextos):
+            if conteudo is None:
+                estado['falhas'].append(f'{nome}: {erro}')
+            else:
+                estado['gerados'] += 1
+                yield nome, conteudo
+            processados = estado['gerados'] + len(estado['falhas']) - len(erros_iniciais)
+            atualizar(
+                processados=processados,
+                gerados=estado['gerados'],
+                falhas=len(estado['falhas']),
+                percentual=round(processados * 100.0 / total, 1),
+            )
+        if estado['falhas']:
+            yield 'erros.txt', '\n'.join(estado['falhas']) + '\n'
+    
+    try:
+        with open(parcial, 'wb') as saida:
+            for bloco in iterar_zip_stream(_entradas()):
+                saida.write(bloco)
+        if not estado['gerados']:
+            raise RuntimeError('Nenhum documento gerado: ' + '; '.join(estado['falhas'][:5]))
+        os.replace(parcial, destino)
+    finally:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+    return {
+        'gerados': estado['gerados'],
+        'falhas': len(estado['falhas']),
+        'erros': estado['falhas'][:50],
+        'tamanho': os.path.getsize(destino),
+    }
+
+
+@app.route('/api/templates/<int:template_id>/gerar-lote/jobs', methods=['POST'])
+@require_auth
+@require_recurso('templates')
+def iniciar_lote_documentos_template(template_id):
+    """Inicia a geração em background de um lote grande; progresso via GET do job"""
+    template, contextos, erros, resposta_erro = _preparar_lote_documentos(template_id, TEMPLATE_LOTE_JOB_MAX)
+    if resposta_erro:
+        return resposta_erro
+    
+    job_id = secrets.token_hex(12)
+    caminho_template = template['caminho_arquivo']
+    job = lote_documentos_jobs.iniciar_tarefa(
+        {
+            'id': job_id,
+            'tipo': 'documentos_lote',
+            'workspace_id': g.auth['workspace_id'],
+            'user_id': g.auth['user_id'],
+            'template_id': template_id,
+            'nome_arquivo': _nome_zip_lote(template),
+            'total': len(contextos),
+            'processados': 0,
+            'gerados': 0,
+            'falhas': len(erros),
+        },
+        lambda atualizar: _executar_lote_documentos(job_id, caminho_template, contextos, erros, atualizar),
+    )
+    return jsonify(job), 202
+
+
+def _obter_job_lote_documentos(job_id):
+    job = lote_documentos_jobs.obter(job_id)
+    if not job or job.get('workspace_id') != g.auth['workspace_id']:
+        return None
+    return job
+
+
+@app.route('/api/templates/lote/jobs/<job_id>', methods=['GET'])
+@require_auth
+@require_recurso('templates')
+def status_lote_documentos_template(job_id):
+    """Progresso de um lote de documentos"""
+    job = _obter_job_lote_documentos(job_id)
+    if not job:
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/templates/lote/jobs/<job_id>/download', methods=['GET'])
+@require_auth
+@require_recurso('templates')
+def download_lote_documentos_template(job_id):
+    """Baixa o ZIP de um lote concluído"""
+    job = _obter_job_lote_documentos(job_id)
+    if not job:
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    if job['status'] != 'concluido':
+        return jsonify({'error': 'Lote ainda não concluído', 'status': job['status']}), 409
+    caminho = os.path.join(_diretorio_lotes_documentos(), f'{job_id}.zip')
+    if not os.path.exists(caminho):
+        return jsonify({'error': 'Arquivo do lote expirou; gere novamente'}), 410
+    return send_file(caminho, mimetype='application/zip', as_attachment=True, download_name=job['nome_arquivo'])
+
+
 # ============================================================================
 # SUPER ADMIN - BOOTSTRAP SEGURO
 # ============================================================================
@@ -12710,41 +15591,24 @@ def bootstrap_superadmin():
 # SUPER ADMIN - DASHBOARD
 # ============================================================================
 
+# Snapshots das métricas (recalculados fora da requisição quando as tabelas de origem mudam)
+METRICAS_ATUALIZACAO_MIN_SEGUNDOS = float(os.getenv('METRICAS_ATUALIZACAO_MIN_SEGUNDOS', '60'))
+METRICAS_IDADE_MAX_SEGUNDOS = float(os.getenv('METRICAS_IDADE_MAX_SEGUNDOS', '3600'))
+METRICAS_RETENCAO_HORAS_DIAS = int(os.getenv('METRICAS_RETENCAO_HORAS_DIAS', '14'))
+metricas_plataforma = MetricasPlataforma(
+    database_path_fn=lambda: app.config['DATABASE'],
+    atualizacao_min_segundos=METRICAS_ATUALIZACAO_MIN_SEGUNDOS,
+    idade_max_segundos=METRICAS_IDADE_MAX_SEGUNDOS,
+    retencao_horas_dias=METRICAS_RETENCAO_HORAS_DIAS,
+)
+
+
 @app.route('/api/admin/estatisticas', methods=['GET'])
 @require_superadmin
 def admin_estatisticas():
     """Retorna estatísticas gerais do sistema para o dashboard de super admin."""
     db = get_db()
-    
-    # Total de usuários
-    total_usuarios = db.execute('SELECT COUNT(*) as count FROM users').fetchone()['count']
-    usuarios_ativos = db.execute("SELECT COUNT(*) as count FROM users WHERE role != 'inativo'").fetchone()['count']
-    
-    # Total de workspaces
-    total_workspaces = db.execute('SELECT COUNT(*) as count FROM workspaces').fetchone()['count']
-    
-    # Total de processos
-    total_processos = db.execute('SELECT COUNT(*) as count FROM processos').fetchone()['count']
-    
-    # Receita mensal (MRR)
-    mrr = db.execute('''
-        SELECT COALESCE(SUM(valor), 0) as total FROM assinaturas 
-        WHERE status = 'ativo' AND ciclo = 'mensal'
-    ''').fetchone()['total']
-    
-    # Usuários novos nos últimos 30 dias
-    usuarios_recentes = db.execute('''
-        SELECT COUNT(*) as count FROM users 
-        WHERE created_at >= date('now', '-30 days')
-    ''').fetchone()['count']
-    
-    # Distribuição por plano
-    planos_dist = db.execute('''
-        SELECT p.nome, COUNT(a.id) as count 
-        FROM planos p 
-        LEFT JOIN assinaturas a ON p.id = a.plano_id AND a.status = 'ativo'
-        GROUP BY p.id
-    ''').fetchall()
+    metricas = metricas_plataforma.atual(db, forcar=parse_bool(request.args.get('atualizar', 'false')))
     
     # Logs recentes
     logs_recentes = db.execute('''
@@ -12753,17 +15617,51 @@ def admin_estatisticas():
     ''').fetchall()
     
     return jsonify({
-        'total_usuarios': total_usuarios,
-        'usuarios_ativos': usuarios_ativos,
-        'total_workspaces': total_workspaces,
-        'total_processos': total_processos,
-        'mrr': mrr,
-        'usuarios_recentes': usuarios_recentes,
-        'distribuicao_planos': [dict(r) for r in planos_dist],
-        'logs_recentes': [dict(r) for r in logs_recentes]
+        'total_usuarios': metricas.get('total_usuarios', 0),
+        'usuarios_ativos': metricas.get('usuarios_ativos', 0),
+        'total_workspaces': metricas.get('total_workspaces', 0),
+        'total_processos': metricas.get('total_processos', 0),
+        'mrr': metricas.get('mrr', 0),
+        'usuarios_recentes': metricas.get('usuarios_recentes', 0),
+        'distribuicao_planos': metricas['assinaturas_plano'],
+        'logs_recentes': [dict(r) for r in logs_recentes],
+        'atualizado_em': metricas['atualizado_em'],
+    })
+
+
+@app.route('/api/admin/metricas/serie', methods=['GET'])
+@require_superadmin
+def admin_metricas_serie():
+    """
+    Séries temporais das métricas para os gráficos do dashboard.
+
+    QUERY PARAMETERS:
+    - metricas: lista separada por vírgula (ex: mrr,novos_usuarios,assinaturas_plano)
+    - granularidade: 'dia' (padrão) ou 'hora'
+    - inicio / fim: período (YYYY-MM-DD ou YYYY-MM-DD HH:00); padrão 30 dias / 48 horas
+    """
+    granularidade = request.args.get('granularidade', 'dia')
+    metricas = [m.strip() for m in request.args.get('metricas', 'mrr,usuarios_ativos,novos_usuarios').split(',')]
+    padrao = timedelta(hours=48) if granularidade == 'hora' else timedelta(days=30)
+    inicio = request.args.get('inicio') or (datetime.utcnow() - padrao).strftime('%Y-%m-%d %H:00')
+    fim = request.args.get('fim') or None
+    try:
+        series = metricas_plataforma.serie(get_db(), metricas, granularidade, inicio, fim)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'granularidade': granularidade,
+        'inicio': inicio,
+        'fim': fim,
+        'series': series,
     })
 
 
+# Totais das listagens de admin (TTL curto; sem filtros, estimados pelo rowid)
+ADMIN_CONTAGEM_TTL_SEGUNDOS = float(os.getenv('ADMIN_CONTAGEM_TTL_SEGUNDOS', '60'))
+contagem_listagens_admin = ContagemCache(ADMIN_CONTAGEM_TTL_SEGUNDOS)
+
+
 @app.route('/api/admin/usuarios', methods=['GET'])
 @require_superadmin
 def admin_listar_usuarios():
@@ -12776,55 +15674,63 @@ def admin_listar_usuarios():
     plano = request.args.get('plano', '')
     data_inicio = request.args.get('data_inicio', '')
     data_fim = request.args.get('data_fim', '')
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
+    per_page, cursor, page = parametros_paginacao(request.args, padrao=20, maximo=200)
     
-    query = '''
-        SELECT u.*, w.nome as workspace_nome, p.nome as plano_nome, a.status as assinatura_status
-        FROM users u
-        LEFT JOIN workspaces w ON u.workspace_id = w.id
-        LEFT JOIN assinaturas a ON w.id = a.workspace_id AND a.status = 'ativo'
-        LEFT JOIN planos p ON a.plano_id = p.id
-        WHERE 1=1
-    '''
+    condicoes = []
     params = []
     
     if search:
-        query += ' AND (u.nome LIKE ? OR u.email LIKE ?)'
+        condicoes.append('(u.nome LIKE ? OR u.email LIKE ?)')
         params.extend([f'%{search}%', f'%{search}%'])
     
     if status:
-        query += ' AND u.role = ?'
+        condicoes.append('u.role = ?')
         params.append(status)
     
     if plano:
-        query += ' AND p.codigo = ?'
+        condicoes.append('p.codigo = ?')
         params.append(plano)
     
     if data_inicio:
-        query += ' AND u.created_at >= ?'
+        condicoes.append('u.created_at >= ?')
         params.append(data_inicio)
     
     if data_fim:
-        query += ' AND u.created_at <= ?'
+        condicoes.append('u.created_at <= ?')
         params.append(data_fim)
     
-    # Count total
-    count_query = query.replace('SELECT u.*, w.nome as workspace_nome, p.nome as plano_nome, a.status as assinatura_status', 'SELECT COUNT(*) as count')
-    total = db.execute(count_query, params).fetchone()['count']
-    
-    # Paginação
-    query += ' ORDER BY u.created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, (page - 1) * per_page])
-    
-    rows = db.execute(query, params).fetchall()
+    try:
+        pagina = paginar(
+            db,
+            'SELECT u.*, w.nome as workspace_nome, p.nome as plano_nome, a.status as assinatura_status',
+            '''FROM users u
+               LEFT JOIN workspaces w ON u.workspace_id = w.id
+               LEFT JOIN assinaturas a ON w.id = a.workspace_id AND a.status = 'ativo'
+               LEFT JOIN planos p ON a.plano_id = p.id''',
+            condicoes,
+            params,
+            per_page,
+            cursor=cursor,
+            pagina=page,
+            coluna_data='u.created_at',
+            coluna_id='u.id',
+            contagem=contagem_listagens_admin,
+            listagem='usuarios',
+            tabela_estimativa='users',
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    total = pagina['total']
     
     return jsonify({
-        'usuarios': [dict(r) for r in rows],
+        'usuarios': [dict(r) for r in pagina['itens']],
         'total': total,
+        'total_aproximado': pagina['total_aproximado'],
         'page': page,
         'per_page': per_page,
-        'total_pages': (total + per_page - 1) // per_page
+        'total_pages': (total + per_page - 1) // per_page,
+        'proximo_cursor': pagina['proximo_cursor'],
+        'tem_mais': pagina['tem_mais'],
     })
 
 
@@ -12888,6 +15794,9 @@ def admin_atualizar_usuario(user_id):
         if campo in data:
             updates.append(f'{campo} = ?')
             params.append(data[campo])
+    if 'telefone' in data:
+        updates.append('telefone_digits = ?, telefone_local = ?')
+        params.extend(phone_index_values(data['telefone']))
     
     if not updates:
         return jsonify({'error': 'Nenhum campo para atualizar'}), 400
@@ -12919,10 +15828,9 @@ def admin_resetar_senha(user_id):
     
     password_hash = hash_senha(nova_senha)
     db.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
-    db.commit()
-    
-    # Registrar audit log
+    # Ação durável: a entrada entra na mesma transação da alteração
     registrar_audit_log('reset_senha', 'users', user_id, None, {'senha_alterada': True})
+    db.commit()
     
     return jsonify({'message': 'Senha resetada com sucesso', 'senha_temporaria': nova_senha})
 
@@ -12943,10 +15851,8 @@ def admin_excluir_usuario(user_id):
     # Soft delete - marca como inativo em vez de excluir
     db.execute("UPDATE users SET role = 'inativo', email = ? WHERE id = ?", 
                (f"{user['email']}.inativo.{user_id}", user_id))
-    db.commit()
-    
-    # Registrar audit log
     registrar_audit_log('excluir', 'users', user_id, dict(user), {'status': 'inativo'})
+    db.commit()
     
     return jsonify({'message': 'Usuário desativado com sucesso'})
 
@@ -13333,50 +16239,68 @@ def admin_atualizar_email_config():
 @app.route('/api/admin/auditoria', methods=['GET'])
 @require_superadmin
 def admin_listar_auditoria():
-    """Lista os logs de auditoria com filtros."""
+    """Lista os logs de auditoria com filtros (arquivo=1 consulta os arquivados)."""
     db = get_db()
+    arquivo = parse_bool(request.args.get('arquivo', 'false'))
+    tabela = 'audit_logs_arquivo' if arquivo else 'audit_logs'
+    if not arquivo:
+        # Entradas ainda no buffer deste worker aparecem na listagem; as dos
+        # outros workers chegam em até AUDIT_LOG_INTERVALO_SEGUNDOS
+        auditoria.esvaziar(timeout=2)
     
     entidade = request.args.get('entidade', '')
     acao = request.args.get('acao', '')
     user_id = request.args.get('user_id', '')
     data_inicio = request.args.get('data_inicio', '')
     data_fim = request.args.get('data_fim', '')
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 50))
+    per_page, cursor, page = parametros_paginacao(request.args, padrao=50, maximo=500)
     
-    query = 'SELECT * FROM audit_logs WHERE 1=1'
+    condicoes = []
     params = []
     
     if entidade:
-        query += ' AND entidade = ?'
+        condicoes.append('entidade = ?')
         params.append(entidade)
     if acao:
-        query += ' AND acao = ?'
+        condicoes.append('acao = ?')
         params.append(acao)
     if user_id:
-        query += ' AND user_id = ?'
+        condicoes.append('user_id = ?')
         params.append(user_id)
     if data_inicio:
-        query += ' AND created_at >= ?'
+        condicoes.append('created_at >= ?')
         params.append(data_inicio)
     if data_fim:
-        query += ' AND created_at <= ?'
+        condicoes.append('created_at <= ?')
         params.append(data_fim)
     
-    # Count
-    count_query = query.replace('SELECT *', 'SELECT COUNT(*) as count')
-    total = db.execute(count_query, params).fetchone()['count']
-    
-    query += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, (page - 1) * per_page])
-    
-    rows = db.execute(query, params).fetchall()
+    try:
+        pagina = paginar(
+            db,
+            'SELECT *',
+            f'FROM {tabela}',
+            condicoes,
+            params,
+            per_page,
+            cursor=cursor,
+            pagina=page,
+            contagem=contagem_listagens_admin,
+            listagem='auditoria',
+            tabela_estimativa=tabela,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'logs': [dict(r) for r in rows],
-        'total': total,
+        'logs': [dict(r) for r in pagina['itens']],
+        'total': pagina['total'],
+        'total_aproximado': pagina['total_aproximado'],
         'page': page,
-        'per_page': per_page
+        'per_page': per_page,
+        'proximo_cursor': pagina['proximo_cursor'],
+        'tem_mais': pagina['tem_mais'],
+        'arquivo': arquivo,
+        'gravacao': auditoria.get_stats(),
     })
 
 
@@ -13384,55 +16308,237 @@ def admin_listar_auditoria():
 # BACKUP E RESTAURAÇÃO
 # ============================================================================
 
+BACKUP_TABELAS = [
+    'workspaces', 'users', 'clientes', 'processos', 'prazos', 'tarefas',
+    'documentos', 'financeiro', 'convites', 'templates_documentos',
+    'planos', 'assinaturas', 'cupons', 'configuracoes_globais',
+    'chat_history', 'audit_logs', 'audit_logs_arquivo', 'notificacoes'
+]
+BACKUP_EXPORT_BATCH_ROWS = int(os.getenv('BACKUP_EXPORT_BATCH_ROWS', '500'))
+BACKUP_RESTORE_BATCH_ROWS = int(os.getenv('BACKUP_RESTORE_BATCH_ROWS', '1000'))
+BACKUP_UPLOAD_TTL_HORAS = int(os.getenv('BACKUP_UPLOAD_TTL_HORAS', '24'))
+
+# Tabelas que podem ser restauradas (a auditoria fica de fora de propósito)
+BACKUP_TABELAS_RESTAURAVEIS = [
+    tabela for tabela in BACKUP_TABELAS if tabela not in ('audit_logs', 'audit_logs_arquivo')
+]
+
+
+def backup_dir() -> str:
+    """Diretório de backups gerados pelo servidor (volume de uploads)."""
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'backups')
+
+
+backup_export_jobs = BackupExportJobs(
+    database_path_fn=lambda: app.config['DATABASE'],
+    diretorio_fn=backup_dir,
+    lote=BACKUP_EXPORT_BATCH_ROWS,
+)
+
+
+# Estado em disco: o progresso de uma restauração sobrevive à reciclagem do
+# worker (--max-requests) e pode ser consultado de qualquer worker
+backup_restore_jobs = RegistroTarefas(diretorio_fn=lambda: os.path.join(backup_dir(), 'tarefas', 'restauracao'))
+backup_incremental_jobs = RegistroTarefas(diretorio_fn=lambda: os.path.join(backup_dir(), 'tarefas', 'incremental'))
+
+backup_incremental = BackupIncremental(
+    database_path_fn=lambda: app.config['DATABASE'],
+    diretorio_fn=lambda: os.path.join(backup_dir(), 'incremental'),
+    # Todas as tabelas com chave primária: o snapshot completo contém o banco inteiro
+    tabelas=None,
+    intervalo_full_dias=BACKUP_FULL_INTERVALO_DIAS,
+    max_deltas=BACKUP_MAX_DELTAS,
+    retencao_cadeias=BACKUP_RETENCAO_CADEIAS,
+    lote=BACKUP_EXPORT_BATCH_ROWS,
+)
+# O índice FTS é derivado: reconstruído após aplicar uma restauração
+backup_incremental.prefixos_derivados = ('busca_index',)
+
+try:
+    # Triggers do log de alterações: criados (também para tabelas novas) ou
+    # removidos conforme BACKUP_INCREMENTAL_ENABLED
+    backup_incremental.configurar_rastreamento(BACKUP_INCREMENTAL_ENABLED)
+except sqlite3.Error as e:
+    print(f"⚠️ Rastreamento do backup incremental indisponível: {e}")
+
+
+def _salvar_upload_backup(file) -> str:
+    """Grava o arquivo enviado em disco (em blocos) e devolve o upload_id."""
+    diretorio = backup_dir()
+    os.makedirs(diretorio, exist_ok=True)
+    limite = time.time() - BACKUP_UPLOAD_TTL_HORAS * 3600
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        try:
+            if nome.startswith('upload_') and os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+    upload_id = secrets.token_hex(12)
+    file.save(os.path.join(diretorio, f'upload_{upload_id}'))
+    return upload_id
+
+
+def _caminho_upload_backup(upload_id: Any) -> Optional[str]:
+    upload_id = str(upload_id or '')
+    if not re.fullmatch(r'[0-9a-f]{24}', upload_id):
+        return None
+    caminho = os.path.join(backup_dir(), f'upload_{upload_id}')
+    return caminho if os.path.exists(caminho) else None
+
+
+def _executar_restauracao_backup(caminho: str, modo: str, tabelas: List[str], estrito: bool,
+                                 total_estimado: Optional[int] = None, progresso=None) -> Dict[str, Any]:
+    """Restaura o arquivo numa conexão própria (serve à rota e aos jobs)."""
+    def _antes_commit(conn, restauradas):
+        if {'clientes', 'users'} & restauradas:
+            backfill_phone_index_columns(conn, only_missing=False)
+        if {'clientes', 'processos'} & restauradas:
+            reconstruir_indice_busca(conn)
+
+    conn = sqlite3.connect(app.config['DATABASE'], timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        return restaurar_arquivo_backup(
+            conn,
+            caminho,
+            BACKUP_TABELAS_RESTAURAVEIS,
+            tabelas,
+            modo=modo,
+            lote=BACKUP_RESTORE_BATCH_ROWS,
+            total_estimado=total_estimado,
+            progresso=progresso,
+            antes_commit=_antes_commit,
+            estrito=estrito,
+        )
+    finally:
+        conn.close()
+
+
+def _opcoes_exportacao_backup(fonte: Dict[str, Any]) -> tuple:
+    formato = str(fonte.get('formato') or 'json').strip().lower()
+    comprimir = parse_bool(fonte.get('gzip'))
+    return formato, comprimir
+
+
+def _metadata_backup() -> Dict[str, Any]:
+    return {
+        'data_exportacao': datetime.now().isoformat(),
+        'exportado_por': g.auth['user']['email'],
+    }
+
+
 @app.route('/api/admin/backup', methods=['GET'])
 @require_superadmin
 def admin_exportar_backup():
-    """Exporta todos os dados do sistema para backup."""
-    db = get_db()
-    
-    backup = {
-        'metadata': {
-            'versao': '1.0',
-            'data_exportacao': datetime.now().isoformat(),
-            'exportado_por': g.auth['user']['email']
-        },
-        'tabelas': {}
-    }
-    
-    tabelas = [
-        'workspaces', 'users', 'clientes', 'processos', 'prazos', 'tarefas',
-        'documentos', 'financeiro', 'convites', 'templates_documentos',
-        'planos', 'assinaturas', 'cupons', 'configuracoes_globais',
-        'chat_history', 'audit_logs', 'notificacoes'
-    ]
-    
-    for tabela in tabelas:
-        try:
-            rows = db.execute(f'SELECT * FROM {tabela}').fetchall()
-            backup['tabelas'][tabela] = [dict(r) for r in rows]
-        except Exception as e:
-            backup['tabelas'][tabela] = {'erro': str(e)}
-    
+    """Exporta todos os dados do sistema para backup (em streaming).
+
+    Query params: formato=json (padrão, compatível com a restauração),
+    ndjson ou snapshot (cópia do banco via API de backup do SQLite); gzip=1
+    comprime a resposta on-the-fly.
+    """
+    formato, comprimir = _opcoes_exportacao_backup(request.args)
+    if formato not in BACKUP_FORMATOS:
+        return jsonify({'error': f'Formato inválido. Use: {", ".join(BACKUP_FORMATOS)}'}), 400
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    try:
+        contagens = contar_registros(conn, BACKUP_TABELAS)
+    finally:
+        conn.close()
+
     # Registrar no audit log
     registrar_audit_log('backup_exportar', 'sistema', None, None, {
-        'tabelas_exportadas': len(tabelas),
-        'total_registros': sum(len(v) for v in backup['tabelas'].values() if isinstance(v, list))
+        'tabelas_exportadas': len(BACKUP_TABELAS),
+        'total_registros': sum(contagens.values()),
+        'formato': formato,
+        'gzip': comprimir,
     })
-    
-    # Gerar nome do arquivo
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"jurispocket_backup_{timestamp}.json"
-    
-    return jsonify(backup), 200, {
-        'Content-Disposition': f'attachment; filename={filename}',
-        'Content-Type': 'application/json'
-    }
+
+    filename = nome_arquivo_backup(formato, comprimir)
+    if formato == 'snapshot':
+        os.makedirs(backup_dir(), exist_ok=True)
+        caminho = os.path.join(backup_dir(), f'.download_{secrets.token_hex(8)}_{filename}')
+        criar_snapshot_sqlite(app.config['DATABASE'], caminho, comprimir=comprimir)
+        tamanho = os.path.getsize(caminho)
+        return app.response_class(
+            iterar_arquivo(caminho, remover_ao_final=True),
+            mimetype='application/gzip' if comprimir else 'application/vnd.sqlite3',
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Content-Length': str(tamanho),
+            },
+        )
+
+    gerador = iterar_backup_ndjson if formato == 'ndjson' else iterar_backup_json
+    blocos = gerador(app.config['DATABASE'], BACKUP_TABELAS, _metadata_backup(), lote=BACKUP_EXPORT_BATCH_ROWS)
+    if comprimir:
+        blocos = comprimir_gzip(blocos)
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'application/x-ndjson' if formato == 'ndjson' else 'application/json'
+    return app.response_class(
+        blocos,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/admin/backup/jobs', methods=['POST'])
+@require_superadmin
+def admin_iniciar_backup_background():
+    """Inicia exportação em background gravada no volume de uploads."""
+    data = request.get_json(silent=True) or {}
+    formato, comprimir = _opcoes_exportacao_backup(data)
+    if formato not in BACKUP_FORMATOS:
+        return jsonify({'error': f'Formato inválido. Use: {", ".join(BACKUP_FORMATOS)}'}), 400
+
+    job = backup_export_jobs.iniciar(formato, comprimir, BACKUP_TABELAS, _metadata_backup())
+    registrar_audit_log('backup_exportar', 'sistema', None, None, {
+        'formato': formato,
+        'gzip': comprimir,
+        'background': True,
+        'job_id': job['id'],
+        'arquivo': job['arquivo'],
+    })
+    return jsonify(job), 202
+
+
+@app.route('/api/admin/backup/jobs', methods=['GET'])
+@require_superadmin
+def admin_listar_backups_background():
+    """Lista exportações em background recentes e seu progresso."""
+    return jsonify({'jobs': backup_export_jobs.listar()})
+
+
+@app.route('/api/admin/backup/jobs/<job_id>', methods=['GET'])
+@require_superadmin
+def admin_status_backup_background(job_id):
+    """Progresso de uma exportação em background."""
+    job = backup_export_jobs.obter(job_id)
+    if not job:
+        return jsonify({'error': 'Job de backup não encontrado'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/admin/backup/jobs/<job_id>/download', methods=['GET'])
+@require_superadmin
+def admin_download_backup_background(job_id):
+    """Baixa o arquivo de uma exportação em background concluída."""
+    caminho = backup_export_jobs.caminho_arquivo(job_id)
+    if not caminho:
+        return jsonify({'error': 'Backup não concluído ou arquivo indisponível'}), 404
+    return send_file(caminho, as_attachment=True, download_name=os.path.basename(caminho))
 
 
 @app.route('/api/admin/backup/verificar', methods=['POST'])
 @require_superadmin
 def admin_verificar_backup():
-    """Verifica a integridade de um arquivo de backup antes da importação."""
+    """Verifica a integridade de um arquivo de backup antes da importação.
+
+    O arquivo é gravado em disco e lido em streaming (JSON, NDJSON ou gzip);
+    o upload_id devolvido pode ser usado na restauração sem reenviar o arquivo.
+    """
     if 'arquivo' not in request.files:
         return jsonify({'error': 'Nenhum arquivo enviado'}), 400
     
@@ -13440,255 +16546,297 @@ def admin_verificar_backup():
     if file.filename == '':
         return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
     
+    upload_id = _salvar_upload_backup(file)
+    caminho = _caminho_upload_backup(upload_id)
     try:
-        conteudo = file.read().decode('utf-8')
-        backup = json.loads(conteudo)
-        
-        # Verificar estrutura
-        if 'metadata' not in backup or 'tabelas' not in backup:
-            return jsonify({'error': 'Arquivo de backup inválido - estrutura incorreta'}), 400
-        
-        # Contar registros
-        estatisticas = {}
-        total_registros = 0
-        for tabela, dados in backup['tabelas'].items():
-            if isinstance(dados, list):
-                estatisticas[tabela] = len(dados)
-                total_registros += len(dados)
-        
-        return jsonify({
-            'valido': True,
-            'versao': backup['metadata'].get('versao', 'desconhecida'),
-            'data_exportacao': backup['metadata'].get('data_exportacao'),
-            'exportado_por': backup['metadata'].get('exportado_por'),
-            'estatisticas': estatisticas,
-            'total_registros': total_registros
-        })
-        
-    except json.JSONDecodeError:
-        return jsonify({'error': 'Arquivo JSON inválido'}), 400
+        resultado = verificar_arquivo_backup(caminho)
+    except (ValueError, UnicodeDecodeError, OSError, EOFError, zlib.error) as e:
+        os.remove(caminho)
+        return jsonify({'error': f'Arquivo de backup inválido: {str(e)}'}), 400
     except Exception as e:
+        os.remove(caminho)
         return jsonify({'error': f'Erro ao verificar backup: {str(e)}'}), 500
 
+    resultado['upload_id'] = upload_id
+    return jsonify(resultado)
+
 
 @app.route('/api/admin/backup/restaurar', methods=['POST'])
 @require_superadmin
 def admin_restaurar_backup():
-    """Restaura dados de um arquivo de backup."""
-    data = request.get_json()
-    
-    if not data or 'backup' not in data:
-        return jsonify({'error': 'Dados do backup não fornecidos'}), 400
-    
-    backup = data['backup']
-    opcoes = data.get('opcoes', {})
-    
-    # Opções de restauração
-    modo = opcoes.get('modo', 'merge')  # 'merge' ou 'replace'
-    tabelas_selecionadas = opcoes.get('tabelas', [])  # Vazio = todas
-    
-    if modo not in ['merge', 'replace']:
-        return jsonify({'error': 'Modo deve ser "merge" ou "replace"'}), 400
-    
-    db = get_db()
-    resultados = {}
-    erros = []
-    
-    # Tabelas que podem ser restauradas
-    tabelas_permitidas = [
-        'workspaces', 'users', 'clientes', 'processos', 'prazos', 'tarefas',
-        'documentos', 'financeiro', 'convites', 'templates_documentos',
-        'planos', 'assinaturas', 'cupons', 'configuracoes_globais',
-        'chat_history', 'notificacoes'
-    ]
-    
-    # Se não especificou tabelas, usa todas
-    if not tabelas_selecionadas:
-        tabelas_selecionadas = list(backup.get('tabelas', {}).keys())
-    
-    # Filtrar apenas tabelas permitidas
-    tabelas_restaurar = [t for t in tabelas_selecionadas if t in tabelas_permitidas]
-    
-    try:
-        # Em modo replace, limpar tabelas antes da importacao para evitar duplicidade
-        # e permitir restauracao fiel do snapshot.
-        if modo == 'replace':
-            db.execute('PRAGMA foreign_keys = OFF')
-            for tabela in reversed(tabelas_restaurar):
-                if tabela in ['planos', 'configuracoes_globais']:
-                    continue
-                try:
-                    db.execute(f'DELETE FROM {tabela}')
-                    try:
-                        db.execute('DELETE FROM sqlite_sequence WHERE name = ?', (tabela,))
-                    except Exception:
-                        # sqlite_sequence pode nao existir dependendo do schema
-                        pass
-                except Exception as e:
-                    erros.append(f'Erro ao limpar {tabela}: {str(e)}')
-                    continue
+    """Restaura dados de um arquivo de backup.
 
-        for tabela in tabelas_restaurar:
-            dados = backup['tabelas'].get(tabela, [])
-            
-            if not isinstance(dados, list) or len(dados) == 0:
-                resultados[tabela] = {'status': 'ignorado', 'mensagem': 'Sem dados para restaurar'}
-                continue
+    Fontes aceitas: multipart 'arquivo', JSON {upload_id} (de /verificar) ou o
+    JSON legado {backup: {...}}. Opções: modo (merge|replace), tabelas (vazio =
+    todas), estrito (desfaz tudo se houver violação de chave estrangeira) e
+    background (devolve um job com progresso).
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is None:
+        opcoes = {
+            'modo': request.form.get('modo'),
+            'tabelas': [t for t in (request.form.get('tabelas') or '').split(',') if t.strip()],
+            'estrito': request.form.get('estrito'),
+            'background': request.form.get('background'),
+        }
+    else:
+        opcoes = data.get('opcoes') or {}
 
-            registros_importados = 0
-            registros_atualizados = 0
-            registros_falhos = 0
+    # Opções de restauração
+    modo = opcoes.get('modo') or 'merge'  # 'merge' ou 'replace'
+    tabelas_selecionadas = [str(t).strip() for t in (opcoes.get('tabelas') or [])]  # Vazio = todas
+    estrito = parse_bool(opcoes.get('estrito'))
+    background = parse_bool(opcoes.get('background'))
 
-            # Estrutura da tabela de destino (somente colunas existentes)
-            table_info = db.execute(f'PRAGMA table_info({tabela})').fetchall()
-            colunas_tabela = {col['name'] for col in table_info}
-            
-            for registro in dados:
-                try:
-                    # Manter somente colunas que existem na tabela destino
-                    registro_limpo = {k: v for k, v in registro.items() if k in colunas_tabela}
-
-                    if not registro_limpo:
-                        continue
-
-                    colunas = ', '.join(registro_limpo.keys())
-                    placeholders = ', '.join(['?' for _ in registro_limpo])
-                    valores = list(registro_limpo.values())
-
-                    # MERGE idempotente:
-                    # 1) Se existir id, faz upsert por id (nao duplica em novos restores)
-                    # 2) Se nao existir id, tenta insert simples e ignora conflitos naturais
-                    if modo == 'merge' and 'id' in registro_limpo and 'id' in colunas_tabela:
-                        existed_before = db.execute(
-                            f'SELECT 1 FROM {tabela} WHERE id = ? LIMIT 1',
-                            (registro_limpo['id'],)
-                        ).fetchone() is not None
-                        colunas_update = [c for c in registro_limpo.keys() if c != 'id']
-                        if colunas_update:
-                            set_clause = ', '.join([f'{c} = excluded.{c}' for c in colunas_update])
-                            before_changes = db.total_changes
-                            db.execute(
-                                f'''
-                                INSERT INTO {tabela} ({colunas})
-                                VALUES ({placeholders})
-                                ON CONFLICT(id) DO UPDATE SET {set_clause}
-                                ''',
-                                valores
-                            )
-                            if db.total_changes - before_changes > 0:
-                                if existed_before:
-                                    registros_atualizados += 1
-                                else:
-                                    registros_importados += 1
-                            continue
-                        else:
-                            before_changes = db.total_changes
-                            db.execute(
-                                f'INSERT OR IGNORE INTO {tabela} ({colunas}) VALUES ({placeholders})',
-                                valores
-                            )
-                            if db.total_changes - before_changes > 0:
-                                registros_importados += 1
-                            continue
+    if modo not in ['merge', 'replace']:
+        return jsonify({'error': 'Modo deve ser "merge" ou "replace"'}), 400
 
-                    before_changes = db.total_changes
-                    db.execute(
-                        f'''
-                        INSERT OR IGNORE INTO {tabela} ({colunas})
-                        VALUES ({placeholders})
-                        ''',
-                        valores
-                    )
-                    if db.total_changes - before_changes > 0:
-                        registros_importados += 1
+    remover_ao_final = False
+    if data is None and 'arquivo' in request.files and request.files['arquivo'].filename:
+        caminho = _caminho_upload_backup(_salvar_upload_backup(request.files['arquivo']))
+        remover_ao_final = True
+    elif data and data.get('upload_id'):
+        caminho = _caminho_upload_backup(data['upload_id'])
+        if not caminho:
+            return jsonify({'error': 'Upload de backup não encontrado ou expirado'}), 404
+        remover_ao_final = True
+    elif data and isinstance(data.get('backup'), dict):
+        # Formato antigo: o backup veio no corpo da requisição
+        os.makedirs(backup_dir(), exist_ok=True)
+        caminho = os.path.join(backup_dir(), f'upload_{secrets.token_hex(12)}')
+        with open(caminho, 'w', encoding='utf-8') as saida:
+            json.dump(data['backup'], saida, ensure_ascii=False, default=str)
+        remover_ao_final = True
+    else:
+        return jsonify({'error': 'Dados do backup não fornecidos'}), 400
 
-                except Exception as e:
-                    registros_falhos += 1
-                    print(f"Erro ao importar registro em {tabela}: {e}")
-            
-            resultados[tabela] = {
-                'status': 'sucesso',
-                'importados': registros_importados,
-                'atualizados': registros_atualizados,
-                'falhos': registros_falhos
-            }
+    try:
+        verificacao = verificar_arquivo_backup(caminho)
+    except (ValueError, UnicodeDecodeError, OSError, EOFError, zlib.error) as e:
+        os.remove(caminho)
+        return jsonify({'error': f'Arquivo de backup inválido: {str(e)}'}), 400
+
+    tabelas_restaurar = [
+        t for t in (tabelas_selecionadas or list(verificacao['estatisticas']))
+        if t in BACKUP_TABELAS_RESTAURAVEIS
+    ]
+    if not tabelas_restaurar:
+        return jsonify({'error': 'Nenhuma tabela restaurável selecionada'}), 400
+    total_estimado = sum(verificacao['estatisticas'].get(t, 0) for t in tabelas_restaurar)
 
-        if modo == 'replace':
-            db.execute('PRAGMA foreign_keys = ON')
+    def _concluir(resultado: Dict[str, Any]):
+        if remover_ao_final:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+        return {
+            'sucesso': True,
+            'modo': modo,
+            'resultados': resultado['resultados'],
+            'erros': resultado['erros'],
+            'total_registros': resultado['total_registros'],
+            'violacoes_fk': resultado['violacoes_fk'],
+            'exemplos_violacoes_fk': resultado['exemplos_violacoes_fk'],
+        }
 
-        db.commit()
-        
-        # Registrar no audit log
+    if background:
+        job = backup_restore_jobs.iniciar_tarefa(
+            {'tipo': 'restauracao', 'modo': modo, 'tabelas': tabelas_restaurar,
+             'registros': 0, 'total_estimado': total_estimado, 'tabela_atual': None},
+            lambda atualizar: _concluir(_executar_restauracao_backup(
+                caminho, modo, tabelas_restaurar, estrito, total_estimado, atualizar
+            )),
+        )
         registrar_audit_log('backup_restaurar', 'sistema', None, None, {
             'modo': modo,
             'tabelas': tabelas_restaurar,
-            'resultados': resultados
-        })
-        
-        return jsonify({
-            'sucesso': True,
-            'modo': modo,
-            'resultados': resultados,
-            'erros': erros if erros else None
+            'background': True,
+            'job_id': job['id'],
+            'sha256': verificacao['sha256'],
         })
-        
+        return jsonify(job), 202
+
+    try:
+        resposta = _concluir(_executar_restauracao_backup(caminho, modo, tabelas_restaurar, estrito, total_estimado))
     except Exception as e:
-        db.rollback()
-        if modo == 'replace':
-            try:
-                db.execute('PRAGMA foreign_keys = ON')
-            except Exception:
-                pass
         return jsonify({'error': f'Erro ao restaurar backup: {str(e)}'}), 500
 
+    # Registrar no audit log
+    registrar_audit_log('backup_restaurar', 'sistema', None, None, {
+        'modo': modo,
+        'tabelas': tabelas_restaurar,
+        'resultados': resposta['resultados'],
+        'sha256': verificacao['sha256'],
+    })
+
+    return jsonify(resposta)
+
+
+@app.route('/api/admin/backup/restaurar/jobs/<job_id>', methods=['GET'])
+@require_superadmin
+def admin_status_restauracao_backup(job_id):
+    """Progresso de uma restauração em background."""
+    job = backup_restore_jobs.obter(job_id)
+    if not job:
+        return jsonify({'error': 'Job de restauração não encontrado'}), 404
+    return jsonify(job)
+
 
 @app.route('/api/admin/backup/automatico', methods=['GET'])
 @require_superadmin
 def admin_status_backup_automatico():
-    """Retorna status do backup automático."""
+    """Retorna status do backup automático (cadeias de snapshot completo + deltas)."""
     db = get_db()
     
-    # Verificar último backup registrado
+    # Verificar último backup manual registrado
     ultimo_backup = db.execute('''
         SELECT * FROM audit_logs 
         WHERE acao = 'backup_exportar' 
         ORDER BY created_at DESC LIMIT 1
     ''').fetchone()
-    
-    # Calcular próximo backup (se configurado para diário)
+
     proximo_backup = None
-    if ultimo_backup:
-        ultima_data = datetime.fromisoformat(ultimo_backup['created_at'])
-        proximo_backup = (ultima_data + timedelta(days=1)).isoformat()
-    
+    job = scheduler.get_job('backup_incremental') if scheduler.running else None
+    if job and job.next_run_time:
+        proximo_backup = job.next_run_time.isoformat()
+
+    status = backup_incremental.status()
     return jsonify({
-        'backup_automatico': False,  # Pode ser configurado
+        'backup_automatico': BACKUP_INCREMENTAL_ENABLED,
         'frequencia': 'diario',
+        'horario': f'{BACKUP_INCREMENTAL_HORA:02d}:30',
+        'intervalo_full_dias': BACKUP_FULL_INTERVALO_DIAS,
+        'retencao_cadeias': BACKUP_RETENCAO_CADEIAS,
         'ultimo_backup': dict(ultimo_backup) if ultimo_backup else None,
         'proximo_backup_agendado': proximo_backup,
-        'recomendacao': 'É recomendado fazer backup manual antes de grandes operações'
+        **status,
+        'recomendacao': (
+            'É recomendado fazer backup manual antes de grandes operações'
+            if BACKUP_INCREMENTAL_ENABLED else
+            'Ative BACKUP_INCREMENTAL_ENABLED para backups noturnos incrementais'
+        ),
+    })
+
+
+@app.route('/api/admin/backup/automatico/executar', methods=['POST'])
+@require_superadmin
+def admin_executar_backup_automatico():
+    """Roda agora um backup incremental (tipo: auto, full ou delta) em background."""
+    data = request.get_json(silent=True) or {}
+    tipo = str(data.get('tipo') or 'auto').strip().lower()
+    if tipo not in ('auto', 'full', 'delta'):
+        return jsonify({'error': 'Tipo deve ser "auto", "full" ou "delta"'}), 400
+
+    job = backup_incremental_jobs.iniciar_tarefa(
+        {'tipo': 'backup_incremental', 'modo': tipo},
+        lambda atualizar: backup_incremental.executar(tipo),
+    )
+    registrar_audit_log('backup_incremental', 'sistema', None, None, {'tipo': tipo, 'job_id': job['id']})
+    return jsonify(job), 202
+
+
+@app.route('/api/admin/backup/automatico/restaurar', methods=['POST'])
+@require_superadmin
+def admin_restaurar_backup_automatico():
+    """Reconstrói o banco a partir do snapshot completo + deltas.
+
+    Body: {ate: ISO opcional (ponto no tempo), aplicar: bool}. Sem aplicar, só
+    gera o arquivo restaurado em backups/incremental para conferência; com
+    aplicar=true copia o resultado sobre o banco em uso.
+    """
+    data = request.get_json(silent=True) or {}
+    ate = data.get('ate') or None
+    aplicar = parse_bool(data.get('aplicar'))
+    if ate:
+        try:
+            ate = datetime.fromisoformat(str(ate)).isoformat()
+        except ValueError:
+            return jsonify({'error': 'Data inválida em "ate" (use ISO 8601)'}), 400
+
+    destino = os.path.join(backup_dir(), 'incremental', f"restaurado_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+
+    def _restaurar(atualizar):
+        resultado = backup_incremental.restaurar(destino, ate=ate, aplicar_em=app.config['DATABASE'] if aplicar else None)
+        if aplicar:
+            os.remove(destino)
+            resultado['arquivo'] = None
+            conn = sqlite3.connect(app.config['DATABASE'], timeout=30)
+            try:
+                reconstruir_indice_busca(conn)
+                conn.commit()
+            finally:
+                conn.close()
+        return resultado
+
+    job = backup_incremental_jobs.iniciar_tarefa({'tipo': 'restauracao_incremental', 'ate': ate, 'aplicar': aplicar}, _restaurar)
+    registrar_audit_log('backup_restaurar', 'sistema', None, None, {
+        'incremental': True,
+        'ate': ate,
+        'aplicar': aplicar,
+        'job_id': job['id'],
     })
+    return jsonify(job), 202
+
+
+@app.route('/api/admin/backup/automatico/jobs/<job_id>', methods=['GET'])
+@require_superadmin
+def admin_status_job_backup_automatico(job_id):
+    """Progresso de um backup ou restauração incremental."""
+    job = backup_incremental_jobs.obter(job_id)
+    if not job:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(job)
 
 
 @app.route('/api/admin/workspaces', methods=['GET'])
 @require_superadmin
 def admin_listar_workspaces():
-    """Lista todos os workspaces do sistema."""
+    """Lista os workspaces do sistema.
+    
+    Sem `limit`/`cursor` devolve todos (telas de seleção). Com eles, pagina por
+    cursor; o corpo continua sendo a lista e a paginação vai nos cabeçalhos
+    X-Proximo-Cursor e X-Total-Count.
+    """
     db = get_db()
     
-    rows = db.execute('''
+    select_sql = '''
         SELECT w.*, 
                (SELECT COUNT(*) FROM users WHERE workspace_id = w.id) as total_usuarios,
                (SELECT COUNT(*) FROM processos WHERE workspace_id = w.id) as total_processos,
                (SELECT COUNT(*) FROM clientes WHERE workspace_id = w.id) as total_clientes,
                p.nome as plano_nome, p.codigo as plano_codigo
+    '''
+    from_sql = '''
         FROM workspaces w
         LEFT JOIN assinaturas a ON w.id = a.workspace_id AND a.status = 'ativo'
         LEFT JOIN planos p ON a.plano_id = p.id
-        ORDER BY w.created_at DESC
-    ''').fetchall()
+    '''
     
-    return jsonify([dict(r) for r in rows])
+    if not (request.args.get('limit') or request.args.get('cursor') or request.args.get('per_page')):
+        rows = db.execute(f'{select_sql} {from_sql} ORDER BY w.created_at DESC, w.id DESC').fetchall()
+        return jsonify([dict(r) for r in rows])
+    
+    limite, cursor, page = parametros_paginacao(request.args, padrao=50, maximo=500)
+    try:
+        pagina = paginar(
+            db, select_sql, from_sql, [], [], limite,
+            cursor=cursor,
+            pagina=page,
+            coluna_data='w.created_at',
+            coluna_id='w.id',
+            contagem=contagem_listagens_admin,
+            listagem='workspaces',
+            tabela_estimativa='workspaces',
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify([dict(r) for r in pagina['itens']])
+    response.headers['X-Total-Count'] = str(pagina['total'])
+    if pagina['proximo_cursor']:
+        response.headers['X-Proximo-Cursor'] = pagina['proximo_cursor']
+    return response
 
 
 # ============================================================================
@@ -13825,9 +16973,8 @@ def admin_excluir_pagamento(assinatura_id, pagamento_id):
     
     db.execute('DELETE FROM assinaturas_pagamentos WHERE id = ? AND assinatura_id = ?',
                (pagamento_id, assinatura_id))
-    db.commit()
-    
     registrar_audit_log('excluir', 'assinaturas_pagamentos', pagamento_id, None, None)
+    db.commit()
     
     return jsonify({'message': 'Pagamento excluído'})
 
@@ -13899,13 +17046,12 @@ def admin_excluir_assinatura(assinatura_id):
     
     # Depois exclui a assinatura
     db.execute('DELETE FROM assinaturas WHERE id = ?', (assinatura_id,))
-    db.commit()
-    
     registrar_audit_log('excluir', 'assinaturas', assinatura_id, None, {
         'workspace_id': assinatura['workspace_id'],
         'plano_id': assinatura['plano_id'],
         'motivo': 'Exclusão definitiva pelo super admin'
     })
+    db.commit()
     
     return jsonify({'message': 'Assinatura excluída com sucesso'})
 
@@ -13914,46 +17060,16 @@ def admin_excluir_assinatura(assinatura_id):
 @require_superadmin
 def admin_resumo_assinaturas():
     """Retorna resumo financeiro das assinaturas."""
-    db = get_db()
-    
-    mes_atual = datetime.now().strftime('%Y-%m')
-    
-    # Total de assinaturas ativas
-    total_ativas = db.execute(
-        "SELECT COUNT(*) as count FROM assinaturas WHERE status = 'ativo'"
-    ).fetchone()['count']
-    
-    # Total de pagamentos do mês
-    pagamentos_mes = db.execute('''
-        SELECT COALESCE(SUM(valor_pago), 0) as total, COUNT(*) as quantidade
-        FROM assinaturas_pagamentos
-        WHERE mes_referencia = ? AND status = 'confirmado'
-    ''', (mes_atual,)).fetchone()
-    
-    # Assinaturas com pagamento pendente (mês atual)
-    assinaturas_pendentes = db.execute('''
-        SELECT COUNT(*) as count FROM assinaturas a
-        WHERE a.status = 'ativo'
-        AND a.id NOT IN (
-            SELECT assinatura_id FROM assinaturas_pagamentos 
-            WHERE mes_referencia = ? AND status = 'confirmado'
-        )
-    ''', (mes_atual,)).fetchone()['count']
-    
-    # MRR (Monthly Recurring Revenue)
-    mrr = db.execute('''
-        SELECT COALESCE(SUM(valor), 0) as total
-        FROM assinaturas
-        WHERE status = 'ativo' AND ciclo = 'mensal'
-    ''').fetchone()['total']
+    metricas = metricas_plataforma.atual(get_db(), forcar=parse_bool(request.args.get('atualizar', 'false')))
     
     return jsonify({
-        'total_assinaturas_ativas': total_ativas,
-        'total_recebido_mes': pagamentos_mes['total'],
-        'quantidade_pagamentos_mes': pagamentos_mes['quantidade'],
-        'assinaturas_pendentes_mes': assinaturas_pendentes,
-        'mrr': mrr,
-        'mes_referencia': mes_atual
+        'total_assinaturas_ativas': metricas.get('assinaturas_ativas', 0),
+        'total_recebido_mes': metricas.get('recebido_mes', 0),
+        'quantidade_pagamentos_mes': metricas.get('pagamentos_mes', 0),
+        'assinaturas_pendentes_mes': metricas.get('assinaturas_pendentes_mes', 0),
+        'mrr': metricas.get('mrr', 0),
+        'mes_referencia': datetime.now().strftime('%Y-%m'),
+        'atualizado_em': metricas['atualizado_em'],
     })
 
 
@@ -14490,7 +17606,8 @@ def email_status():
         'configurado': bool(config.get('enabled')),
         'provider': provider,
         'smtp_host': config.get('smtp_host') if provider == 'smtp' else None,
-        'smtp_from': from_address if config.get('enabled') else None
+        'smtp_from': from_address if config.get('enabled') else None,
+        'fila': email_service.delivery_queue.get_stats(),
     })
 
 @app.route('/api/email/teste', methods=['POST'])
@@ -15895,6 +19012,12 @@ def whatsapp_inbox_conversas():
     params.append(limit)
     rows = db.execute(query, params).fetchall()
 
+    clientes_por_telefone = find_workspace_clients_by_phones(
+        db,
+        workspace_id,
+        [row['phone'] or '' for row in rows if not row['client_id']],
+    )
+
     conversas: List[Dict[str, Any]] = []
     for row in rows:
         item = dict(row)
@@ -15903,7 +19026,7 @@ def whatsapp_inbox_conversas():
             item['status'] = 'novo'
 
         if not item.get('client_id'):
-            found = find_workspace_client_by_phone(db, workspace_id, item.get('phone') or '')
+            found = clientes_por_telefone.get(item.get('phone') or '')
             if found:
                 item['client_id'] = found.get('id')
                 item['cliente_nome'] = found.get('nome')
@@ -16209,7 +19332,7 @@ def whatsapp_automacoes_preview_ia():
     return jsonify({
         'sucesso': True,
         'mensagem': suggested,
-        'ia_disponivel': bool(openai_client),
+        'ia_disponivel': llm_gateway.is_configured(),
     })
 
 @app.route('/api/clientes/<int:id>/whatsapp/boasvindas', methods=['POST'])
@@ -16356,67 +19479,21 @@ def whatsapp_debug():
         'recipients': recipients,
         'logs': [dict(r) for r in logs],
         'automacao_logs': [dict(r) for r in automacao_logs],
+        'inbound_ingester': whatsapp_inbound_ingester.get_stats(),
+        'ai_message_cache': whatsapp_ai_message_cache.get_stats(),
     })
 
-@app.route('/api/internal/whatsapp/inbound', methods=['POST'])
-def whatsapp_inbound_webhook():
-    """
-    Recebe mensagens de entrada do microservico WhatsApp Web.
-    Endpoint interno (webhook) para listener de mensagens.
-    """
-    webhook_secret = os.environ.get('WHATSAPP_INBOUND_WEBHOOK_SECRET', '')
-    header_signature = request.headers.get('x-jurispocket-signature', '')
-
-    if webhook_secret:
-        raw_body = request.get_data(as_text=True) or ''
-        expected_signature = hmac.new(
-            webhook_secret.encode('utf-8'),
-            raw_body.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-
-        if not hmac.compare_digest(header_signature, expected_signature):
-            return jsonify({'sucesso': False, 'erro': 'Assinatura invalida'}), 401
-
-    payload = request.get_json(silent=True) or {}
-    event = payload.get('event')
-    session_key = str(payload.get('userId') or '').strip()
-    from_jid = payload.get('from')
-    text = payload.get('text')
-
-    if event != 'whatsapp.message.received' or not session_key:
-        return jsonify({'sucesso': True})
-
-    from_phone = ''
-    if from_jid:
-        from_phone = normalize_phone_digits(str(from_jid).split('@')[0])
-
-    print(f"Webhook WhatsApp recebido: event={event} session={session_key} from={from_jid} text={text}")
+# ============================================================================
+# INGESTÃO ASSÍNCRONA DO WEBHOOK WHATSAPP
+# ============================================================================
 
-    db = get_db()
-    platform_config = ensure_platform_whatsapp_config(db)
-    platform_key = platform_config.get('session_key') or PLATFORM_WHATSAPP_SESSION_KEY
+WHATSAPP_INBOUND_BATCH_SIZE = int(os.environ.get('WHATSAPP_INBOUND_BATCH_SIZE', '200'))
+WHATSAPP_INBOUND_FLUSH_MS = int(os.environ.get('WHATSAPP_INBOUND_FLUSH_MS', '250'))
+WHATSAPP_INBOUND_QUEUE_SIZE = int(os.environ.get('WHATSAPP_INBOUND_QUEUE_SIZE', '10000'))
 
-    # Mensagens recebidas pela plataforma nao devem ser encaminhadas a clientes
-    if session_key == platform_key:
-        try:
-            log_whatsapp_message(
-                db=db,
-                workspace_id=None,
-                client_id=None,
-                user_id=None,
-                channel='platform',
-                direction='inbound',
-                sender_key=session_key,
-                sender_phone=from_phone,
-                message_text=text or '',
-                status='received',
-                commit=True,
-            )
-        except Exception as error:
-            print(f"Erro ao registrar log inbound plataforma: {error}")
-        return jsonify({'sucesso': True})
 
+def resolve_whatsapp_session_workspace(db, session_key: str) -> tuple:
+    """Resolve (workspace_id, user_id) a partir da session key do microservico."""
     workspace_id = None
     session_user_id = None
     if session_key.startswith('workspace-') or session_key.startswith('workspace:'):
@@ -16451,70 +19528,316 @@ def whatsapp_inbound_webhook():
                 session_user_id = int(user_row['id'])
                 workspace_id = int(user_row['workspace_id'])
 
-    if not workspace_id:
-        return jsonify({'sucesso': True})
+    return workspace_id, session_user_id
 
-    client = find_workspace_client_by_phone(db, workspace_id, from_phone)
-    client_id = client.get('id') if client else None
 
-    try:
-        log_whatsapp_message(
-            db=db,
-            workspace_id=workspace_id,
-            client_id=client_id,
-            user_id=session_user_id,
-            channel='workspace',
-            direction='inbound',
-            sender_key=session_key,
-            sender_phone=from_phone,
-            message_text=text or '',
-            status='received',
-            commit=True,
-        )
-    except Exception as error:
-        print(f"Erro ao registrar log inbound WhatsApp: {error}")
+class WhatsAppInboundIngester:
+    """Fila em memoria + thread que persiste mensagens recebidas em lotes.
 
-    try:
-        upsert_whatsapp_inbox_conversation_inbound(
-            db=db,
-            workspace_id=workspace_id,
-            phone=from_phone,
-            message_text=text or '',
-            client_id=client_id,
-        )
-        db.commit()
-    except Exception as error:
-        print(f"Erro ao atualizar inbox WhatsApp inbound: {error}")
+    O webhook apenas valida a assinatura e enfileira. A thread agrupa os eventos
+    por conversa (na ordem de chegada) e grava tudo em uma unica transacao por
+    lote: um upsert de inbox por conversa, logs via executemany e uma
+    notificacao por admin/conversa.
+    """
 
-    # Notifica admins do workspace sobre nova mensagem
-    try:
-        msg_preview = (text or '').strip()
-        if len(msg_preview) > 120:
-            msg_preview = msg_preview[:117] + '...'
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.25, max_queue: int = 10000):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self._queue: 'queue.Queue[Dict[str, Any]]' = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = threading.Event()
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'processed': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_batch_ms': 0.0,
+            'busy_seconds': 0.0,
+        }
 
-        admins = db.execute(
-            '''SELECT id FROM users
-               WHERE workspace_id = ? AND role IN ('admin', 'superadmin')''',
-            (workspace_id,),
-        ).fetchall()
-        for admin in admins:
-            db.execute(
-                '''INSERT INTO notificacoes (usuario_id, workspace_id, titulo, mensagem, tipo, link)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (
-                    admin['id'],
+    def enqueue(self, event: Dict[str, Any], timeout: float = 1.0) -> bool:
+        """Enfileira evento; retorna False se a fila continuar cheia apos timeout."""
+        self._ensure_running()
+        with self._lock:
+            self._seq += 1
+            event['seq'] = self._seq
+        try:
+            self._queue.put(event, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+        with self._lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def _ensure_running(self) -> None:
+        # Threads nao sobrevivem ao fork dos workers do gunicorn: inicia sob demanda por processo.
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='whatsapp-inbound-ingester',
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self.process_batch(batch)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Drena a fila antes de encerrar (chamado no atexit)."""
+        self._stopping.set()
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=timeout)
+            return
+
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(pending), self.batch_size):
+            self.process_batch(pending[start:start + self.batch_size])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_size'] = self._queue.qsize()
+        stats['running'] = bool(self._thread and self._thread.is_alive())
+        busy = stats['busy_seconds']
+        stats['events_per_second'] = round(stats['processed'] / busy, 1) if busy > 0 else None
+        stats['busy_seconds'] = round(busy, 3)
+        return stats
+
+    def process_batch(self, events: List[Dict[str, Any]]) -> int:
+        """Persiste um lote em uma transacao; em caso de erro, reprocessa evento a evento."""
+        if not events:
+            return 0
+
+        started = time.perf_counter()
+        events = sorted(events, key=lambda item: item.get('seq') or 0)
+        processed = 0
+        try:
+            with app.app_context():
+                db = get_db()
+                try:
+                    self._persist(db, events)
+                    db.commit()
+                    processed = len(events)
+                except Exception as error:
+                    db.rollback()
+                    logger.warning(
+                        "[whatsapp-inbound] Falha no lote de %s eventos, reprocessando individualmente: %s",
+                        len(events), error,
+                    )
+                    for event in events:
+                        try:
+                            self._persist(db, [event])
+                            db.commit()
+                            processed += 1
+                        except Exception as event_error:
+                            db.rollback()
+                            logger.error(
+                                "[whatsapp-inbound] Evento descartado (seq=%s): %s", event.get('seq'), event_error
+                            )
+        except Exception as error:
+            logger.exception("[whatsapp-inbound] Erro ao abrir contexto de ingestao: %s", error)
+
+        elapsed = time.perf_counter() - started
+        # Contadores compartilhados com enqueue (threads das requisições) e com stop
+        with self._lock:
+            self._stats['processed'] += processed
+            self._stats['failed'] += len(events) - processed
+            self._stats['batches'] += 1
+            self._stats['last_batch_size'] = len(events)
+            self._stats['last_batch_ms'] = round(elapsed * 1000, 2)
+            self._stats['busy_seconds'] += elapsed
+        return processed
+
+    def _persist(self, db, events: List[Dict[str, Any]]) -> None:
+        platform_config = ensure_platform_whatsapp_config(db)
+        platform_key = platform_config.get('session_key') or PLATFORM_WHATSAPP_SESSION_KEY
+
+        log_rows: List[tuple] = []
+        sessions: Dict[str, tuple] = {}
+        conversations: Dict[tuple, List[Dict[str, Any]]] = {}
+
+        for event in events:
+            session_key = event['session_key']
+            if session_key == platform_key:
+                # Mensagens recebidas pela plataforma nao devem ser encaminhadas a clientes
+                log_rows.append((
+                    None, None, None, 'platform', 'inbound', session_key, event['from_phone'],
+                    (event['text'] or '')[:2000], event.get('message_id'), None,
+                ))
+                continue
+
+            if session_key not in sessions:
+                sessions[session_key] = resolve_whatsapp_session_workspace(db, session_key)
+            workspace_id, session_user_id = sessions[session_key]
+            if not workspace_id:
+                continue
+
+            conversations.setdefault((workspace_id, event['from_phone']), []).append(
+                dict(event, user_id=session_user_id)
+            )
+
+        phones_by_workspace: Dict[int, List[str]] = {}
+        for workspace_id, phone in conversations:
+            phones_by_workspace.setdefault(workspace_id, []).append(phone)
+        clients_by_workspace = {
+            workspace_id: find_workspace_clients_by_phones(db, workspace_id, phones)
+            for workspace_id, phones in phones_by_workspace.items()
+        }
+
+        admins_by_workspace: Dict[int, List[int]] = {}
+        notification_rows: List[tuple] = []
+
+        for (workspace_id, phone), items in conversations.items():
+            client = clients_by_workspace[workspace_id].get(phone)
+            client_id = client.get('id') if client else None
+            last_item = items[-1]
+
+            first_seq = None
+            if phone:
+                first_seq = upsert_whatsapp_inbox_conversation_inbound(
+                    db=db,
+                    workspace_id=workspace_id,
+                    phone=phone,
+                    message_text=last_item['text'] or '',
+                    client_id=client_id,
+                    message_count=len(items),
+                    received_at=last_item['received_at'],
+                )
+
+            for offset, item in enumerate(items):
+                log_rows.append((
+                    workspace_id, client_id, item['user_id'], 'workspace', 'inbound',
+                    item['session_key'], phone, (item['text'] or '')[:2000], item.get('message_id'),
+                    first_seq + offset if first_seq else None,
+                ))
+
+            # Notifica admins do workspace: uma notificacao por conversa no lote
+            if workspace_id not in admins_by_workspace:
+                admins_by_workspace[workspace_id] = [
+                    row['id'] for row in db.execute(
+                        '''SELECT id FROM users
+                           WHERE workspace_id = ? AND role IN ('admin', 'superadmin')''',
+                        (workspace_id,),
+                    ).fetchall()
+                ]
+
+            msg_preview = (last_item['text'] or '').strip()
+            if len(msg_preview) > 120:
+                msg_preview = msg_preview[:117] + '...'
+            if len(items) > 1:
+                msg_preview = f"{len(items)} novas mensagens. Ultima: {msg_preview or '(sem texto)'}"
+            for admin_id in admins_by_workspace[workspace_id]:
+                notification_rows.append((
+                    admin_id,
                     workspace_id,
                     'Nova mensagem no WhatsApp',
-                    f"De: {from_phone or 'contato'} - {msg_preview or '(sem texto)'}",
+                    f"De: {phone or 'contato'} - {msg_preview or '(sem texto)'}",
                     'whatsapp',
                     '/app/whatsapp',
-                ),
+                ))
+
+        if log_rows:
+            db.executemany(
+                '''INSERT INTO whatsapp_message_log
+                   (workspace_id, client_id, user_id, channel, direction, sender_key, sender_phone,
+                    message_text, provider_message_id, conversation_seq, status)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'received')''',
+                log_rows,
+            )
+        if notification_rows:
+            db.executemany(
+                '''INSERT INTO notificacoes (usuario_id, workspace_id, titulo, mensagem, tipo, link)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                notification_rows,
             )
-        db.commit()
-    except Exception as error:
-        print(f"Erro ao registrar notificacao inbound WhatsApp: {error}")
 
-    return jsonify({'sucesso': True})
+
+whatsapp_inbound_ingester = WhatsAppInboundIngester(
+    batch_size=WHATSAPP_INBOUND_BATCH_SIZE,
+    flush_interval=WHATSAPP_INBOUND_FLUSH_MS / 1000.0,
+    max_queue=WHATSAPP_INBOUND_QUEUE_SIZE,
+)
+atexit.register(whatsapp_inbound_ingester.stop)
+
+
+@app.route('/api/internal/whatsapp/inbound', methods=['POST'])
+def whatsapp_inbound_webhook():
+    """
+    Recebe mensagens de entrada do microservico WhatsApp Web.
+    Endpoint interno (webhook) para listener de mensagens: valida, enfileira
+    e responde 202; a persistencia e feita em lote pelo ingester.
+    """
+    webhook_secret = os.environ.get('WHATSAPP_INBOUND_WEBHOOK_SECRET', '')
+    header_signature = request.headers.get('x-jurispocket-signature', '')
+
+    if webhook_secret:
+        raw_body = request.get_data(as_text=True) or ''
+        expected_signature = hmac.new(
+            webhook_secret.encode('utf-8'),
+            raw_body.encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+
+        if not hmac.compare_digest(header_signature, expected_signature):
+            return jsonify({'sucesso': False, 'erro': 'Assinatura invalida'}), 401
+
+    payload = request.get_json(silent=True) or {}
+    event = payload.get('event')
+    session_key = str(payload.get('userId') or '').strip()
+    from_jid = payload.get('from')
+    text = payload.get('text')
+
+    if event != 'whatsapp.message.received' or not session_key:
+        return jsonify({'sucesso': True})
+
+    from_phone = ''
+    if from_jid:
+        from_phone = normalize_phone_digits(str(from_jid).split('@')[0])
+
+    enqueued = whatsapp_inbound_ingester.enqueue({
+        'session_key': session_key,
+        'from_phone': from_phone,
+        'text': text if isinstance(text, str) else '',
+        'message_id': payload.get('messageId'),
+        'received_at': now_sql_timestamp(),
+    })
+    if not enqueued:
+        logger.warning("[whatsapp-inbound] Fila cheia, evento recusado: session=%s", session_key)
+        return jsonify({'sucesso': False, 'erro': 'Fila de ingestao cheia'}), 503
+
+    return jsonify({'sucesso': True, 'enfileirado': True}), 202
 
 # ============================================================================
 # CONFIGURAÇÕES PÚBLICAS (Para Landing Page)
@@ -16541,10 +19864,41 @@ def config_public():
 # STATIC FILES
 # ============================================================================
 
+# Offload da entrega: '' (Flask/werkzeug), 'accel' (nginx X-Accel-Redirect)
+# ou 'sendfile' (X-Sendfile). A autorização continua sendo feita aqui.
+FILE_OFFLOAD = os.getenv('FILE_OFFLOAD', '').strip().lower()
+FILE_OFFLOAD_UPLOADS_PREFIX = os.getenv('FILE_OFFLOAD_UPLOADS_PREFIX', '/_protected/uploads/')
+FILE_STAT_CACHE_SEGUNDOS = float(os.getenv('FILE_STAT_CACHE_SEGUNDOS', '5'))
+STATIC_PRECOMPRESS = parse_bool(os.getenv('STATIC_PRECOMPRESS', 'true'))
+
+entrega_uploads = EntregaArquivos(
+    lambda: app.config['UPLOAD_FOLDER'],
+    offload=FILE_OFFLOAD,
+    prefixo_offload=FILE_OFFLOAD_UPLOADS_PREFIX,
+    cache_stat_segundos=FILE_STAT_CACHE_SEGUNDOS,
+)
+
+# Subpastas de UPLOAD_FOLDER que nunca saem por /uploads (backups, caches e
+# arquivos servidos só por rotas autenticadas)
+UPLOADS_PRIVADOS = {'backups', 'cache', 'comprovantes', 'templates'}
+
+
+def _upload_publico(filename: str) -> bool:
+    partes = [p for p in str(filename or '').replace('\\', '/').split('/') if p]
+    if not partes or partes[0] in UPLOADS_PRIVADOS:
+        return False
+    return not (partes[0] == 'blobs' and len(partes) > 1 and partes[1] == 'tmp')
+
+
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
     """Serve uploaded files"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    if not _upload_publico(filename):
+        return jsonify({'error': 'Not found'}), 404
+    # Blobs são endereçados por conteúdo: o mesmo nome nunca muda de bytes.
+    # São documentos e comprovantes dos clientes, então o cache é só do navegador.
+    cache_control = CACHE_IMUTAVEL_PRIVADO if filename.startswith('blobs/') else CACHE_REVALIDAR
+    return entrega_uploads.responder(filename, cache_control=cache_control)
 
 
 # ============================================================================
@@ -16581,6 +19935,21 @@ import os
 
 STATIC_FOLDER = os.path.join(os.path.dirname(__file__), 'static')
 
+entrega_frontend = EntregaArquivos(lambda: STATIC_FOLDER, cache_stat_segundos=FILE_STAT_CACHE_SEGUNDOS)
+
+
+def _precomprimir_frontend():
+    try:
+        totais = precomprimir_diretorio(STATIC_FOLDER)
+        if totais['gzip'] or totais['brotli']:
+            print(f"🗜️ Frontend pré-comprimido: {totais['gzip']} gzip, {totais['brotli']} brotli")
+    except Exception as e:
+        print(f"⚠️ Falha ao pré-comprimir o frontend: {e}")
+
+
+if STATIC_PRECOMPRESS and os.path.isdir(STATIC_FOLDER):
+    threading.Thread(target=_precomprimir_frontend, daemon=True).start()
+
 @app.route('/api/maintenance/status', methods=['GET'])
 def maintenance_status():
     """Retorna status do modo manutenção para o frontend."""
@@ -16619,16 +19988,14 @@ def serve_frontend(path):
     if path.startswith('api/'):
         return jsonify({'error': 'Not found'}), 404
     
-    # Tenta servir arquivo específico
-    if path:
-        file_path = os.path.join(STATIC_FOLDER, path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return send_from_directory(STATIC_FOLDER, path)
+    # Tenta servir arquivo específico (assets com hash no nome são imutáveis)
+    if path and path != 'index.html' and entrega_frontend.localizar(path):
+        cache_control = CACHE_IMUTAVEL if asset_com_hash(path) else CACHE_REVALIDAR
+        return entrega_frontend.responder(path, cache_control=cache_control, comprimir=True)
     
-    # Serve index.html para SPA
-    index_path = os.path.join(STATIC_FOLDER, 'index.html')
-    if os.path.exists(index_path):
-        return send_from_directory(STATIC_FOLDER, 'index.html')
+    # Serve index.html para SPA (sempre revalidado: aponta para os assets da versão atual)
+    if entrega_frontend.localizar('index.html'):
+        return entrega_frontend.responder('index.html', cache_control='no-cache', comprimir=True)
     
     # Debug - mostra o que está acontecendo
     return jsonify({
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK / REPLAY - COPILOTO JURIDICO
+
+Reexecuta conversas gravadas em ia_interaction_logs contra um servidor LLM
+local que fala o formato OpenAI (/v1/chat/completions, com e sem stream).
+Nada sai da maquina: o servidor mock devolve as chamadas de funcao e a
+resposta final gravadas no log, entao o benchmark roda em CI sem rede.
+
+Mede, por conversa, o tempo de LLM (ida e volta ao mock), de funcoes do
+Copiloto (banco), de serializacao da resposta e o restante (contexto,
+persistencia), e compara processar_mensagem, processar_comando_acao e
+executar_funcao com um baseline salvo. Sai com codigo 1 quando ha regressao.
+
+Uso:
+    # dados sinteticos (CI)
+    python benchmark_assistente_ia.py --save-baseline baseline_ia.json
+    python benchmark_assistente_ia.py --baseline baseline_ia.json
+
+    # replay de logs reais a partir de uma copia do banco (somente leitura)
+    python benchmark_assistente_ia.py --logs-db /caminho/jurispocket.db --limite 200
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_tmp_dir = tempfile.mkdtemp(prefix='jurispocket-bench-ia-')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp_dir, 'bench.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(_tmp_dir, 'uploads')
+os.environ['ENABLE_BACKGROUND_JOBS'] = 'false'
+# Garante que nenhum provider real seja configurado
+for _var in ('GROQ_API_KEY', 'OPENAI_API_KEY', 'DATAJUD_API_KEY'):
+    os.environ[_var] = ''
+
+ETAPAS = ('total_ms', 'llm_ms', 'funcoes_ms', 'serializacao_ms', 'outros_ms')
+ALVOS = ('processar_mensagem', 'processar_comando_acao', 'executar_funcao')
+
+
+# ============================================================================
+# SERVIDOR LLM MOCK (formato OpenAI)
+# ============================================================================
+
+class MockLLMServer:
+    """Servidor HTTP local que responde chat.completions a partir de um roteiro.
+
+    O roteiro da conversa atual tem as chamadas de funcao gravadas e a resposta
+    final. Requisicoes com `tools` recebem primeiro as tool_calls; depois de
+    mensagens role=tool (ou sem tools, como o resumo de contexto) recebem texto.
+    """
+
+    def __init__(self, latencia_ms: float = 0.0):
+        self.latencia_ms = latencia_ms
+        self._lock = threading.Lock()
+        self._roteiro = {'tool_calls': [], 'resposta': 'ok'}
+        self.requisicoes = 0
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                tamanho = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(tamanho) or b'{}')
+                servidor._responder(self, payload)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._httpd.server_address[1]}/v1'
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._httpd.shutdown()
+
+    def definir_roteiro(self, tool_calls: list, resposta: str):
+        with self._lock:
+            self._roteiro = {'tool_calls': list(tool_calls), 'resposta': resposta or 'ok'}
+
+    def _proxima_mensagem(self, payload: dict) -> dict:
+        mensagens = payload.get('messages') or []
+        ultima = mensagens[-1] if mensagens else {}
+        with self._lock:
+            self.requisicoes += 1
+            if payload.get('tools') and ultima.get('role') != 'tool' and self._roteiro['tool_calls']:
+                chamadas, self._roteiro['tool_calls'] = self._roteiro['tool_calls'], []
+                return {
+                    'role': 'assistant',
+                    'content': None,
+                    'tool_calls': [
+                        {
+                            'id': f'call_{indice}',
+                            'type': 'function',
+                            'function': {
+                                'name': chamada['nome'],
+                                'arguments': json.dumps(chamada.get('args') or {}, ensure_ascii=False),
+                            },
+                        }
+                        for indice, chamada in enumerate(chamadas)
+                    ],
+                }
+            if not payload.get('tools'):
+                # Chamadas auxiliares (ex.: resumo do contexto do Copiloto)
+                return {'role': 'assistant', 'content': 'Resumo da conversa para benchmark.'}
+            return {'role': 'assistant', 'content': self._roteiro['resposta']}
+
+    def _responder(self, handler, payload: dict):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000.0)
+        mensagem = self._proxima_mensagem(payload)
+        base = {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+            'created': int(time.time()),
+            'model': payload.get('model') or 'mock',
+        }
+        prompt_tokens = len(json.dumps(payload.get('messages') or [], ensure_ascii=False)) // 4
+        completion_tokens = len(mensagem.get('content') or '') // 4
+
+        if not payload.get('stream'):
+            corpo = json.dumps({
+                **base,
+                'object': 'chat.completion',
+                'choices': [{
+                    'index': 0,
+                    'message': mensagem,
+                    'finish_reason': 'tool_calls' if mensagem.get('tool_calls') else 'stop',
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                },
+            }).encode('utf-8')
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(corpo)))
+            handler.end_headers()
+            handler.wfile.write(corpo)
+            return
+
+        deltas = []
+        if mensagem.get('tool_calls'):
+            deltas.append({
+                'role': 'assistant',
+                'tool_calls': [dict(chamada, index=indice) for indice, chamada in enumerate(mensagem['tool_calls'])],
+            })
+        conteudo = mensagem.get('content') or ''
+        for inicio in range(0, len(conteudo), 24):
+            deltas.append({'content': conteudo[inicio:inicio + 24]})
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.end_headers()
+        for delta in deltas:
+            chunk = {**base, 'object': 'chat.completion.chunk',
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+            handler.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+        handler.wfile.write(b'data: [DONE]\n\n')
+
+
+# ============================================================================
+# DADOS
+# ============================================================================
+
+def copiar_banco_origem(caminho: str):
+    """Copia o banco de origem para o banco temporario (o original nao e alterado)."""
+    origem = sqlite3.connect(f'file:{caminho}?mode=ro', uri=True)
+    destino = sqlite3.connect(os.environ['DATABASE_PATH'])
+    with destino:
+        origem.backup(destino)
+    origem.close()
+    destino.close()
+
+
+def carregar_conversas_do_log(app_module, limite: int) -> list:
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        rows = db.execute(
+            '''SELECT id, workspace_id, user_id, input_message, response_text,
+                      function_calls, status, total_duration_ms
+               FROM ia_interaction_logs
+               WHERE status IN ('success', 'fallback')
+                 AND TRIM(COALESCE(input_message, '')) != ''
+               ORDER BY id DESC
+               LIMIT ?''',
+            (limite,),
+        ).fetchall()
+    conversas = []
+    for row in rows:
+        try:
+            chamadas = json.loads(row['function_calls'] or '[]')
+        except (TypeError, ValueError):
+            chamadas = []
+        mensagem = row['input_message']
+        if app_module.AssistenteIA.extrair_comando_acao(mensagem).get('tipo'):
+            # Confirmar acao real executaria efeitos (ex.: envio de WhatsApp)
+            continue
+        conversas.append({
+            'log_id': row['id'],
+            'workspace_id': row['workspace_id'],
+            'user_id': row['user_id'],
+            'mensagem': mensagem,
+            'resposta': row['response_text'] or '',
+            'funcoes': [
+                {'nome': c.get('nome'), 'args': c.get('args') or {}}
+                for c in chamadas if isinstance(c, dict) and c.get('nome')
+            ],
+            'duracao_gravada_ms': row['total_duration_ms'],
+        })
+    return list(reversed(conversas))
+
+
+def preparar_dados_sinteticos(app_module, processos: int) -> dict:
+    """Cria workspace com clientes, processos, prazos, movimentacoes e financeiro."""
+    hoje = time.strftime('%Y-%m-%d')
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        workspace_id = db.execute("INSERT INTO workspaces (nome) VALUES ('Benchmark IA')").lastrowid
+        user_id = db.execute(
+            '''INSERT INTO users (workspace_id, nome, email, password_hash, role)
+               VALUES (?, 'Admin', ?, 'x', 'admin')''',
+            (workspace_id, f'bench-ia-{uuid.uuid4().hex[:8]}@example.com'),
+        ).lastrowid
+        for indice in range(processos):
+            cliente_id = db.execute(
+                'INSERT INTO clientes (workspace_id, nome, email) VALUES (?, ?, ?)',
+                (workspace_id, f'Cliente Benchmark {indice}', f'cliente{indice}@example.com'),
+            ).lastrowid
+            processo_id = db.execute(
+                '''INSERT INTO processos (workspace_id, cliente_id, numero, titulo, status)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (workspace_id, cliente_id, f'{indice:07d}-12.2024.8.26.0100',
+                 f'Ação de cobrança {indice}', 'ativo' if indice % 4 else 'arquivado'),
+            ).lastrowid
+            db.execute(
+                '''INSERT INTO prazos (workspace_id, processo_id, tipo, data_prazo, descricao)
+                   VALUES (?, ?, 'Contestação', date(?, ?), 'Prazo de benchmark')''',
+                (workspace_id, processo_id, hoje, f'+{indice % 20} days'),
+            )
+            db.execute(
+                '''INSERT INTO movimentacoes_processo
+                   (workspace_id, processo_id, codigo_movimento, nome_movimento, data_movimento)
+                   VALUES (?, ?, ?, 'Juntada de petição', date(?, ?))''',
+                (workspace_id, processo_id, 100 + indice, hoje, f'-{indice % 30} days'),
+            )
+            db.execute(
+                '''INSERT INTO financeiro (workspace_id, processo_id, cliente_id, tipo, descricao, valor, data)
+                   VALUES (?, ?, ?, ?, 'Honorários', ?, ?)''',
+                (workspace_id, processo_id, cliente_id, 'entrada' if indice % 3 else 'saida', 100.0 + indice, hoje),
+            )
+        db.commit()
+    return {'workspace_id': workspace_id, 'user_id': user_id}
+
+
+def conversas_sinteticas(contexto: dict, repeticoes: int) -> list:
+    roteiros = [
+        ('Quais processos ativos eu tenho?', [{'nome': 'listar_processos', 'args': {'status': 'ativo'}}]),
+        ('Quais os prazos desta semana?', [{'nome': 'proximos_prazos_criticos', 'args': {'dias': 7}}]),
+        ('Me dá um resumo financeiro do mês', [{'nome': 'resumo_financeiro', 'args': {'periodo': 'mes_atual'}}]),
+        ('Busque o processo do Cliente Benchmark 7', [{'nome': 'buscar_processo', 'args': {'cliente': 'Cliente Benchmark 7'}}]),
+        ('Movimentações recentes e prazos críticos', [
+            {'nome': 'listar_movimentacoes_recentes', 'args': {'dias': 15}},
+            {'nome': 'proximos_prazos_criticos', 'args': {'dias': 15}},
+        ]),
+        ('Obrigado!', []),
+    ]
+    return [
+        {
+            'log_id': None,
+            'workspace_id': contexto['workspace_id'],
+            'user_id': contexto['user_id'],
+            'mensagem': mensagem,
+            'resposta': f'Resposta de benchmark para: {mensagem}',
+            'funcoes': funcoes,
+            'duracao_gravada_ms': None,
+        }
+        for _ in range(repeticoes)
+        for mensagem, funcoes in roteiros
+    ]
+
+
+# ============================================================================
+# INSTRUMENTACAO
+# ============================================================================
+
+class Cronometro:
+    """Acumula tempo por etapa na thread da conversa e nas threads de funcao."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.llm_ms = 0.0
+            self.funcoes_ms = 0.0
+            self.funcoes = []
+
+    def somar_llm(self, ms: float):
+        with self._lock:
+            self.llm_ms += ms
+
+    def somar_funcao(self, nome: str, ms: float):
+        with self._lock:
+            self.funcoes_ms += ms
+            self.funcoes.append((nome, ms))
+
+
+def instrumentar(app_module, cronometro: Cronometro):
+    """Envolve gateway LLM e executar_funcao para medir cada etapa."""
+    gateway = app_module.llm_gateway
+    chat_completion_original = gateway.chat_completion
+
+    def chat_completion(**payload):
+        inicio = time.perf_counter()
+        resposta = chat_completion_original(**payload)
+        if not payload.get('stream'):
+            cronometro.somar_llm((time.perf_counter() - inicio) * 1000)
+            return resposta
+        return _stream_cronometrado(resposta, inicio)
+
+    def _stream_cronometrado(stream, inicio):
+        try:
+            yield from stream
+        finally:
+            cronometro.somar_llm((time.perf_counter() - inicio) * 1000)
+
+    gateway.chat_completion = chat_completion
+
+    executar_funcao_original = app_module.AssistenteIA.executar_funcao
+
+    def executar_funcao(nome, args, *a, **kw):
+        inicio = time.perf_counter()
+        try:
+            return executar_funcao_original(nome, args, *a, **kw)
+        finally:
+            cronometro.somar_funcao(nome, (time.perf_counter() - inicio) * 1000)
+
+    app_module.AssistenteIA.executar_funcao = staticmethod(executar_funcao)
+    return executar_funcao_original
+
+
+# ============================================================================
+# EXECUCAO
+# ============================================================================
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def resumir(amostras: list) -> dict:
+    return {
+        'n': len(amostras),
+        'p50': round(percentil(amostras, 0.5), 3),
+        'p95': round(percentil(amostras, 0.95), 3),
+        'media': round(statistics.fmean(amostras), 3) if amostras else 0.0,
+    }
+
+
+def replay_mensagens(app_module, servidor, cronometro, conversas, stream: bool) -> dict:
+    etapas = {etapa: [] for etapa in ETAPAS}
+    ttft = []
+    divergencias = []
+    for indice, conversa in enumerate(conversas):
+        servidor.definir_roteiro(conversa['funcoes'], conversa['resposta'])
+        cronometro.reset()
+        session_id = f"bench-{conversa['log_id'] or indice}"
+        with app_module.app.app_context():
+            inicio = time.perf_counter()
+            if stream:
+                resultado = {}
+                primeiro_token = None
+                for evento in app_module.AssistenteIA.processar_mensagem_eventos(
+                    conversa['mensagem'], conversa['workspace_id'], conversa['user_id'], session_id, stream=True
+                ):
+                    if evento['tipo'] == 'token' and primeiro_token is None:
+                        primeiro_token = time.perf_counter()
+                    elif evento['tipo'] == 'fim':
+                        resultado = evento['resultado']
+                if primeiro_token is not None:
+                    ttft.append((primeiro_token - inicio) * 1000)
+            else:
+                resultado = app_module.AssistenteIA.processar_mensagem(
+                    conversa['mensagem'], conversa['workspace_id'], conversa['user_id'], session_id
+                )
+            fim_processamento = time.perf_counter()
+            json.dumps(resultado, ensure_ascii=False, default=str)
+            fim = time.perf_counter()
+
+        total_ms = (fim - inicio) * 1000
+        serializacao_ms = (fim - fim_processamento) * 1000
+        etapas['total_ms'].append(total_ms)
+        etapas['llm_ms'].append(cronometro.llm_ms)
+        etapas['funcoes_ms'].append(cronometro.funcoes_ms)
+        etapas['serializacao_ms'].append(serializacao_ms)
+        # Funcoes em paralelo podem somar mais que o tempo de parede
+        etapas['outros_ms'].append(max(0.0, total_ms - cronometro.llm_ms - serializacao_ms
+                                       - min(cronometro.funcoes_ms, total_ms)))
+
+        esperadas = sorted(f['nome'] for f in conversa['funcoes'])
+        executadas = sorted(nome for nome, _ in cronometro.funcoes)
+        if resultado.get('status') not in ('success', None) or esperadas != executadas:
+            divergencias.append({
+                'log_id': conversa['log_id'],
+                'mensagem': conversa['mensagem'][:80],
+                'status': resultado.get('status'),
+                'funcoes_esperadas': esperadas,
+                'funcoes_executadas': executadas,
+            })
+
+    relatorio = {etapa: resumir(valores) for etapa, valores in etapas.items()}
+    if stream:
+        relatorio['ttft_ms'] = resumir(ttft)
+    relatorio['divergencias'] = divergencias
+    return relatorio
+
+
+def replay_funcoes(app_module, executar_funcao_original, conversas, repeticoes: int) -> dict:
+    """Executa diretamente cada funcao gravada (sem LLM), agrupando por nome."""
+    por_funcao = {}
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        for _ in range(repeticoes):
+            for conversa in conversas:
+                for chamada in conversa['funcoes']:
+                    inicio = time.perf_counter()
+                    try:
+                        executar_funcao_original(
+                            chamada['nome'], chamada['args'], conversa['workspace_id'],
+                            user_id=conversa['user_id'], session_id='bench-funcoes', db=db,
+                        )
+                    finally:
+                        por_funcao.setdefault(chamada['nome'], []).append((time.perf_counter() - inicio) * 1000)
+                    # Funcoes de escrita apenas criam acoes pendentes; nao acumular entre rodadas
+                    db.rollback()
+    todas = [ms for valores in por_funcao.values() for ms in valores]
+    return {'geral': resumir(todas), **{nome: resumir(valores) for nome, valores in sorted(por_funcao.items())}}
+
+
+def replay_comandos_acao(app_module, contexto: dict, total: int) -> dict:
+    """Cria acoes pendentes de tarefa e mede confirmacao/cancelamento."""
+    amostras = {'confirmar': [], 'cancelar': []}
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        for indice in range(total):
+            acao = app_module.AssistenteIA.criar_acao_pendente(
+                db=db,
+                workspace_id=contexto['workspace_id'],
+                user_id=contexto['user_id'],
+                session_id='bench-acoes',
+                action_type='criar_tarefa',
+                payload={'titulo': f'Tarefa benchmark {indice}', 'prioridade': 'media'},
+                preview='Criar tarefa de benchmark',
+            )
+            db.commit()
+            tipo = 'confirmar' if indice % 2 == 0 else 'cancelar'
+            comando = acao['comando_confirmacao'] if tipo == 'confirmar' else acao['comando_cancelamento']
+            inicio = time.perf_counter()
+            app_module.AssistenteIA.processar_comando_acao(
+                db=db,
+                workspace_id=contexto['workspace_id'],
+                user_id=contexto['user_id'],
+                session_id='bench-acoes',
+                mensagem=comando,
+            )
+            db.commit()
+            amostras[tipo].append((time.perf_counter() - inicio) * 1000)
+    todas = amostras['confirmar'] + amostras['cancelar']
+    return {'geral': resumir(todas), **{tipo: resumir(valores) for tipo, valores in amostras.items()}}
+
+
+def comparar_baseline(atual: dict, baseline: dict, tolerancia: float, minimo_ms: float) -> list:
+    """Regressao: p50 ou p95 acima de baseline * (1 + tolerancia) e por mais de minimo_ms."""
+    regressoes = []
+    for alvo in ALVOS:
+        for metrica in ('p50', 'p95'):
+            base = ((baseline.get(alvo) or {}).get(metrica))
+            valor = ((atual.get(alvo) or {}).get(metrica))
+            if base is None or valor is None:
+                continue
+            if valor > base * (1 + tolerancia) and valor - base > minimo_ms:
+                regressoes.append({
+                    'alvo': alvo,
+                    'metrica': metrica,
+                    'baseline_ms': base,
+                    'atual_ms': valor,
+                    'variacao_pct': round((valor / base - 1) * 100, 1) if base else None,
+                })
+    return regressoes
+
+
+def imprimir_linha(rotulo: str, resumo: dict):
+    print(f"  {rotulo:<24} n={resumo['n']:<5} p50={resumo['p50']:9.2f}ms "
+          f"p95={resumo['p95']:9.2f}ms media={resumo['media']:9.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay/benchmark offline do Copiloto')
+    parser.add_argument('--logs-db', help='Banco com ia_interaction_logs (copiado, nunca alterado)')
+    parser.add_argument('--limite', type=int, default=200, help='Maximo de conversas do log')
+    parser.add_argument('--processos', type=int, default=300, help='Processos nos dados sinteticos')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Rodadas das conversas sinteticas')
+    parser.add_argument('--comandos', type=int, default=50, help='Comandos de acao a medir')
+    parser.add_argument('--latencia-llm-ms', type=float, default=0.0, help='Latencia simulada do mock')
+    parser.add_argument('--stream', action='store_true', help='Usar o caminho de streaming (mede TTFT)')
+    parser.add_argument('--baseline', help='JSON de baseline para detectar regressoes')
+    parser.add_argument('--save-baseline', help='Grava o resultado atual como baseline')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='Folga relativa antes de regressao')
+    parser.add_argument('--minimo-ms', type=float, default=2.0, help='Diferenca absoluta minima (ruido)')
+    parser.add_argument('--json', help='Grava o relatorio completo em JSON')
+    parser.add_argument('--estrito', action='store_true', help='Divergencias de funcoes/status tambem falham')
+    opcoes = parser.parse_args()
+
+    if opcoes.logs_db:
+        copiar_banco_origem(opcoes.logs_db)
+
+    import app as app_module
+    from services.llm_gateway import LLMProvider
+    from openai import OpenAI
+
+    servidor = MockLLMServer(latencia_ms=opcoes.latencia_llm_ms).iniciar()
+    app_module.llm_gateway.providers = [
+        LLMProvider('mock', OpenAI(base_url=servidor.base_url, api_key='mock', max_retries=0), 'mock-model')
+    ]
+    cronometro = Cronometro()
+    executar_funcao_original = instrumentar(app_module, cronometro)
+
+    contexto = preparar_dados_sinteticos(app_module, opcoes.processos)
+    if opcoes.logs_db:
+        conversas = carregar_conversas_do_log(app_module, opcoes.limite)
+        origem = f'{len(conversas)} conversas de {opcoes.logs_db}'
+    else:
+        conversas = conversas_sinteticas(contexto, opcoes.repeticoes)
+        origem = f'{len(conversas)} conversas sinteticas ({opcoes.processos} processos)'
+
+    print("=" * 72)
+    print(f"BENCHMARK COPILOTO: {origem}{' [stream]' if opcoes.stream else ''}")
+    print("=" * 72)
+
+    mensagens = replay_mensagens(app_module, servidor, cronometro, conversas, opcoes.stream)
+    funcoes = replay_funcoes(app_module, executar_funcao_original, conversas, 1 if opcoes.logs_db else 3)
+    comandos = replay_comandos_acao(app_module, contexto, opcoes.comandos)
+    servidor.parar()
+
+    print("processar_mensagem (por etapa):")
+    for etapa in ETAPAS + (('ttft_ms',) if opcoes.stream else ()):
+        imprimir_linha(etapa, mensagens[etapa])
+    print("executar_funcao:")
+    for nome, resumo in funcoes.items():
+        imprimir_linha(nome, resumo)
+    print("processar_comando_acao:")
+    for tipo, resumo in comandos.items():
+        imprimir_linha(tipo, resumo)
+    print(f"Requisicoes ao LLM mock: {servidor.requisicoes}")
+
+    atual = {
+        'processar_mensagem': mensagens['total_ms'],
+        'processar_comando_acao': comandos['geral'],
+        'executar_funcao': funcoes['geral'],
+    }
+    relatorio = {
+        'origem': origem,
+        'stream': opcoes.stream,
+        **atual,
+        'etapas': {k: v for k, v in mensagens.items() if k != 'divergencias'},
+        'funcoes': funcoes,
+        'comandos_acao': comandos,
+        'divergencias': mensagens['divergencias'],
+        'regressoes': [],
+    }
+
+    falhou = False
+    if opcoes.baseline:
+        with open(opcoes.baseline, encoding='utf-8') as arquivo:
+            baseline = json.load(arquivo)
+        relatorio['regressoes'] = comparar_baseline(atual, baseline, opcoes.tolerancia, opcoes.minimo_ms)
+        for regressao in relatorio['regressoes']:
+            print(f"REGRESSAO {regressao['alvo']} {regressao['metrica']}: "
+                  f"{regressao['baseline_ms']:.2f}ms -> {regressao['atual_ms']:.2f}ms "
+                  f"(+{regressao['variacao_pct']}%)")
+        falhou = bool(relatorio['regressoes'])
+        if not falhou:
+            print(f"Sem regressoes (tolerancia {opcoes.tolerancia:.0%}).")
+
+    if mensagens['divergencias']:
+        print(f"Divergencias de funcoes/status: {len(mensagens['divergencias'])}")
+        for divergencia in mensagens['divergencias'][:10]:
+            print(f"  - {divergencia}")
+        falhou = falhou or opcoes.estrito
+
+    if opcoes.save_baseline:
+        with open(opcoes.save_baseline, 'w', encoding='utf-8') as arquivo:
+            json.dump(atual, arquivo, indent=2)
+        print(f"Baseline gravado em {opcoes.save_baseline}")
+    if opcoes.json:
+        with open(opcoes.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == '__main__':
+    main()
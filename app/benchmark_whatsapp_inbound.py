@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK - INGESTAO DO WEBHOOK WHATSAPP
+
+Compara a gravacao evento a evento (lote de 1, equivalente ao webhook sincrono
+antigo) com a ingestao em lote do WhatsAppInboundIngester, usando um banco
+SQLite temporario.
+
+Uso:
+    python benchmark_whatsapp_inbound.py [eventos] [conversas]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_tmp_dir = tempfile.mkdtemp(prefix='jurispocket-bench-')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp_dir, 'bench.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(_tmp_dir, 'uploads')
+os.environ['ENABLE_BACKGROUND_JOBS'] = 'false'
+
+
+def preparar_workspace(app_module, conversas: int) -> int:
+    """Cria workspace, admin e clientes com telefone para o benchmark."""
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        workspace_id = db.execute("INSERT INTO workspaces (nome) VALUES ('Benchmark')").lastrowid
+        db.execute(
+            '''INSERT INTO users (workspace_id, nome, email, password_hash, role)
+               VALUES (?, 'Admin', 'bench@example.com', 'x', 'admin')''',
+            (workspace_id,),
+        )
+        for index in range(conversas):
+            telefone = f'119{index:08d}'
+            db.execute(
+                '''INSERT INTO clientes (workspace_id, nome, telefone, telefone_digits, telefone_local)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (workspace_id, f'Cliente {index}', telefone, *app_module.phone_index_values(telefone)),
+            )
+        db.commit()
+    return workspace_id
+
+
+def gerar_eventos(workspace_id: int, total: int, conversas: int) -> list:
+    return [
+        {
+            'seq': index + 1,
+            'session_key': f'workspace-{workspace_id}',
+            'from_phone': f'55119{index % conversas:08d}',
+            'text': f'Mensagem de teste {index}',
+            'message_id': f'bench-{index}',
+            'received_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        for index in range(total)
+    ]
+
+
+def medir(ingester, eventos: list, batch_size: int) -> float:
+    inicio = time.perf_counter()
+    for start in range(0, len(eventos), batch_size):
+        ingester.process_batch(eventos[start:start + batch_size])
+    return time.perf_counter() - inicio
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    conversas = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    import app as app_module
+
+    workspace_id = preparar_workspace(app_module, conversas)
+    eventos = gerar_eventos(workspace_id, total, conversas)
+
+    print("=" * 60)
+    print(f"BENCHMARK: {total} eventos em {conversas} conversas")
+    print("=" * 60)
+
+    for label, batch_size in (('Evento a evento', 1), ('Lote de 50', 50), ('Lote de 200', 200)):
+        ingester = app_module.WhatsAppInboundIngester(batch_size=batch_size)
+        elapsed = medir(ingester, eventos, batch_size)
+        print(f"{label:<18} {elapsed:8.3f}s  {total / elapsed:10.1f} eventos/s")
+
+    with app_module.app.app_context():
+        db = app_module.get_db()
+        fora_de_ordem = db.execute(
+            '''SELECT COUNT(*) FROM (
+                   SELECT sender_phone, conversation_seq,
+                          LAG(conversation_seq) OVER (PARTITION BY sender_phone ORDER BY id) AS anterior
+                   FROM whatsapp_message_log WHERE direction = 'inbound'
+               ) WHERE anterior IS NOT NULL AND conversation_seq != anterior + 1'''
+        ).fetchone()[0]
+    print(f"Sequencias fora de ordem por conversa: {fora_de_ordem}")
+
+
+if __name__ == '__main__':
+    main()
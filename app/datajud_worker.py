@@ -754,28 +754,29 @@ def criar_alertas(
     alertas_criados = 0
     
     try:
-        for mov in novas_movimentacoes:
-            # Extrai apenas os últimos 9 dígitos do NPU para exibir no alerta
-            npu_curto = numero_processo[-9:] if len(numero_processo) >= 9 else numero_processo
-            
-            titulo = f"🔔 Nova movimentação - {npu_curto}"
-            mensagem = f"{mov['nome']}\nData: {mov['data']}"
-            
-            cursor.execute('''
-                INSERT INTO alertas_notificacoes
-                (workspace_id, processo_id, tipo, titulo, mensagem, lido, data_criacao)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
+        # Extrai apenas os últimos 9 dígitos do NPU para exibir no alerta
+        npu_curto = numero_processo[-9:] if len(numero_processo) >= 9 else numero_processo
+        titulo = f"🔔 Nova movimentação - {npu_curto}"
+        data_criacao = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        # Um único executemany para todas as movimentações do processo
+        cursor.executemany('''
+            INSERT INTO alertas_notificacoes
+            (workspace_id, processo_id, tipo, titulo, mensagem, lido, data_criacao)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (
                 workspace_id,
                 processo_id,
                 'movimentacao',
                 titulo,
-                mensagem,
+                f"{mov['nome']}\nData: {mov['data']}",
                 False,  # Novo alerta não lido
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ))
-            
-            alertas_criados += 1
+                data_criacao,
+            )
+            for mov in novas_movimentacoes
+        ])
+        alertas_criados = len(novas_movimentacoes)
         
         conn.commit()
         logger.info(f"🔔 {alertas_criados} alertas criados")
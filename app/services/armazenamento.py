@@ -0,0 +1,248 @@
+"""
+Armazenamento de Arquivos
+
+Blobs endereçados por conteúdo no volume de uploads:
+- o upload é copiado em blocos para um temporário enquanto o SHA-256 é calculado
+- o arquivo final fica em blobs/<sha[:2]>/<sha>.<ext>; conteúdo repetido
+  (o mesmo PDF enviado duas vezes, por qualquer processo) reaproveita o blob
+- armazenamento_blobs guarda a contagem de referências; blob sem referências
+  fica para a coleta (coletar_orfaos), que apaga o arquivo numa transação
+  própria — nunca antes do commit de quem liberou
+- armazenamento_uso mantém os bytes por workspace, atualizados a cada
+  upload/remoção (limite 'armazenamento' do plano)
+
+As operações no banco usam a conexão e a transação do chamador: o commit da
+rota grava o documento e a referência juntos, e um rollback não deixa
+referência apontando para arquivo apagado.
+"""
+
+import hashlib
+import os
+import secrets
+from typing import Any, Callable, Dict, Optional
+
+
+TAMANHO_BLOCO = 256 * 1024
+
+
+def criar_tabelas_armazenamento(db) -> bool:
+    """Cria as tabelas de blobs e de uso. Retorna True se o uso acabou de ser criado."""
+    existia = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'armazenamento_uso'"
+    ).fetchone() is not None
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS armazenamento_blobs (
+            chave TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS armazenamento_uso (
+            workspace_id INTEGER PRIMARY KEY,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            arquivos INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return not existia
+
+
+class ArmazenamentoConteudo:
+    """Recebe uploads em streaming e grava blobs deduplicados com contagem de referências."""
+
+    def __init__(self, upload_folder_fn: Callable[[], str]):
+        self._upload_folder_fn = upload_folder_fn
+
+    @property
+    def diretorio_blobs(self) -> str:
+        return os.path.join(self._upload_folder_fn(), 'blobs')
+
+    def _caminho_blob(self, chave: str) -> str:
+        return os.path.join(self.diretorio_blobs, chave[:2], chave)
+
+    def chave_do_caminho(self, caminho: Optional[str]) -> Optional[str]:
+        """Chave do blob se `caminho` aponta para blobs/, senão None (arquivo legado)."""
+        if not caminho:
+            return None
+        raiz = os.path.abspath(self.diretorio_blobs) + os.sep
+        absoluto = os.path.abspath(caminho)
+        if not absoluto.startswith(raiz):
+            return None
+        return os.path.basename(absoluto)
+
+    def url_publica(self, caminho: str) -> str:
+        """URL em /uploads/ para servir o blob (avatar, logo)."""
+        return '/uploads/' + os.path.relpath(caminho, self._upload_folder_fn()).replace(os.sep, '/')
+
+    # ------------------------------------------------------------------
+    # Upload
+    # ------------------------------------------------------------------
+
+    def receber(self, stream, extensao: str) -> Dict[str, Any]:
+        """Copia o stream para um temporário calculando SHA-256 e tamanho."""
+        temporarios = os.path.join(self.diretorio_blobs, 'tmp')
+        os.makedirs(temporarios, exist_ok=True)
+        temp = os.path.join(temporarios, f'{secrets.token_hex(8)}.parcial')
+        digest = hashlib.sha256()
+        tamanho = 0
+        try:
+            with open(temp, 'wb') as saida:
+                for bloco in iter(lambda: stream.read(TAMANHO_BLOCO), b''):
+                    digest.update(bloco)
+                    saida.write(bloco)
+                    tamanho += len(bloco)
+        except Exception:
+            self.descartar({'temp': temp})
+            raise
+        extensao = ''.join(c for c in str(extensao or '').lower() if c.isalnum())[:10]
+        return {
+            'temp': temp,
+            'sha256': digest.hexdigest(),
+            'tamanho': tamanho,
+            'extensao': extensao,
+        }
+
+    def descartar(self, recebido: Dict[str, Any]) -> None:
+        try:
+            os.remove(recebido['temp'])
+        except OSError:
+            pass
+
+    def registrar(self, db, recebido: Dict[str, Any], workspace_id: Optional[int]) -> Dict[str, Any]:
+        """
+        Soma uma referência ao blob (criando-o se for conteúdo novo) e o uso do
+        workspace. O UPDATE abre a transação de escrita antes de olhar o disco,
+        então liberar() de outro processo não apaga o arquivo no meio do caminho.
+        """
+        chave = recebido['sha256'] + (f".{recebido['extensao']}" if recebido['extensao'] else '')
+        db.execute(
+            '''INSERT INTO armazenamento_blobs (chave, sha256, tamanho, referencias)
+               VALUES (?, ?, ?, 1)
+               ON CONFLICT(chave) DO UPDATE SET referencias = referencias + 1''',
+            (chave, recebido['sha256'], recebido['tamanho']),
+        )
+        caminho = self._caminho_blob(chave)
+        deduplicado = os.path.exists(caminho)
+        if deduplicado:
+            self.descartar(recebido)
+        else:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            os.replace(recebido['temp'], caminho)
+        if workspace_id:
+            self._ajustar_uso(db, workspace_id, recebido['tamanho'], 1)
+        return {
+            'caminho': caminho,
+            'relativo': os.path.relpath(caminho, self._upload_folder_fn()).replace(os.sep, '/'),
+            'chave': chave,
+            'sha256': recebido['sha256'],
+            'tamanho': recebido['tamanho'],
+            'deduplicado': deduplicado,
+        }
+
+    def liberar(self, db, caminho: Optional[str], workspace_id: Optional[int], tamanho: Optional[int] = None) -> Optional[str]:
+        """
+        Remove uma referência e desconta o uso do workspace (sem commit).
+
+        Nada é apagado do disco aqui. Para arquivo legado (fora de blobs),
+        retorna o caminho: o chamador o passa a remover_arquivo depois do commit.
+        """
+        if not caminho:
+            return None
+        chave = self.chave_do_caminho(caminho)
+        legado = None
+        if chave is None:
+            if tamanho is None:
+                try:
+                    tamanho = os.path.getsize(caminho)
+                except OSError:
+                    tamanho = 0
+            legado = caminho
+        else:
+            # Decrementa primeiro: o UPDATE pega o lock de escrita antes da leitura
+            db.execute('UPDATE armazenamento_blobs SET referencias = referencias - 1 WHERE chave = ?', (chave,))
+            blob = db.execute(
+                'SELECT tamanho, referencias FROM armazenamento_blobs WHERE chave = ?', (chave,)
+            ).fetchone()
+            if blob is None:
+                return None
+            tamanho = blob[0] if tamanho is None else tamanho
+        if workspace_id:
+            self._ajustar_uso(db, workspace_id, -int(tamanho or 0), -1)
+        return legado
+
+    @staticmethod
+    def remover_arquivo(caminho: Optional[str]) -> None:
+        """Apaga o arquivo legado devolvido por liberar (chamar após o commit)."""
+        if not caminho:
+            return
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+    def coletar_orfaos(self, db, lote: int = 500) -> Dict[str, int]:
+        """
+        Apaga blobs sem referências. Os arquivos são removidos com a transação
+        de escrita aberta: registrar() de outro processo espera o commit e, sem
+        o arquivo, grava o conteúdo de novo em vez de reaproveitar um blob que
+        estava sendo apagado.
+        """
+        totais = {'blobs': 0, 'bytes': 0}
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            orfaos = db.execute(
+                'SELECT chave, tamanho FROM armazenamento_blobs WHERE referencias <= 0 LIMIT ?', (int(lote),)
+            ).fetchall()
+            for chave, tamanho in orfaos:
+                try:
+                    os.remove(self._caminho_blob(chave))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue  # fica para a próxima coleta
+                db.execute('DELETE FROM armazenamento_blobs WHERE chave = ?', (chave,))
+                totais['blobs'] += 1
+                totais['bytes'] += int(tamanho or 0)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return totais
+
+    # ------------------------------------------------------------------
+    # Uso por workspace
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ajustar_uso(db, workspace_id: int, delta_bytes: int, delta_arquivos: int) -> None:
+        db.execute('INSERT OR IGNORE INTO armazenamento_uso (workspace_id) VALUES (?)', (int(workspace_id),))
+        db.execute(
+            '''UPDATE armazenamento_uso
+               SET bytes = MAX(0, bytes + ?), arquivos = MAX(0, arquivos + ?), updated_at = CURRENT_TIMESTAMP
+               WHERE workspace_id = ?''',
+            (int(delta_bytes), int(delta_arquivos), int(workspace_id)),
+        )
+
+    @staticmethod
+    def uso_workspace(db, workspace_id: int) -> Dict[str, int]:
+        row = db.execute(
+            'SELECT bytes, arquivos FROM armazenamento_uso WHERE workspace_id = ?', (int(workspace_id),)
+        ).fetchone()
+        return {'bytes': int(row[0]) if row else 0, 'arquivos': int(row[1]) if row else 0}
+
+    def estatisticas(self, db) -> Dict[str, Any]:
+        row = db.execute(
+            '''SELECT COUNT(*), COALESCE(SUM(tamanho), 0), COALESCE(SUM(tamanho * MAX(referencias, 0)), 0),
+                      COALESCE(SUM(CASE WHEN referencias <= 0 THEN tamanho END), 0)
+               FROM armazenamento_blobs'''
+        ).fetchone()
+        return {
+            'blobs': row[0],
+            'bytes_em_disco': row[1],
+            'bytes_referenciados': row[2],
+            'bytes_economizados': row[2] - row[1] + row[3],
+            'bytes_aguardando_coleta': row[3],
+        }
@@ -0,0 +1,283 @@
+"""
+Auditoria Assíncrona
+
+registrar_audit_log deixa de gravar (e commitar) dentro da requisição:
+- a entrada, já com o horário do evento, vai para um buffer em memória
+- uma thread escritora grava em lote (executemany + um commit) quando o
+  buffer atinge `lote` entradas ou a cada `intervalo_segundos`
+- ações sensíveis (ou tudo, no modo 'sincrono') continuam gravando na hora,
+  na conexão e transação da própria requisição: com transação aberta, o
+  commit da rota grava as duas coisas juntas; só sem transação aberta (rota
+  que não escreve ou já commitou) a entrada é commitada sozinha
+- buffer cheio aplica o mesmo caminho síncrono (não descarta entradas)
+- no encerramento (atexit) o buffer é esvaziado antes de sair
+
+Linhas antigas são movidas para audit_logs_arquivo (mesmo esquema, mesmos
+ids), mantendo audit_logs pequena para as telas de admin.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+
+COLUNAS = (
+    'user_id', 'user_nome', 'user_email', 'acao', 'entidade', 'entidade_id',
+    'dados_anteriores', 'dados_novos', 'ip_address', 'user_agent', 'created_at',
+)
+
+_SQL_INSERIR = (
+    f"INSERT INTO audit_logs ({', '.join(COLUNAS)}) "
+    f"VALUES ({', '.join('?' for _ in COLUNAS)})"
+)
+
+
+def criar_tabela_arquivo_auditoria(db) -> None:
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS audit_logs_arquivo (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            user_nome TEXT,
+            user_email TEXT,
+            acao TEXT NOT NULL,
+            entidade TEXT NOT NULL,
+            entidade_id INTEGER,
+            dados_anteriores TEXT,
+            dados_novos TEXT,
+            ip_address TEXT,
+            user_agent TEXT,
+            created_at TIMESTAMP,
+            arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_audit_logs_arquivo_created ON audit_logs_arquivo (created_at, id)'
+    )
+
+
+def agora_utc() -> str:
+    """Mesmo formato de CURRENT_TIMESTAMP do SQLite."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class AuditoriaAssincrona:
+    """Buffer de entradas de auditoria com gravação em lote numa thread dedicada."""
+
+    def __init__(
+        self,
+        database_path_fn: Callable[[], str],
+        lote: int = 200,
+        intervalo_segundos: float = 2.0,
+        max_buffer: int = 10000,
+        modo: str = 'assincrono',
+        acoes_duraveis: Iterable[str] = (),
+    ):
+        self._database_path_fn = database_path_fn
+        self.lote = max(1, int(lote))
+        self.intervalo_segundos = max(0.05, float(intervalo_segundos))
+        self.max_buffer = max(self.lote, int(max_buffer))
+        self.modo = 'sincrono' if str(modo).strip().lower() == 'sincrono' else 'assincrono'
+        self.acoes_duraveis = {acao.strip() for acao in acoes_duraveis if acao and acao.strip()}
+
+        self._buffer: Deque[Tuple[Any, ...]] = deque()
+        self._cond = threading.Condition()
+        self._em_gravacao = 0
+        self._forcar = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._parando = False
+        self._stats = {
+            'enfileiradas': 0, 'gravadas': 0, 'lotes': 0, 'duraveis': 0,
+            'gravacoes_diretas': 0, 'falhas': 0, 'arquivadas': 0,
+        }
+
+    def duravel(self, acao: str) -> bool:
+        return self.modo == 'sincrono' or acao in self.acoes_duraveis
+
+    @staticmethod
+    def _linha(valores: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(valores.get(coluna) for coluna in COLUNAS[:-1]) + (valores.get('created_at') or agora_utc(),)
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._database_path_fn(), timeout=30)
+
+    def _gravar_lote(self, linhas: List[Tuple[Any, ...]]) -> None:
+        conn = self._conectar()
+        try:
+            with conn:
+                conn.executemany(_SQL_INSERIR, linhas)
+        finally:
+            conn.close()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                # Espera o lote encher ou o intervalo vencer (o que vier antes)
+                limite = time.monotonic() + self.intervalo_segundos
+                while (
+                    not self._parando
+                    and not self._forcar
+                    and len(self._buffer) < self.lote
+                    and time.monotonic() < limite
+                ):
+                    self._cond.wait(max(0.0, limite - time.monotonic()))
+                if not self._buffer:
+                    self._forcar = False
+                    if self._parando:
+                        return
+                    continue
+                lote = [self._buffer.popleft() for _ in range(min(self.lote, len(self._buffer)))]
+                self._em_gravacao = len(lote)
+            try:
+                self._gravar_lote(lote)
+            except Exception as e:
+                print(f"[auditoria] Falha ao gravar lote de {len(lote)}: {e}")
+                with self._cond:
+                    self._stats['falhas'] += 1
+                    self._em_gravacao = 0
+                    # Devolve ao início do buffer para a próxima tentativa
+                    self._buffer.extendleft(reversed(lote))
+                    self._cond.notify_all()
+                    if self._parando:
+                        return
+                time.sleep(min(self.intervalo_segundos, 1.0))
+            else:
+                with self._cond:
+                    self._stats['gravadas'] += len(lote)
+                    self._stats['lotes'] += 1
+                    self._em_gravacao = 0
+                    self._cond.notify_all()
+
+    def _garantir_escritora(self) -> bool:
+        """Inicia a escritora no primeiro uso (e de novo após fork). Chamado com o lock."""
+        if self._parando:
+            return False
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            if self._pid is not None and self._pid != os.getpid():
+                self._buffer.clear()  # entradas herdadas são do processo pai
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='auditoria-escritora', daemon=True)
+            self._thread.start()
+        return True
+
+    def registrar(self, valores: Dict[str, Any], conexao: Optional[sqlite3.Connection] = None) -> None:
+        """
+        Registra uma entrada (chaves de COLUNAS; created_at é preenchido se faltar).
+
+        Ações duráveis, buffer cheio ou escritora encerrada gravam na hora —
+        na `conexao` da requisição quando informada (dentro da transação da
+        própria rota, que commita junto), senão numa conexão própria.
+        """
+        linha = self._linha(valores)
+        duravel = self.duravel(valores.get('acao'))
+        with self._cond:
+            self._stats['enfileiradas'] += 1
+            if duravel:
+                self._stats['duraveis'] += 1
+            elif len(self._buffer) < self.max_buffer and self._garantir_escritora():
+                self._buffer.append(linha)
+                if len(self._buffer) >= self.lote:
+                    self._cond.notify_all()
+                return
+            self._stats['gravacoes_diretas'] += 1
+
+        if conexao is not None:
+            em_transacao = conexao.in_transaction
+            conexao.execute(_SQL_INSERIR, linha)
+            if not em_transacao:
+                conexao.commit()
+        else:
+            self._gravar_lote([linha])
+        with self._cond:
+            self._stats['gravadas'] += 1
+
+    def esvaziar(self, timeout: float = 10.0) -> bool:
+        """
+        Força a gravação do buffer e aguarda (True se esvaziou no prazo).
+
+        Só alcança o buffer deste processo: com vários workers, entradas dos
+        outros aparecem em até `intervalo_segundos`.
+        """
+        limite = time.monotonic() + timeout
+        with self._cond:
+            if self._buffer:
+                self._garantir_escritora()
+            self._forcar = True
+            self._cond.notify_all()
+            while (self._buffer or self._em_gravacao) and time.monotonic() < limite:
+                self._cond.wait(max(0.0, limite - time.monotonic()))
+            return not self._buffer and not self._em_gravacao
+
+    def parar(self, timeout: float = 10.0) -> None:
+        """Encerramento limpo: grava o que estiver no buffer e para a escritora."""
+        with self._cond:
+            self._parando = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            restantes = list(self._buffer)
+            self._buffer.clear()
+        if restantes:
+            try:
+                self._gravar_lote(restantes)
+                with self._cond:
+                    self._stats['gravadas'] += len(restantes)
+            except Exception as e:
+                print(f"[auditoria] {len(restantes)} entrada(s) perdida(s) no encerramento: {e}")
+
+    # ------------------------------------------------------------------
+    # Arquivo
+    # ------------------------------------------------------------------
+
+    def arquivar(self, dias: int, lote: int = 5000) -> int:
+        """Move para audit_logs_arquivo as linhas com mais de `dias` dias, em lotes."""
+        if dias <= 0:
+            return 0
+        corte = (datetime.utcnow() - timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+        colunas = ', '.join(('id',) + COLUNAS)
+        total = 0
+        conn = self._conectar()
+        try:
+            while True:
+                with conn:
+                    ids = [row[0] for row in conn.execute(
+                        'SELECT id FROM audit_logs WHERE created_at < ? ORDER BY created_at, id LIMIT ?',
+                        (corte, lote),
+                    )]
+                    if not ids:
+                        break
+                    faixa = ','.join('?' for _ in ids)
+                    conn.execute(
+                        f'INSERT OR REPLACE INTO audit_logs_arquivo ({colunas}) '
+                        f'SELECT {colunas} FROM audit_logs WHERE id IN ({faixa})',
+                        ids,
+                    )
+                    conn.execute(f'DELETE FROM audit_logs WHERE id IN ({faixa})', ids)
+                total += len(ids)
+                if len(ids) < lote:
+                    break
+        finally:
+            conn.close()
+        with self._cond:
+            self._stats['arquivadas'] += total
+        return total
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._stats,
+                'pendentes': len(self._buffer),
+                'modo': self.modo,
+                'lote': self.lote,
+                'escritora_ativa': self._thread is not None and self._thread.is_alive(),
+            }
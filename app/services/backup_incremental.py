@@ -0,0 +1,587 @@
+"""
+Backup Incremental
+
+Cadeias de backup: um snapshot completo (API de backup do SQLite) seguido de
+deltas compactos com as linhas alteradas desde o backup anterior.
+
+- Triggers gravam (tabela, chave primária em JSON) em backup_alteracoes a
+  cada INSERT/UPDATE/DELETE; por padrão todas as tabelas com chave primária
+  são rastreadas, não só as do backup exportável
+- o delta grava o estado atual de cada linha alterada (ou a remoção, se ela
+  não existe mais) e limpa o log até a marca d'água usada
+- tabelas sem rastreio no snapshot (fora de `tabelas` ou sem chave primária)
+  impedem aplicar a restauração sobre o banco em uso; tabelas derivadas
+  (índice FTS) são aceitas e reconstruídas pelo chamador
+- execuções concorrentes (um agendador por worker do gunicorn) são evitadas
+  com flock num arquivo de trava no diretório dos backups
+- a cada `intervalo_full_dias` (ou `max_deltas`) começa uma cadeia nova;
+  só as últimas `retencao_cadeias` ficam em disco
+- a restauração descompacta o snapshot e reaplica os deltas em ordem
+
+Layout em `diretorio`: manifesto.json, full_<timestamp>.db.gz e
+delta_<timestamp>.ndjson.gz.
+"""
+
+import gzip
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: só a trava entre threads
+    fcntl = None
+
+from .backup_service import _dumps, _valor_restauravel, criar_snapshot_sqlite
+
+
+TABELA_ALTERACOES = 'backup_alteracoes'
+PREFIXO_TRIGGER = 'trg_backup_'
+
+
+def _tabelas_do_banco(conn: sqlite3.Connection) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    ({tabela: colunas da chave primária}, [tabelas sem chave rastreável]).
+    Tabelas virtuais e suas tabelas-sombra entram na segunda lista.
+    """
+    linhas = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()
+    virtuais = [nome for nome, sql in linhas if (sql or '').upper().startswith('CREATE VIRTUAL TABLE')]
+    com_chave: Dict[str, List[str]] = {}
+    sem_chave: List[str] = []
+    for nome, _ in linhas:
+        if nome == TABELA_ALTERACOES:
+            continue
+        if nome in virtuais or any(nome.startswith(virtual + '_') for virtual in virtuais):
+            sem_chave.append(nome)
+            continue
+        colunas = sorted(
+            (linha[5], linha[1]) for linha in conn.execute(f'PRAGMA table_info("{nome}")').fetchall() if linha[5]
+        )
+        if colunas:
+            com_chave[nome] = [coluna for _, coluna in colunas]
+        else:
+            sem_chave.append(nome)
+    return com_chave, sem_chave
+
+
+def _expressao_chave(colunas: List[str], referencia: str = '') -> str:
+    prefixo = f'{referencia}.' if referencia else ''
+    return 'json_array(' + ', '.join(f'{prefixo}"{coluna}"' for coluna in colunas) + ')'
+
+
+class BackupIncremental:
+    """Backups completos + deltas a partir do log de alterações por trigger."""
+
+    def __init__(
+        self,
+        database_path_fn: Callable[[], str],
+        diretorio_fn: Callable[[], str],
+        tabelas: Optional[List[str]] = None,
+        intervalo_full_dias: int = 7,
+        max_deltas: int = 30,
+        retencao_cadeias: int = 4,
+        lote: int = 500,
+    ):
+        self._database_path_fn = database_path_fn
+        self._diretorio_fn = diretorio_fn
+        # None: todas as tabelas com chave primária
+        self.tabelas = list(tabelas) if tabelas is not None else None
+        # Tabelas que o chamador reconstrói após restaurar (ex.: índice FTS)
+        self.prefixos_derivados: Tuple[str, ...] = ()
+        self.intervalo_full_dias = max(1, intervalo_full_dias)
+        self.max_deltas = max(1, max_deltas)
+        self.retencao_cadeias = max(1, retencao_cadeias)
+        self.lote = max(1, lote)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _trava(self, bloquear: bool = False):
+        """Exclusão mútua entre threads e entre processos (flock em .trava)."""
+        if not self._lock.acquire(blocking=bloquear):
+            raise RuntimeError('Backup incremental já em execução')
+        arquivo = None
+        try:
+            if fcntl is not None:
+                os.makedirs(self._diretorio_fn(), exist_ok=True)
+                arquivo = open(self._caminho('.trava'), 'a+')
+                try:
+                    fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | (0 if bloquear else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    raise RuntimeError('Backup incremental já em execução em outro processo')
+            yield
+        finally:
+            if arquivo is not None:
+                arquivo.close()  # libera o flock
+            self._lock.release()
+
+    def _rastreadas(self, conn: sqlite3.Connection) -> Dict[str, List[str]]:
+        com_chave, _ = _tabelas_do_banco(conn)
+        if self.tabelas is None:
+            return com_chave
+        return {tabela: chave for tabela, chave in com_chave.items() if tabela in self.tabelas}
+
+    def _sem_rastreio(self, conn: sqlite3.Connection, rastreadas: Optional[List[str]]) -> List[str]:
+        """Tabelas de `conn` fora de `rastreadas` (None: nenhuma), ignorando as derivadas."""
+        com_chave, sem_chave = _tabelas_do_banco(conn)
+        return [
+            tabela for tabela in sorted(set(com_chave) | set(sem_chave))
+            if tabela not in (rastreadas or ()) and not tabela.startswith(self.prefixos_derivados or ('\0',))
+        ]
+
+    # ------------------------------------------------------------------
+    # Rastreamento de alterações
+    # ------------------------------------------------------------------
+
+    def _conectar(self, caminho: Optional[str] = None) -> sqlite3.Connection:
+        return sqlite3.connect(caminho or self._database_path_fn(), timeout=30)
+
+    def configurar_rastreamento(self, ativo: bool) -> None:
+        """Cria (ou remove, se inativo) a tabela de log e os triggers por tabela."""
+        conn = self._conectar()
+        try:
+            if not ativo:
+                self._remover_triggers(conn)
+                conn.execute(f'DROP TABLE IF EXISTS {TABELA_ALTERACOES}')
+                conn.commit()
+                return
+
+            colunas_log = {linha[1] for linha in conn.execute(f'PRAGMA table_info({TABELA_ALTERACOES})').fetchall()}
+            if colunas_log and 'chave' not in colunas_log:
+                # Log antigo (só tabelas com id): recomeça do zero
+                self._remover_triggers(conn)
+                conn.execute(f'DROP TABLE {TABELA_ALTERACOES}')
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {TABELA_ALTERACOES} (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tabela TEXT NOT NULL,
+                    chave TEXT NOT NULL
+                )
+            ''')
+            rastreadas = self._rastreadas(conn)
+            for tabela, chave in rastreadas.items():
+                registrar = f"INSERT INTO {TABELA_ALTERACOES} (tabela, chave) VALUES ('{tabela}', "
+                nova, antiga = _expressao_chave(chave, 'NEW'), _expressao_chave(chave, 'OLD')
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {PREFIXO_TRIGGER}{tabela}_insert AFTER INSERT ON "{tabela}"
+                    BEGIN {registrar}{nova}); END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {PREFIXO_TRIGGER}{tabela}_update AFTER UPDATE ON "{tabela}"
+                    BEGIN
+                        {registrar}{nova});
+                        INSERT INTO {TABELA_ALTERACOES} (tabela, chave)
+                        SELECT '{tabela}', {antiga} WHERE {antiga} IS NOT {nova};
+                    END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {PREFIXO_TRIGGER}{tabela}_delete AFTER DELETE ON "{tabela}"
+                    BEGIN {registrar}{antiga}); END
+                ''')
+            # Tabelas que deixaram de ser rastreadas
+            for (nome,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?", (PREFIXO_TRIGGER + '%',)
+            ).fetchall():
+                tabela = nome[len(PREFIXO_TRIGGER):].rsplit('_', 1)[0]
+                if tabela not in rastreadas:
+                    conn.execute(f'DROP TRIGGER IF EXISTS {nome}')
+            conn.commit()
+        finally:
+            conn.close()
+
+        # Conjunto rastreado mudou (tabela nova, log antigo): a cadeia atual
+        # não cobre essas tabelas, então o próximo ciclo abre outra
+        manifesto = self.carregar_manifesto()
+        if manifesto['cadeias'] and manifesto['cadeias'][-1].get('tabelas_rastreadas') != sorted(rastreadas):
+            self._forcar_full()
+
+    @staticmethod
+    def _remover_triggers(conn: sqlite3.Connection) -> None:
+        triggers = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?",
+            (PREFIXO_TRIGGER + '%',),
+        ).fetchall()
+        for (nome,) in triggers:
+            conn.execute(f'DROP TRIGGER IF EXISTS {nome}')
+
+    def _forcar_full(self) -> None:
+        manifesto = self.carregar_manifesto()
+        if not manifesto.get('forcar_full'):
+            manifesto['forcar_full'] = True
+            os.makedirs(self._diretorio_fn(), exist_ok=True)
+            self._salvar_manifesto(manifesto)
+
+    @staticmethod
+    def _marca_atual(conn: sqlite3.Connection) -> int:
+        return conn.execute(f'SELECT COALESCE(MAX(seq), 0) FROM {TABELA_ALTERACOES}').fetchone()[0]
+
+    def alteracoes_pendentes(self) -> Optional[int]:
+        conn = self._conectar()
+        try:
+            return conn.execute(
+                f'SELECT COUNT(*) FROM (SELECT DISTINCT tabela, chave FROM {TABELA_ALTERACOES})'
+            ).fetchone()[0]
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Manifesto
+    # ------------------------------------------------------------------
+
+    def _caminho(self, nome: str) -> str:
+        return os.path.join(self._diretorio_fn(), nome)
+
+    def carregar_manifesto(self) -> Dict[str, Any]:
+        try:
+            with open(self._caminho('manifesto.json'), 'r', encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return {'cadeias': []}
+
+    def _salvar_manifesto(self, manifesto: Dict[str, Any]) -> None:
+        caminho = self._caminho('manifesto.json')
+        parcial = f'{caminho}.{os.getpid()}.parcial'
+        with open(parcial, 'w', encoding='utf-8') as arquivo:
+            json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+        os.replace(parcial, caminho)
+
+    def _precisa_full(self, manifesto: Dict[str, Any]) -> bool:
+        if manifesto.get('forcar_full') or not manifesto['cadeias']:
+            return True
+        cadeia = manifesto['cadeias'][-1]
+        if len(cadeia['deltas']) >= self.max_deltas:
+            return True
+        criado_em = datetime.fromisoformat(cadeia['criado_em'])
+        return datetime.now() - criado_em >= timedelta(days=self.intervalo_full_dias)
+
+    def _aplicar_retencao(self, manifesto: Dict[str, Any]) -> List[str]:
+        removidos = []
+        while len(manifesto['cadeias']) > self.retencao_cadeias:
+            cadeia = manifesto['cadeias'].pop(0)
+            for nome in [cadeia['full']] + [delta['arquivo'] for delta in cadeia['deltas']]:
+                try:
+                    os.remove(self._caminho(nome))
+                    removidos.append(nome)
+                except OSError:
+                    pass
+        return removidos
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    def executar(self, tipo: str = 'auto') -> Dict[str, Any]:
+        """Roda um backup: 'full', 'delta' ou 'auto' (delta, ou full quando a cadeia vence)."""
+        if tipo not in ('auto', 'full', 'delta'):
+            raise ValueError(f'Tipo de backup inválido: {tipo}')
+        with self._trava():
+            # Manifesto lido sob a trava: reflete o que outro processo acabou de gravar
+            manifesto = self.carregar_manifesto()
+            if tipo == 'full' or (tipo == 'auto' and self._precisa_full(manifesto)):
+                resultado = self._executar_full(manifesto)
+            elif not manifesto['cadeias'] or manifesto.get('forcar_full'):
+                raise ValueError('Não há snapshot completo válido; rode um backup full antes do delta')
+            else:
+                resultado = self._executar_delta(manifesto)
+            resultado['removidos_por_retencao'] = self._aplicar_retencao(manifesto)
+            self._salvar_manifesto(manifesto)
+            return resultado
+
+    def _executar_full(self, manifesto: Dict[str, Any]) -> Dict[str, Any]:
+        inicio = datetime.now()
+        self.configurar_rastreamento(True)
+        conn = self._conectar()
+        try:
+            # Alterações gravadas durante a cópia ficam acima da marca e entram
+            # no próximo delta (reaplicá-las sobre o snapshot é idempotente)
+            marca = self._marca_atual(conn)
+            rastreadas = sorted(self._rastreadas(conn))
+        finally:
+            conn.close()
+
+        timestamp = inicio.strftime('%Y%m%d_%H%M%S')
+        nome = f'full_{timestamp}_{secrets.token_hex(3)}.db.gz'
+        destino = self._caminho(nome)
+        criar_snapshot_sqlite(self._database_path_fn(), destino + '.parcial', comprimir=True)
+        os.replace(destino + '.parcial', destino)
+        self._limpar_log(marca)
+
+        cadeia = {
+            'id': f'{timestamp}_{secrets.token_hex(3)}',
+            'full': nome,
+            'criado_em': inicio.isoformat(),
+            'marca': marca,
+            'tabelas_rastreadas': rastreadas,
+            'bytes': os.path.getsize(destino),
+            'deltas': [],
+        }
+        manifesto['cadeias'].append(cadeia)
+        manifesto.pop('forcar_full', None)
+        return {
+            'tipo': 'full',
+            'cadeia': cadeia['id'],
+            'arquivo': nome,
+            'bytes': cadeia['bytes'],
+            'duracao_ms': round((datetime.now() - inicio).total_seconds() * 1000, 1),
+        }
+
+    def _executar_delta(self, manifesto: Dict[str, Any]) -> Dict[str, Any]:
+        inicio = datetime.now()
+        cadeia = manifesto['cadeias'][-1]
+        destino = None
+        conn = self._conectar()
+        conn.isolation_level = None
+        try:
+            # Transação de leitura: o log e as linhas vêm do mesmo instante
+            conn.execute('BEGIN')
+            marca = self._marca_atual(conn)
+            chaves_primarias = self._rastreadas(conn)
+            alterados: Dict[str, List[str]] = {}
+            for tabela, chave in conn.execute(
+                f'''SELECT tabela, chave FROM {TABELA_ALTERACOES}
+                    WHERE seq <= ? GROUP BY tabela, chave ORDER BY tabela, chave''',
+                (marca,),
+            ):
+                alterados.setdefault(tabela, []).append(chave)
+
+            if not alterados:
+                conn.execute('COMMIT')
+                return {'tipo': 'delta', 'cadeia': cadeia['id'], 'arquivo': None, 'registros': 0, 'remocoes': 0}
+
+            timestamp = inicio.strftime('%Y%m%d_%H%M%S')
+            nome = f'delta_{timestamp}_{secrets.token_hex(3)}.ndjson.gz'
+            destino = self._caminho(nome)
+            seq_de = cadeia['deltas'][-1]['seq_ate'] if cadeia['deltas'] else cadeia['marca']
+            registros = remocoes = 0
+            with gzip.open(destino + '.parcial', 'wt', encoding='utf-8', compresslevel=6) as saida:
+                saida.write(_dumps({'_delta': {
+                    'cadeia': cadeia['id'], 'seq_de': seq_de, 'seq_ate': marca, 'criado_em': inicio.isoformat(),
+                }}) + '\n')
+                for tabela, chaves in alterados.items():
+                    pk = chaves_primarias.get(tabela)
+                    if pk is None:
+                        continue  # tabela removida do banco ou do rastreio
+                    presentes = set()
+                    for posicao in range(0, len(chaves), self.lote):
+                        filtro, valores = self._filtro_chaves(pk, chaves[posicao:posicao + self.lote])
+                        cursor = conn.execute(
+                            f'SELECT {_expressao_chave(pk)} AS _chave_backup, * FROM "{tabela}" WHERE {filtro}',
+                            (valores,),
+                        )
+                        if posicao == 0:
+                            colunas = [descricao[0] for descricao in cursor.description][1:]
+                            saida.write(_dumps({'_tabela': tabela, 'colunas': colunas, 'pk': pk}) + '\n')
+                        for linha in cursor:
+                            presentes.add(linha[0])
+                            saida.write(_dumps(list(linha[1:])) + '\n')
+                    removidos = [chave for chave in chaves if chave not in presentes]
+                    if removidos:
+                        saida.write(_dumps({'_remocoes': tabela, 'pk': pk, 'chaves': removidos}) + '\n')
+                    registros += len(presentes)
+                    remocoes += len(removidos)
+                saida.write(_dumps({'_fim': {'total_registros': registros, 'remocoes': remocoes}}) + '\n')
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if destino and os.path.exists(destino + '.parcial'):
+                os.remove(destino + '.parcial')
+            raise
+        finally:
+            conn.close()
+
+        os.replace(destino + '.parcial', destino)
+        self._limpar_log(marca)
+        delta = {
+            'arquivo': nome,
+            'criado_em': inicio.isoformat(),
+            'seq_de': seq_de,
+            'seq_ate': marca,
+            'registros': registros,
+            'remocoes': remocoes,
+            'tabelas': {tabela: len(chaves) for tabela, chaves in alterados.items()},
+            'bytes': os.path.getsize(destino),
+        }
+        cadeia['deltas'].append(delta)
+        return {
+            'tipo': 'delta',
+            'cadeia': cadeia['id'],
+            'arquivo': nome,
+            'registros': registros,
+            'remocoes': remocoes,
+            'bytes': delta['bytes'],
+            'duracao_ms': round((datetime.now() - inicio).total_seconds() * 1000, 1),
+        }
+
+    @staticmethod
+    def _filtro_chaves(pk: List[str], chaves: Iterable[str]) -> Tuple[str, str]:
+        """(condição SQL, parâmetro JSON) que seleciona as linhas pelas chaves do log."""
+        chaves = list(chaves)
+        if len(pk) == 1:
+            # Chave simples: compara o valor direto (usa o índice da chave primária)
+            return f'"{pk[0]}" IN (SELECT value FROM json_each(?))', json.dumps([json.loads(c)[0] for c in chaves])
+        return f'{_expressao_chave(pk)} IN (SELECT value FROM json_each(?))', json.dumps(chaves)
+
+    def _limpar_log(self, marca: int) -> None:
+        conn = self._conectar()
+        try:
+            conn.execute(f'DELETE FROM {TABELA_ALTERACOES} WHERE seq <= ?', (marca,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Status e restauração
+    # ------------------------------------------------------------------
+
+    def status(self) -> Dict[str, Any]:
+        manifesto = self.carregar_manifesto()
+        cadeias = manifesto['cadeias']
+        ultimo_full = cadeias[-1] if cadeias else None
+        ultimo_delta = next((c['deltas'][-1] for c in reversed(cadeias) if c['deltas']), None)
+        return {
+            'cadeias': [
+                {
+                    'id': cadeia['id'],
+                    'full': cadeia['full'],
+                    'criado_em': cadeia['criado_em'],
+                    'deltas': len(cadeia['deltas']),
+                    'ultimo_delta_em': cadeia['deltas'][-1]['criado_em'] if cadeia['deltas'] else None,
+                    'bytes': cadeia['bytes'] + sum(delta['bytes'] for delta in cadeia['deltas']),
+                }
+                for cadeia in cadeias
+            ],
+            'ultimo_full': ultimo_full and {k: ultimo_full[k] for k in ('full', 'criado_em', 'bytes')},
+            'ultimo_delta': ultimo_delta and {
+                k: ultimo_delta[k] for k in ('arquivo', 'criado_em', 'registros', 'remocoes', 'bytes')
+            },
+            'alteracoes_pendentes': self.alteracoes_pendentes(),
+            'forcar_full': bool(manifesto.get('forcar_full')),
+        }
+
+    def restaurar(self, destino: str, ate: Optional[str] = None, aplicar_em: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Reconstrói o banco em `destino`: snapshot da cadeia mais recente até
+        `ate` (ISO) e os deltas criados até lá. Com `aplicar_em`, copia o
+        resultado sobre esse banco via API de backup e força um full no
+        próximo ciclo (o log de alterações deixa de corresponder à cadeia).
+        """
+        manifesto = self.carregar_manifesto()
+        cadeias = [c for c in manifesto['cadeias'] if ate is None or c['criado_em'] <= ate]
+        if not cadeias:
+            raise ValueError('Nenhum backup completo disponível para o ponto solicitado')
+        cadeia = cadeias[-1]
+        deltas = [d for d in cadeia['deltas'] if ate is None or d['criado_em'] <= ate]
+
+        parcial = destino + '.parcial'
+        with gzip.open(self._caminho(cadeia['full']), 'rb') as entrada, open(parcial, 'wb') as saida:
+            shutil.copyfileobj(entrada, saida, 1024 * 1024)
+
+        registros = remocoes = 0
+        conn = self._conectar(parcial)
+        conn.isolation_level = None
+        try:
+            # Com deltas, tabelas que eles não cobrem ficariam no estado do
+            # snapshot completo, perdendo as alterações feitas desde então.
+            # Cadeias antigas (sem a lista) só rastreavam parte das tabelas.
+            sem_rastreio = self._sem_rastreio(conn, cadeia.get('tabelas_rastreadas')) if deltas else []
+            if aplicar_em and sem_rastreio:
+                raise ValueError(
+                    'O snapshot contém tabelas sem rastreio de alterações; restaure em arquivo '
+                    f'e confira antes de aplicar: {", ".join(sem_rastreio)}'
+                )
+            conn.execute('PRAGMA foreign_keys = OFF')
+            conn.execute('BEGIN')
+            for delta in deltas:
+                aplicado = self._aplicar_delta(conn, self._caminho(delta['arquivo']))
+                registros += aplicado['registros']
+                remocoes += aplicado['remocoes']
+            # O banco restaurado começa sem alterações pendentes
+            conn.execute(f'DELETE FROM {TABELA_ALTERACOES}')
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            conn.close()
+            os.remove(parcial)
+            raise
+        conn.close()
+        os.replace(parcial, destino)
+
+        if aplicar_em:
+            origem = sqlite3.connect(destino)
+            alvo = sqlite3.connect(aplicar_em, timeout=30)
+            try:
+                origem.backup(alvo)
+            finally:
+                alvo.close()
+                origem.close()
+            with self._trava(bloquear=True):
+                manifesto = self.carregar_manifesto()
+                manifesto['forcar_full'] = True
+                self._salvar_manifesto(manifesto)
+
+        return {
+            'cadeia': cadeia['id'],
+            'full': cadeia['full'],
+            'deltas_aplicados': len(deltas),
+            'ponto_restauracao': deltas[-1]['criado_em'] if deltas else cadeia['criado_em'],
+            'registros': registros,
+            'remocoes': remocoes,
+            'arquivo': os.path.basename(destino),
+            'aplicado': bool(aplicar_em),
+            'tabelas_sem_rastreio': sem_rastreio,
+        }
+
+    def _aplicar_delta(self, conn: sqlite3.Connection, caminho: str) -> Dict[str, int]:
+        registros = remocoes = 0
+        tabela, sql, indices, pendentes = None, None, [], []
+
+        def _descarregar():
+            if pendentes:
+                conn.executemany(sql, pendentes)
+                pendentes.clear()
+
+        with gzip.open(caminho, 'rt', encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                item = json.loads(linha)
+                if isinstance(item, list):
+                    pendentes.append(tuple(_valor_restauravel(item[i]) for i in indices))
+                    registros += 1
+                    if len(pendentes) >= self.lote:
+                        _descarregar()
+                elif '_tabela' in item:
+                    _descarregar()
+                    tabela = item['_tabela']
+                    existentes = {c[1] for c in conn.execute(f'PRAGMA table_info("{tabela}")').fetchall()}
+                    colunas = [c for c in item['colunas'] if c in existentes]
+                    indices = [item['colunas'].index(c) for c in colunas]
+                    nomes = ', '.join(f'"{c}"' for c in colunas)
+                    sql = (
+                        f'INSERT OR REPLACE INTO "{tabela}" ({nomes}) '
+                        f"VALUES ({', '.join('?' for _ in colunas)})"
+                    )
+                elif '_remocoes' in item:
+                    _descarregar()
+                    if 'chaves' in item:
+                        filtro, valores = self._filtro_chaves(item['pk'], item['chaves'])
+                        quantidade = len(item['chaves'])
+                    else:
+                        # Deltas anteriores ao rastreio por chave primária (só id)
+                        filtro, valores = 'id IN (SELECT value FROM json_each(?))', json.dumps(item['ids'])
+                        quantidade = len(item['ids'])
+                    conn.execute(f'DELETE FROM "{item["_remocoes"]}" WHERE {filtro}', (valores,))
+                    remocoes += quantidade
+                elif '_fim' in item:
+                    _descarregar()
+                    return {'registros': registros, 'remocoes': remocoes}
+        raise ValueError(f'Delta truncado: {os.path.basename(caminho)}')
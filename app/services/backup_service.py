@@ -0,0 +1,751 @@
+"""
+Serviço de Backup
+
+Exportação em streaming do banco SQLite, sem montar o backup inteiro em memória:
+- JSON no formato legado ({"metadata": ..., "tabelas": {...}}), gerado por partes
+- NDJSON (uma linha por registro, com cabeçalho de colunas por tabela)
+- compressão gzip on-the-fly para qualquer um dos formatos
+- snapshot binário via API de backup online do SQLite (Connection.backup)
+- exportações em background gravando no volume de uploads, com progresso
+
+Verificação e restauração também leem o arquivo em streaming (JSON legado,
+NDJSON, com ou sem gzip) e gravam em lotes numa única transação.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .jobs import RegistroTarefas
+
+
+BACKUP_VERSAO_JSON = '1.0'
+BACKUP_VERSAO_NDJSON = '2.0'
+FORMATOS = ('json', 'ndjson', 'snapshot')
+
+# Callback de progresso: (tabela, registros_da_tabela, registros_totais)
+Progresso = Callable[[str, int, int], None]
+
+
+def _json_default(valor: Any):
+    """Serializa BLOBs como {"__bytes__": base64}; o restore faz o inverso."""
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return {'__bytes__': base64.b64encode(bytes(valor)).decode('ascii')}
+    return str(valor)
+
+
+def _dumps(valor: Any) -> str:
+    return json.dumps(valor, ensure_ascii=False, default=_json_default, separators=(',', ':'))
+
+
+def nome_arquivo_backup(formato: str, comprimir: bool, timestamp: Optional[str] = None) -> str:
+    timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+    extensao = {'json': 'json', 'ndjson': 'ndjson', 'snapshot': 'db'}[formato]
+    return f"jurispocket_backup_{timestamp}.{extensao}{'.gz' if comprimir else ''}"
+
+
+def abrir_conexao_leitura(database_path: str) -> sqlite3.Connection:
+    """Conexão própria para o backup, fora da conexão da requisição."""
+    conn = sqlite3.connect(database_path, check_same_thread=False)
+    conn.row_factory = None
+    return conn
+
+
+def contar_registros(conn: sqlite3.Connection, tabelas: Iterable[str]) -> Dict[str, int]:
+    contagens = {}
+    for tabela in tabelas:
+        try:
+            contagens[tabela] = conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+        except sqlite3.OperationalError:
+            contagens[tabela] = 0
+    return contagens
+
+
+def _iterar_linhas_tabela(conn: sqlite3.Connection, tabela: str, lote: int):
+    """Retorna (colunas, gerador de lotes de linhas) ou levanta OperationalError."""
+    cursor = conn.execute(f'SELECT * FROM {tabela}')
+    colunas = [descricao[0] for descricao in cursor.description]
+
+    def lotes():
+        while True:
+            linhas = cursor.fetchmany(lote)
+            if not linhas:
+                return
+            yield linhas
+
+    return colunas, lotes()
+
+
+def iterar_backup_ndjson(
+    database_path: str,
+    tabelas: List[str],
+    metadata: Dict[str, Any],
+    lote: int = 500,
+    progresso: Optional[Progresso] = None,
+) -> Iterator[bytes]:
+    """
+    Gera o backup NDJSON em blocos de bytes.
+
+    Linhas: {"_backup": metadata} / {"_tabela": nome, "colunas": [...]} /
+    [valores...] por registro / {"_fim_tabela": nome, "registros": n} /
+    {"_fim": {"total_registros": n}}. Uma transação de leitura garante um
+    retrato consistente entre tabelas.
+    """
+    conn = abrir_conexao_leitura(database_path)
+    try:
+        conn.execute('BEGIN')
+        cabecalho = dict(metadata, versao=BACKUP_VERSAO_NDJSON, formato='ndjson', tabelas=list(tabelas))
+        yield (_dumps({'_backup': cabecalho}) + '\n').encode('utf-8')
+        total = 0
+        for tabela in tabelas:
+            try:
+                colunas, lotes = _iterar_linhas_tabela(conn, tabela, lote)
+            except sqlite3.OperationalError as erro:
+                yield (_dumps({'_tabela': tabela, 'erro': str(erro)}) + '\n').encode('utf-8')
+                continue
+            yield (_dumps({'_tabela': tabela, 'colunas': colunas}) + '\n').encode('utf-8')
+            registros = 0
+            for linhas in lotes:
+                yield ''.join(_dumps(list(linha)) + '\n' for linha in linhas).encode('utf-8')
+                registros += len(linhas)
+                total += len(linhas)
+                if progresso:
+                    progresso(tabela, registros, total)
+            yield (_dumps({'_fim_tabela': tabela, 'registros': registros}) + '\n').encode('utf-8')
+        yield (_dumps({'_fim': {'total_registros': total}}) + '\n').encode('utf-8')
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def iterar_backup_json(
+    database_path: str,
+    tabelas: List[str],
+    metadata: Dict[str, Any],
+    lote: int = 500,
+    progresso: Optional[Progresso] = None,
+) -> Iterator[bytes]:
+    """Gera o JSON no formato legado (aceito pela tela de restauração) por partes."""
+    conn = abrir_conexao_leitura(database_path)
+    try:
+        conn.execute('BEGIN')
+        cabecalho = dict(metadata, versao=BACKUP_VERSAO_JSON)
+        yield ('{"metadata":' + _dumps(cabecalho) + ',"tabelas":{').encode('utf-8')
+        total = 0
+        for indice, tabela in enumerate(tabelas):
+            prefixo = (',' if indice else '') + _dumps(tabela) + ':'
+            try:
+                colunas, lotes = _iterar_linhas_tabela(conn, tabela, lote)
+            except sqlite3.OperationalError as erro:
+                yield (prefixo + _dumps({'erro': str(erro)})).encode('utf-8')
+                continue
+            yield (prefixo + '[').encode('utf-8')
+            registros = 0
+            for linhas in lotes:
+                bloco = ','.join(_dumps(dict(zip(colunas, linha))) for linha in linhas)
+                yield ((',' if registros else '') + bloco).encode('utf-8')
+                registros += len(linhas)
+                total += len(linhas)
+                if progresso:
+                    progresso(tabela, registros, total)
+            yield b']'
+        yield b'}}'
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def comprimir_gzip(blocos: Iterable[bytes], nivel: int = 6, tamanho_minimo: int = 64 * 1024) -> Iterator[bytes]:
+    """Comprime um fluxo de blocos em gzip, emitindo saída a cada ~64KB de entrada."""
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+    pendente: List[bytes] = []
+    acumulado = 0
+    for bloco in blocos:
+        pendente.append(bloco)
+        acumulado += len(bloco)
+        if acumulado >= tamanho_minimo:
+            saida = compressor.compress(b''.join(pendente))
+            pendente, acumulado = [], 0
+            if saida:
+                yield saida
+    if pendente:
+        saida = compressor.compress(b''.join(pendente))
+        if saida:
+            yield saida
+    yield compressor.flush()
+
+
+def criar_snapshot_sqlite(
+    database_path: str,
+    destino: str,
+    paginas_por_passo: int = 1024,
+    progresso: Optional[Callable[[int, int], None]] = None,
+    comprimir: bool = False,
+) -> str:
+    """
+    Copia o banco com a API de backup online do SQLite (fidelidade total:
+    schema, índices, triggers). Escritas concorrentes continuam liberadas entre
+    os passos. Com comprimir=True grava `destino` em gzip.
+    """
+    alvo = destino + '.tmp' if comprimir else destino
+    origem = sqlite3.connect(database_path)
+    copia = sqlite3.connect(alvo)
+    try:
+        def _progresso(status, restantes, total):
+            if progresso:
+                progresso(total - restantes, total)
+
+        origem.backup(copia, pages=max(1, paginas_por_passo), progress=_progresso)
+    finally:
+        copia.close()
+        origem.close()
+
+    if comprimir:
+        with open(alvo, 'rb') as entrada, gzip.open(destino, 'wb', compresslevel=6) as saida:
+            shutil.copyfileobj(entrada, saida, 1024 * 1024)
+        os.remove(alvo)
+    return destino
+
+
+def iterar_arquivo(caminho: str, remover_ao_final: bool = False, tamanho_bloco: int = 256 * 1024) -> Iterator[bytes]:
+    try:
+        with open(caminho, 'rb') as arquivo:
+            while True:
+                bloco = arquivo.read(tamanho_bloco)
+                if not bloco:
+                    break
+                yield bloco
+    finally:
+        if remover_ao_final:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+
+def exportar_para_arquivo(
+    database_path: str,
+    destino: str,
+    formato: str,
+    comprimir: bool,
+    tabelas: List[str],
+    metadata: Dict[str, Any],
+    lote: int = 500,
+    atualizar: Optional[Callable[..., None]] = None,
+) -> Dict[str, Any]:
+    """Grava o backup em `destino` (via arquivo .parcial renomeado ao final)."""
+    atualizar = atualizar or (lambda **_: None)
+    parcial = destino + '.parcial'
+    try:
+        if formato == 'snapshot':
+            def _progresso_paginas(copiadas, total):
+                atualizar(
+                    tabela_atual='paginas',
+                    registros=copiadas,
+                    total_estimado=total,
+                    percentual=round(copiadas * 100.0 / total, 1) if total else 100.0,
+                )
+
+            criar_snapshot_sqlite(database_path, parcial, progresso=_progresso_paginas, comprimir=comprimir)
+        else:
+            conn = abrir_conexao_leitura(database_path)
+            try:
+                total_estimado = sum(contar_registros(conn, tabelas).values())
+            finally:
+                conn.close()
+            atualizar(total_estimado=total_estimado)
+
+            def _progresso(tabela, _registros_tabela, total):
+                atualizar(
+                    tabela_atual=tabela,
+                    registros=total,
+                    percentual=round(min(total * 100.0 / total_estimado, 99.9), 1) if total_estimado else 0.0,
+                )
+
+            gerador = iterar_backup_ndjson if formato == 'ndjson' else iterar_backup_json
+            blocos = gerador(database_path, tabelas, metadata, lote=lote, progresso=_progresso)
+            if comprimir:
+                blocos = comprimir_gzip(blocos)
+            escritos = 0
+            with open(parcial, 'wb') as saida:
+                for bloco in blocos:
+                    saida.write(bloco)
+                    escritos += len(bloco)
+                    atualizar(bytes=escritos)
+        os.replace(parcial, destino)
+    except Exception:
+        try:
+            os.remove(parcial)
+        except OSError:
+            pass
+        raise
+    tamanho = os.path.getsize(destino)
+    atualizar(bytes=tamanho)
+    return {'arquivo': os.path.basename(destino), 'bytes': tamanho}
+
+
+class BackupExportJobs(RegistroTarefas):
+    """
+    Exportações em background gravadas em `diretorio`.
+
+    O estado de cada tarefa fica no mesmo diretório dos arquivos, para o
+    download funcionar em qualquer worker.
+    """
+
+    def __init__(self, database_path_fn: Callable[[], str], diretorio_fn: Callable[[], str], lote: int = 500):
+        super().__init__(diretorio_fn=diretorio_fn)
+        self._database_path_fn = database_path_fn
+        self.lote = lote
+
+    def iniciar(self, formato: str, comprimir: bool, tabelas: List[str], metadata: Dict[str, Any]) -> Dict[str, Any]:
+        if formato not in FORMATOS:
+            raise ValueError(f'Formato inválido: {formato}')
+        job_id = secrets.token_hex(8)
+        arquivo = nome_arquivo_backup(formato, comprimir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job_id[:6]}")
+        diretorio = self._diretorio_fn()
+        database_path = self._database_path_fn()
+
+        def _executar(atualizar):
+            os.makedirs(diretorio, exist_ok=True)
+            return exportar_para_arquivo(
+                database_path,
+                os.path.join(diretorio, arquivo),
+                formato,
+                comprimir,
+                list(tabelas),
+                dict(metadata),
+                lote=self.lote,
+                atualizar=atualizar,
+            )
+
+        return self.iniciar_tarefa(
+            {
+                'id': job_id,
+                'tipo': 'exportacao',
+                'formato': formato,
+                'gzip': comprimir,
+                'arquivo': arquivo,
+                'tabela_atual': None,
+                'registros': 0,
+                'total_estimado': None,
+                'bytes': 0,
+            },
+            _executar,
+        )
+
+    def caminho_arquivo(self, job_id: str) -> Optional[str]:
+        job = self.obter(job_id)
+        if not job or job['status'] != 'concluido' or job.get('tipo') != 'exportacao':
+            return None
+        caminho = os.path.join(self._diretorio_fn(), job['arquivo'])
+        return caminho if os.path.exists(caminho) else None
+
+
+# ============================================================================
+# LEITURA EM STREAMING (VERIFICAÇÃO E RESTAURAÇÃO)
+# ============================================================================
+
+def abrir_arquivo_backup(caminho: str):
+    """Abre o backup como texto, detectando gzip pelos bytes mágicos."""
+    with open(caminho, 'rb') as arquivo:
+        gz = arquivo.read(2) == b'\x1f\x8b'
+    if gz:
+        return gzip.open(caminho, 'rt', encoding='utf-8')
+    return open(caminho, 'r', encoding='utf-8-sig')
+
+
+class _LeitorJSONIncremental:
+    """Percorre o JSON legado por partes: só um registro fica em memória por vez."""
+
+    ESPACOS = ' \t\r\n'
+
+    def __init__(self, arquivo, tamanho_bloco: int = 256 * 1024):
+        self.arquivo = arquivo
+        self.tamanho_bloco = tamanho_bloco
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _encher(self) -> bool:
+        if self.eof:
+            return False
+        bloco = self.arquivo.read(self.tamanho_bloco)
+        if not bloco:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + bloco
+        self.pos = 0
+        return True
+
+    def espiar(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.ESPACOS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._encher():
+                return ''
+
+    def consumir(self, caractere: str):
+        if self.espiar() != caractere:
+            raise ValueError(f"JSON inválido: esperado '{caractere}' na posição {self.pos}")
+        self.pos += 1
+
+    def consumir_virgula(self):
+        if self.espiar() == ',':
+            self.pos += 1
+
+    def valor(self) -> Any:
+        self.espiar()
+        while True:
+            try:
+                valor, fim = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._encher():
+                    raise
+                continue
+            # Número no fim do buffer pode estar cortado: lê mais e decodifica de novo
+            if fim == len(self.buf) and not self.eof and self._encher():
+                continue
+            self.pos = fim
+            return valor
+
+
+def _eventos_json_legado(arquivo) -> Iterator[tuple]:
+    leitor = _LeitorJSONIncremental(arquivo)
+    leitor.consumir('{')
+    while leitor.espiar() not in ('}', ''):
+        chave = leitor.valor()
+        leitor.consumir(':')
+        if chave == 'tabelas':
+            leitor.consumir('{')
+            while leitor.espiar() not in ('}', ''):
+                tabela = leitor.valor()
+                leitor.consumir(':')
+                if leitor.espiar() == '[':
+                    leitor.consumir('[')
+                    yield ('tabela', tabela, None)
+                    registros = 0
+                    while leitor.espiar() not in (']', ''):
+                        registro = leitor.valor()
+                        if not isinstance(registro, dict):
+                            raise ValueError(f'Registro inválido em {tabela}')
+                        registros += 1
+                        yield ('registro', tabela, registro)
+                        leitor.consumir_virgula()
+                    leitor.consumir(']')
+                    yield ('fim_tabela', tabela, None)
+                else:
+                    informacao = leitor.valor()
+                    yield ('erro_tabela', tabela, informacao)
+                leitor.consumir_virgula()
+            leitor.consumir('}')
+        else:
+            valor = leitor.valor()
+            if chave == 'metadata':
+                yield ('metadata', valor)
+        leitor.consumir_virgula()
+    leitor.consumir('}')
+    yield ('fim', None)
+
+
+def _eventos_ndjson(arquivo) -> Iterator[tuple]:
+    tabela = None
+    colunas: List[str] = []
+    for numero_linha, linha in enumerate(arquivo, start=1):
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            item = json.loads(linha)
+        except json.JSONDecodeError:
+            raise ValueError(f'NDJSON inválido na linha {numero_linha}')
+        if isinstance(item, list):
+            if tabela is None:
+                raise ValueError(f'Registro fora de tabela na linha {numero_linha}')
+            yield ('registro', tabela, dict(zip(colunas, item)))
+        elif '_backup' in item:
+            yield ('metadata', item['_backup'])
+        elif '_tabela' in item:
+            if 'erro' in item:
+                yield ('erro_tabela', item['_tabela'], {'erro': item['erro']})
+                tabela = None
+                continue
+            tabela, colunas = item['_tabela'], list(item.get('colunas') or [])
+            yield ('tabela', tabela, None)
+        elif '_fim_tabela' in item:
+            yield ('fim_tabela', item['_fim_tabela'], item.get('registros'))
+            tabela = None
+        elif '_fim' in item:
+            yield ('fim', (item['_fim'] or {}).get('total_registros'))
+
+
+def iterar_eventos_backup(caminho: str) -> Iterator[tuple]:
+    """
+    Eventos normalizados de um backup JSON ou NDJSON (gzip ou não):
+    ('metadata', dict), ('tabela', nome, None), ('registro', nome, dict),
+    ('fim_tabela', nome, total_declarado), ('erro_tabela', nome, info) e
+    ('fim', total_declarado).
+    """
+    with abrir_arquivo_backup(caminho) as arquivo:
+        inicio = arquivo.read(64).lstrip()
+    ndjson = inicio.startswith('{"_backup"')
+    with abrir_arquivo_backup(caminho) as arquivo:
+        yield from (_eventos_ndjson(arquivo) if ndjson else _eventos_json_legado(arquivo))
+
+
+def detectar_formato_backup(caminho: str) -> str:
+    with open(caminho, 'rb') as arquivo:
+        if arquivo.read(16).startswith(b'SQLite format 3'):
+            return 'snapshot'
+    with abrir_arquivo_backup(caminho) as arquivo:
+        return 'ndjson' if arquivo.read(64).lstrip().startswith('{"_backup"') else 'json'
+
+
+def sha256_arquivo(caminho: str) -> str:
+    digest = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def verificar_arquivo_backup(caminho: str) -> Dict[str, Any]:
+    """
+    Verifica o backup numa passada em streaming. Levanta ValueError se a
+    estrutura for inválida ou se o arquivo NDJSON estiver truncado.
+    """
+    formato = detectar_formato_backup(caminho)
+    if formato == 'snapshot':
+        raise ValueError('Snapshot SQLite não é restaurável por esta tela; substitua o arquivo do banco')
+
+    metadata: Optional[Dict[str, Any]] = None
+    estatisticas: Dict[str, int] = {}
+    avisos: List[str] = []
+    total = 0
+    fim_encontrado = False
+    for evento in iterar_eventos_backup(caminho):
+        tipo = evento[0]
+        if tipo == 'metadata':
+            metadata = evento[1] or {}
+        elif tipo == 'tabela':
+            estatisticas.setdefault(evento[1], 0)
+        elif tipo == 'registro':
+            estatisticas[evento[1]] += 1
+            total += 1
+        elif tipo == 'fim_tabela' and evento[2] is not None and evento[2] != estatisticas.get(evento[1]):
+            raise ValueError(f'Tabela {evento[1]} com {estatisticas.get(evento[1])} registros; esperado {evento[2]}')
+        elif tipo == 'erro_tabela':
+            avisos.append(f'Tabela {evento[1]} não exportada: {(evento[2] or {}).get("erro")}')
+        elif tipo == 'fim':
+            fim_encontrado = True
+            if evento[1] is not None and evento[1] != total:
+                raise ValueError(f'Total de registros {total} difere do declarado ({evento[1]})')
+
+    if metadata is None:
+        raise ValueError('Arquivo de backup inválido - estrutura incorreta')
+    if formato == 'ndjson' and not fim_encontrado:
+        raise ValueError('Arquivo de backup truncado - marcador de fim ausente')
+
+    return {
+        'valido': True,
+        'formato': formato,
+        'versao': metadata.get('versao', 'desconhecida'),
+        'data_exportacao': metadata.get('data_exportacao'),
+        'exportado_por': metadata.get('exportado_por'),
+        'estatisticas': estatisticas,
+        'total_registros': total,
+        'tamanho_bytes': os.path.getsize(caminho),
+        'sha256': sha256_arquivo(caminho),
+        'avisos': avisos or None,
+    }
+
+
+# ============================================================================
+# RESTAURAÇÃO EM LOTE
+# ============================================================================
+
+def _valor_restauravel(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        if set(valor) == {'__bytes__'}:
+            return base64.b64decode(valor['__bytes__'])
+        return json.dumps(valor, ensure_ascii=False)
+    if isinstance(valor, list):
+        return json.dumps(valor, ensure_ascii=False)
+    return valor
+
+
+def _gravar_lote(conn: sqlite3.Connection, tabela: str, colunas: tuple, linhas: List[tuple], modo: str, resultado: Dict[str, Any]):
+    nomes = ', '.join(colunas)
+    marcadores = ', '.join('?' for _ in colunas)
+    existentes = 0
+    upsert = modo == 'merge' and 'id' in colunas and len(colunas) > 1
+    if upsert:
+        indice_id = colunas.index('id')
+        existentes = conn.execute(
+            f'SELECT COUNT(*) FROM {tabela} WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps([linha[indice_id] for linha in linhas], default=str),),
+        ).fetchone()[0]
+        atualizacoes = ', '.join(f'{coluna} = excluded.{coluna}' for coluna in colunas if coluna != 'id')
+        sql = f'INSERT INTO {tabela} ({nomes}) VALUES ({marcadores}) ON CONFLICT(id) DO UPDATE SET {atualizacoes}'
+    else:
+        sql = f'INSERT OR IGNORE INTO {tabela} ({nomes}) VALUES ({marcadores})'
+
+    conn.execute('SAVEPOINT lote_restauracao')
+    try:
+        # rowcount do executemany soma só as linhas do comando (sem os triggers)
+        alterados = conn.executemany(sql, linhas).rowcount
+        conn.execute('RELEASE lote_restauracao')
+        if upsert:
+            resultado['atualizados'] += existentes
+            resultado['importados'] += max(0, alterados - existentes)
+        else:
+            resultado['importados'] += alterados
+        return
+    except sqlite3.Error:
+        conn.execute('ROLLBACK TO lote_restauracao')
+        conn.execute('RELEASE lote_restauracao')
+
+    # Lote com registro inválido: isola linha a linha para contar as falhas
+    for linha in linhas:
+        try:
+            existia = upsert and conn.execute(
+                f'SELECT 1 FROM {tabela} WHERE id = ?', (linha[colunas.index('id')],)
+            ).fetchone() is not None
+            if conn.execute(sql, linha).rowcount > 0:
+                resultado['atualizados' if existia else 'importados'] += 1
+        except sqlite3.Error as erro:
+            resultado['falhos'] += 1
+            if len(resultado['exemplos_falhas']) < 5:
+                resultado['exemplos_falhas'].append(str(erro))
+
+
+def restaurar_arquivo_backup(
+    conn: sqlite3.Connection,
+    caminho: str,
+    tabelas_permitidas: List[str],
+    tabelas_selecionadas: Optional[List[str]] = None,
+    modo: str = 'merge',
+    lote: int = 1000,
+    tabelas_preservadas: Iterable[str] = ('planos', 'configuracoes_globais'),
+    total_estimado: Optional[int] = None,
+    progresso: Optional[Callable[..., None]] = None,
+    antes_commit: Optional[Callable[[sqlite3.Connection, set], None]] = None,
+    estrito: bool = False,
+) -> Dict[str, Any]:
+    """
+    Restaura o backup lendo o arquivo em streaming, com executemany em lotes
+    dentro de uma única transação. As chaves estrangeiras ficam desligadas
+    durante a carga e são conferidas uma vez ao final (PRAGMA
+    foreign_key_check). Com estrito=True, violações desfazem tudo.
+
+    Em modo replace cada tabela é limpa ao aparecer no arquivo (exceto as
+    preservadas). Levanta exceção (após rollback) em erro estrutural.
+    """
+    selecionadas = set(tabelas_selecionadas or tabelas_permitidas) & set(tabelas_permitidas)
+    preservadas = set(tabelas_preservadas)
+    resultados: Dict[str, Dict[str, Any]] = {}
+    erros: List[str] = []
+    colunas_destino: Dict[str, List[str]] = {}
+    pendentes: Dict[tuple, List[tuple]] = {}
+    processados = 0
+    atualizar = progresso or (lambda **_: None)
+
+    def _descarregar(tabela: str):
+        for chave in [chave for chave in pendentes if chave[0] == tabela]:
+            _gravar_lote(conn, tabela, chave[1], pendentes.pop(chave), modo, resultados[tabela])
+
+    isolation_original = conn.isolation_level
+    fks_originais = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+    conn.isolation_level = None
+    conn.execute('PRAGMA foreign_keys = OFF')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for evento in iterar_eventos_backup(caminho):
+            tipo = evento[0]
+            if tipo == 'tabela':
+                tabela = evento[1]
+                if tabela not in selecionadas:
+                    continue
+                info = conn.execute(f'PRAGMA table_info({tabela})').fetchall()
+                colunas_destino[tabela] = [coluna[1] for coluna in info]
+                resultados[tabela] = {
+                    'status': 'sucesso', 'importados': 0, 'atualizados': 0, 'falhos': 0, 'exemplos_falhas': [],
+                }
+                if modo == 'replace' and tabela not in preservadas:
+                    try:
+                        conn.execute(f'DELETE FROM {tabela}')
+                        try:
+                            conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (tabela,))
+                        except sqlite3.OperationalError:
+                            # sqlite_sequence pode nao existir dependendo do schema
+                            pass
+                    except sqlite3.Error as erro:
+                        erros.append(f'Erro ao limpar {tabela}: {erro}')
+                atualizar(tabela_atual=tabela)
+            elif tipo == 'registro':
+                tabela, registro = evento[1], evento[2]
+                if tabela not in resultados:
+                    continue
+                colunas = tuple(coluna for coluna in colunas_destino[tabela] if coluna in registro)
+                if not colunas:
+                    continue
+                chave = (tabela, colunas)
+                pendentes.setdefault(chave, []).append(tuple(_valor_restauravel(registro[c]) for c in colunas))
+                if len(pendentes[chave]) >= lote:
+                    _gravar_lote(conn, tabela, colunas, pendentes.pop(chave), modo, resultados[tabela])
+                processados += 1
+                if processados % lote == 0:
+                    atualizar(
+                        registros=processados,
+                        percentual=round(min(processados * 100.0 / total_estimado, 99.0), 1) if total_estimado else 0.0,
+                    )
+            elif tipo == 'fim_tabela' and evento[1] in resultados:
+                _descarregar(evento[1])
+                if not any(resultados[evento[1]][campo] for campo in ('importados', 'atualizados', 'falhos')):
+                    resultados[evento[1]].update({'status': 'ignorado', 'mensagem': 'Sem dados para restaurar'})
+            elif tipo == 'erro_tabela' and evento[1] in selecionadas:
+                erros.append(f'Tabela {evento[1]} ausente no backup: {(evento[2] or {}).get("erro")}')
+        for tabela in list(resultados):
+            _descarregar(tabela)
+
+        violacoes: Dict[str, int] = {}
+        exemplos_violacoes: List[Dict[str, Any]] = []
+        for tabela in resultados:
+            for linha in conn.execute(f'PRAGMA foreign_key_check({tabela})').fetchall():
+                violacoes[tabela] = violacoes.get(tabela, 0) + 1
+                if len(exemplos_violacoes) < 20:
+                    exemplos_violacoes.append({'tabela': linha[0], 'rowid': linha[1], 'referencia': linha[2]})
+        if violacoes and estrito:
+            raise ValueError(f'Violações de chave estrangeira: {violacoes}')
+
+        if antes_commit:
+            antes_commit(conn, set(resultados))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.execute(f'PRAGMA foreign_keys = {"ON" if fks_originais else "OFF"}')
+        conn.isolation_level = isolation_original
+
+    for resultado in resultados.values():
+        if not resultado['exemplos_falhas']:
+            resultado.pop('exemplos_falhas')
+    atualizar(registros=processados, percentual=100.0)
+    return {
+        'resultados': resultados,
+        'erros': erros or None,
+        'total_registros': processados,
+        'violacoes_fk': violacoes or None,
+        'exemplos_violacoes_fk': exemplos_violacoes or None,
+    }
@@ -4,23 +4,286 @@ Integração com SMTP (Gmail, Outlook, etc) ou serviços como SendGrid
 """
 
 import os
+import string
 import smtplib
 import ssl
 import socket
+import threading
+import queue
+import time
+import atexit
 import requests
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 from datetime import datetime
 import sqlite3
 
 
+# Limite de mensagens por chamada na API batch do Resend
+RESEND_BATCH_LIMIT = 100
+
+
+# Templates HTML dos emails, compilados uma única vez no carregamento do módulo.
+# O corpo base depende apenas de APP_URL e do ano corrente; a versão com esses
+# campos já aplicados fica em cache e cada envio só substitui título/conteúdo.
+_TEMPLATE_ACAO = string.Template('''
+        <tr>
+            <td style="padding: 20px 30px; text-align: center;">
+                <a href="$acao_link" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: #ffffff; padding: 12px 30px; text-decoration: none; border-radius: 25px; display: inline-block; font-weight: bold;">
+                    $acao_texto
+                </a>
+            </td>
+        </tr>
+        ''')
+
+_TEMPLATE_BASE = string.Template('''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>$titulo</title>
+</head>
+<body style="margin: 0; padding: 0; background-color: #f4f4f4; font-family: Arial, sans-serif;">
+    <table width="100%" cellpadding="0" cellspacing="0" style="background-color: #f4f4f4;">
+        <tr>
+            <td align="center" style="padding: 20px 0;">
+                <table width="600" cellpadding="0" cellspacing="0" style="background-color: #ffffff; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                    <!-- Header -->
+                    <tr>
+                        <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center; border-radius: 10px 10px 0 0;">
+                            <h1 style="color: #ffffff; margin: 0; font-size: 24px;">⚖️ JurisGestão</h1>
+                        </td>
+                    </tr>
+                    
+                    <!-- Título -->
+                    <tr>
+                        <td style="padding: 30px 30px 20px 30px;">
+                            <h2 style="color: #333333; margin: 0; font-size: 20px;">$titulo</h2>
+                        </td>
+                    </tr>
+                    
+                    <!-- Conteúdo -->
+                    <tr>
+                        <td style="padding: 0 30px 20px 30px; color: #555555; font-size: 16px; line-height: 1.6;">
+                            $conteudo
+                        </td>
+                    </tr>
+                    
+                    $acao_html
+                    
+                    <!-- Footer -->
+                    <tr>
+                        <td style="padding: 30px; text-align: center; border-top: 1px solid #eeeeee; color: #999999; font-size: 12px;">
+                            <p>Este é um email automático do sistema JurisGestão.</p>
+                            <p>© $ano_atual JurisGestão. Todos os direitos reservados.</p>
+                            <p><a href="$app_url" style="color: #667eea; text-decoration: none;">Acessar Sistema</a></p>
+                        </td>
+                    </tr>
+                </table>
+            </td>
+        </tr>
+    </table>
+</body>
+</html>''')
+
+_template_base_cache: Dict[tuple, string.Template] = {}
+_template_base_lock = threading.Lock()
+
+
+def _template_base_compilado(app_url: str, ano_atual: int) -> string.Template:
+    """Retorna o template base com APP_URL e ano já aplicados (cacheado)"""
+    chave = (app_url, ano_atual)
+    template = _template_base_cache.get(chave)
+    if template is None:
+        with _template_base_lock:
+            template = _template_base_cache.get(chave)
+            if template is None:
+                # '$' literal em APP_URL não pode virar placeholder na segunda etapa
+                parcial = _TEMPLATE_BASE.safe_substitute(
+                    app_url=str(app_url).replace('$', '$$'),
+                    ano_atual=ano_atual,
+                )
+                template = string.Template(parcial)
+                _template_base_cache.clear()
+                _template_base_cache[chave] = template
+    return template
+
+
 def _parse_bool(value: Any, default: bool = False) -> bool:
     if value is None:
         return default
     return str(value).strip().lower() in {'1', 'true', 'yes', 'on', 'sim'}
 
 
+class SMTPSessionPool:
+    """Reaproveita conexões SMTP autenticadas entre envios.
+
+    Conexões ociosas expiram após idle_timeout segundos. A chave identifica a
+    configuração (host/porta/usuário/senha): se o SMTP for reconfigurado, as
+    conexões antigas são descartadas.
+    """
+
+    def __init__(self, factory: Callable[[], smtplib.SMTP], idle_timeout: float = 60.0, max_idle: int = 2):
+        self._factory = factory
+        self.idle_timeout = idle_timeout
+        self.max_idle = max(0, max_idle)
+        self._idle: List[tuple] = []  # (chave, conexão, último uso)
+        self._lock = threading.Lock()
+        self.stats = {'created': 0, 'reused': 0, 'expired': 0}
+
+    def acquire(self, key: tuple) -> smtplib.SMTP:
+        """Retorna uma conexão ociosa válida ou abre uma nova."""
+        now = time.monotonic()
+        candidate = None
+        stale = []
+        with self._lock:
+            while self._idle and candidate is None:
+                entry_key, server, last_used = self._idle.pop()
+                if entry_key == key and now - last_used < self.idle_timeout:
+                    candidate = server
+                else:
+                    stale.append(server)
+            self.stats['expired'] += len(stale)
+
+        for server in stale:
+            self._close(server)
+
+        if candidate is not None:
+            try:
+                if candidate.noop()[0] == 250:
+                    with self._lock:
+                        self.stats['reused'] += 1
+                    return candidate
+            except Exception:
+                pass
+            self._close(candidate)
+
+        server = self._factory()
+        with self._lock:
+            self.stats['created'] += 1
+        return server
+
+    def release(self, key: tuple, server: smtplib.SMTP) -> None:
+        """Devolve a conexão para reuso (ou fecha se o pool estiver cheio)."""
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((key, server, time.monotonic()))
+                return
+        self._close(server)
+
+    def discard(self, server: Optional[smtplib.SMTP]) -> None:
+        if server is not None:
+            self._close(server)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, server, _ in idle:
+            self._close(server)
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+
+class EmailDeliveryQueue:
+    """Fila de envio em background.
+
+    Tira o envio de email do caminho da requisição/monitoramento: os lotes
+    enfileirados em uma janela curta são enviados juntos, reaproveitando a
+    mesma sessão SMTP (ou a API batch do Resend).
+    """
+
+    def __init__(self, service: 'EmailService', max_size: int = 1000, coalesce_seconds: float = 0.5):
+        self.service = service
+        self.coalesce_seconds = max(0.0, coalesce_seconds)
+        self._queue: 'queue.Queue[List[Dict[str, Any]]]' = queue.Queue(maxsize=max(1, max_size))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = threading.Event()
+        self.stats = {'queued': 0, 'rejected': 0, 'sent': 0, 'failed': 0}
+
+    def submit(self, messages: List[Dict[str, Any]]) -> bool:
+        """Enfileira mensagens ({'to', 'subject', 'html', 'text'}); False se a fila estiver cheia."""
+        if not messages:
+            return True
+        self._ensure_running()
+        try:
+            self._queue.put_nowait(list(messages))
+        except queue.Full:
+            with self._lock:
+                self.stats['rejected'] += len(messages)
+            return False
+        with self._lock:
+            self.stats['queued'] += len(messages)
+        return True
+
+    def _ensure_running(self) -> None:
+        # Threads não sobrevivem ao fork dos workers do gunicorn: inicia sob demanda por processo
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='email-delivery', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                messages = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.coalesce_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    messages.extend(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._deliver(messages)
+
+    def _deliver(self, messages: List[Dict[str, Any]]) -> None:
+        try:
+            results = self.service.send_bulk(messages)
+        except Exception as e:
+            print(f"⚠️  Erro no envio de emails em lote: {e}")
+            with self._lock:
+                self.stats['failed'] += len(messages)
+            return
+
+        sent = sum(1 for r in results if r.get('success'))
+        with self._lock:
+            self.stats['sent'] += sent
+            self.stats['failed'] += len(results) - sent
+        for result in results:
+            if not result.get('success'):
+                print(f"⚠️  Falha ao enviar email para {result.get('email')}: {result.get('error')}")
+
+    def stop(self, timeout: float = 15.0) -> None:
+        """Drena a fila antes de encerrar o processo."""
+        self._stopping.set()
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=timeout)
+        self.service.smtp_pool.close_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        return {**stats, 'pending': self._queue.qsize()}
+
+
 class EmailService:
     """Serviço para envio de notificações por email"""
     
@@ -39,6 +302,18 @@ class EmailService:
         self.resend_api_url = os.getenv('RESEND_API_URL', 'https://api.resend.com/emails').strip()
         self.resend_from = os.getenv('RESEND_FROM', '').strip()
         self.resend_timeout_seconds = float(os.getenv('RESEND_TIMEOUT_SECONDS', '12'))
+        self.resend_batch_api_url = os.getenv('RESEND_BATCH_API_URL', '').strip()
+
+        # Conexões SMTP reaproveitadas e fila de envio em background
+        self.smtp_pool = SMTPSessionPool(
+            self._create_smtp_connection,
+            idle_timeout=float(os.getenv('SMTP_POOL_IDLE_SECONDS', '60')),
+            max_idle=int(os.getenv('SMTP_POOL_MAX_IDLE', '2')),
+        )
+        self.delivery_queue = EmailDeliveryQueue(
+            self,
+            max_size=int(os.getenv('EMAIL_QUEUE_MAX_SIZE', '1000')),
+        )
         
         # Configurações de envio
         self.enabled = False
@@ -140,63 +415,109 @@ class EmailService:
             'error': 'Nenhum provedor de email ativo'
         }
 
-    def _send_email_smtp(self, to_email: str, subject: str, html_content: str,
-                         text_content: str = None) -> Dict[str, Any]:
-        try:
-            # Cria mensagem
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.smtp_from or self.smtp_user
-            msg['To'] = to_email
-            
-            # Adiciona versão texto
-            if text_content:
-                msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
-            
-            # Adiciona versão HTML
-            msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-            
-            # Envia
-            with self._create_smtp_connection() as server:
-                server.sendmail(
-                    self.smtp_from or self.smtp_user,
-                    to_email,
-                    msg.as_string()
-                )
-            
-            return {
-                'success': True,
-                'message': 'Email enviado com sucesso',
-                'provider': 'smtp'
-            }
-            
-        except (socket.timeout, TimeoutError):
+    def _smtp_pool_key(self) -> tuple:
+        return (self.smtp_host, self.smtp_port, self.smtp_user, self.smtp_pass, self.smtp_force_ipv4)
+
+    def _build_mime_message(self, to_email: str, subject: str, html_content: str,
+                            text_content: str = None) -> str:
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.smtp_from or self.smtp_user
+        msg['To'] = to_email
+        
+        # Adiciona versão texto
+        if text_content:
+            msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
+        
+        # Adiciona versão HTML
+        msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+        return msg.as_string()
+
+    def _smtp_error_result(self, e: Exception) -> Dict[str, Any]:
+        if isinstance(e, (socket.timeout, TimeoutError)):
             return {
                 'success': False,
                 'error': f'Timeout ao conectar no SMTP ({self.smtp_host}:{self.smtp_port})',
                 'provider': 'smtp'
             }
-        except OSError as e:
-            if getattr(e, 'errno', None) == 101:
-                return {
-                    'success': False,
-                    'error': (
-                        f'Rede indisponível para SMTP ({self.smtp_host}:{self.smtp_port}). '
-                        'Isso normalmente indica bloqueio de saída na hospedagem.'
-                    ),
-                    'provider': 'smtp'
-                }
-            return {
-                'success': False,
-                'error': str(e),
-                'provider': 'smtp'
-            }
-        except Exception as e:
+        if isinstance(e, OSError) and getattr(e, 'errno', None) == 101:
             return {
                 'success': False,
-                'error': str(e),
+                'error': (
+                    f'Rede indisponível para SMTP ({self.smtp_host}:{self.smtp_port}). '
+                    'Isso normalmente indica bloqueio de saída na hospedagem.'
+                ),
                 'provider': 'smtp'
             }
+        return {
+            'success': False,
+            'error': str(e),
+            'provider': 'smtp'
+        }
+
+    def _send_email_smtp(self, to_email: str, subject: str, html_content: str,
+                         text_content: str = None) -> Dict[str, Any]:
+        return self._send_bulk_smtp([{
+            'to': to_email,
+            'subject': subject,
+            'html': html_content,
+            'text': text_content,
+        }])[0]
+
+    def _send_bulk_smtp(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Envia várias mensagens na mesma sessão SMTP autenticada (pool)."""
+        key = self._smtp_pool_key()
+        from_email = self.smtp_from or self.smtp_user
+        results: List[Dict[str, Any]] = []
+        server = None
+        connection_error: Optional[Dict[str, Any]] = None
+
+        for message in messages:
+            to_email = message['to']
+            if connection_error:
+                # Servidor indisponível: não repete o timeout para cada destinatário
+                results.append({'email': to_email, **connection_error})
+                continue
+
+            mime = self._build_mime_message(to_email, message['subject'], message['html'], message.get('text'))
+            for attempt in (1, 2):
+                if server is None:
+                    try:
+                        server = self.smtp_pool.acquire(key)
+                    except Exception as e:
+                        connection_error = self._smtp_error_result(e)
+                        results.append({'email': to_email, **connection_error})
+                        break
+                try:
+                    server.sendmail(from_email, to_email, mime)
+                    results.append({
+                        'email': to_email,
+                        'success': True,
+                        'message': 'Email enviado com sucesso',
+                        'provider': 'smtp'
+                    })
+                    break
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                    # Erro do servidor para esta mensagem: a sessão continua válida
+                    results.append({'email': to_email, **self._smtp_error_result(e)})
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    # Conexão reaproveitada pode ter sido encerrada pelo servidor: tenta uma nova
+                    self.smtp_pool.discard(server)
+                    server = None
+                    if attempt == 2:
+                        connection_error = self._smtp_error_result(e)
+                        results.append({'email': to_email, **connection_error})
+                except Exception as e:
+                    self.smtp_pool.discard(server)
+                    server = None
+                    connection_error = self._smtp_error_result(e)
+                    results.append({'email': to_email, **connection_error})
+                    break
+
+        if server is not None:
+            self.smtp_pool.release(key, server)
+        return results
 
     def _send_email_resend(self, to_email: str, subject: str, html_content: str,
                            text_content: str = None) -> Dict[str, Any]:
@@ -263,13 +584,132 @@ class EmailService:
                 'provider': 'resend'
             }
     
+    def _get_resend_batch_url(self) -> str:
+        if self.resend_batch_api_url:
+            return self.resend_batch_api_url
+        return self.resend_api_url.rstrip('/') + '/batch'
+
+    def _send_bulk_resend(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Envia via API batch do Resend (até RESEND_BATCH_LIMIT mensagens por chamada)."""
+        from_email = self.resend_from or self.smtp_from or self.smtp_user
+        results: List[Dict[str, Any]] = []
+
+        for start in range(0, len(messages), RESEND_BATCH_LIMIT):
+            chunk = messages[start:start + RESEND_BATCH_LIMIT]
+            payload = []
+            for message in chunk:
+                item: Dict[str, Any] = {
+                    'from': from_email,
+                    'to': [message['to']],
+                    'subject': message['subject'],
+                    'html': message['html'],
+                }
+                if message.get('text'):
+                    item['text'] = message['text']
+                payload.append(item)
+
+            try:
+                response = requests.post(
+                    self._get_resend_batch_url(),
+                    headers={
+                        'Authorization': f'Bearer {self.resend_api_key}',
+                        'Content-Type': 'application/json',
+                    },
+                    json=payload,
+                    timeout=self.resend_timeout_seconds,
+                )
+                if response.status_code in (200, 201, 202):
+                    chunk_result = {
+                        'success': True,
+                        'message': 'Email enviado com sucesso',
+                        'provider': 'resend'
+                    }
+                else:
+                    chunk_result = {
+                        'success': False,
+                        'error': f'Resend HTTP {response.status_code}: {response.text}',
+                        'provider': 'resend'
+                    }
+            except requests.Timeout:
+                chunk_result = {
+                    'success': False,
+                    'error': 'Timeout ao conectar no Resend API',
+                    'provider': 'resend'
+                }
+            except requests.RequestException as e:
+                chunk_result = {
+                    'success': False,
+                    'error': f'Falha de rede ao enviar via Resend: {e}',
+                    'provider': 'resend'
+                }
+
+            results.extend({'email': message['to'], **chunk_result} for message in chunk)
+
+        return results
+
+    def send_bulk(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Envia várias mensagens reaproveitando a sessão do provedor.
+
+        Args:
+            messages: Lista de dicts com 'to', 'subject', 'html' e 'text' (opcional)
+
+        Returns:
+            Lista de resultados (um por mensagem, com 'email' e 'success')
+        """
+        if not messages:
+            return []
+        if not self.is_configured():
+            return [
+                {'email': m['to'], 'success': False, 'error': 'Serviço de email não configurado'}
+                for m in messages
+            ]
+
+        provider = self.get_active_provider()
+        if provider == 'resend':
+            if len(messages) == 1:
+                m = messages[0]
+                return [{'email': m['to'], **self._send_email_resend(m['to'], m['subject'], m['html'], m.get('text'))}]
+            return self._send_bulk_resend(messages)
+        if provider == 'smtp':
+            return self._send_bulk_smtp(messages)
+
+        return [
+            {'email': m['to'], 'success': False, 'error': 'Nenhum provedor de email ativo'}
+            for m in messages
+        ]
+
+    def enqueue_email_to_multiple(self, to_emails: List[str], subject: str,
+                                  html_content: str, text_content: str = None) -> Dict[str, Any]:
+        """Enfileira o envio para múltiplos destinatários (não bloqueia o chamador)."""
+        if not self.is_configured():
+            return {
+                'success': False,
+                'error': 'Serviço de email não configurado'
+            }
+
+        messages = [
+            {'to': email, 'subject': subject, 'html': html_content, 'text': text_content}
+            for email in to_emails
+        ]
+        if not self.delivery_queue.submit(messages):
+            return {
+                'success': False,
+                'error': 'Fila de envio de emails cheia'
+            }
+        return {
+            'success': True,
+            'queued': True,
+            'total': len(messages),
+        }
+    
     def send_email_to_multiple(self, to_emails: List[str], subject: str, 
                                html_content: str, text_content: str = None) -> Dict[str, Any]:
-        """Envia email para múltiplos destinatários"""
-        results = []
-        for email in to_emails:
-            result = self.send_email(email, subject, html_content, text_content)
-            results.append({'email': email, **result})
+        """Envia email para múltiplos destinatários (uma sessão para todos)"""
+        results = self.send_bulk([
+            {'to': email, 'subject': subject, 'html': html_content, 'text': text_content}
+            for email in to_emails
+        ])
         
         success_count = sum(1 for r in results if r['success'])
         return {
@@ -287,6 +727,12 @@ class NotificadorEmail:
         self.email_service = email_service_instance or EmailService()
         self.get_db = db_connection_func
     
+    def _enviar(self, emails: List[str], titulo: str, html: str, enfileirar: bool = False) -> Dict:
+        """Envia na hora ou, com enfileirar=True, delega à fila de envio em background"""
+        if enfileirar:
+            return self.email_service.enqueue_email_to_multiple(emails, titulo, html)
+        return self.email_service.send_email_to_multiple(emails, titulo, html)
+    
     def _get_logo_url(self) -> str:
         """Retorna URL do logo"""
         return os.getenv('APP_LOGO_URL', 'https://via.placeholder.com/200x50/667eea/ffffff?text=JurisGestao')
@@ -298,69 +744,16 @@ class NotificadorEmail:
     def _criar_template_base(self, titulo: str, conteudo: str, acao_texto: str = None, 
                              acao_link: str = None) -> str:
         """Cria template HTML base para emails"""
-        logo_url = self._get_logo_url()
-        app_url = self._get_app_url()
-        ano_atual = datetime.now().year
+        acao_html = _TEMPLATE_ACAO.substitute(
+            acao_link=acao_link,
+            acao_texto=acao_texto,
+        ) if acao_texto and acao_link else ''
         
-        acao_html = f'''
-        <tr>
-            <td style="padding: 20px 30px; text-align: center;">
-                <a href="{acao_link}" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: #ffffff; padding: 12px 30px; text-decoration: none; border-radius: 25px; display: inline-block; font-weight: bold;">
-                    {acao_texto}
-                </a>
-            </td>
-        </tr>
-        ''' if acao_texto and acao_link else ''
-        
-        return f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{titulo}</title>
-</head>
-<body style="margin: 0; padding: 0; background-color: #f4f4f4; font-family: Arial, sans-serif;">
-    <table width="100%" cellpadding="0" cellspacing="0" style="background-color: #f4f4f4;">
-        <tr>
-            <td align="center" style="padding: 20px 0;">
-                <table width="600" cellpadding="0" cellspacing="0" style="background-color: #ffffff; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                    <!-- Header -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center; border-radius: 10px 10px 0 0;">
-                            <h1 style="color: #ffffff; margin: 0; font-size: 24px;">⚖️ JurisGestão</h1>
-                        </td>
-                    </tr>
-                    
-                    <!-- Título -->
-                    <tr>
-                        <td style="padding: 30px 30px 20px 30px;">
-                            <h2 style="color: #333333; margin: 0; font-size: 20px;">{titulo}</h2>
-                        </td>
-                    </tr>
-                    
-                    <!-- Conteúdo -->
-                    <tr>
-                        <td style="padding: 0 30px 20px 30px; color: #555555; font-size: 16px; line-height: 1.6;">
-                            {conteudo}
-                        </td>
-                    </tr>
-                    
-                    {acao_html}
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="padding: 30px; text-align: center; border-top: 1px solid #eeeeee; color: #999999; font-size: 12px;">
-                            <p>Este é um email automático do sistema JurisGestão.</p>
-                            <p>© {ano_atual} JurisGestão. Todos os direitos reservados.</p>
-                            <p><a href="{app_url}" style="color: #667eea; text-decoration: none;">Acessar Sistema</a></p>
-                        </td>
-                    </tr>
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>'''
+        return _template_base_compilado(self._get_app_url(), datetime.now().year).substitute(
+            titulo=titulo,
+            conteudo=conteudo,
+            acao_html=acao_html,
+        )
     
     def _get_usuarios_com_alerta_email(self, workspace_id: int, user_id: int = None):
         """Busca usuários que aceitam notificações por email"""
@@ -388,7 +781,8 @@ class NotificadorEmail:
     
     def notificar_nova_movimentacao(self, workspace_id: int, processo_id: int, 
                                     numero_processo: str, descricao: str, 
-                                    data_movimento: str = None, user_id: int = None) -> Dict:
+                                    data_movimento: str = None, user_id: int = None,
+                                    enfileirar: bool = False) -> Dict:
         """Notifica sobre nova movimentação processual"""
         if not self.email_service.is_configured():
             return {'success': False, 'error': 'Email não configurado'}
@@ -418,12 +812,79 @@ class NotificadorEmail:
         )
         
         emails = [u['email'] for u in usuarios]
-        return self.email_service.send_email_to_multiple(emails, titulo, html)
+        return self._enviar(emails, titulo, html, enfileirar)
+    
+    def notificar_resumo_movimentacoes(self, workspace_id: int, processos: List[Dict[str, Any]],
+                                       user_id: int = None, enfileirar: bool = False) -> Dict:
+        """
+        Notifica em um único email as novas movimentações de vários processos
+
+        Args:
+            processos: Lista de dicts com 'processo_id', 'numero_processo' e
+                'movimentacoes' (cada uma com 'nome' e 'data')
+        """
+        if not self.email_service.is_configured():
+            return {'success': False, 'error': 'Email não configurado'}
+        
+        usuarios = self._get_usuarios_com_alerta_email(workspace_id, user_id)
+        if not usuarios:
+            return {'success': False, 'error': 'Nenhum usuário com alerta de email ativo'}
+        
+        total_movimentacoes = sum(len(p['movimentacoes']) for p in processos)
+        titulo = f"📋 {total_movimentacoes} Nova(s) Movimentação(ões) em {len(processos)} Processo(s)"
+        
+        linhas_html = ""
+        for processo in processos:
+            movimentacoes = processo['movimentacoes']
+            ultimas = '<br>'.join(
+                f"{mov.get('nome')} ({mov.get('data')})" for mov in movimentacoes[:3]
+            )
+            if len(movimentacoes) > 3:
+                ultimas += f"<br>...e mais {len(movimentacoes) - 3}"
+            linhas_html += f"""
+            <tr>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">
+                    <a href="{self._get_app_url()}/processos/{processo['processo_id']}" style="color: #667eea; text-decoration: none;">{processo['numero_processo']}</a>
+                </td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: center;">{len(movimentacoes)}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">{ultimas}</td>
+            </tr>
+            """
+        
+        conteudo = f"""
+        <p>Olá,</p>
+        <p>O monitoramento encontrou <strong>{total_movimentacoes} nova(s) movimentação(ões)</strong> em {len(processos)} processo(s):</p>
+        
+        <table width="100%" style="border-collapse: collapse; margin: 15px 0;">
+            <thead>
+                <tr style="background-color: #f8f9fa;">
+                    <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Processo</th>
+                    <th style="padding: 10px; text-align: center; border-bottom: 2px solid #ddd;">Novas</th>
+                    <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Últimas movimentações</th>
+                </tr>
+            </thead>
+            <tbody>
+                {linhas_html}
+            </tbody>
+        </table>
+        
+        <p>Acesse o sistema para mais detalhes.</p>
+        """
+        
+        html = self._criar_template_base(
+            titulo=titulo,
+            conteudo=conteudo,
+            acao_texto="Ver Processos",
+            acao_link=f"{self._get_app_url()}/processos"
+        )
+        
+        emails = [u['email'] for u in usuarios]
+        return self._enviar(emails, titulo, html, enfileirar)
     
     def notificar_novo_prazo(self, workspace_id: int, processo_id: int,
                              numero_processo: str, titulo_prazo: str, 
                              data_prazo: str, descricao: str = None,
-                             user_id: int = None) -> Dict:
+                             user_id: int = None, enfileirar: bool = False) -> Dict:
         """Notifica sobre novo prazo processual"""
         if not self.email_service.is_configured():
             return {'success': False, 'error': 'Email não configurado'}
@@ -454,11 +915,12 @@ class NotificadorEmail:
         )
         
         emails = [u['email'] for u in usuarios]
-        return self.email_service.send_email_to_multiple(emails, titulo, html)
+        return self._enviar(emails, titulo, html, enfileirar)
     
     def notificar_nova_tarefa(self, workspace_id: int, tarefa_id: int,
                               titulo_tarefa: str, descricao: str = None,
-                              data_vencimento: str = None, usuario_atribuido_id: int = None) -> Dict:
+                              data_vencimento: str = None, usuario_atribuido_id: int = None,
+                              enfileirar: bool = False) -> Dict:
         """Notifica sobre nova tarefa atribuída"""
         if not self.email_service.is_configured():
             return {'success': False, 'error': 'Email não configurado'}
@@ -494,11 +956,12 @@ class NotificadorEmail:
         )
         
         emails = [u['email'] for u in usuarios]
-        return self.email_service.send_email_to_multiple(emails, titulo, html)
+        return self._enviar(emails, titulo, html, enfileirar)
     
     def notificar_audiencia(self, workspace_id: int, processo_id: int,
                            numero_processo: str, data_audiencia: str, 
-                           hora: str, local: str, user_id: int = None) -> Dict:
+                           hora: str, local: str, user_id: int = None,
+                           enfileirar: bool = False) -> Dict:
         """Notifica sobre audiência marcada"""
         if not self.email_service.is_configured():
             return {'success': False, 'error': 'Email não configurado'}
@@ -529,9 +992,10 @@ class NotificadorEmail:
         )
         
         emails = [u['email'] for u in usuarios]
-        return self.email_service.send_email_to_multiple(emails, titulo, html)
+        return self._enviar(emails, titulo, html, enfileirar)
     
-    def notificar_lembrete_prazo(self, workspace_id: int, dias_antes: int = 3) -> Dict:
+    def notificar_lembrete_prazo(self, workspace_id: int, dias_antes: int = 3,
+                                 enfileirar: bool = False) -> Dict:
         """Envia lembretes de prazos próximos"""
         if not self.email_service.is_configured() or not self.get_db:
             return {'success': False, 'error': 'Serviço não configurado'}
@@ -600,12 +1064,13 @@ class NotificadorEmail:
         )
         
         emails = [u['email'] for u in usuarios]
-        return self.email_service.send_email_to_multiple(emails, titulo, html)
+        return self._enviar(emails, titulo, html, enfileirar)
 
 
 # Instância global
 email_service = EmailService()
 notificador_email = NotificadorEmail(email_service_instance=email_service)
+atexit.register(email_service.delivery_queue.stop)
 
 
 def configurar_db(db_func):
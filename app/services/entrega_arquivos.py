@@ -0,0 +1,233 @@
+"""
+Entrega de Arquivos
+
+Camada única para servir arquivos do disco (frontend compilado e uploads):
+- ETag forte: o SHA-256 do nome em blobs endereçados por conteúdo, ou
+  mtime+tamanho nos demais; If-None-Match responde 304
+- Range (Accept-Ranges: bytes) para PDFs grandes, via werkzeug
+- variantes pré-comprimidas (.br/.gz) quando o cliente aceita
+- offload opcional: X-Accel-Redirect (nginx) ou X-Sendfile (Apache/lighttpd),
+  com a checagem de acesso feita antes, no Flask
+- cache curto de os.stat, inclusive negativo (rotas da SPA que não são arquivo)
+
+O brotli é opcional: sem o pacote, só as variantes gzip são geradas.
+"""
+
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+# Imutável, mas só no navegador: proxies e CDNs compartilhados não guardam
+CACHE_IMUTAVEL_PRIVADO = 'private, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'public, max-age=0, must-revalidate'
+CACHE_PRIVADO = 'private, no-cache'
+
+EXTENSOES_COMPRIMIVEIS = {'.js', '.mjs', '.css', '.html', '.svg', '.json', '.txt', '.map', '.xml', '.webmanifest'}
+
+# Vite gera assets/<nome>-<hash>.<ext>; o conteúdo nunca muda para o mesmo nome
+PADRAO_ASSET_VITE = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$')
+PADRAO_SHA256 = re.compile(r'\b([0-9a-f]{64})\b')
+
+
+def asset_com_hash(relativo: str) -> bool:
+    return bool(PADRAO_ASSET_VITE.match(relativo.replace(os.sep, '/')))
+
+
+def precomprimir_diretorio(raiz: str, tamanho_minimo: int = 1024) -> Dict[str, int]:
+    """
+    Gera .gz (e .br, com brotli instalado) para os arquivos de texto ainda sem variante atualizada.
+
+    Cada variante é gravada num temporário exclusivo e publicada com
+    os.replace: vários workers rodando ao mesmo tempo não corrompem o arquivo.
+    """
+    totais = {'gzip': 0, 'brotli': 0, 'erros': 0}
+    for pasta, _, arquivos in os.walk(raiz):
+        for nome in arquivos:
+            if os.path.splitext(nome)[1].lower() not in EXTENSOES_COMPRIMIVEIS:
+                continue
+            origem = os.path.join(pasta, nome)
+            try:
+                info = os.stat(origem)
+                if info.st_size < tamanho_minimo:
+                    continue
+                for sufixo, chave in (('.gz', 'gzip'), ('.br', 'brotli')):
+                    if chave == 'brotli' and brotli is None:
+                        continue
+                    destino = origem + sufixo
+                    if os.path.exists(destino) and os.path.getmtime(destino) >= info.st_mtime:
+                        continue
+                    descritor, parcial = tempfile.mkstemp(prefix=f'.{nome}.', suffix='.parcial', dir=pasta)
+                    try:
+                        with open(origem, 'rb') as entrada, os.fdopen(descritor, 'wb') as saida:
+                            if chave == 'gzip':
+                                with gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=saida) as comprimido:
+                                    shutil.copyfileobj(entrada, comprimido)
+                            else:
+                                saida.write(brotli.compress(entrada.read()))
+                        os.chmod(parcial, 0o644)
+                        os.replace(parcial, destino)
+                    except BaseException:
+                        try:
+                            os.remove(parcial)
+                        except OSError:
+                            pass
+                        raise
+                    totais[chave] += 1
+            except OSError:
+                totais['erros'] += 1
+    return totais
+
+
+class EntregaArquivos:
+    """Serve arquivos de `raiz` com validação, cache HTTP, Range e offload opcional."""
+
+    def __init__(
+        self,
+        raiz_fn,
+        offload: Optional[str] = None,
+        prefixo_offload: str = '',
+        cache_stat_segundos: float = 5.0,
+        max_entradas_stat: int = 4096,
+    ):
+        self._raiz_fn = raiz_fn
+        self.offload = (offload or '').strip().lower() or None
+        self.prefixo_offload = prefixo_offload.rstrip('/') + '/'
+        self.cache_stat_segundos = max(0.0, float(cache_stat_segundos))
+        self.max_entradas_stat = max(1, int(max_entradas_stat))
+        self._stats: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {'respostas': 0, 'nao_modificado': 0, 'comprimidos': 0, 'offload': 0}
+
+    def _stat(self, caminho: str) -> Optional[os.stat_result]:
+        agora = time.monotonic()
+        with self._lock:
+            item = self._stats.get(caminho)
+            if item is not None and agora - item[0] < self.cache_stat_segundos:
+                self._stats.move_to_end(caminho)
+                return item[1]
+        try:
+            info = os.stat(caminho)
+            info = info if os.path.isfile(caminho) else None
+        except OSError:
+            info = None
+        with self._lock:
+            self._stats[caminho] = (agora, info)
+            self._stats.move_to_end(caminho)
+            while len(self._stats) > self.max_entradas_stat:
+                self._stats.popitem(last=False)
+        return info
+
+    def localizar(self, relativo: str) -> Optional[str]:
+        """Caminho absoluto do arquivo regular em `raiz`, ou None (fora da raiz/inexistente)."""
+        if not relativo:
+            return None
+        caminho = safe_join(self._raiz_fn(), relativo)
+        if caminho is None or self._stat(caminho) is None:
+            return None
+        return caminho
+
+    def _variante(self, caminho: str, info: os.stat_result):
+        aceitas = request.accept_encodings
+        for sufixo, codificacao in (('.br', 'br'), ('.gz', 'gzip')):
+            if not aceitas[codificacao]:
+                continue
+            variante = self._stat(caminho + sufixo)
+            if variante is not None and variante.st_mtime >= info.st_mtime:
+                return caminho + sufixo, variante, codificacao
+        return caminho, info, None
+
+    def responder(
+        self,
+        relativo: str,
+        cache_control: str = CACHE_REVALIDAR,
+        as_attachment: bool = False,
+        download_name: Optional[str] = None,
+        comprimir: bool = False,
+    ) -> Response:
+        """Resposta para o arquivo `relativo` (levanta NotFound se não existir)."""
+        caminho = self.localizar(relativo)
+        if caminho is None:
+            raise NotFound()
+        info = self._stat(caminho)
+        mimetype = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+
+        codificacao = None
+        entregue, info_entregue = caminho, info
+        if comprimir and os.path.splitext(caminho)[1].lower() in EXTENSOES_COMPRIMIVEIS:
+            entregue, info_entregue, codificacao = self._variante(caminho, info)
+
+        sha = PADRAO_SHA256.search(os.path.basename(caminho))
+        etag = sha.group(1) if sha else f'{info.st_mtime_ns:x}-{info.st_size:x}'
+        if codificacao:
+            etag = f'{etag}-{codificacao}'
+
+        with self._lock:
+            self._contadores['respostas'] += 1
+            if codificacao:
+                self._contadores['comprimidos'] += 1
+
+        if self.offload == 'accel':
+            # nginx entrega o arquivo (Range incluso); aqui só o 304 sai direto
+            if request.if_none_match.contains(etag):
+                resposta = Response(status=304)
+                with self._lock:
+                    self._contadores['nao_modificado'] += 1
+            else:
+                relativo_entregue = os.path.relpath(entregue, self._raiz_fn()).replace(os.sep, '/')
+                resposta = Response(mimetype=mimetype)
+                resposta.headers['X-Accel-Redirect'] = self.prefixo_offload + quote(relativo_entregue)
+                with self._lock:
+                    self._contadores['offload'] += 1
+            resposta.set_etag(etag)
+        else:
+            resposta = send_file(
+                entregue,
+                request.environ,
+                mimetype=mimetype,
+                as_attachment=as_attachment,
+                download_name=download_name or os.path.basename(caminho),
+                conditional=True,
+                etag=etag,
+                last_modified=info_entregue.st_mtime,
+                use_x_sendfile=self.offload == 'sendfile',
+            )
+            if resposta.status_code == 304:
+                with self._lock:
+                    self._contadores['nao_modificado'] += 1
+            elif self.offload == 'sendfile':
+                with self._lock:
+                    self._contadores['offload'] += 1
+
+        if as_attachment or download_name:
+            nome = download_name or os.path.basename(caminho)
+            resposta.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', filename=nome)
+        if codificacao:
+            resposta.headers['Content-Encoding'] = codificacao
+        if comprimir:
+            resposta.vary.add('Accept-Encoding')
+        resposta.headers['Cache-Control'] = cache_control
+        return resposta
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._contadores, 'stat_cache': len(self._stats), 'offload_modo': self.offload}
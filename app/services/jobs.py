@@ -0,0 +1,170 @@
+"""
+Tarefas em Background
+
+Registro genérico de tarefas longas (exportação e restauração de backup,
+lotes de documentos) rodando em threads, com progresso consultável:
+- cada tarefa recebe `atualizar(**campos)` para publicar progresso
+- com um diretório, o estado vai para `{id}.job.json` (gravação atômica), e
+  a consulta funciona em qualquer worker do gunicorn e sobrevive à
+  reciclagem do worker; tarefa 'executando' de um pid morto vira 'erro'
+- tarefas antigas são descartadas por workspace, junto dos arquivos `{id}.*`
+"""
+
+import json
+import os
+import re
+import secrets
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+class RegistroTarefas:
+    """
+    Registro de tarefas em background, com progresso consultável.
+
+    Com `diretorio_fn`, cada tarefa também é gravada em `{id}.job.json` nesse
+    diretório: a consulta funciona em qualquer worker do gunicorn, e tarefas
+    concluídas saem da memória sem sumir. Tarefas antigas são descartadas por
+    workspace (`max_por_workspace`), junto dos arquivos `{id}.*` que geraram,
+    para um workspace movimentado não expulsar as tarefas dos outros.
+    """
+
+    MAX_JOBS_EM_MEMORIA = 20
+
+    def __init__(self, diretorio_fn: Optional[Callable[[], str]] = None, max_por_workspace: Optional[int] = None):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._diretorio_fn = diretorio_fn
+        self.max_por_workspace = max(1, int(max_por_workspace or self.MAX_JOBS_EM_MEMORIA))
+
+    def iniciar_tarefa(self, campos: Dict[str, Any], funcao: Callable[[Callable[..., None]], Dict[str, Any]]) -> Dict[str, Any]:
+        """Roda `funcao(atualizar)` numa thread; o dict retornado vai para `resultado`."""
+        job_id = campos.get('id') or secrets.token_hex(8)
+        job = {
+            'id': job_id,
+            'status': 'executando',
+            'percentual': 0.0,
+            'erro': None,
+            'resultado': None,
+            'iniciado_em': datetime.now().isoformat(),
+            'concluido_em': None,
+            **campos,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            antigos = sorted(self._jobs.values(), key=lambda item: item['iniciado_em'])
+            if self._diretorio_fn is None:
+                # Só em memória: o limite vale por workspace
+                por_workspace: Dict[Any, List[Dict[str, Any]]] = {}
+                for antigo in antigos:
+                    por_workspace.setdefault(antigo.get('workspace_id'), []).append(antigo)
+                excedentes = [
+                    antigo for jobs in por_workspace.values()
+                    for antigo in jobs[:max(0, len(jobs) - self.max_por_workspace)]
+                ]
+            else:
+                excedentes = antigos[:max(0, len(antigos) - self.MAX_JOBS_EM_MEMORIA)]
+            for antigo in excedentes:
+                if antigo['status'] != 'executando':
+                    self._jobs.pop(antigo['id'], None)
+        if self._diretorio_fn is not None:
+            self._persistir(dict(job))
+            self._descartar_antigos_em_disco(job.get('workspace_id'))
+
+        def _executar():
+            try:
+                resultado = funcao(lambda **valores: self._atualizar(job_id, **valores))
+                self._atualizar(
+                    job_id,
+                    status='concluido',
+                    percentual=100.0,
+                    resultado=resultado,
+                    concluido_em=datetime.now().isoformat(),
+                )
+            except Exception as erro:
+                self._atualizar(job_id, status='erro', erro=str(erro), concluido_em=datetime.now().isoformat())
+
+        threading.Thread(target=_executar, name=f'tarefa-{job_id}', daemon=True).start()
+        return self.obter(job_id)
+
+    def _atualizar(self, job_id: str, **campos):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(campos)
+                job = dict(job)
+        if job and self._diretorio_fn is not None:
+            self._persistir(job)
+
+    def _caminho_job(self, job_id: str) -> str:
+        return os.path.join(self._diretorio_fn(), f'{job_id}.job.json')
+
+    def _persistir(self, job: Dict[str, Any]) -> None:
+        diretorio = self._diretorio_fn()
+        try:
+            os.makedirs(diretorio, exist_ok=True)
+            descritor, temporario = tempfile.mkstemp(prefix='.job_', dir=diretorio)
+            with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+                json.dump({'job': job, 'pid': os.getpid()}, arquivo, ensure_ascii=False, default=str)
+            os.replace(temporario, self._caminho_job(job['id']))
+        except OSError as e:
+            print(f"[jobs] Falha ao gravar estado da tarefa {job['id']}: {e}")
+
+    def _ler(self, caminho: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                dados = json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+        job = dados.get('job') or {}
+        if job.get('status') == 'executando' and dados.get('pid') != os.getpid():
+            try:
+                os.kill(int(dados.get('pid')), 0)
+            except PermissionError:
+                pass
+            except (OSError, TypeError, ValueError):
+                # O worker que rodava a tarefa morreu (restart, timeout)
+                job.update(status='erro', erro='Tarefa interrompida; inicie novamente')
+        return job or None
+
+    def _descartar_antigos_em_disco(self, workspace_id: Any) -> None:
+        diretorio = self._diretorio_fn()
+        try:
+            nomes = os.listdir(diretorio)
+        except OSError:
+            return
+        jobs = []
+        for nome in nomes:
+            if nome.endswith('.job.json'):
+                job = self._ler(os.path.join(diretorio, nome))
+                if job and job.get('workspace_id') == workspace_id:
+                    jobs.append(job)
+        jobs.sort(key=lambda item: item.get('iniciado_em') or '')
+        for antigo in jobs[:max(0, len(jobs) - self.max_por_workspace)]:
+            if antigo.get('status') == 'executando':
+                continue
+            for nome in nomes:
+                if nome.startswith(f"{antigo['id']}."):
+                    try:
+                        os.remove(os.path.join(diretorio, nome))
+                    except OSError:
+                        pass
+            with self._lock:
+                self._jobs.pop(antigo['id'], None)
+
+    def obter(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        if self._diretorio_fn is None or not re.fullmatch(r'[0-9A-Za-z_-]+', str(job_id or '')):
+            return None
+        # Tarefa de outro worker (ou já fora da memória)
+        return self._ler(self._caminho_job(job_id))
+
+    def listar(self, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if tipo is None or job.get('tipo') == tipo]
+        return sorted(jobs, key=lambda item: item['iniciado_em'], reverse=True)
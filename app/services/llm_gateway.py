@@ -0,0 +1,397 @@
+"""
+Gateway de chamadas LLM (Groq / OpenAI)
+
+Centraliza as chamadas chat.completions do app:
+- limite de chamadas simultâneas (pool limitado com tempo máximo de espera)
+- token bucket por provider (requisições por minuto)
+- failover automático Groq -> OpenAI em 429, 5xx, timeout ou falha de conexão
+- coalescência de chamadas idênticas em andamento (não-stream)
+- métricas de latência e tokens por provider
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class LLMGatewayError(Exception):
+    """Nenhum provider conseguiu atender a chamada."""
+
+
+class TokenBucket:
+    """Token bucket simples: `rate_per_minute` tokens/min com rajada até `capacity`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = max(float(rate_per_minute), 0.0) / 60.0
+        self.capacity = float(capacity if capacity is not None else max(rate_per_minute, 1))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Consome um token, esperando até `timeout` segundos pela reposição."""
+        if self.rate_per_second <= 0:
+            return True
+        deadline = time.monotonic() + max(timeout, 0.0)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                espera = (1 - self._tokens) / self.rate_per_second
+            if now + espera > deadline:
+                return False
+            time.sleep(min(espera, 0.25))
+
+
+class LLMProvider:
+    """Cliente compatível com OpenAI + modelo padrão + limite de taxa."""
+
+    def __init__(self, name: str, client: Any, model: str, requests_per_minute: float = 0):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.bucket = TokenBucket(requests_per_minute)
+
+
+class LLMGateway:
+    """
+    Executa chat completions com limite de concorrência, rate limit e failover.
+
+    Os providers são tentados na ordem em que foram configurados. Um erro é
+    considerado transitório (e dispara failover) quando o status HTTP é 429 ou
+    5xx, ou quando a chamada falha por timeout/conexão; os demais erros (ex.:
+    400 tool_use_failed) sobem direto para o chamador.
+    """
+
+    LATENCY_WINDOW = 200
+
+    def __init__(
+        self,
+        providers: Optional[List[LLMProvider]] = None,
+        max_concurrency: int = 4,
+        queue_timeout: float = 30.0,
+        rate_limit_wait: float = 5.0,
+    ):
+        self.providers: List[LLMProvider] = list(providers or [])
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.queue_timeout = max(0.0, float(queue_timeout))
+        self.rate_limit_wait = max(0.0, float(rate_limit_wait))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._local = threading.local()
+        self._metrics_lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            'calls': 0,
+            'coalesced': 0,
+            'failovers': 0,
+            'queue_timeouts': 0,
+            'in_flight': 0,
+        }
+        self._provider_stats: Dict[str, Dict[str, Any]] = {}
+        self._latencies: Dict[str, deque] = {}
+
+    # ------------------------------------------------------------------
+    # Configuração / estado
+    # ------------------------------------------------------------------
+
+    def add_provider(self, provider: LLMProvider):
+        self.providers.append(provider)
+
+    def is_configured(self) -> bool:
+        return bool(self.providers)
+
+    @property
+    def primary(self) -> Optional[LLMProvider]:
+        return self.providers[0] if self.providers else None
+
+    def last_provider(self) -> Optional[str]:
+        """Provider que atendeu a última chamada desta thread."""
+        return getattr(self._local, 'provider', None)
+
+    def last_model(self) -> Optional[str]:
+        """Modelo usado na última chamada desta thread."""
+        return getattr(self._local, 'model', None)
+
+    # ------------------------------------------------------------------
+    # Chamadas
+    # ------------------------------------------------------------------
+
+    def chat_completion(self, **payload) -> Any:
+        """
+        Equivalente a client.chat.completions.create(**payload).
+
+        Sem 'model' no payload, usa o modelo padrão de cada provider. Com
+        stream=True devolve um iterador de chunks; o failover só acontece antes
+        do primeiro chunk.
+        """
+        if not self.providers:
+            raise LLMGatewayError('Nenhum provider de IA configurado')
+
+        if payload.get('stream'):
+            return self._stream_completion(payload)
+
+        chave = self._coalesce_key(payload)
+        with self._inflight_lock:
+            future = self._inflight.get(chave)
+            lider = future is None
+            if lider:
+                future = Future()
+                self._inflight[chave] = future
+
+        if not lider:
+            with self._metrics_lock:
+                self._stats['coalesced'] += 1
+            provider_name, model, response = future.result()
+            self._local.provider = provider_name
+            self._local.model = model
+            return response
+
+        try:
+            provider_name, response = self._call_with_failover(payload, stream=False)
+            future.set_result((provider_name, self.last_model(), response))
+            return response
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(chave, None)
+
+    def _stream_completion(self, payload: Dict[str, Any]) -> Iterator[Any]:
+        provider_name, stream = self._call_with_failover(payload, stream=True)
+        return _GatewayStream(self, provider_name, stream)
+
+    def _finish_stream(self, provider_name: str, duration_ms: float, chunks: int, error: Optional[BaseException]):
+        self._slots.release()
+        self._mark_done()
+        if error is not None:
+            self._record_error(provider_name, self._error_kind(error))
+        else:
+            self._record_success(provider_name, duration_ms, completion_tokens=chunks, stream=True)
+
+    def _call_with_failover(self, payload: Dict[str, Any], stream: bool):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._metrics_lock:
+                self._stats['queue_timeouts'] += 1
+            raise LLMGatewayError(
+                'Limite de chamadas simultâneas de IA atingido (429). Tente novamente em instantes.'
+            )
+        self._mark_started()
+
+        release_slot = True
+        ultimo_erro: Optional[BaseException] = None
+        try:
+            for indice, provider in enumerate(self.providers):
+                if indice > 0:
+                    with self._metrics_lock:
+                        self._stats['failovers'] += 1
+
+                if not provider.bucket.acquire(self.rate_limit_wait):
+                    self._record_error(provider.name, 'rate_limited_local')
+                    ultimo_erro = LLMGatewayError(
+                        f'Limite de requisições (429) do provider {provider.name} atingido localmente'
+                    )
+                    continue
+
+                call_payload = dict(payload)
+                if not call_payload.get('model') or indice > 0:
+                    # No failover o modelo do provider principal não existe no secundário
+                    call_payload['model'] = provider.model
+
+                started_at = time.perf_counter()
+                try:
+                    response = provider.client.chat.completions.create(**call_payload)
+                except Exception as error:
+                    self._record_error(provider.name, self._error_kind(error))
+                    if not self.is_transient_error(error):
+                        raise
+                    ultimo_erro = error
+                    print(f"[llm-gateway] {provider.name} indisponivel ({error}); tentando proximo provider")
+                    continue
+
+                self._local.provider = provider.name
+                self._local.model = call_payload['model']
+                if stream:
+                    # O slot fica ocupado até o stream ser consumido/fechado
+                    release_slot = False
+                    return provider.name, response
+
+                usage = getattr(response, 'usage', None)
+                self._record_success(
+                    provider.name,
+                    (time.perf_counter() - started_at) * 1000,
+                    prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+                    completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+                )
+                return provider.name, response
+
+            raise ultimo_erro or LLMGatewayError('Nenhum provider de IA disponível')
+        finally:
+            if release_slot:
+                self._slots.release()
+                self._mark_done()
+
+    @staticmethod
+    def is_transient_error(error: BaseException) -> bool:
+        status_code = getattr(error, 'status_code', None)
+        if status_code is None:
+            status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+        if isinstance(status_code, int):
+            return status_code == 429 or status_code >= 500
+        nome = type(error).__name__
+        return nome in {'APIConnectionError', 'APITimeoutError', 'ConnectError', 'ReadTimeout', 'TimeoutException'}
+
+    @staticmethod
+    def _error_kind(error: BaseException) -> str:
+        status_code = getattr(error, 'status_code', None)
+        return f'http_{status_code}' if status_code else type(error).__name__
+
+    @staticmethod
+    def _coalesce_key(payload: Dict[str, Any]) -> str:
+        serializado = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def _provider_bucket(self, provider_name: str) -> Dict[str, Any]:
+        stats = self._provider_stats.get(provider_name)
+        if stats is None:
+            stats = {
+                'calls': 0,
+                'errors': {},
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'stream_chunks': 0,
+            }
+            self._provider_stats[provider_name] = stats
+            self._latencies[provider_name] = deque(maxlen=self.LATENCY_WINDOW)
+        return stats
+
+    def _mark_started(self):
+        with self._metrics_lock:
+            self._stats['calls'] += 1
+            self._stats['in_flight'] += 1
+
+    def _mark_done(self):
+        with self._metrics_lock:
+            self._stats['in_flight'] -= 1
+
+    def _record_success(
+        self,
+        provider_name: str,
+        duration_ms: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        stream: bool = False,
+    ):
+        with self._metrics_lock:
+            stats = self._provider_bucket(provider_name)
+            stats['calls'] += 1
+            if stream:
+                stats['stream_chunks'] += int(completion_tokens)
+            else:
+                stats['prompt_tokens'] += int(prompt_tokens)
+                stats['completion_tokens'] += int(completion_tokens)
+            self._latencies[provider_name].append(duration_ms)
+
+    def _record_error(self, provider_name: str, kind: str):
+        with self._metrics_lock:
+            erros = self._provider_bucket(provider_name)['errors']
+            erros[kind] = erros.get(kind, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            providers = {}
+            for name, stats in self._provider_stats.items():
+                latencias = sorted(self._latencies[name])
+                providers[name] = {
+                    **stats,
+                    'errors': dict(stats['errors']),
+                    'latency_ms_avg': round(sum(latencias) / len(latencias), 1) if latencias else 0.0,
+                    'latency_ms_p95': (
+                        round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 1)
+                        if latencias else 0.0
+                    ),
+                }
+            return {
+                **self._stats,
+                'max_concurrency': self.max_concurrency,
+                'providers_configurados': [p.name for p in self.providers],
+                'providers': providers,
+            }
+
+
+class _GatewayStream:
+    """
+    Iterador do stream que devolve o slot de concorrência ao terminar.
+
+    Libera o slot no fim do stream, em erro, em close() ou quando é coletado
+    sem nunca ter sido consumido.
+    """
+
+    def __init__(self, gateway: LLMGateway, provider_name: str, stream: Any):
+        self._gateway = gateway
+        self._provider_name = provider_name
+        self._stream = iter(stream)
+        self._raw = stream
+        self._started_at = time.perf_counter()
+        self._chunks = 0
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        try:
+            chunk = next(self._stream)
+        except StopIteration:
+            self._finish(None)
+            raise
+        except Exception as error:
+            self._finish(error)
+            raise
+        self._chunks += 1
+        return chunk
+
+    def _finish(self, error: Optional[BaseException]):
+        if self._finished:
+            return
+        self._finished = True
+        self._gateway._finish_stream(
+            self._provider_name,
+            (time.perf_counter() - self._started_at) * 1000,
+            self._chunks,
+            error,
+        )
+
+    def close(self):
+        fechar = getattr(self._raw, 'close', None)
+        if callable(fechar):
+            try:
+                fechar()
+            except Exception:
+                pass
+        self._finish(None)
+
+    def __del__(self):
+        try:
+            self._finish(None)
+        except Exception:
+            pass
@@ -0,0 +1,347 @@
+"""
+Métricas da Plataforma
+
+O dashboard do Super Admin lia COUNT/SUM de users, workspaces, processos e
+assinaturas a cada carregamento. Agora os números ficam materializados em
+metricas_snapshots, uma linha por (granularidade, período, métrica, dimensão):
+- 'hora' e 'dia' em UTC; a linha do período corrente é sobrescrita (upsert)
+  a cada atualização, então a última linha do dia é o fechamento do dia
+- triggers nas tabelas de origem só incrementam um contador em
+  metricas_estado; o dashboard só lê metricas_snapshots e, quando o contador
+  mudou (no máximo a cada `atualizacao_min_segundos`) ou o snapshot
+  envelheceu, dispara o recálculo numa thread com conexão própria
+- um job horário grava o ponto da hora mesmo sem acessos ao dashboard
+- as séries para gráficos saem só de metricas_snapshots
+
+Linhas horárias antigas são podadas; as diárias ficam.
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+GRANULARIDADES = {'hora': '%Y-%m-%d %H:00', 'dia': '%Y-%m-%d'}
+
+# Métricas em moeda (as demais são contagens e saem como int)
+METRICAS_MONETARIAS = {'mrr', 'recebido_mes'}
+
+# Dimensão da distribuição por plano (uma linha por nome de plano)
+METRICA_PLANOS = 'assinaturas_plano'
+
+# (tabela, evento) que alteram alguma métrica
+_GATILHOS = [
+    ('users', 'INSERT'), ('users', 'DELETE'), ('users', 'UPDATE OF role'),
+    ('workspaces', 'INSERT'), ('workspaces', 'DELETE'),
+    ('processos', 'INSERT'), ('processos', 'DELETE'),
+    ('planos', 'INSERT'), ('planos', 'DELETE'), ('planos', 'UPDATE OF nome'),
+    ('assinaturas', 'INSERT'), ('assinaturas', 'DELETE'),
+    ('assinaturas', 'UPDATE OF status, valor, ciclo, plano_id'),
+    ('assinaturas_pagamentos', 'INSERT'), ('assinaturas_pagamentos', 'DELETE'),
+    ('assinaturas_pagamentos', 'UPDATE OF status, valor_pago, mes_referencia'),
+]
+
+
+def criar_tabelas_metricas(db) -> bool:
+    """Cria tabelas e triggers; True se metricas_snapshots acabou de ser criada."""
+    existia = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'metricas_snapshots'"
+    ).fetchone() is not None
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_snapshots (
+            granularidade TEXT NOT NULL,
+            periodo TEXT NOT NULL,
+            metrica TEXT NOT NULL,
+            dimensao TEXT NOT NULL DEFAULT '',
+            valor REAL NOT NULL,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (granularidade, metrica, dimensao, periodo)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_estado (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            alteracoes INTEGER NOT NULL DEFAULT 0,
+            alteracoes_snapshot INTEGER,
+            snapshot_em REAL
+        )
+    ''')
+    db.execute('INSERT OR IGNORE INTO metricas_estado (id, alteracoes) VALUES (1, 0)')
+    for tabela, evento in _GATILHOS:
+        nome = f"trg_metricas_{tabela}_{evento.split()[0].lower()}"
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {nome} AFTER {evento} ON {tabela}
+            BEGIN
+                UPDATE metricas_estado SET alteracoes = alteracoes + 1 WHERE id = 1;
+            END
+        ''')
+    return not existia
+
+
+def preencher_historico_metricas(db) -> int:
+    """Pontos diários de novos cadastros a partir de created_at (uma vez, na criação)."""
+    total = 0
+    for metrica, tabela in (('novos_usuarios', 'users'), ('novos_workspaces', 'workspaces')):
+        cursor = db.execute(f'''
+            INSERT OR IGNORE INTO metricas_snapshots (granularidade, periodo, metrica, dimensao, valor)
+            SELECT 'dia', strftime('%Y-%m-%d', created_at), ?, '', COUNT(*)
+            FROM {tabela}
+            WHERE created_at IS NOT NULL
+            GROUP BY 2
+        ''', (metrica,))
+        total += cursor.rowcount
+    return total
+
+
+def _limites(granularidade: str, momento: datetime) -> Tuple[str, str, str]:
+    """(período, início, fim) do período de `momento` no formato de CURRENT_TIMESTAMP."""
+    if granularidade == 'hora':
+        inicio = momento.replace(minute=0, second=0, microsecond=0)
+        fim = inicio + timedelta(hours=1)
+    else:
+        inicio = momento.replace(hour=0, minute=0, second=0, microsecond=0)
+        fim = inicio + timedelta(days=1)
+    formato = '%Y-%m-%d %H:%M:%S'
+    return inicio.strftime(GRANULARIDADES[granularidade]), inicio.strftime(formato), fim.strftime(formato)
+
+
+def calcular_metricas(db, agora: Optional[datetime] = None) -> Dict[str, Any]:
+    """Lê as tabelas de origem (uma vez) e devolve os valores atuais."""
+    agora = agora or datetime.utcnow()
+    mes_atual = agora.strftime('%Y-%m')
+
+    def _valor(sql: str, params: Sequence[Any] = ()) -> Any:
+        return db.execute(sql, params).fetchone()[0]
+
+    usuarios = db.execute(
+        "SELECT COUNT(*), COALESCE(SUM(role != 'inativo'), 0) FROM users"
+    ).fetchone()
+    assinaturas = db.execute('''
+        SELECT COUNT(*), COALESCE(SUM(CASE WHEN ciclo = 'mensal' THEN valor ELSE 0 END), 0)
+        FROM assinaturas WHERE status = 'ativo'
+    ''').fetchone()
+    pagamentos = db.execute('''
+        SELECT COALESCE(SUM(valor_pago), 0), COUNT(*)
+        FROM assinaturas_pagamentos
+        WHERE mes_referencia = ? AND status = 'confirmado'
+    ''', (mes_atual,)).fetchone()
+
+    valores: Dict[str, Any] = {
+        'total_usuarios': usuarios[0],
+        'usuarios_ativos': usuarios[1],
+        'total_workspaces': _valor('SELECT COUNT(*) FROM workspaces'),
+        'total_processos': _valor('SELECT COUNT(*) FROM processos'),
+        'assinaturas_ativas': assinaturas[0],
+        'mrr': assinaturas[1],
+        'usuarios_recentes': _valor(
+            'SELECT COUNT(*) FROM users WHERE created_at >= ?',
+            ((agora - timedelta(days=30)).strftime('%Y-%m-%d'),),
+        ),
+        'recebido_mes': pagamentos[0],
+        'pagamentos_mes': pagamentos[1],
+        'assinaturas_pendentes_mes': _valor('''
+            SELECT COUNT(*) FROM assinaturas a
+            WHERE a.status = 'ativo'
+            AND a.id NOT IN (
+                SELECT assinatura_id FROM assinaturas_pagamentos
+                WHERE mes_referencia = ? AND status = 'confirmado'
+            )
+        ''', (mes_atual,)),
+    }
+    # Cadastros no período corrente (faixa de created_at, via índice)
+    for granularidade in GRANULARIDADES:
+        _, inicio, fim = _limites(granularidade, agora)
+        for metrica, tabela in (('novos_usuarios', 'users'), ('novos_workspaces', 'workspaces')):
+            valores[f'{metrica}:{granularidade}'] = _valor(
+                f'SELECT COUNT(*) FROM {tabela} WHERE created_at >= ? AND created_at < ?', (inicio, fim)
+            )
+    valores[METRICA_PLANOS] = {
+        row[0]: row[1] for row in db.execute('''
+            SELECT p.nome, COUNT(a.id)
+            FROM planos p
+            LEFT JOIN assinaturas a ON p.id = a.plano_id AND a.status = 'ativo'
+            GROUP BY p.id
+        ''')
+    }
+    return valores
+
+
+def _formatar(metrica: str, valor: float) -> Any:
+    if metrica in METRICAS_MONETARIAS:
+        return valor
+    return int(valor)
+
+
+class MetricasPlataforma:
+    """Snapshots das métricas do Super Admin e séries temporais para gráficos."""
+
+    def __init__(self, database_path_fn: Optional[Callable[[], str]] = None,
+                 atualizacao_min_segundos: float = 60.0, idade_max_segundos: float = 3600.0,
+                 retencao_horas_dias: int = 14):
+        self._database_path_fn = database_path_fn
+        self.atualizacao_min_segundos = max(0.0, float(atualizacao_min_segundos))
+        self.idade_max_segundos = max(self.atualizacao_min_segundos, float(idade_max_segundos))
+        self.retencao_horas_dias = max(1, int(retencao_horas_dias))
+        self._lock = threading.Lock()
+        self._atualizando = False
+        self._stats = {'snapshots': 0, 'leituras': 0, 'recalculos_em_segundo_plano': 0}
+
+    # ------------------------------------------------------------------
+    # Gravação
+    # ------------------------------------------------------------------
+
+    def registrar_snapshot(self, db, agora: Optional[datetime] = None) -> Dict[str, Any]:
+        """Recalcula e grava (upsert) as linhas da hora e do dia correntes."""
+        with self._lock:
+            agora = agora or datetime.utcnow()
+            alteracoes = db.execute('SELECT alteracoes FROM metricas_estado WHERE id = 1').fetchone()[0]
+            valores = calcular_metricas(db, agora)
+
+            linhas = []
+            for granularidade in GRANULARIDADES:
+                periodo, _, _ = _limites(granularidade, agora)
+                for metrica, valor in valores.items():
+                    if metrica == METRICA_PLANOS:
+                        linhas.extend((granularidade, periodo, metrica, nome, quantidade)
+                                      for nome, quantidade in valor.items())
+                    elif ':' in metrica:
+                        nome, sufixo = metrica.split(':')
+                        if sufixo == granularidade:
+                            linhas.append((granularidade, periodo, nome, '', valor))
+                    else:
+                        linhas.append((granularidade, periodo, metrica, '', valor))
+
+            # Planos removidos/renomeados não devem sobrar no período corrente
+            for granularidade in GRANULARIDADES:
+                periodo, _, _ = _limites(granularidade, agora)
+                db.execute(
+                    'DELETE FROM metricas_snapshots WHERE granularidade = ? AND metrica = ? AND periodo = ?',
+                    (granularidade, METRICA_PLANOS, periodo),
+                )
+            db.executemany('''
+                INSERT INTO metricas_snapshots (granularidade, periodo, metrica, dimensao, valor, atualizado_em)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (granularidade, metrica, dimensao, periodo)
+                DO UPDATE SET valor = excluded.valor, atualizado_em = excluded.atualizado_em
+            ''', linhas)
+            db.execute(
+                'DELETE FROM metricas_snapshots WHERE granularidade = ? AND periodo < ?',
+                ('hora', (agora - timedelta(days=self.retencao_horas_dias)).strftime(GRANULARIDADES['hora'])),
+            )
+            db.execute(
+                'UPDATE metricas_estado SET alteracoes_snapshot = ?, snapshot_em = ? WHERE id = 1',
+                (alteracoes, time.time()),
+            )
+            db.commit()
+            self._stats['snapshots'] += 1
+        return valores
+
+    def atualizar_em_segundo_plano(self) -> bool:
+        """Recalcula o snapshot numa thread com conexão própria (uma por vez)."""
+        if self._database_path_fn is None:
+            return False
+        with self._lock:
+            if self._atualizando:
+                return False
+            self._atualizando = True
+            self._stats['recalculos_em_segundo_plano'] += 1
+
+        def _executar():
+            try:
+                conn = sqlite3.connect(self._database_path_fn(), timeout=30)
+                try:
+                    self.registrar_snapshot(conn)
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"[metricas] Falha ao atualizar snapshot: {e}")
+            finally:
+                with self._lock:
+                    self._atualizando = False
+
+        threading.Thread(target=_executar, name='metricas-snapshot', daemon=True).start()
+        return True
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def atual(self, db, forcar: bool = False) -> Dict[str, Any]:
+        """
+        Valores do último snapshot diário, lidos só de metricas_snapshots.
+
+        Se as tabelas de origem mudaram (respeitando o intervalo mínimo, ou
+        já com `forcar`) ou o snapshot envelheceu, o recálculo roda em
+        segundo plano e aparece na próxima leitura.
+        """
+        estado = db.execute(
+            'SELECT alteracoes, alteracoes_snapshot, snapshot_em FROM metricas_estado WHERE id = 1'
+        ).fetchone()
+        idade = time.time() - estado[2] if estado[2] is not None else None
+        if (
+            idade is None
+            or idade >= self.idade_max_segundos
+            or (estado[0] != estado[1] and (forcar or idade >= self.atualizacao_min_segundos))
+        ):
+            self.atualizar_em_segundo_plano()
+
+        with self._lock:
+            self._stats['leituras'] += 1
+        periodo = db.execute(
+            "SELECT MAX(periodo) FROM metricas_snapshots WHERE granularidade = 'dia' AND metrica = 'total_usuarios'"
+        ).fetchone()[0]
+        resultado: Dict[str, Any] = {METRICA_PLANOS: []}
+        atualizado_em = None
+        for row in db.execute(
+            "SELECT metrica, dimensao, valor, atualizado_em FROM metricas_snapshots "
+            "WHERE granularidade = 'dia' AND periodo = ?",
+            (periodo,),
+        ):
+            if row[0] == METRICA_PLANOS:
+                resultado[METRICA_PLANOS].append({'nome': row[1], 'count': int(row[2])})
+            else:
+                resultado[row[0]] = _formatar(row[0], row[2])
+            atualizado_em = max(atualizado_em or row[3], row[3])
+        resultado['atualizado_em'] = atualizado_em
+        return resultado
+
+    def serie(
+        self,
+        db,
+        metricas: Iterable[str],
+        granularidade: str = 'dia',
+        inicio: Optional[str] = None,
+        fim: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """[{metrica, dimensao, pontos: [{periodo, valor}]}] entre inicio e fim (inclusive)."""
+        if granularidade not in GRANULARIDADES:
+            raise ValueError("granularidade deve ser 'hora' ou 'dia'")
+        metricas = [m for m in metricas if m]
+        if not metricas:
+            return []
+        condicoes = ['granularidade = ?', f"metrica IN ({','.join('?' for _ in metricas)})"]
+        params: List[Any] = [granularidade, *metricas]
+        if inicio:
+            condicoes.append('periodo >= ?')
+            params.append(inicio)
+        if fim:
+            condicoes.append('periodo <= ?')
+            params.append(fim + ' 23:59' if granularidade == 'hora' and len(fim) == 10 else fim)
+
+        series: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for row in db.execute(
+            f"SELECT metrica, dimensao, periodo, valor FROM metricas_snapshots "
+            f"WHERE {' AND '.join(condicoes)} ORDER BY metrica, dimensao, periodo",
+            params,
+        ):
+            series.setdefault((row[0], row[1]), []).append({'periodo': row[2], 'valor': _formatar(row[0], row[3])})
+        return [
+            {'metrica': metrica, 'dimensao': dimensao or None, 'pontos': pontos}
+            for (metrica, dimensao), pontos in series.items()
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,181 @@
+"""
+Paginação
+
+Listagens administrativas paginadas por cursor (keyset) em (created_at, id):
+- a próxima página parte de "(created_at, id) < cursor", usando os índices
+  compostos abaixo; o custo não cresce com a profundidade como no OFFSET
+- `pagina` continua aceito (OFFSET) para clientes antigos
+- o total vem de um cache com TTL por filtro; sem filtros, é estimado pelo
+  intervalo de rowid (sem varrer a tabela)
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# (nome, tabela, colunas): combinações de filtro das telas de admin/auditoria
+INDICES_PAGINACAO = [
+    ('idx_audit_logs_created', 'audit_logs', 'created_at, id'),
+    ('idx_audit_logs_entidade_created', 'audit_logs', 'entidade, created_at, id'),
+    ('idx_audit_logs_acao_created', 'audit_logs', 'acao, created_at, id'),
+    ('idx_audit_logs_user_created', 'audit_logs', 'user_id, created_at, id'),
+    ('idx_users_created', 'users', 'created_at, id'),
+    ('idx_users_role_created', 'users', 'role, created_at, id'),
+    ('idx_workspaces_created', 'workspaces', 'created_at, id'),
+    ('idx_assinaturas_workspace_status', 'assinaturas', 'workspace_id, status'),
+    ('idx_processos_workspace', 'processos', 'workspace_id'),
+    ('idx_ia_logs_workspace_created', 'ia_interaction_logs', 'workspace_id, created_at, id'),
+    ('idx_ia_logs_workspace_user_created', 'ia_interaction_logs', 'workspace_id, user_id, created_at, id'),
+    ('idx_ia_logs_workspace_status_created', 'ia_interaction_logs', 'workspace_id, status, created_at, id'),
+]
+
+
+def criar_indices_paginacao(db) -> None:
+    for nome, tabela, colunas in INDICES_PAGINACAO:
+        db.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({colunas})')
+
+
+def codificar_cursor(created_at: Any, registro_id: Any) -> str:
+    bruto = json.dumps([created_at, registro_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor: str) -> Tuple[Any, int]:
+    """(created_at, id) do cursor; ValueError se inválido."""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, registro_id = json.loads(bruto.decode('utf-8'))
+        return created_at, int(registro_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+class ContagemCache:
+    """Totais por (listagem, filtros) com TTL; evita COUNT(*) a cada página."""
+
+    def __init__(self, ttl_segundos: float = 60.0, max_entradas: int = 256):
+        self.ttl_segundos = max(0.0, float(ttl_segundos))
+        self.max_entradas = max(1, int(max_entradas))
+        self._entradas: 'OrderedDict[Any, Tuple[float, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def obter(self, chave: Any, calcular: Callable[[], int]) -> int:
+        agora = time.monotonic()
+        with self._lock:
+            item = self._entradas.get(chave)
+            if item is not None and agora - item[0] < self.ttl_segundos:
+                self._entradas.move_to_end(chave)
+                self._stats['hits'] += 1
+                return item[1]
+            self._stats['misses'] += 1
+        total = int(calcular())
+        with self._lock:
+            self._entradas[chave] = (agora, total)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return total
+
+    def invalidar(self, listagem: Optional[str] = None) -> None:
+        with self._lock:
+            if listagem is None:
+                self._entradas.clear()
+                return
+            for chave in [c for c in self._entradas if c[0] == listagem]:
+                self._entradas.pop(chave, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, 'entradas': len(self._entradas)}
+
+
+def estimar_linhas(db, tabela: str) -> int:
+    """Aproximação de COUNT(*) pelo intervalo de rowid (exata sem exclusões)."""
+    row = db.execute(f'SELECT MIN(rowid), MAX(rowid) FROM {tabela}').fetchone()
+    if not row or row[0] is None:
+        return 0
+    return int(row[1]) - int(row[0]) + 1
+
+
+def paginar(
+    db,
+    select_sql: str,
+    from_sql: str,
+    condicoes: Sequence[str],
+    params: Sequence[Any],
+    limite: int,
+    cursor: Optional[str] = None,
+    pagina: Optional[int] = None,
+    coluna_data: str = 'created_at',
+    coluna_id: str = 'id',
+    contagem: Optional[ContagemCache] = None,
+    listagem: str = '',
+    tabela_estimativa: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Executa `select_sql from_sql WHERE condicoes` em ordem (data, id) decrescente.
+    Retorna {itens, proximo_cursor, tem_mais, total, total_aproximado}.
+    Levanta ValueError para cursor inválido.
+    """
+    where = list(condicoes)
+    valores: List[Any] = list(params)
+
+    total = None
+    total_aproximado = False
+    if contagem is not None:
+        if not where and tabela_estimativa:
+            total = estimar_linhas(db, tabela_estimativa)
+            total_aproximado = True
+        else:
+            sql_contagem = f'SELECT COUNT(*) {from_sql}' + (f" WHERE {' AND '.join(where)}" if where else '')
+            total = contagem.obter(
+                (listagem, sql_contagem, tuple(valores)),
+                lambda: db.execute(sql_contagem, valores).fetchone()[0],
+            )
+
+    if cursor:
+        data_cursor, id_cursor = decodificar_cursor(cursor)
+        where.append(f'({coluna_data}, {coluna_id}) < (?, ?)')
+        valores.extend([data_cursor, id_cursor])
+
+    sql = f'{select_sql} {from_sql}'
+    if where:
+        sql += f" WHERE {' AND '.join(where)}"
+    sql += f' ORDER BY {coluna_data} DESC, {coluna_id} DESC LIMIT ?'
+    valores.append(limite + 1)
+    if not cursor and pagina and pagina > 1:
+        sql += ' OFFSET ?'
+        valores.append((pagina - 1) * limite)
+
+    rows = db.execute(sql, valores).fetchall()
+    tem_mais = len(rows) > limite
+    rows = rows[:limite]
+    campo_data = coluna_data.split('.')[-1]
+    campo_id = coluna_id.split('.')[-1]
+    proximo = codificar_cursor(rows[-1][campo_data], rows[-1][campo_id]) if tem_mais and rows else None
+    return {
+        'itens': rows,
+        'proximo_cursor': proximo,
+        'tem_mais': tem_mais,
+        'total': total,
+        'total_aproximado': total_aproximado,
+    }
+
+
+def parametros_paginacao(args, padrao: int = 50, maximo: int = 200) -> Tuple[int, Optional[str], int]:
+    """(limite, cursor, pagina) a partir da query string (per_page/limit, cursor, page)."""
+    try:
+        limite = int(args.get('per_page') or args.get('limit') or padrao)
+    except (TypeError, ValueError):
+        limite = padrao
+    try:
+        pagina = int(args.get('page') or 1)
+    except (TypeError, ValueError):
+        pagina = 1
+    cursor = (args.get('cursor') or '').strip() or None
+    return max(1, min(limite, maximo)), cursor, max(1, pagina)
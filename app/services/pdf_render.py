@@ -0,0 +1,336 @@
+"""
+Renderização de PDF
+
+Converte HTML (extrato) e DOCX (documentos gerados) em PDF no próprio
+servidor, com o LibreOffice em modo headless — nada sai da máquina:
+- as conversões rodam num pool de threads, cada uma disparando um soffice
+  com perfil próprio por processo e thread (instâncias paralelas, inclusive
+  de outros workers do gunicorn, não disputam o mesmo perfil)
+- a requisição só espera alguns segundos; depois recebe 'processando' e
+  consulta de novo pela chave
+- o PDF pronto fica em disco por workspace/chave (LRU por tamanho total);
+  pedidos repetidos da mesma chave, prontos ou em andamento, são reaproveitados
+- a situação de cada chave fica num arquivo `.estado` ao lado do PDF, então
+  a consulta funciona em qualquer worker, não só no que iniciou a conversão
+"""
+
+import hashlib
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+# Filtros de exportação por formato de entrada
+_FILTROS = {
+    'html': ['--infilter=HTML (StarWriter)', '--convert-to', 'pdf:writer_pdf_Export'],
+    'docx': ['--convert-to', 'pdf:writer_pdf_Export'],
+}
+
+
+def localizar_soffice(caminho: Optional[str] = None) -> Optional[str]:
+    """Executável do LibreOffice (configurado ou no PATH), ou None."""
+    if caminho:
+        return caminho if os.path.isfile(caminho) and os.access(caminho, os.X_OK) else None
+    for nome in ('soffice', 'libreoffice'):
+        encontrado = shutil.which(nome)
+        if encontrado:
+            return encontrado
+    return None
+
+
+def _repassar_resultado(origem: Future, destino: Future) -> None:
+    """Copia o desfecho da conversão para o futuro registrado antes dela começar."""
+    erro = origem.exception()
+    if erro is not None:
+        destino.set_exception(erro)
+    else:
+        destino.set_result(origem.result())
+
+
+class RenderizadorPDF:
+    """Pool de conversões para PDF com cache em disco."""
+
+    MAX_REGISTROS = 500
+
+    def __init__(
+        self,
+        diretorio_fn: Callable[[], str],
+        soffice: Optional[str] = None,
+        max_workers: int = 2,
+        timeout_segundos: int = 60,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self._diretorio_fn = diretorio_fn
+        self.soffice = localizar_soffice(soffice)
+        self.max_workers = max(1, int(max_workers))
+        self.timeout_segundos = max(5, int(timeout_segundos))
+        self.max_bytes = max(0, int(max_bytes))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._perfis: 'queue.Queue[int]' = queue.Queue()
+        for indice in range(self.max_workers):
+            self._perfis.put(indice)
+        self._registros: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'conversoes': 0, 'falhas': 0, 'cache_hits': 0, 'evictions': 0}
+
+    @property
+    def disponivel(self) -> bool:
+        return self.soffice is not None
+
+    @staticmethod
+    def chave(*partes: Any) -> str:
+        digest = hashlib.sha256()
+        for parte in partes:
+            digest.update(parte if isinstance(parte, bytes) else str(parte).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _caminho(self, workspace_id: int, chave: str) -> str:
+        return os.path.join(self._diretorio_fn(), 'arquivos', str(int(workspace_id)), f'{chave}.pdf')
+
+    @staticmethod
+    def _caminho_estado(destino: str) -> str:
+        return destino[:-len('.pdf')] + '.estado'
+
+    @staticmethod
+    def _gravar_estado(destino: str, estado: Dict[str, Any]) -> None:
+        pasta = os.path.dirname(destino)
+        os.makedirs(pasta, exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(prefix='.estado_', dir=pasta)
+        with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+            json.dump(estado, arquivo, ensure_ascii=False)
+        os.replace(temporario, RenderizadorPDF._caminho_estado(destino))
+
+    def _ler_estado(self, destino: str) -> Optional[Dict[str, Any]]:
+        """Estado gravado em disco; 'processando' de um processo que morreu é descartado."""
+        try:
+            with open(self._caminho_estado(destino), encoding='utf-8') as arquivo:
+                estado = json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+        if estado.get('status') == 'processando':
+            pid = estado.get('pid')
+            if pid == os.getpid():
+                # Deste processo: vale o registro em memória (que não está ativo)
+                return None
+            try:
+                os.kill(int(pid), 0)
+            except PermissionError:
+                pass  # vivo, de outro usuário
+            except (OSError, TypeError, ValueError):
+                return None
+        return estado
+
+    def caminho_pronto(self, workspace_id: int, chave: str) -> Optional[str]:
+        caminho = self._caminho(workspace_id, chave)
+        if not os.path.exists(caminho):
+            return None
+        try:
+            os.utime(caminho, None)  # LRU pelo mtime
+        except OSError:
+            pass
+        with self._lock:
+            self._stats['cache_hits'] += 1
+        return caminho
+
+    def _obter_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pdf-render')
+            return self._executor
+
+    # ------------------------------------------------------------------
+    # Conversão
+    # ------------------------------------------------------------------
+
+    def _converter(self, conteudo: bytes, extensao: str, destino: str, nome: str) -> str:
+        perfil = self._perfis.get()
+        try:
+            base = self._diretorio_fn()
+            os.makedirs(os.path.join(base, 'tmp'), exist_ok=True)
+            with tempfile.TemporaryDirectory(prefix='conv_', dir=os.path.join(base, 'tmp')) as temporario:
+                entrada = os.path.join(temporario, f'documento.{extensao}')
+                with open(entrada, 'wb') as arquivo:
+                    arquivo.write(conteudo)
+                perfil_dir = os.path.join(base, 'perfis', f'worker_{os.getpid()}_{perfil}')
+                comando = [
+                    self.soffice,
+                    f'-env:UserInstallation=file://{perfil_dir}',
+                    '--headless', '--norestore', '--nolockcheck', '--nodefault',
+                    *_FILTROS[extensao],
+                    '--outdir', temporario,
+                    entrada,
+                ]
+                try:
+                    processo = subprocess.run(
+                        comando,
+                        capture_output=True,
+                        timeout=self.timeout_segundos,
+                        env={**os.environ, 'HOME': perfil_dir},
+                    )
+                except subprocess.TimeoutExpired:
+                    raise RuntimeError(f'Conversão excedeu {self.timeout_segundos}s')
+                saida = os.path.join(temporario, 'documento.pdf')
+                if not os.path.exists(saida):
+                    detalhe = (processo.stderr or processo.stdout or b'').decode('utf-8', 'replace').strip()
+                    raise RuntimeError(f'LibreOffice não gerou o PDF: {detalhe[-300:] or processo.returncode}')
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(saida, destino)
+            self._gravar_estado(destino, {'status': 'pronto', 'nome': nome})
+            with self._lock:
+                self._stats['conversoes'] += 1
+            self._aplicar_limite()
+            return destino
+        except Exception as e:
+            with self._lock:
+                self._stats['falhas'] += 1
+            try:
+                self._gravar_estado(destino, {'status': 'erro', 'erro': str(e), 'nome': nome})
+            except OSError:
+                pass
+            raise
+        finally:
+            self._perfis.put(perfil)
+
+    def solicitar(
+        self,
+        workspace_id: int,
+        chave: str,
+        extensao: str,
+        produzir: Callable[[], bytes],
+        nome: str = 'documento.pdf',
+        aguardar_segundos: float = 0,
+    ) -> Dict[str, Any]:
+        """
+        Garante a conversão de `chave`. `produzir` (HTML/DOCX em bytes) só é
+        chamado se não houver PDF pronto nem conversão em andamento.
+        Retorna {'status': 'pronto'|'processando'|'erro', 'caminho'?, 'erro'?}.
+        """
+        if not self.disponivel:
+            raise RuntimeError('LibreOffice não encontrado no servidor')
+        if extensao not in _FILTROS:
+            raise ValueError(f'Formato não suportado: {extensao}')
+
+        caminho = self.caminho_pronto(workspace_id, chave)
+        if caminho:
+            return {'status': 'pronto', 'caminho': caminho, 'nome': nome}
+
+        destino = self._caminho(workspace_id, chave)
+        # Verificação e registro na mesma seção do lock: duas threads pedindo
+        # a mesma chave não disparam dois soffice
+        with self._lock:
+            registro = self._registros.get(chave)
+            em_andamento = registro is not None and registro['workspace_id'] == workspace_id and not registro['futuro'].done()
+            if not em_andamento:
+                estado = self._ler_estado(destino)
+                if estado and estado.get('status') == 'processando':
+                    # Outro worker já está convertendo esta chave
+                    return {'status': 'processando', 'nome': estado.get('nome') or nome}
+                registro = {'workspace_id': workspace_id, 'futuro': Future(), 'nome': nome}
+                self._registros[chave] = registro
+                self._registros.move_to_end(chave)
+                while len(self._registros) > self.MAX_REGISTROS:
+                    antigo_chave, antigo = next(iter(self._registros.items()))
+                    if not antigo['futuro'].done():
+                        break
+                    self._registros.pop(antigo_chave)
+        if not em_andamento:
+            futuro = registro['futuro']
+            try:
+                conteudo = produzir()
+                self._gravar_estado(destino, {'status': 'processando', 'nome': nome, 'pid': os.getpid()})
+                conversao = self._obter_executor().submit(self._converter, conteudo, extensao, destino, nome)
+            except Exception as erro:
+                futuro.set_exception(erro)
+                raise
+            conversao.add_done_callback(lambda feito: _repassar_resultado(feito, futuro))
+
+        if aguardar_segundos > 0:
+            wait([registro['futuro']], timeout=aguardar_segundos)
+        return self.status(workspace_id, chave)
+
+    def status(self, workspace_id: int, chave: str) -> Optional[Dict[str, Any]]:
+        """Situação da conversão de `chave` no workspace (None se desconhecida)."""
+        with self._lock:
+            registro = self._registros.get(chave)
+        if registro is not None and registro['workspace_id'] != workspace_id:
+            registro = None
+        if registro is not None and not registro['futuro'].done():
+            return {'status': 'processando', 'nome': registro['nome']}
+        if registro is not None and registro['futuro'].exception() is not None:
+            return {'status': 'erro', 'erro': str(registro['futuro'].exception()), 'nome': registro['nome']}
+
+        # Conversão iniciada por outro worker (ou antes de um restart)
+        destino = self._caminho(workspace_id, chave)
+        estado = self._ler_estado(destino) or {}
+        nome = registro['nome'] if registro else estado.get('nome') or f'{chave[:16]}.pdf'
+        caminho = self.caminho_pronto(workspace_id, chave)
+        if caminho:
+            return {'status': 'pronto', 'caminho': caminho, 'nome': nome}
+        if estado.get('status') == 'processando':
+            return {'status': 'processando', 'nome': nome}
+        if estado.get('status') == 'erro':
+            return {'status': 'erro', 'erro': estado.get('erro') or 'Falha na conversão', 'nome': nome}
+        return None
+
+    # ------------------------------------------------------------------
+    # Cache em disco
+    # ------------------------------------------------------------------
+
+    def _aplicar_limite(self) -> None:
+        raiz = os.path.join(self._diretorio_fn(), 'arquivos')
+        arquivos = []
+        total = 0
+        for pasta, _, nomes in os.walk(raiz):
+            for nome in nomes:
+                if not nome.endswith('.pdf'):
+                    continue
+                caminho = os.path.join(pasta, nome)
+                try:
+                    info = os.stat(caminho)
+                except OSError:
+                    continue
+                arquivos.append((info.st_mtime, info.st_size, caminho))
+                total += info.st_size
+        arquivos.sort()
+        while total > self.max_bytes and arquivos:
+            _, tamanho, caminho = arquivos.pop(0)
+            try:
+                os.remove(caminho)
+                total -= tamanho
+                with self._lock:
+                    self._stats['evictions'] += 1
+            except OSError:
+                continue
+            try:
+                os.remove(self._caminho_estado(caminho))
+            except OSError:
+                pass
+
+    def encerrar(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        # Perfis do soffice são por processo: os deste não serão reaproveitados
+        for indice in range(self.max_workers):
+            shutil.rmtree(
+                os.path.join(self._diretorio_fn(), 'perfis', f'worker_{os.getpid()}_{indice}'),
+                ignore_errors=True,
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            em_andamento = sum(1 for registro in self._registros.values() if not registro['futuro'].done())
+            return {
+                **self._stats,
+                'disponivel': self.disponivel,
+                'workers': self.max_workers,
+                'em_andamento': em_andamento,
+            }
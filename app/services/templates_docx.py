@@ -0,0 +1,279 @@
+"""
+Templates DOCX compilados
+
+O docxtpl relê o .docx, reconstrói o XML do corpo, aplica as correções de
+tags (patch_xml) e compila o Jinja a cada documento gerado. Aqui isso é feito
+uma vez por template:
+- os bytes do .docx e o corpo já normalizado e compilado ficam em memória,
+  num LRU limitado pelo tamanho aproximado das entradas
+- a chave é o caminho do arquivo (blobs são endereçados por conteúdo) e o
+  mtime/tamanho é conferido a cada uso para arquivos legados
+- cada geração abre um Document a partir dos bytes em memória (o render do
+  docxtpl altera o documento) e grava o resultado num BytesIO
+
+Cabeçalhos e rodapés continuam sendo renderizados pelo docxtpl.
+
+Lotes grandes usam PoolRenderizacao: processos separados (o render é CPU e
+segura o GIL), cada um com seu próprio cache de templates compilados. Os
+processos saem de um forkserver, não de fork do worker: o worker do gunicorn
+tem outras threads (SQLite, logging, APScheduler) e um fork pode herdar locks
+presos por elas.
+"""
+
+import io
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from docxtpl import DocxTemplate
+from jinja2 import Template
+
+
+class _TemplateCompilado:
+    __slots__ = ('conteudo', 'corpo', 'assinatura', 'tamanho')
+
+    def __init__(self, conteudo: bytes, corpo: Template, assinatura: Tuple[int, int], tamanho: int):
+        self.conteudo = conteudo
+        self.corpo = corpo
+        self.assinatura = assinatura
+        self.tamanho = tamanho
+
+
+class _DocxTemplatePreparado(DocxTemplate):
+    """DocxTemplate que usa o corpo já compilado em vez de refazer patch_xml + Jinja."""
+
+    def __init__(self, compilado: _TemplateCompilado):
+        super().__init__(io.BytesIO(compilado.conteudo))
+        self._compilado = compilado
+
+    def build_xml(self, context, jinja_env=None):
+        if jinja_env is not None:
+            return super().build_xml(context, jinja_env)
+        # Mesmo pós-processamento de DocxTemplate.render_xml_part
+        self.current_rendering_part = self.docx._part
+        xml = self._compilado.corpo.render(context)
+        xml = re.sub(r'\n<w:p([ >])', r'<w:p\1', xml)
+        xml = xml.replace('{_{', '{{').replace('}_}', '}}').replace('{_%', '{%').replace('%_}', '%}')
+        return self.resolve_listing(xml)
+
+
+class TemplateDocxCache:
+    """LRU de templates DOCX compilados, limitado por bytes."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entradas: 'OrderedDict[str, _TemplateCompilado]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidacoes': 0, 'evictions': 0, 'renderizacoes': 0}
+
+    @staticmethod
+    def _assinatura(caminho: str) -> Tuple[int, int]:
+        info = os.stat(caminho)
+        return info.st_mtime_ns, info.st_size
+
+    def _compilar(self, caminho: str, assinatura: Tuple[int, int]) -> _TemplateCompilado:
+        with open(caminho, 'rb') as arquivo:
+            conteudo = arquivo.read()
+        modelo = DocxTemplate(io.BytesIO(conteudo))
+        modelo.init_docx()
+        xml = modelo.patch_xml(modelo.get_xml())
+        xml = re.sub(r'<w:p([ >])', r'\n<w:p\1', xml)
+        corpo = Template(xml)
+        # Peso aproximado: zip original + XML do corpo (o código Jinja é proporcional)
+        return _TemplateCompilado(conteudo, corpo, assinatura, len(conteudo) + 2 * len(xml))
+
+    def obter(self, caminho: str) -> _TemplateCompilado:
+        """Template compilado de `caminho` (compila e guarda se necessário)."""
+        assinatura = self._assinatura(caminho)
+        with self._lock:
+            entrada = self._entradas.get(caminho)
+            if entrada is not None and entrada.assinatura == assinatura:
+                self._entradas.move_to_end(caminho)
+                self._stats['hits'] += 1
+                return entrada
+            self._stats['misses'] += 1
+
+        entrada = self._compilar(caminho, assinatura)
+        with self._lock:
+            antiga = self._entradas.pop(caminho, None)
+            if antiga is not None:
+                self._bytes -= antiga.tamanho
+            if entrada.tamanho <= self.max_bytes:
+                self._entradas[caminho] = entrada
+                self._bytes += entrada.tamanho
+                while self._bytes > self.max_bytes and self._entradas:
+                    _, removida = self._entradas.popitem(last=False)
+                    self._bytes -= removida.tamanho
+                    self._stats['evictions'] += 1
+        return entrada
+
+    def renderizar(self, caminho: str, contexto: Dict[str, Any]) -> bytes:
+        """Gera o .docx preenchido e retorna os bytes (nada é gravado em disco)."""
+        documento = _DocxTemplatePreparado(self.obter(caminho))
+        documento.render(contexto)
+        saida = io.BytesIO()
+        documento.save(saida)
+        with self._lock:
+            self._stats['renderizacoes'] += 1
+        return saida.getvalue()
+
+    def renderizar_lote(
+        self,
+        caminho: str,
+        contextos: Iterable[Tuple[str, Dict[str, Any]]],
+        max_workers: int = 4,
+    ) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+        """
+        Renderiza vários documentos do mesmo template em paralelo.
+        Retorna (nome, bytes, erro) na ordem recebida; falhas não interrompem o lote.
+        """
+        itens = list(contextos)
+        self.obter(caminho)  # compila uma vez antes de distribuir
+
+        def _um(item):
+            nome, contexto = item
+            try:
+                return nome, self.renderizar(caminho, contexto), None
+            except Exception as e:
+                return nome, None, str(e)
+
+        if len(itens) <= 1 or max_workers <= 1:
+            return [_um(item) for item in itens]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(itens))) as executor:
+            return list(executor.map(_um, itens))
+
+    def invalidar(self, caminho: Optional[str] = None) -> None:
+        with self._lock:
+            if caminho is None:
+                self._entradas.clear()
+                self._bytes = 0
+            else:
+                entrada = self._entradas.pop(caminho, None)
+                if entrada is None:
+                    return
+                self._bytes -= entrada.tamanho
+            self._stats['invalidacoes'] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# Cache do processo de renderização (criado pelo initializer do pool)
+_cache_worker: Optional[TemplateDocxCache] = None
+
+
+def _iniciar_worker(max_bytes: int) -> None:
+    global _cache_worker
+    _cache_worker = TemplateDocxCache(max_bytes)
+
+
+def _renderizar_worker(caminho: str, nome: str, contexto: Dict[str, Any]) -> Tuple[str, bytes]:
+    return nome, _cache_worker.renderizar(caminho, contexto)
+
+
+class PoolRenderizacao:
+    """Pool de processos para renderizar lotes de documentos, criado no primeiro uso."""
+
+    def __init__(self, max_workers: int = 2, max_bytes_cache: int = 32 * 1024 * 1024):
+        self.max_workers = max(1, int(max_workers))
+        self.max_bytes_cache = int(max_bytes_cache)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _obter_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=_iniciar_worker,
+                    initargs=(self.max_bytes_cache,),
+                )
+            return self._executor
+
+    def _descartar_executor(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def renderizar(
+        self,
+        caminho: str,
+        contextos: Iterable[Tuple[str, Dict[str, Any]]],
+    ) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+        """
+        Produz (nome, bytes, erro) à medida que os documentos ficam prontos.
+        No máximo 2x max_workers documentos ficam em voo, então a memória não
+        cresce com o tamanho do lote.
+        """
+        executor = self._obter_executor()
+        pendentes = {}
+        fila = iter(contextos)
+        esgotada = False
+        try:
+            while pendentes or not esgotada:
+                while not esgotada and len(pendentes) < self.max_workers * 2:
+                    try:
+                        nome, contexto = next(fila)
+                    except StopIteration:
+                        esgotada = True
+                        break
+                    pendentes[executor.submit(_renderizar_worker, caminho, nome, contexto)] = nome
+                if not pendentes:
+                    break
+                prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    nome = pendentes.pop(futuro)
+                    try:
+                        _, conteudo = futuro.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        yield nome, None, str(e)
+                    else:
+                        yield nome, conteudo, None
+        except BrokenProcessPool:
+            self._descartar_executor()
+            raise
+        finally:
+            for futuro in pendentes:
+                futuro.cancel()
+
+    def encerrar(self) -> None:
+        self._descartar_executor()
+
+
+def limpar_arquivos_temporarios(diretorios: Iterable[str], idade_maxima_segundos: float) -> Dict[str, int]:
+    """Remove arquivos (não pastas) mais antigos que `idade_maxima_segundos` nos diretórios."""
+    limite = time.time() - idade_maxima_segundos
+    totais = {'removidos': 0, 'bytes': 0, 'erros': 0}
+    for diretorio in diretorios:
+        if not os.path.isdir(diretorio):
+            continue
+        for entrada in os.scandir(diretorio):
+            try:
+                if not entrada.is_file(follow_symlinks=False):
+                    continue
+                info = entrada.stat(follow_symlinks=False)
+                if info.st_mtime >= limite:
+                    continue
+                os.remove(entrada.path)
+                totais['removidos'] += 1
+                totais['bytes'] += info.st_size
+            except OSError:
+                totais['erros'] += 1
+    return totais
@@ -0,0 +1,79 @@
+"""
+ZIP em streaming
+
+Gera o arquivo ZIP por partes, sem montar o pacote inteiro em memória: o
+ZipFile escreve num destino não-seekable (entradas com data descriptor) e o
+gerador repassa os bytes assim que cada bloco é escrito.
+
+Arquivos já comprimidos (PDF, imagens, Office, ZIP) vão como STORED; texto e
+demais formatos usam DEFLATE.
+"""
+
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple, Union
+
+
+# Formatos que já saem comprimidos: deflate de novo só gasta CPU
+EXTENSOES_COMPRIMIDAS = {
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif',
+    '.zip', '.gz', '.7z', '.rar', '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+    '.mp3', '.mp4', '.m4a', '.ogg', '.opus', '.webm', '.mov',
+}
+
+# (nome no ZIP, conteúdo): str/bytes vão direto; Path é lido do disco em blocos
+EntradaZip = Tuple[str, Union[str, bytes, Path]]
+
+
+def compressao_para(nome: str) -> int:
+    extensao = os.path.splitext(nome)[1].lower()
+    return zipfile.ZIP_STORED if extensao in EXTENSOES_COMPRIMIDAS else zipfile.ZIP_DEFLATED
+
+
+class _DestinoStream:
+    """Destino sem seek/tell para o ZipFile; os bytes escritos são drenados pelo gerador."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def drenar(self) -> List[bytes]:
+        if not self._partes:
+            return []
+        partes, self._partes = self._partes, []
+        return [b''.join(partes)]
+
+
+def iterar_zip_stream(entradas: Iterable[EntradaZip], tamanho_bloco: int = 256 * 1024) -> Iterator[bytes]:
+    """Produz o ZIP das `entradas` em blocos, lendo arquivos do disco sob demanda."""
+    destino = _DestinoStream()
+    with zipfile.ZipFile(destino, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, conteudo in entradas:
+            if isinstance(conteudo, Path):
+                info = zipfile.ZipInfo(nome, date_time=time.localtime(conteudo.stat().st_mtime)[:6])
+                info.file_size = conteudo.stat().st_size
+            else:
+                conteudo = conteudo.encode('utf-8') if isinstance(conteudo, str) else conteudo
+                info = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+                info.file_size = len(conteudo)
+            info.compress_type = compressao_para(nome)
+            info.external_attr = 0o644 << 16
+
+            with zf.open(info, mode='w') as saida:
+                if isinstance(conteudo, Path):
+                    with open(conteudo, 'rb') as origem:
+                        for bloco in iter(lambda: origem.read(tamanho_bloco), b''):
+                            saida.write(bloco)
+                            yield from destino.drenar()
+                else:
+                    saida.write(conteudo)
+            yield from destino.drenar()
+    yield from destino.drenar()
@@ -344,11 +344,9 @@ function BackupTab() {
 
     setCarregando(true);
     try {
-      const conteudo = await arquivoSelecionado.text();
-      const backup = JSON.parse(conteudo);
-
+      // O arquivo já foi enviado na verificação; o servidor o lê do disco
       const response = await api.post('/admin/backup/restaurar', {
-        backup,
+        upload_id: verificacao.upload_id,
         opcoes: {
           modo: modoRestauracao,
           tabelas: [] // Todas as tabelas
@@ -429,7 +427,7 @@ function BackupTab() {
             <div className="space-y-3">
               <Input
                 type="file"
-                accept=".json"
+                accept=".json,.ndjson,.gz"
                 onChange={(e) => {
                   setArquivoSelecionado(e.target.files?.[0] || null);
                   setVerificacao(null);
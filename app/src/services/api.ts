@@ -226,6 +226,16 @@ export const financeiro = {
       params: { mes },
       responseType: 'blob',
     }),
+  // PDF gerado no servidor: 200 com o arquivo ou 202 { pdf_id } enquanto converte
+  getExtratoPdf: (mes: string) =>
+    api.get('/financeiro/extrato/pdf', {
+      params: { mes },
+      responseType: 'blob',
+    }),
+};
+
+export const pdfs = {
+  obter: (pdfId: string) => api.get(`/pdf/${pdfId}`, { responseType: 'blob' }),
 };
 
 export const notificacoes = {
@@ -263,16 +273,18 @@ export const ia = {
     api.post('/ia/chat', { mensagem: `CANCELAR ACAO ${acaoId}`, session_id: sessionId }),
   historico: (sessionId?: string) =>
     api.get('/ia/historico', { params: { session_id: sessionId } }),
-  auditoria: (params?: { status?: string; limit?: number }) =>
+  auditoria: (params?: { status?: string; limit?: number; cursor?: string }) =>
     api.get('/ia/auditoria', { params }),
 };
 
 export const admin = {
   // Dashboard
-  estatisticas: () => api.get('/admin/estatisticas'),
+  estatisticas: (atualizar?: boolean) => api.get('/admin/estatisticas', { params: atualizar ? { atualizar: 1 } : undefined }),
+  serieMetricas: (params: { metricas: string; granularidade?: 'dia' | 'hora'; inicio?: string; fim?: string }) =>
+    api.get('/admin/metricas/serie', { params }),
   
   // Usuários
-  listarUsuarios: (params?: { search?: string; page?: number; per_page?: number; status?: string }) => 
+  listarUsuarios: (params?: { search?: string; page?: number; per_page?: number; status?: string; cursor?: string }) => 
     api.get('/admin/usuarios', { params }),
   obterUsuario: (id: number) => api.get(`/admin/usuarios/${id}`),
   atualizarUsuario: (id: number, data: any) => api.put(`/admin/usuarios/${id}`, data),
@@ -299,7 +311,7 @@ export const admin = {
   atualizarConfiguracao: (chave: string, data: any) => api.put(`/admin/configuracoes/${chave}`, data),
   
   // Auditoria
-  listarAuditoria: (params?: { entidade?: string; acao?: string; page?: number; per_page?: number }) => 
+  listarAuditoria: (params?: { entidade?: string; acao?: string; page?: number; per_page?: number; cursor?: string }) => 
     api.get('/admin/auditoria', { params }),
   
   // Backup
@@ -307,10 +319,16 @@ export const admin = {
   verificarBackup: (formData: FormData) => api.post('/admin/backup/verificar', formData, {
     headers: { 'Content-Type': 'multipart/form-data' }
   }),
-  restaurarBackup: (data: { backup: any; opcoes: any }) => api.post('/admin/backup/restaurar', data),
+  restaurarBackup: (data: { upload_id?: string; backup?: any; opcoes: any }) => api.post('/admin/backup/restaurar', data),
+  statusRestauracaoBackup: (jobId: string) => api.get(`/admin/backup/restaurar/jobs/${jobId}`),
   statusBackupAutomatico: () => api.get('/admin/backup/automatico'),
+  iniciarBackupBackground: (data: { formato: 'json' | 'ndjson' | 'snapshot'; gzip?: boolean }) =>
+    api.post('/admin/backup/jobs', data),
+  statusBackupBackground: (jobId: string) => api.get(`/admin/backup/jobs/${jobId}`),
+  downloadBackupBackground: (jobId: string) =>
+    api.get(`/admin/backup/jobs/${jobId}/download`, { responseType: 'blob' }),
   
-  workspaces: () => api.get('/admin/workspaces'),
+  workspaces: (params?: { limit?: number; cursor?: string }) => api.get('/admin/workspaces', { params }),
 };
 
 export const templates = {
@@ -321,8 +339,15 @@ export const templates = {
   update: (id: number, data: Partial<{ nome?: string; descricao?: string; conteudo?: string; tipo_arquivo?: 'texto' | 'docx'; variaveis?: string[] }>) =>
     api.put(`/templates/${id}`, data),
   delete: (id: number) => api.delete(`/templates/${id}`),
-  gerar: (id: number, data: { processo_id: number; formato?: 'json' | 'download' }) =>
+  gerar: (id: number, data: { processo_id: number; formato?: 'json' | 'download' | 'pdf' }) =>
     api.post(`/templates/${id}/gerar`, data, { responseType: 'blob' }),
+  gerarLote: (id: number, processoIds: number[]) =>
+    api.post(`/templates/${id}/gerar-lote`, { processo_ids: processoIds }, { responseType: 'blob' }),
+  iniciarLoteJob: (id: number, processoIds: number[]) =>
+    api.post(`/templates/${id}/gerar-lote/jobs`, { processo_ids: processoIds }),
+  statusLoteJob: (jobId: string) => api.get(`/templates/lote/jobs/${jobId}`),
+  downloadLoteJob: (jobId: string) =>
+    api.get(`/templates/lote/jobs/${jobId}/download`, { responseType: 'blob' }),
 };
 
 export { api };
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+TESTES - ROTEADOR DE INTENCOES DO COPILOTO
+
+Uso:
+    python test_roteador_intencoes.py
+    (ou: python -m pytest test_roteador_intencoes.py)
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Banco e uploads temporarios antes de importar o app (init_db roda na importacao)
+_TMP = tempfile.mkdtemp(prefix='roteador_')
+os.environ.setdefault('DATABASE_PATH', os.path.join(_TMP, 'teste.db'))
+os.environ.setdefault('UPLOAD_FOLDER', os.path.join(_TMP, 'uploads'))
+os.environ.setdefault('ENABLE_BACKGROUND_JOBS', 'false')
+
+import app as aplicacao  # noqa: E402
+
+roteador = aplicacao.RoteadorIntencoes(max_tokens=12)
+
+
+def test_consulta_por_localidade_vai_para_o_llm():
+    """'sao' de 'Sao Paulo' nao conta como palavra conhecida"""
+    for mensagem in (
+        'quais processos em são paulo',
+        'processos em sao paulo',
+        'quais processos em boa vista',
+        'meus processos de são josé dos campos',
+    ):
+        assert roteador.classificar(mensagem) is None, mensagem
+
+
+def test_nome_de_pessoa_vai_para_o_llm():
+    for mensagem in (
+        'quais são os processos do joão',
+        'quais prazos da maria hoje',
+        'tarefas pendentes da ana',
+    ):
+        assert roteador.classificar(mensagem) is None, mensagem
+
+
+def test_cidade_vai_para_o_llm():
+    for mensagem in (
+        'quais processos ativos em curitiba',
+        'processos de recife',
+    ):
+        assert roteador.classificar(mensagem) is None, mensagem
+
+
+def test_mes_vai_para_o_llm():
+    for mensagem in (
+        'prazos de março',
+        'resumo financeiro de janeiro',
+        'quais processos arquivados em dezembro',
+    ):
+        assert roteador.classificar(mensagem) is None, mensagem
+
+
+def test_quais_sao_continua_roteado():
+    rota = roteador.classificar('quais são meus processos ativos')
+    assert rota is not None
+    assert rota['intencao'] == 'processos'
+    assert rota['args'] == {'status': 'ativo'}
+
+
+def test_contagem_usa_total_e_indica_corte():
+    db = sqlite3.connect(aplicacao.app.config['DATABASE'])
+    db.row_factory = sqlite3.Row
+    workspace_id = db.execute("INSERT INTO workspaces (nome) VALUES ('Teste roteador')").lastrowid
+    cliente_id = db.execute(
+        'INSERT INTO clientes (workspace_id, nome) VALUES (?, ?)', (workspace_id, 'Cliente')
+    ).lastrowid
+    for indice in range(35):
+        db.execute(
+            "INSERT INTO processos (workspace_id, cliente_id, numero, titulo, status) VALUES (?, ?, ?, ?, 'ativo')",
+            (workspace_id, cliente_id, f'{indice:07d}', f'Processo {indice}'),
+        )
+    db.execute(
+        "INSERT INTO processos (workspace_id, cliente_id, numero, titulo, status) VALUES (?, ?, 'X', 'Arquivado', 'arquivado')",
+        (workspace_id, cliente_id),
+    )
+    db.commit()
+
+    rota = roteador.classificar('quantos processos ativos')
+    resultado = aplicacao._funcao_listar_processos(db, rota['args'], workspace_id, None, 'teste')
+    assert resultado['total'] == 35
+    assert len(resultado['processos']) == 20
+
+    resposta = roteador.formatar(rota, resultado)
+    assert resposta.startswith('📁 **35 processo(s) ativos** (mostrando 20 de 35):')
+    db.close()
+
+
+def main():
+    testes = [
+        test_consulta_por_localidade_vai_para_o_llm,
+        test_nome_de_pessoa_vai_para_o_llm,
+        test_cidade_vai_para_o_llm,
+        test_mes_vai_para_o_llm,
+        test_quais_sao_continua_roteado,
+        test_contagem_usa_total_e_indica_corte,
+    ]
+    falhas = 0
+    for teste in testes:
+        try:
+            teste()
+            print(f"OK: {teste.__name__}")
+        except AssertionError as e:
+            falhas += 1
+            print(f"FALHA: {teste.__name__} {e}")
+    print("=" * 60)
+    print("Testes concluidos!" if not falhas else f"{falhas} teste(s) com falha")
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -56,6 +56,7 @@ if ! command -v gunicorn >/dev/null 2>&1; then
 fi
 
 exec gunicorn -w 1 -b 0.0.0.0:${PORT:-8080} \
+  --threads ${GUNICORN_THREADS:-4} \
   --access-logfile - \
   --error-logfile - \
   --timeout 120 \